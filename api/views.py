@@ -17,7 +17,7 @@ from .serializers import (
     AvailabilitySummaryResponseSerializer,
 )
 from ventas.models import (
-    Servicio, ReservaServicio, VentaReserva,
+    Servicio, ReservaServicio, VentaReserva, hora_a_minutos,
     ServicioBloqueo, ServicioSlotBloqueo,
     CategoriaServicio, Producto, ConfiguracionResumen
 )
@@ -47,9 +47,9 @@ def get_available_slots_for_service(servicio, fecha):
     reservas_por_hora = ReservaServicio.objects.filter(
         servicio=servicio,
         fecha_agendamiento=fecha
-    ).values('hora_inicio').annotate(cantidad=Count('id'))
+    ).values('minuto_inicio').annotate(cantidad=Count('id')).order_by()
 
-    slots_ocupacion = {str(r['hora_inicio']): r['cantidad'] for r in reservas_por_hora}
+    slots_ocupacion = {r['minuto_inicio']: r['cantidad'] for r in reservas_por_hora}
 
     # Get max simultaneous services
     max_simultaneos = getattr(servicio, 'max_servicios_simultaneos', 1)
@@ -72,7 +72,7 @@ def get_available_slots_for_service(servicio, fecha):
             continue
 
         # Check capacity
-        reservas_count = slots_ocupacion.get(hora_str, 0)
+        reservas_count = slots_ocupacion.get(hora_a_minutos(hora_str), 0)
         if reservas_count < max_simultaneos:
             horas_disponibles.append(hora_str)
 
@@ -265,8 +265,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ventas.middleware.ThreadLocalMiddleware',  # Agregar aquí el nuevo middleware
     'ventas.middleware_debug.DebugImageUploadMiddleware',  # Debug temporal
+    'ventas.middleware_perfilado.PerfiladoMiddleware',  # Solo si PERFILADO_ACTIVO
 ]
 
+# Perfilado por request (ventas/services/perfilado_service.py). APAGADO por
+# defecto; con PERFILADO_ACTIVO=true cada request deja latencia, consultas, N+1
+# y aciertos de caché en un buffer circular por proceso, que se ve en
+# /ventas/diagnostico/perfilado/. PERFILADO_MUESTREO < 1 mide solo esa fracción.
+PERFILADO_ACTIVO = os.getenv('PERFILADO_ACTIVO', 'false').lower() == 'true'
+PERFILADO_MUESTREO = float(os.getenv('PERFILADO_MUESTREO', '1.0'))
+PERFILADO_MUESTRAS = int(os.getenv('PERFILADO_MUESTRAS', '2000'))
+
 ROOT_URLCONF = 'aremko_project.urls'
 
 TEMPLATES = [
@@ -313,15 +322,29 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True
 
 # Cache configuration (reduce queries repetidas)
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
+# Con REDIS_URL la caché es compartida entre todos los workers de gunicorn (una
+# invalidación en un worker llega a los demás). Sin REDIS_URL (local, tests) cae a
+# memoria del proceso. Los dominios/versiones viven en ventas/services/cache_service.py.
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'aremko',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000
+            }
         }
     }
-}
 
 LANGUAGE_CODE = 'es-cl'
 TIME_ZONE = 'America/Santiago'
@@ -625,6 +648,12 @@ DPV_LLM_TEMPERATURE = float(os.getenv("DPV_LLM_TEMPERATURE", "0.7"))
 DPV_LLM_TIMEOUT_SECONDS = int(os.getenv("DPV_LLM_TIMEOUT_SECONDS", "30"))
 DPV_LLM_SITE_URL = os.getenv("DPV_LLM_SITE_URL", "https://www.aremko.cl")
 DPV_LLM_SITE_NAME = os.getenv("DPV_LLM_SITE_NAME", "Destino Puerto Varas Piloto")
+# Presupuesto (tokens estimados, ver services/llm/token_budget.py) de lo que varía
+# por turno en el prompt de Luna: historial del chat y conocimiento del agente.
+# 0 = sin tope. El conocimiento va sin tope por defecto: son reglas del negocio,
+# van en el prefijo cacheado y recortarlas ahorra poco. Activarlo es opt-in.
+DPV_LLM_HISTORY_TOKEN_BUDGET = int(os.getenv("DPV_LLM_HISTORY_TOKEN_BUDGET", "2500"))
+DPV_LLM_KNOWLEDGE_TOKEN_BUDGET = int(os.getenv("DPV_LLM_KNOWLEDGE_TOKEN_BUDGET", "0"))
 
 # ──────────────── DPV — CMS-IA: Perplexity (búsqueda web) ────────────────
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY", "")
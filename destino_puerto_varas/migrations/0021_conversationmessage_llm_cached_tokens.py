@@ -0,0 +1,20 @@
+"""Add ConversationMessage.llm_cached_tokens (caché de prompt del proveedor).
+
+Drift-safe: una columna nueva con default, sin tocar el resto del modelo.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("destino_puerto_varas", "0020_blogpost"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversationmessage",
+            name="llm_cached_tokens",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -613,6 +613,8 @@ class ConversationMessage(models.Model):
     llm_model = models.CharField(max_length=80, blank=True, default="")
     llm_input_tokens = models.PositiveIntegerField(default=0)
     llm_output_tokens = models.PositiveIntegerField(default=0)
+    # Parte de llm_input_tokens leída de la caché de prompt del proveedor.
+    llm_cached_tokens = models.PositiveIntegerField(default=0)
     llm_cost_usd = models.DecimalField(max_digits=10, decimal_places=6, default=0)
     llm_latency_ms = models.PositiveIntegerField(default=0)
     llm_error = models.CharField(max_length=200, blank=True, default="")
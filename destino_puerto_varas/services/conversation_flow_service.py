@@ -224,6 +224,7 @@ def _record_llm_metadata_if_any(msg: ConversationMessage, metadata: dict) -> Non
         output_tokens=int(metadata.get("output_tokens", 0) or 0),
         latency_ms=int(metadata.get("latency_ms", 0) or 0),
         error=metadata.get("error", "") or "",
+        cached_tokens=int(metadata.get("cached_tokens", 0) or 0),
     )
 
 
@@ -1,4 +1,4 @@
-"""Persiste métricas LLM (tokens, costo, latencia, error) en un ConversationMessage."""
+"""Persiste métricas LLM (tokens, caché, costo, latencia, error) de cada llamada."""
 
 from decimal import Decimal
 
@@ -8,6 +8,13 @@ from .pricing import calculate_cost_usd
 class CostTracker:
     """Registra tokens, costo y latencia de una llamada LLM en un ConversationMessage."""
 
+    @staticmethod
+    def cache_ratio(input_tokens: int, cached_tokens: int) -> float:
+        """Fracción del input que salió de la caché de prompt del proveedor (0..1)."""
+        if not input_tokens:
+            return 0.0
+        return min(cached_tokens or 0, input_tokens) / input_tokens
+
     @staticmethod
     def record_to_message(
         message,
@@ -16,17 +23,32 @@ class CostTracker:
         output_tokens: int,
         latency_ms: int,
         error: str = "",
+        cached_tokens: int = 0,
     ):
         message.llm_model = model or ""
         message.llm_input_tokens = input_tokens or 0
         message.llm_output_tokens = output_tokens or 0
+        message.llm_cached_tokens = cached_tokens or 0
         message.llm_latency_ms = latency_ms or 0
         message.llm_error = (error or "")[:200]
         if not error:
             message.llm_cost_usd = Decimal(str(round(
-                calculate_cost_usd(model, input_tokens, output_tokens), 6
+                calculate_cost_usd(model, input_tokens, output_tokens, cached_tokens), 6
             )))
         message.save(update_fields=[
-            "llm_model", "llm_input_tokens", "llm_output_tokens",
+            "llm_model", "llm_input_tokens", "llm_output_tokens", "llm_cached_tokens",
             "llm_cost_usd", "llm_latency_ms", "llm_error",
         ])
+
+    @staticmethod
+    def turn_metrics(model: str, input_tokens: int, output_tokens: int,
+                     cached_tokens: int = 0) -> dict:
+        """Caché y costo de un turno de Luna, con los nombres de campo de
+        SugerenciaAgenteWhatsApp."""
+        return {
+            "cached_tokens": cached_tokens or 0,
+            "cache_ratio": round(CostTracker.cache_ratio(input_tokens, cached_tokens), 4),
+            "cost_usd": Decimal(str(round(
+                calculate_cost_usd(model, input_tokens or 0, output_tokens or 0, cached_tokens), 6
+            ))),
+        }
@@ -40,7 +40,8 @@ class LLMReplyService:
             return {"text": fallback_text, "llm_used": False, "metadata": {}}
 
         user_prompt = user_prompt_fn()
-        result = self.provider.generate(SYSTEM_PROMPT, user_prompt)
+        # SYSTEM_PROMPT es igual en todas las conversaciones: va como prefijo cacheable.
+        result = self.provider.generate("", user_prompt, cached_prefix=SYSTEM_PROMPT)
 
         if not result.ok or not result.text:
             return {
@@ -62,6 +63,7 @@ class LLMReplyService:
                 "model": result.model,
                 "input_tokens": result.input_tokens,
                 "output_tokens": result.output_tokens,
+                "cached_tokens": result.cached_tokens,
                 "latency_ms": result.latency_ms,
                 "error": "",
             },
@@ -1,18 +1,34 @@
 """Cliente OpenRouter — usa el SDK OpenAI por compatibilidad de protocolo.
 
 Siempre retorna LLMResult; nunca lanza excepción hacia arriba. Eso simplifica el fallback.
+
+Caché de prompt: la parte FIJA del system prompt (persona, catálogo, reglas) es
+casi igual en todas las conversaciones. `system_message(prefijo, resto)` la marca
+con `cache_control` y el proveedor la cobra con descuento mientras siga caliente
+(ver `pricing.CACHE_READ_FACTOR`). Anthropic y Gemini necesitan la marca
+explícita; al resto (OpenAI, DeepSeek) se le manda texto plano y cachea solo el
+prefijo repetido. Los tokens leídos de caché vuelven en `LLMResult.cached_tokens`.
 """
 
 import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from django.conf import settings
+from django.db import connection, connections
 
 from openai import APIError, APITimeoutError, OpenAI, RateLimitError
 
 logger = logging.getLogger(__name__)
 
+# Modelos (por prefijo) que solo cachean el prompt si el mensaje trae la marca.
+MODELOS_CACHE_EXPLICITO = ("anthropic/", "google/")
+
+# Tope de tools de UN paso del modelo que corren a la vez (cada una con su
+# propia conexión a la base).
+TOOLS_SIMULTANEAS = 4
+
 
 class LLMResult:
     """Resultado de una llamada al LLM."""
@@ -26,6 +42,7 @@ class LLMResult:
         latency_ms,
         error="",
         tool_calls_executed=None,
+        cached_tokens=0,
     ):
         self.text = text
         self.model = model
@@ -33,7 +50,9 @@ class LLMResult:
         self.output_tokens = output_tokens
         self.latency_ms = latency_ms
         self.error = error
-        # Lista de dicts {"name": str, "arguments": dict, "result": dict} — auditoría
+        # Parte de input_tokens que el proveedor leyó de su caché de prompt.
+        self.cached_tokens = cached_tokens
+        # Lista de dicts {"name", "arguments", "result", "ms", "paralela"} — auditoría
         self.tool_calls_executed = tool_calls_executed or []
 
     @property
@@ -41,6 +60,85 @@ class LLMResult:
         return not self.error
 
 
+def system_message(cached_prefix: str, rest: str = "") -> dict:
+    """Mensaje system con `cached_prefix` marcado para la caché de prompt del
+    proveedor y `rest` (lo que cambia por turno) después, sin marcar."""
+    content = [{"type": "text", "text": cached_prefix,
+                "cache_control": {"type": "ephemeral"}}]
+    if rest:
+        content.append({"type": "text", "text": rest})
+    return {"role": "system", "content": content}
+
+
+def _preparar_mensajes(messages: list, model: str) -> list:
+    """Para modelos sin caché explícita, los mensajes en partes vuelven a ser
+    texto plano (mismo contenido; hay proxies que no aceptan `cache_control`)."""
+    if (model or "").startswith(MODELOS_CACHE_EXPLICITO):
+        return list(messages)
+    planos = []
+    for m in messages:
+        if isinstance(m.get("content"), list):
+            m = dict(m, content="".join(p.get("text", "") for p in m["content"]))
+        planos.append(m)
+    return planos
+
+
+def _cached_tokens(usage) -> int:
+    """Tokens de input leídos de la caché (OpenRouter: prompt_tokens_details)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get("cached_tokens", 0) or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def _ejecutar_tool(tool_executor, tool_name, arguments):
+    """(resultado, ms) de una tool. Una excepción vuelve como resultado de error."""
+    start = time.monotonic()
+    try:
+        result = tool_executor(tool_name, arguments)
+    except Exception as exc:
+        logger.exception("Tool %s falló: %s", tool_name, exc)
+        result = {"error": f"tool_execution_failed: {str(exc)[:150]}"}
+    return result, int((time.monotonic() - start) * 1000)
+
+
+def _ejecutar_tool_en_hilo(tool_executor, tool_name, arguments):
+    try:
+        return _ejecutar_tool(tool_executor, tool_name, arguments)
+    finally:
+        # El hilo del pool abrió su propia conexión: se cierra acá y no queda
+        # colgada fuera del ciclo request/response de Django.
+        connections.close_all()
+
+
+def ejecutar_tool_calls(llamadas, tool_executor, paralelizable=None):
+    """Ejecuta las tools pedidas en UN paso del modelo. Devuelve
+    ([(resultado, ms)] en el mismo orden que `llamadas` ([(nombre, argumentos)]),
+    si corrieron en paralelo).
+
+    Corren a la vez solo si son varias, TODAS son de lectura
+    (`paralelizable(nombre)`) y el llamador no está dentro de una transacción:
+    los hilos usan otra conexión y no verían lo que esa transacción aún no
+    confirmó. Si una sola escribe (carrito, propuesta), van en serie como
+    siempre — el orden en que el modelo las pidió importa.
+    """
+    en_paralelo = (
+        len(llamadas) > 1
+        and paralelizable is not None
+        and all(paralelizable(nombre) for nombre, _ in llamadas)
+        and not connection.in_atomic_block
+    )
+    if not en_paralelo:
+        return [_ejecutar_tool(tool_executor, nombre, args) for nombre, args in llamadas], False
+    with ThreadPoolExecutor(max_workers=min(len(llamadas), TOOLS_SIMULTANEAS),
+                            thread_name_prefix="tool") as pool:
+        futuros = [pool.submit(_ejecutar_tool_en_hilo, tool_executor, nombre, args)
+                   for nombre, args in llamadas]
+        return [f.result() for f in futuros], True
+
+
 class OpenRouterProvider:
     """Cliente OpenRouter usando el SDK OpenAI por compatibilidad de protocolo."""
 
@@ -71,8 +169,13 @@ class OpenRouterProvider:
         model: str = None,
         max_tokens: int = None,
         temperature: float = None,
+        cached_prefix: str = "",
     ) -> LLMResult:
-        """Genera respuesta. Siempre devuelve LLMResult (nunca lanza hacia arriba)."""
+        """Genera respuesta. Siempre devuelve LLMResult (nunca lanza hacia arriba).
+
+        `cached_prefix`: parte fija del system prompt que va ANTES de
+        `system_prompt` marcada para la caché del proveedor (ver `system_message`).
+        """
         model_effective = model or self.default_model
 
         if not self.api_key:
@@ -90,12 +193,14 @@ class OpenRouterProvider:
 
         start = time.monotonic()
         try:
+            system = (system_message(cached_prefix, system_prompt) if cached_prefix
+                      else {"role": "system", "content": system_prompt})
             resp = client.chat.completions.create(
                 model=model_effective,
-                messages=[
-                    {"role": "system", "content": system_prompt},
+                messages=_preparar_mensajes([
+                    system,
                     {"role": "user", "content": user_prompt},
-                ],
+                ], model_effective),
                 max_tokens=max_tokens or self.max_tokens,
                 temperature=temperature if temperature is not None else self.temperature,
                 extra_headers={
@@ -113,6 +218,7 @@ class OpenRouterProvider:
                 input_tokens=getattr(usage, "prompt_tokens", 0) or 0,
                 output_tokens=getattr(usage, "completion_tokens", 0) or 0,
                 latency_ms=elapsed_ms,
+                cached_tokens=_cached_tokens(usage),
             )
         except APITimeoutError as e:
             elapsed_ms = int((time.monotonic() - start) * 1000)
@@ -144,16 +250,21 @@ class OpenRouterProvider:
         max_tokens: int = None,
         temperature: float = None,
         max_iterations: int = 3,
+        paralelizable=None,
     ) -> LLMResult:
         """Genera respuesta con tool-calling. Loop hasta que el LLM retorna texto final.
 
         Args:
             messages: lista de dicts con formato OpenAI chat (role, content).
-                      Debe incluir el system prompt como primer mensaje.
+                      Debe incluir el system prompt como primer mensaje (puede
+                      venir de `system_message` para usar la caché de prompt).
             tools: lista de tools en formato OpenAI function-calling.
             tool_executor: callable(name: str, arguments: dict) -> dict/str
                            que ejecuta la tool y retorna el resultado serializable.
             max_iterations: cuántas rondas de tool-use permitir antes de forzar respuesta.
+            paralelizable: callable(name: str) -> bool; las tools de lectura que el
+                           modelo pide en un mismo paso corren a la vez
+                           (ver `ejecutar_tool_calls`). None = siempre en serie.
 
         Retorna siempre LLMResult. Si hay error, .text es fallback vacío.
         """
@@ -172,8 +283,9 @@ class OpenRouterProvider:
                 error="Cliente OpenRouter no inicializable",
             )
 
-        working_messages = list(messages)
+        working_messages = _preparar_mensajes(messages, model_effective)
         total_input_tokens = 0
+        total_cached_tokens = 0
         total_output_tokens = 0
         total_latency_ms = 0
         tool_calls_executed = []
@@ -207,6 +319,7 @@ class OpenRouterProvider:
                 usage = resp.usage
                 total_input_tokens += getattr(usage, "prompt_tokens", 0) or 0
                 total_output_tokens += getattr(usage, "completion_tokens", 0) or 0
+                total_cached_tokens += _cached_tokens(usage)
 
                 choice = resp.choices[0]
                 msg = choice.message
@@ -229,6 +342,7 @@ class OpenRouterProvider:
                         output_tokens=total_output_tokens,
                         latency_ms=total_latency_ms,
                         tool_calls_executed=tool_calls_executed,
+                        cached_tokens=total_cached_tokens,
                     )
 
                 # Persistir el turn del assistant con tool_calls en el contexto
@@ -248,23 +362,24 @@ class OpenRouterProvider:
                     ],
                 })
 
-                # Ejecutar cada tool call y agregar los resultados como mensajes "tool"
+                # Ejecutar las tool calls del paso y agregar los resultados como mensajes
+                # "tool", en el orden en que el modelo las pidió.
+                llamadas = []
                 for tc in tool_calls:
-                    tool_name = tc.function.name
                     try:
                         arguments = json.loads(tc.function.arguments or "{}")
                     except json.JSONDecodeError:
                         arguments = {}
-                    try:
-                        result = tool_executor(tool_name, arguments)
-                    except Exception as exc:
-                        logger.exception("Tool %s falló: %s", tool_name, exc)
-                        result = {"error": f"tool_execution_failed: {str(exc)[:150]}"}
+                    llamadas.append((tc.function.name, arguments))
+                resultados, en_paralelo = ejecutar_tool_calls(llamadas, tool_executor, paralelizable)
 
+                for tc, (tool_name, arguments), (result, ms) in zip(tool_calls, llamadas, resultados):
                     tool_calls_executed.append({
                         "name": tool_name,
                         "arguments": arguments,
                         "result": result,
+                        "ms": ms,
+                        "paralela": en_paralelo,
                     })
 
                     working_messages.append({
@@ -282,25 +397,30 @@ class OpenRouterProvider:
                 latency_ms=total_latency_ms,
                 error="max_iterations_without_final_text",
                 tool_calls_executed=tool_calls_executed,
+                cached_tokens=total_cached_tokens,
             )
 
         except APITimeoutError as e:
             logger.warning("OpenRouter (tools) timeout: %s", e)
             return LLMResult("", model_effective, total_input_tokens, total_output_tokens,
                              total_latency_ms, error=f"timeout: {str(e)[:150]}",
-                             tool_calls_executed=tool_calls_executed)
+                             tool_calls_executed=tool_calls_executed,
+                             cached_tokens=total_cached_tokens)
         except RateLimitError as e:
             logger.warning("OpenRouter (tools) rate limit: %s", e)
             return LLMResult("", model_effective, total_input_tokens, total_output_tokens,
                              total_latency_ms, error=f"rate_limit: {str(e)[:150]}",
-                             tool_calls_executed=tool_calls_executed)
+                             tool_calls_executed=tool_calls_executed,
+                             cached_tokens=total_cached_tokens)
         except APIError as e:
             logger.error("OpenRouter (tools) APIError: %s", e)
             return LLMResult("", model_effective, total_input_tokens, total_output_tokens,
                              total_latency_ms, error=f"api_error: {str(e)[:150]}",
-                             tool_calls_executed=tool_calls_executed)
+                             tool_calls_executed=tool_calls_executed,
+                             cached_tokens=total_cached_tokens)
         except Exception as e:
             logger.exception("OpenRouter (tools) unexpected: %s", e)
             return LLMResult("", model_effective, total_input_tokens, total_output_tokens,
                              total_latency_ms, error=f"unexpected: {str(e)[:150]}",
-                             tool_calls_executed=tool_calls_executed)
+                             tool_calls_executed=tool_calls_executed,
+                             cached_tokens=total_cached_tokens)
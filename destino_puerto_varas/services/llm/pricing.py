@@ -14,13 +14,36 @@ PRICING = {
 
 DEFAULT_FALLBACK = {"input": 1.00, "output": 5.00}
 
+# Fracción del precio de input que se cobra por un token leído de la caché de
+# prompt del proveedor (prefijo repetido). Por prefijo del modelo.
+CACHE_READ_FACTOR = {
+    "anthropic/": 0.10,
+    "openai/": 0.50,
+    "google/": 0.25,
+}
+
 
 def get_model_pricing(model: str) -> dict:
     """Devuelve {"input": float, "output": float} por 1M tokens."""
     return PRICING.get(model, DEFAULT_FALLBACK)
 
 
-def calculate_cost_usd(model: str, input_tokens: int, output_tokens: int) -> float:
-    """Calcula el costo estimado de una llamada."""
+def cache_read_factor(model: str) -> float:
+    """Fracción del precio de input de un token cacheado (1.0 = sin descuento)."""
+    for prefix, factor in CACHE_READ_FACTOR.items():
+        if (model or "").startswith(prefix):
+            return factor
+    return 1.0
+
+
+def calculate_cost_usd(model: str, input_tokens: int, output_tokens: int,
+                       cached_tokens: int = 0) -> float:
+    """Calcula el costo estimado de una llamada.
+
+    `cached_tokens` es la parte de `input_tokens` que el proveedor leyó de su
+    caché de prompt; se cobra con el descuento de `CACHE_READ_FACTOR`.
+    """
     p = get_model_pricing(model)
-    return (input_tokens / 1_000_000 * p["input"]) + (output_tokens / 1_000_000 * p["output"])
+    cached = min(cached_tokens or 0, input_tokens or 0)
+    input_cost = ((input_tokens - cached) + cached * cache_read_factor(model)) / 1_000_000 * p["input"]
+    return input_cost + (output_tokens / 1_000_000 * p["output"])
@@ -0,0 +1,63 @@
+"""Estimación local de tokens y recorte a presupuesto antes de llamar al LLM.
+
+No hay tokenizer exacto para todos los modelos de OpenRouter (cada proveedor
+cuenta distinto), así que se estima por caracteres: en español ~3,5 caracteres
+por token con los tokenizers actuales. Para decidir cuánto historial entra
+alcanza — el conteo real lo devuelve el proveedor en `usage` y queda en el
+CostTracker.
+"""
+
+import math
+import re
+
+CARACTERES_POR_TOKEN = 3.5
+
+# Un mensaje del historial empieza en una línea "[Quién]: "; las líneas
+# siguientes sin esa marca son del mismo mensaje (respuestas de varias líneas).
+_INICIO_MENSAJE = re.compile(r"\n(?=\[[^\]\n]+\]: )")
+
+
+def estimar_tokens(texto: str) -> int:
+    """Tokens aproximados de `texto` (por exceso)."""
+    return math.ceil(len(texto or "") / CARACTERES_POR_TOKEN)
+
+
+def recortar_historial(texto: str, presupuesto: int) -> str:
+    """Deja los mensajes MÁS RECIENTES (los de abajo) que caben en `presupuesto`.
+
+    Se corta por mensaje completo ("[Cliente]: …" / "[Aremko]: …", con todas
+    sus líneas): un mensaje a medias, o líneas sueltas sin quién las dijo,
+    confunden más al modelo que uno que no está. El último mensaje entra
+    siempre, aunque solo no quepa.
+    """
+    if not presupuesto or estimar_tokens(texto) <= presupuesto:
+        return texto
+    mensajes = _INICIO_MENSAJE.split(texto)
+    quedan = []
+    usados = 0
+    for mensaje in reversed(mensajes):
+        costo = estimar_tokens(mensaje) + 1
+        if quedan and usados + costo > presupuesto:
+            break
+        quedan.append(mensaje)
+        usados += costo
+    omitidos = len(mensajes) - len(quedan)
+    return "\n".join([f"(… {omitidos} mensajes anteriores omitidos)"] + quedan[::-1])
+
+
+def recortar_secciones(texto: str, presupuesto: int) -> str:
+    """Deja los PRIMEROS párrafos (separados por línea en blanco) que caben en
+    `presupuesto`. Para textos redactados en orden de importancia, como el
+    conocimiento del agente."""
+    if not presupuesto or estimar_tokens(texto) <= presupuesto:
+        return texto
+    parrafos = texto.split("\n\n")
+    quedan = []
+    usados = 0
+    for parrafo in parrafos:
+        costo = estimar_tokens(parrafo) + 1
+        if usados + costo > presupuesto:
+            break
+        quedan.append(parrafo)
+        usados += costo
+    return "\n\n".join(quedan)
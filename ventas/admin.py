@@ -6,6 +6,7 @@ from django import forms
 logger = logging.getLogger(__name__)
 from django.db import models, transaction
 from .forms import PagoInlineForm, PagoInlineFormSet, VentaReservaAdminForm
+from .services.totales_service import totales_diferidos
 from django.forms import DateTimeInput
 from datetime import date, datetime, timedelta  # Importa date, datetime, y timedelta
 from django.utils import timezone
@@ -14,7 +15,7 @@ from django.utils.safestring import mark_safe
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.forms import DateInput, TimeInput, Select
-from .models import (CalendarioCabana, 
+from .models import (VENTA_CANCELADA, CalendarioCabana, 
     Proveedor, CategoriaProducto, Producto, VentaReserva, ReservaProducto,
     Pago, Cliente, CategoriaServicio, Servicio, ReservaServicio,
     Region, Comuna,
@@ -86,9 +87,10 @@ from .models import (CalendarioCabana,
     RefugioConfig,
     RefugioImagen,
     RefugioLead,
+    # Cola de trabajos en segundo plano
+    Trabajo,
 )
-from django.http import HttpResponse
-import xlwt
+from .services import exportacion_service
 
 # Personalización del título de la administración
 admin.site.site_header = _("Sistema de Gestión de Ventas")
@@ -120,6 +122,31 @@ class ReservaServicioInlineForm(forms.ModelForm):
 
         return fecha_agendamiento
 
+    def clean(self):
+        """Rechaza la fila si su bloque horario choca con otras reservas del mismo
+        servicio (sobre max_servicios_simultaneos) o con la agenda del masajista.
+        Solo si cambió algo del horario: editar el precio de una reserva vieja
+        no re-valida lo que ya estaba agendado."""
+        from .services.disponibilidad_service import buscar_conflictos
+
+        cleaned_data = super().clean()
+        campos_horario = {'servicio', 'fecha_agendamiento', 'hora_inicio', 'proveedor_asignado'}
+        if not campos_horario & set(self.changed_data):
+            return cleaned_data
+        servicio = cleaned_data.get('servicio')
+        fecha = cleaned_data.get('fecha_agendamiento')
+        hora = cleaned_data.get('hora_inicio')
+        if not (servicio and fecha and hora) or cleaned_data.get('DELETE'):
+            return cleaned_data
+        if isinstance(fecha, datetime):
+            fecha = fecha.date()
+        conflictos = buscar_conflictos(servicio, fecha, hora,
+                                       proveedor=cleaned_data.get('proveedor_asignado'),
+                                       excluir=self.instance)
+        if conflictos:
+            raise forms.ValidationError([c.mensaje for c in conflictos])
+        return cleaned_data
+
 class ReservaServicioInline(admin.TabularInline):
     model = ReservaServicio
     form = ReservaServicioInlineForm
@@ -728,7 +755,10 @@ class VentaReservaAdmin(admin.ModelAdmin):
                 )
 
     def save_related(self, request, form, formsets, change):
-        super().save_related(request, form, formsets, change)
+        # Las N líneas de los inlines recalculan el total de la venta UNA vez al
+        # final del bloque, no una vez por línea guardada/borrada.
+        with totales_diferidos():
+            super().save_related(request, form, formsets, change)
         # Productos agregados por el admin entran al flujo de cocina: si ninguna
         # comanda de la reserva los cubre, se crea una en Pendiente. Así la agenda
         # operativa y el panel de cocina los ven con estado (evita pedidos
@@ -2057,31 +2087,13 @@ class ClienteAdmin(admin.ModelAdmin):
         return queryset, use_distinct
 
     def exportar_a_excel(self, request, queryset):
-        response = HttpResponse(content_type='application/ms-excel')
-        response['Content-Disposition'] = 'attachment; filename="clientes_{}.xls"'.format(
-            datetime.now().strftime('%Y%m%d_%H%M%S')
-        )
-
-        wb = xlwt.Workbook(encoding='utf-8')
-        ws = wb.add_sheet('Clientes')
-
-        # Estilos
-        header_style = xlwt.easyxf('font: bold on; pattern: pattern solid, fore_colour gray25;')
-
-        # Headers
-        headers = ['Nombre', 'Teléfono', 'Email']
-        for col, header in enumerate(headers):
-            ws.write(0, col, header, header_style)
-            ws.col(col).width = 256 * 20
-
-        # Datos
-        for row, cliente in enumerate(queryset, 1):
-            ws.write(row, 0, cliente.nombre)
-            ws.write(row, 1, cliente.telefono)
-            ws.write(row, 2, cliente.email)
-
-        wb.save(response)
-        return response
+        """XLSX por trozos (ver exportacion_service): la selección puede ser
+        "todos" los ~14K clientes."""
+        filas = queryset.order_by().values_list('nombre', 'telefono', 'email').iterator(
+            chunk_size=exportacion_service.FILAS_POR_TROZO)
+        return exportacion_service.respuesta_xlsx(
+            'clientes_{}.xlsx'.format(datetime.now().strftime('%Y%m%d_%H%M%S')), 'Clientes',
+            ['Nombre', 'Teléfono', 'Email'], filas)
 
     exportar_a_excel.short_description = "Exportar clientes seleccionados a Excel"
 
@@ -4167,44 +4179,32 @@ class PagoMasajistaAdmin(admin.ModelAdmin):
     actions = ['exportar_a_excel']
 
     def exportar_a_excel(self, request, queryset):
-        """Exporta los pagos seleccionados a Excel"""
-        import xlwt
-        response = HttpResponse(content_type='application/ms-excel')
-        response['Content-Disposition'] = 'attachment; filename="pagos_masajistas.xls"'
-
-        wb = xlwt.Workbook(encoding='utf-8')
-        ws = wb.add_sheet('Pagos')
-
-        # Encabezados
-        row_num = 0
-        columns = [
+        """Exporta los pagos seleccionados a Excel (XLSX por trozos, ver exportacion_service)"""
+        columnas = [
             'ID', 'Masajista', 'RUT', 'Fecha Pago',
             'Periodo Inicio', 'Periodo Fin',
             'Monto Bruto', '% Retención', 'Monto Retención',
             'Monto Neto', 'N° Transferencia', 'Banco'
         ]
-
-        for col_num, column_title in enumerate(columns):
-            ws.write(row_num, col_num, column_title)
-
-        # Datos
-        for pago in queryset:
-            row_num += 1
-            ws.write(row_num, 0, pago.id)
-            ws.write(row_num, 1, pago.proveedor.nombre)
-            ws.write(row_num, 2, pago.proveedor.rut or '')
-            ws.write(row_num, 3, pago.fecha_pago.strftime('%d/%m/%Y %H:%M'))
-            ws.write(row_num, 4, pago.periodo_inicio.strftime('%d/%m/%Y'))
-            ws.write(row_num, 5, pago.periodo_fin.strftime('%d/%m/%Y'))
-            ws.write(row_num, 6, float(pago.monto_bruto))
-            ws.write(row_num, 7, float(pago.porcentaje_retencion))
-            ws.write(row_num, 8, float(pago.monto_retencion))
-            ws.write(row_num, 9, float(pago.monto_neto))
-            ws.write(row_num, 10, pago.numero_transferencia or '')
-            ws.write(row_num, 11, pago.proveedor.banco or '')
-
-        wb.save(response)
-        return response
+        filas = (
+            [
+                pago.id,
+                pago.proveedor.nombre,
+                pago.proveedor.rut or '',
+                timezone.localtime(pago.fecha_pago).strftime('%d/%m/%Y %H:%M'),
+                pago.periodo_inicio.strftime('%d/%m/%Y'),
+                pago.periodo_fin.strftime('%d/%m/%Y'),
+                float(pago.monto_bruto),
+                float(pago.porcentaje_retencion),
+                float(pago.monto_retencion),
+                float(pago.monto_neto),
+                pago.numero_transferencia or '',
+                pago.proveedor.banco or '',
+            ]
+            for pago in queryset.select_related('proveedor').iterator(
+                chunk_size=exportacion_service.FILAS_POR_TROZO)
+        )
+        return exportacion_service.respuesta_xlsx('pagos_masajistas.xlsx', 'Pagos', columnas, filas)
 
     exportar_a_excel.short_description = "Exportar pagos seleccionados a Excel"
 
@@ -4337,7 +4337,7 @@ class ServicioBloqueoAdmin(admin.ModelAdmin):
                 fecha_agendamiento__gte=obj.fecha_inicio,
                 fecha_agendamiento__lte=obj.fecha_fin
             ).exclude(
-                venta_reserva__estado_reserva='cancelada'
+                VENTA_CANCELADA
             ).select_related('venta_reserva', 'venta_reserva__cliente')
 
             if not reservas.exists():
@@ -7307,3 +7307,53 @@ class CalendarioCabanaAdmin(admin.ModelAdmin):
             f'Booking y Airbnb ahora: hasta que lo hagas, ellos ven esas '
             f'cabañas libres y pueden vender una fecha ya ocupada.',
             level=messages.WARNING)
+
+
+@admin.register(Trabajo)
+class TrabajoAdmin(admin.ModelAdmin):
+    """Cola de trabajos en segundo plano (crons, campañas). Los encolan los
+    endpoints y vistas; el worker `procesar_trabajos` los corre."""
+
+    list_display = ('id', 'tarea_resumen', 'cola', 'estado', 'intentos', 'max_intentos',
+                    'ejecutar_desde', 'tomado_por', 'terminado_en', 'creado_en')
+    list_filter = ('estado', 'cola', 'tarea')
+    search_fields = ('clave', 'error')
+    date_hierarchy = 'creado_en'
+    ordering = ('-creado_en', '-id')
+    list_per_page = 50
+    readonly_fields = ('cola', 'tarea', 'argumentos', 'clave', 'estado', 'intentos', 'max_intentos',
+                       'ejecutar_desde', 'tomado_en', 'latido_en', 'tomado_por', 'terminado_en', 'resultado',
+                       'error', 'creado_en')
+    actions = ['reintentar_ahora', 'cancelar']
+
+    @admin.display(description='Tarea')
+    def tarea_resumen(self, obj):
+        if obj.tarea == 'comando':
+            return f"comando: {obj.argumentos.get('nombre', '')}"
+        return obj.tarea
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='🔁 Reintentar ahora (fallidos y pendientes)')
+    def reintentar_ahora(self, request, queryset):
+        n = 0
+        for trabajo in queryset.filter(estado__in=[Trabajo.ESTADO_FALLIDO, Trabajo.ESTADO_PENDIENTE,
+                                                   Trabajo.ESTADO_CANCELADO]):
+            # Un fallido con la misma clave que uno activo no se revive: sería un duplicado.
+            if trabajo.estado != Trabajo.ESTADO_PENDIENTE and trabajo.clave and Trabajo.objects.filter(
+                    clave=trabajo.clave, estado__in=Trabajo.ACTIVOS).exists():
+                continue
+            Trabajo.objects.filter(pk=trabajo.pk).update(
+                estado=Trabajo.ESTADO_PENDIENTE, ejecutar_desde=timezone.now(),
+                intentos=0 if trabajo.estado != Trabajo.ESTADO_PENDIENTE else trabajo.intentos)
+            n += 1
+        self.message_user(request, f'{n} trabajo(s) vuelven a la cola.')
+
+    @admin.action(description='⛔ Cancelar')
+    def cancelar(self, request, queryset):
+        """Los pendientes no se toman; los que están corriendo terminan igual,
+        pero quedan cancelados en vez de listos."""
+        n = queryset.filter(estado__in=Trabajo.ACTIVOS).update(
+            estado=Trabajo.ESTADO_CANCELADO, terminado_en=timezone.now())
+        self.message_user(request, f'{n} trabajo(s) cancelado(s).')
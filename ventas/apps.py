@@ -58,6 +58,42 @@ class VentasConfig(AppConfig):
                 f"No se pudo importar comanda_comentario_signals: {exc}"
             )
 
+        # Caché por dominios: invalidación al cambiar servicios, reservas, bloqueos
+        try:
+            import ventas.signals.cache_signals  # noqa: F401
+        except Exception as exc:
+            import logging
+            logging.getLogger(__name__).warning(
+                f"No se pudo importar cache_signals: {exc}"
+            )
+
+        # Tabla de hechos de ventas: recalcula los días tocados por reservas y pagos
+        try:
+            import ventas.signals.hechos_ventas_signals  # noqa: F401
+        except Exception as exc:
+            import logging
+            logging.getLogger(__name__).warning(
+                f"No se pudo importar hechos_ventas_signals: {exc}"
+            )
+
+        # Métricas por cliente de la segmentación: recalcula los teléfonos tocados
+        try:
+            import ventas.signals.metricas_cliente_signals  # noqa: F401
+        except Exception as exc:
+            import logging
+            logging.getLogger(__name__).warning(
+                f"No se pudo importar metricas_cliente_signals: {exc}"
+            )
+
+        # Taxonomía de clientes: encola los clientes cuyas reservas cambiaron
+        try:
+            import ventas.signals.taxonomia_signals  # noqa: F401
+        except Exception as exc:
+            import logging
+            logging.getLogger(__name__).warning(
+                f"No se pudo importar taxonomia_signals: {exc}"
+            )
+
         # Los modelos ya están registrados en admin.py usando decoradores @admin.register
         # No necesitamos registrarlos manualmente aquí
         # Importar admin para asegurar que se ejecuten los decoradores
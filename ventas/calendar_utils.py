@@ -3,7 +3,7 @@ from google.oauth2 import service_account
 from datetime import timedelta
 from django.conf import settings
 from django.db.models import Q, Sum # Import Sum
-from .models import ReservaServicio
+from .models import ReservaServicio, hora_a_minutos
 import os
 
 def crear_evento_calendar(reserva):
@@ -48,15 +48,16 @@ def verificar_disponibilidad(servicio, fecha_propuesta, hora_propuesta, cantidad
         True si el slot está disponible, False en caso contrario.
     """
     try:
-        # Convert hora_propuesta string 'HH:MM' to time object for comparison if needed,
-        # but the model field is CharField, so keep it as string for filtering.
+        # Se compara en minutos desde la medianoche ('16:00' == '16:00:00' == 960):
+        # la grilla y hora_inicio no siempre usan el mismo formato de string.
         hora_propuesta_str = str(hora_propuesta) # Ensure it's a string
+        minuto_propuesto = hora_a_minutos(hora_propuesta)
 
         # 1. Verificar si el slot está definido para el día de la semana
         day_name = fecha_propuesta.strftime('%A').lower()
         slots_config = servicio.slots_disponibles if isinstance(servicio.slots_disponibles, dict) else {}
         slots_for_day = slots_config.get(day_name, [])
-        if hora_propuesta_str not in slots_for_day:
+        if minuto_propuesto is None or minuto_propuesto not in {hora_a_minutos(s) for s in slots_for_day}:
             print(f"DEBUG: Slot {hora_propuesta_str} no definido en {slots_for_day} para {day_name}")
             return False # Slot no definido para este día
 
@@ -64,7 +65,7 @@ def verificar_disponibilidad(servicio, fecha_propuesta, hora_propuesta, cantidad
         query = ReservaServicio.objects.filter(
             servicio=servicio,
             fecha_agendamiento=fecha_propuesta,
-            hora_inicio=hora_propuesta_str # Filter using the string time
+            minuto_inicio=minuto_propuesto,
         )
 
         # Exclude the current instance if we are editing it
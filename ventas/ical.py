@@ -27,10 +27,16 @@ Límite honesto, para que quede escrito donde se lea: iCal tiene latencia. Las
 OTAs releen el calendario cada varios minutos u horas y ese reloj no lo
 controlamos. La ventana de doble venta se achica mucho, pero no es cero. Sin
 latencia solo se llega con un channel manager certificado, que es otra liga.
+
+Booking y Airbnb leen la URL seguido y casi siempre no cambió nada: el .ics ya
+armado vive en la caché compartida (dominio 'ical', un ámbito por cabaña) y
+solo se regenera cuando cambia una reserva, un bloqueo o la cabaña misma
+(`ventas/signals/cache_signals.py`). `feed_cacheado` devuelve además el ETag.
 """
+import hashlib
 from datetime import timedelta
 
-from ventas.models import ReservaServicio, ServicioBloqueo
+from ventas.models import VENTA_CANCELADA, ReservaServicio, ServicioBloqueo
 from ventas.views.agenda_operativa_view import filtro_alojamiento
 
 # RFC 5545: las líneas se pliegan a 75 octetos. Los nombres de cabaña de Aremko
@@ -75,7 +81,7 @@ def tramos_ocupados(servicio_id, desde=None):
              # Adicional»: devolvería fechas ocupadas que no son de una cabaña.
              .filter(servicio_id=servicio_id, venta_reserva__isnull=False,
                      **filtro_alojamiento())
-             .exclude(venta_reserva__estado_reserva='cancelada')
+             .exclude(VENTA_CANCELADA)
              .select_related('venta_reserva'))
     if desde:
         filas = filas.filter(fecha_agendamiento__gte=desde)
@@ -162,3 +168,24 @@ def construir_ics(nombre_cabana, tramos, ahora=None):
         ]
     lineas.append('END:VCALENDAR')
     return '\r\n'.join(_plegar(l) for l in lineas) + '\r\n'
+
+
+def feed_cacheado(servicio_id, nombre_cabana, desde):
+    """{'cuerpo', 'etag', 'tramos'} del .ics de una cabaña desde `desde`.
+
+    Sale de la caché mientras nada de ESA cabaña cambie; `desde` va en la clave,
+    así que el corte de una semana atrás avanza solo al cambiar el día.
+    """
+    from ventas.services.cache_service import cache_ns
+
+    def _generar():
+        tramos = tramos_ocupados(servicio_id, desde=desde)
+        cuerpo = construir_ics(nombre_cabana, tramos)
+        # El ETag no mira DTSTAMP: regenerar sin cambios reales da el mismo ETag
+        # y la OTA sigue recibiendo 304.
+        huella = hashlib.md5(repr((nombre_cabana, tramos)).encode('utf-8')).hexdigest()
+        return {'cuerpo': cuerpo, 'etag': f'"{huella}"', 'tramos': len(tramos)}
+
+    return cache_ns('ical', ambito=servicio_id).get_or_set(
+        f'feed:{desde.isoformat()}', _generar)
+
@@ -1,11 +1,12 @@
-"""Marca como 'expirado' las PendingReservation que excedieron su TTL sin confirmacion.
+"""Marca como 'expirado' las PendingReservation que excedieron su TTL sin confirmacion
+y borra las RetencionSlot vencidas (ya no cuentan como ocupadas; solo ocupan filas).
 
 Se ejecuta como Render Cron Job (recomendado cada 30 min).
 """
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from ventas.models import PendingReservation
+from ventas.models import PendingReservation, RetencionSlot
 
 
 class Command(BaseCommand):
@@ -29,6 +30,10 @@ class Command(BaseCommand):
                 self.stdout.write(f'  - #{p.id} {p.cliente.nombre} ${p.monto:,} (creado {p.created_at})')
             return
 
+        retenciones, _ = RetencionSlot.objects.filter(expires_at__lt=ahora).delete()
+        if retenciones:
+            self.stdout.write(f'{retenciones} slots retenidos vencidos borrados.')
+
         if count == 0:
             self.stdout.write('No hay pendings expirados.')
             return
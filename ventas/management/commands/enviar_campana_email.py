@@ -1,18 +1,29 @@
 # -*- coding: utf-8 -*-
 """
 Comando para enviar campañas de email de forma controlada y segura
+
+El envío real pasa por `ventas.services.envio_email_service`: destinatarios
+reclamados por lote (pending → sending) antes de enviar, una conexión por
+lote, supresión precargada, logs en bloque y un token bucket que reparte
+`batch_size` emails cada `interval` minutos en vez de dormir entre lotes.
 """
 
-import time
 import logging
-from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 
 from ventas.models import EmailCampaign, EmailRecipient, EmailDeliveryLog
+from ventas.services.envio_email_service import (
+    Enviador,
+    LimitadorTasa,
+    ListaSupresion,
+    liberar_colgados,
+    reclamar,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -154,6 +165,17 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f'⏰ Campaña fuera de horario ({start_time}-{end_time}). Saltando.'))
             return
         
+        # Lo que una corrida caída dejó en 'sending' sin confirmar pasa a
+        # 'failed' (pudo haber salido: no se reenvía) para que la campaña cierre.
+        released = 0
+        if not dry_run:
+            released = liberar_colgados(
+                EmailRecipient.objects.filter(campaign=campaign), 'status', 'sending', 'failed',
+                'claimed_at', error_message='Sin confirmar: la corrida que lo reclamó se cortó')
+            if released:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ {released} destinatarios colgados en "sending" pasan a "failed" (revisar a mano)'))
+
         # Obtener destinatarios pendientes
         pending_recipients = EmailRecipient.objects.filter(
             campaign=campaign,
@@ -164,113 +186,212 @@ class Command(BaseCommand):
         total_pending = pending_recipients.count()
         if total_pending == 0:
             self.stdout.write(self.style.WARNING(f'⚠️ No hay destinatarios pendientes para campaña {campaign.id}'))
+            if released:
+                self.update_final_status(campaign)
             return
         
         self.stdout.write(f'📊 Destinatarios pendientes: {total_pending}')
         
-        # Cambiar estado de campaña a 'sending'
-        if not dry_run:
+        if dry_run:
+            processed = self.simulate_batches(pending_recipients, campaign_batch_size, single_batch)
+        else:
+            # Cambiar estado de campaña a 'sending'
             campaign.status = 'sending'
             campaign.save()
+            processed = self.send_batches(campaign, campaign_batch_size, campaign_interval, single_batch)
         
-        # Procesar en lotes
+        # Actualizar estado final de la campaña
+        if not dry_run:
+            self.update_final_status(campaign)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Procesados {processed} emails de la campaña {campaign.name}'))
+
+    def update_final_status(self, campaign):
+        """completed si salió todo, paused si algo falló; nada mientras haya
+        pendientes o destinatarios en curso."""
+        # Verificar recipients pendientes
+        remaining = EmailRecipient.objects.filter(
+            campaign=campaign,
+            send_enabled=True,
+            status='pending'
+        ).count()
+
+        # Reclamados y sin confirmar: otra corrida enviando ahora, o una que
+        # se cayó a mitad de lote (liberar_colgados los pasa a 'failed' al
+        # vencer el reclamo).
+        in_flight = EmailRecipient.objects.filter(
+            campaign=campaign,
+            send_enabled=True,
+            status='sending'
+        ).count()
+
+        # Verificar total de destinatarios habilitados
+        total_enabled = EmailRecipient.objects.filter(
+            campaign=campaign,
+            send_enabled=True
+        ).count()
+
+        # Verificar emails exitosamente enviados
+        successfully_sent = EmailRecipient.objects.filter(
+            campaign=campaign,
+            send_enabled=True,
+            status__in=['sent', 'delivered', 'opened', 'clicked']
+        ).count()
+
+        # Solo marcar como completada si TODOS los habilitados fueron enviados exitosamente
+        # update_fields: emails_sent lo suma send_batches con F() en la base
+        if in_flight:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {in_flight} destinatarios en estado "sending" sin confirmar: no se '
+                f'reenvían. Si ninguna corrida está activa, pasan a "failed" al vencer el reclamo.'
+            ))
+        elif remaining == 0 and successfully_sent == total_enabled:
+            campaign.status = 'completed'
+            campaign.save(update_fields=['status', 'updated_at'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Campaña {campaign.name} completada: {successfully_sent}/{total_enabled} emails enviados'
+            ))
+        elif remaining == 0 and successfully_sent < total_enabled:
+            # Hay algunos que fallaron - marcar como pausada para revisión
+            campaign.status = 'paused'
+            campaign.save(update_fields=['status', 'updated_at'])
+            failed_count = total_enabled - successfully_sent
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ Campaña {campaign.name} pausada: {failed_count} emails fallaron. '
+                f'Enviados exitosamente: {successfully_sent}/{total_enabled}'
+            ))
+        else:
+            self.stdout.write(f'📊 Quedan {remaining} destinatarios pendientes')
+
+    def simulate_batches(self, pending_recipients, batch_size, single_batch):
+        """Dry-run: compone los mensajes de cada lote sin reclamar ni enviar."""
         processed = 0
-        for i in range(0, total_pending, campaign_batch_size):
-            batch = pending_recipients[i:i + campaign_batch_size]
-            
-            self.stdout.write(f'\n📤 Enviando lote {i//campaign_batch_size + 1}: {len(batch)} emails')
-            
+        total = pending_recipients.count()
+        for i in range(0, total, batch_size):
+            batch = list(pending_recipients[i:i + batch_size])
+            self.stdout.write(f'\n📤 Simulando lote {i // batch_size + 1}: {len(batch)} emails')
             for recipient in batch:
-                try:
-                    # Exclusión al ENVIAR (no al crear la campaña): respeta las
-                    # bajas y la blacklist ocurridas DESPUÉS de armar los lotes.
-                    if not dry_run and self._esta_excluido(recipient.email):
-                        recipient.status = 'excluded'
-                        recipient.error_message = 'Excluido: desuscrito o en lista negra'
-                        recipient.save()
-                        self.stdout.write(f'🚫 Excluido (baja/blacklist): {recipient.email}')
-                        continue
-                    if self.send_email(recipient, dry_run):
-                        processed += 1
-                        if not dry_run:
-                            recipient.mark_as_sent()
-                    
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f'❌ Error enviando a {recipient.email}: {e}'))
-                    if not dry_run:
-                        recipient.status = 'failed'
-                        recipient.error_message = str(e)
-                        recipient.save()
-            
+                _, final_subject, _, ai_used = self.compose_email(recipient)
+                indicator = "🤖" if ai_used else "📧"
+                self.stdout.write(f'{indicator} [DRY-RUN] {recipient.email}: {final_subject[:50]}...')
+                processed += 1
+            if single_batch:
+                break
+        return processed
+
+    def send_batches(self, campaign, batch_size, interval_minutes, single_batch):
+        """Reclama y envía lotes hasta vaciar los pendientes (o uno solo con
+        --single-batch). El ritmo lo pone el limitador: `batch_size` emails
+        cada `interval_minutes`, con el primer lote de inmediato."""
+        limitador = LimitadorTasa(
+            por_minuto=batch_size / interval_minutes if interval_minutes else None,
+            rafaga=batch_size,
+        )
+        enviador = Enviador(limitador)
+        supresion = ListaSupresion.cargar()
+        candidatos = EmailRecipient.objects.filter(
+            campaign=campaign, send_enabled=True,
+        ).order_by('priority', 'id')
+
+        processed = 0
+        numero = 0
+        while True:
+            batch = reclamar(candidatos, 'status', 'pending', 'sending', batch_size, marca='claimed_at')
+            if not batch:
+                break
+            numero += 1
+            if supresion.vencida():
+                supresion = ListaSupresion.cargar()
+            self.stdout.write(f'\n📤 Enviando lote {numero}: {len(batch)} emails')
+            processed += self.send_batch(campaign, batch, supresion, enviador)
+            if enviador.sin_conexion:
+                self.stdout.write(self.style.ERROR(
+                    '\n❌ Sin conexión con el servidor de email: se corta la corrida. '
+                    'Lo que no se alcanzó a enviar vuelve a pendiente para la próxima.'))
+                break
+
             # Modo --single-batch: procesa solo este lote y sale
             if single_batch:
                 self.stdout.write(self.style.SUCCESS(f'\n✅ Lote completado en modo --single-batch. {len(batch)} emails procesados. Saliendo.'))
                 self.stdout.write(f'💡 Próxima ejecución del cron procesará el siguiente lote.')
                 break
+        return processed
 
-            # Pausa entre lotes (excepto el último)
-            if i + campaign_batch_size < total_pending:
-                self.stdout.write(f'⏸️ Pausa de {campaign_interval} minutos...')
-                if not dry_run:
-                    time.sleep(campaign_interval * 60)
-        
-        # Actualizar estado final de la campaña
-        if not dry_run:
-            # Verificar recipients pendientes
-            remaining = EmailRecipient.objects.filter(
-                campaign=campaign,
-                send_enabled=True,
-                status='pending'
-            ).count()
-
-            # Verificar total de destinatarios habilitados
-            total_enabled = EmailRecipient.objects.filter(
-                campaign=campaign,
-                send_enabled=True
-            ).count()
-
-            # Verificar emails exitosamente enviados
-            successfully_sent = EmailRecipient.objects.filter(
-                campaign=campaign,
-                send_enabled=True,
-                status__in=['sent', 'delivered', 'opened', 'clicked']
-            ).count()
-
-            # Solo marcar como completada si TODOS los habilitados fueron enviados exitosamente
-            if remaining == 0 and successfully_sent == total_enabled:
-                campaign.status = 'completed'
-                campaign.save()
-                self.stdout.write(self.style.SUCCESS(
-                    f'✅ Campaña {campaign.name} completada: {successfully_sent}/{total_enabled} emails enviados'
-                ))
-            elif remaining == 0 and successfully_sent < total_enabled:
-                # Hay algunos que fallaron - marcar como pausada para revisión
-                campaign.status = 'paused'
-                campaign.save()
-                failed_count = total_enabled - successfully_sent
-                self.stdout.write(self.style.WARNING(
-                    f'⚠️ Campaña {campaign.name} pausada: {failed_count} emails fallaron. '
-                    f'Enviados exitosamente: {successfully_sent}/{total_enabled}'
+    def send_batch(self, campaign, batch, supresion, enviador):
+        """Envía un lote ya reclamado y escribe su resultado en bloque.
+
+        Devuelve cuántos se enviaron. Un fallo de envío deja al destinatario
+        en 'failed' (no vuelve a 'pending'): reintentar es decisión manual. Lo
+        que no se llegó a intentar (sin conexión) sí vuelve a 'pending'.
+        """
+        now = timezone.now()
+        to_send = []
+        messages = []
+        for recipient in batch:
+            recipient.campaign = campaign
+            # Exclusión al ENVIAR (no al crear la campaña): respeta las
+            # bajas y la blacklist ocurridas DESPUÉS de armar los lotes.
+            if supresion.excluye(recipient.email):
+                recipient.status = 'excluded'
+                recipient.error_message = 'Excluido: desuscrito o en lista negra'
+                self.stdout.write(f'🚫 Excluido (baja/blacklist): {recipient.email}')
+                continue
+            try:
+                message, final_subject, final_body, ai_used = self.compose_email(recipient)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Error enviando a {recipient.email}: {e}'))
+                recipient.status = 'failed'
+                recipient.error_message = str(e)
+                continue
+            to_send.append((recipient, final_subject, final_body, ai_used))
+            messages.append(message)
+
+        logs = []
+        sent = 0
+        for (recipient, final_subject, final_body, ai_used), result in zip(
+                to_send, enviador.enviar(messages)):
+            if not result.intentado:
+                recipient.status = 'pending'
+                recipient.error_message = result.error
+            elif result.ok:
+                sent += 1
+                indicator = "🤖✅" if ai_used else "📧✅"
+                self.stdout.write(f'{indicator} {recipient.email}')
+                # Contenido enviado queda en el recipient
+                recipient.status = 'sent'
+                recipient.sent_at = now
+                recipient.personalized_subject = final_subject
+                recipient.personalized_body = final_body
+                logs.append(EmailDeliveryLog(
+                    recipient=recipient, campaign=campaign, log_type='send_attempt',
+                    smtp_response=f'Email sent successfully (AI: {ai_used})',
+                    server_response_time=result.ms,
                 ))
             else:
-                self.stdout.write(f'📊 Quedan {remaining} destinatarios pendientes')
-        
-        self.stdout.write(self.style.SUCCESS(f'✅ Procesados {processed} emails de la campaña {campaign.name}'))
+                self.stdout.write(f'❌ {recipient.email} - Error: {result.error}')
+                recipient.status = 'failed'
+                recipient.error_message = result.error
+                logs.append(EmailDeliveryLog(
+                    recipient=recipient, campaign=campaign, log_type='delivery_failure',
+                    error_message=result.error, server_response_time=result.ms,
+                ))
 
-    def _esta_excluido(self, email):
-        """True si el email se dio de baja (NewsletterSubscriber inactivo) o está
-        en EmailBlacklist activa. Se chequea por cada envío para respetar las
-        bajas que llegan entre lote y lote."""
-        from ventas.models import EmailBlacklist, NewsletterSubscriber
-        email = (email or '').strip().lower()
-        if not email:
-            return True
-        if EmailBlacklist.objects.filter(email__iexact=email, is_active=True).exists():
-            return True
-        return NewsletterSubscriber.objects.filter(email__iexact=email, is_active=False).exists()
-
-    def send_email(self, recipient, dry_run=False):
-        """Envía un email individual con IA en tiempo real"""
+        with transaction.atomic():
+            EmailRecipient.objects.bulk_update(batch, [
+                'status', 'sent_at', 'personalized_subject', 'personalized_body', 'error_message',
+            ])
+            EmailDeliveryLog.objects.bulk_create(logs)
+            if sent:
+                EmailCampaign.objects.filter(pk=campaign.pk).update(
+                    emails_sent=F('emails_sent') + sent)
+        return sent
+
+    def compose_email(self, recipient):
+        """Arma el email de un destinatario con IA en tiempo real.
+
+        Returns:
+            (EmailMultiAlternatives, asunto final, cuerpo final, ai_used)
+        """
         
         # NUEVA ARQUITECTURA: Generar variaciones únicas con IA en tiempo real
         from ventas.services.ai_service import ai_service
@@ -310,72 +431,29 @@ class Command(BaseCommand):
             final_body = recipient.personalized_body.replace('{nombre_cliente}', recipient.name)
             ai_used = False
         
-        if dry_run:
-            indicator = "🤖" if ai_used else "📧"
-            self.stdout.write(f'{indicator} [DRY-RUN] {recipient.email}: {final_subject[:50]}...')
-            return True
-        
-        try:
-            # Agregar footer con link de unsubscribe
-            from ventas.utils.email_footer import get_email_footer_html
-            final_body_with_footer = final_body + get_email_footer_html(recipient.email)
-
-            # Crear email con contenido final
-            # List-Unsubscribe one-click: requisito Gmail/Yahoo para remitentes
-            # masivos; el botón "Desuscribirse" del cliente de correo evita que
-            # el usuario marque Spam. El POST lo atiende unsubscribe_view.
-            unsubscribe_url = f"https://www.aremko.cl/unsubscribe/{recipient.email}/"
-            msg = EmailMultiAlternatives(
-                subject=final_subject,
-                body=final_body,  # Fallback text sin HTML
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[recipient.email],
-                headers={
-                    'List-Unsubscribe': f'<{unsubscribe_url}>, <mailto:ventas@aremko.cl?subject=unsubscribe>',
-                    'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
-                },
-            )
-
-            # Agregar contenido HTML con footer de unsubscribe
-            msg.attach_alternative(final_body_with_footer, "text/html")
-            
-            # Enviar
-            result = msg.send()
-            
-            if result:
-                indicator = "🤖✅" if ai_used else "📧✅"
-                self.stdout.write(f'{indicator} {recipient.email}')
-                
-                # Actualizar contenido enviado en el recipient
-                recipient.personalized_subject = final_subject
-                recipient.personalized_body = final_body
-                recipient.save()
-                
-                # Log de entrega
-                EmailDeliveryLog.objects.create(
-                    recipient=recipient,
-                    campaign=recipient.campaign,
-                    log_type='send_attempt',
-                    smtp_response=f'Email sent successfully (AI: {ai_used})'
-                )
-                
-                return True
-            else:
-                self.stdout.write(f'❌ {recipient.email} - Send failed')
-                return False
-                
-        except Exception as e:
-            self.stdout.write(f'❌ {recipient.email} - Error: {e}')
-            
-            # Log de error
-            EmailDeliveryLog.objects.create(
-                recipient=recipient,
-                campaign=recipient.campaign,
-                log_type='delivery_failure',
-                error_message=str(e)
-            )
-            
-            return False
+        # Agregar footer con link de unsubscribe
+        from ventas.utils.email_footer import get_email_footer_html
+        final_body_with_footer = final_body + get_email_footer_html(recipient.email)
+
+        # Crear email con contenido final
+        # List-Unsubscribe one-click: requisito Gmail/Yahoo para remitentes
+        # masivos; el botón "Desuscribirse" del cliente de correo evita que
+        # el usuario marque Spam. El POST lo atiende unsubscribe_view.
+        unsubscribe_url = f"https://www.aremko.cl/unsubscribe/{recipient.email}/"
+        msg = EmailMultiAlternatives(
+            subject=final_subject,
+            body=final_body,  # Fallback text sin HTML
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[recipient.email],
+            headers={
+                'List-Unsubscribe': f'<{unsubscribe_url}>, <mailto:ventas@aremko.cl?subject=unsubscribe>',
+                'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
+            },
+        )
+
+        # Agregar contenido HTML con footer de unsubscribe
+        msg.attach_alternative(final_body_with_footer, "text/html")
+        return msg, final_subject, final_body, ai_used
 
     def handle_exception(self, e):
         """Maneja excepciones del comando"""
@@ -2,7 +2,8 @@ from django.core.management.base import BaseCommand
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.utils import timezone
-from ventas.models import MailParaEnviar, Contact
+from ventas.models import MailParaEnviar
+from ventas.services.envio_email_service import Enviador, ListaSupresion, liberar_colgados, reclamar
 import zoneinfo
 
 
@@ -29,10 +30,14 @@ class Command(BaseCommand):
                 self.stdout.write(f"Fuera de horario de envío (8:00-18:00). Hora actual: {hour:02d}:{now_chile.minute:02d}")
                 return
 
-        # Buscar emails pendientes
-        emails_pendientes = MailParaEnviar.objects.filter(
-            estado='PENDIENTE'
-        ).order_by('prioridad', 'creado_en')[:batch_size]
+        # Reclamar pendientes (PENDIENTE → ENVIANDO) antes de enviar: si la
+        # corrida se cae, la próxima no los repite; vencido el reclamo, pasan
+        # a FALLIDO.
+        liberar_colgados(MailParaEnviar.objects.all(), 'estado', 'ENVIANDO', 'FALLIDO', 'reclamado_en')
+        emails_pendientes = reclamar(
+            MailParaEnviar.objects.order_by('prioridad', 'creado_en'),
+            'estado', 'PENDIENTE', 'ENVIANDO', batch_size, marca='reclamado_en',
+        )
 
         if not emails_pendientes:
             self.stdout.write("Sin emails pendientes para enviar.")
@@ -42,38 +47,54 @@ class Command(BaseCommand):
         failed_count = 0
         from_email = getattr(settings, 'EMAIL_HOST_USER', None) or getattr(settings, 'VENTAS_FROM_EMAIL', 'ventas@aremko.cl')
         reply_to = [getattr(settings, 'VENTAS_FROM_EMAIL', 'ventas@aremko.cl')]
+        supresion = ListaSupresion.cargar()
 
+        a_enviar = []
+        mensajes = []
         for mail_obj in emails_pendientes:
-            try:
-                # Personalización con nombre
-                contenido = mail_obj.contenido_html.replace('[Nombre]', mail_obj.nombre)
-                
-                # Crear email
-                email = EmailMultiAlternatives(
-                    subject=mail_obj.asunto,
-                    body=contenido,
-                    from_email=from_email,
-                    to=[mail_obj.email],
-                    reply_to=reply_to,
-                )
-                
-                # Adjuntar HTML
-                if '<' in contenido and '>' in contenido:
-                    email.attach_alternative(contenido, 'text/html')
-
-                # Enviar
-                email.send()
-                
-                # Marcar como enviado
-                mail_obj.marcar_como_enviado()
-                
+            if supresion.excluye(mail_obj.email):
+                mail_obj.estado = 'FALLIDO'
+                mail_obj.notas = (mail_obj.notas + '\n' if mail_obj.notas else '') + 'Excluido: desuscrito o en lista negra'
+                failed_count += 1
+                self.stdout.write(f"🚫 Excluido (baja/blacklist): {mail_obj.email}")
+                continue
+
+            # Personalización con nombre
+            contenido = mail_obj.contenido_html.replace('[Nombre]', mail_obj.nombre)
+
+            # Crear email
+            email = EmailMultiAlternatives(
+                subject=mail_obj.asunto,
+                body=contenido,
+                from_email=from_email,
+                to=[mail_obj.email],
+                reply_to=reply_to,
+            )
+
+            # Adjuntar HTML
+            if '<' in contenido and '>' in contenido:
+                email.attach_alternative(contenido, 'text/html')
+
+            a_enviar.append(mail_obj)
+            mensajes.append(email)
+
+        ahora = timezone.now()
+        for mail_obj, resultado in zip(a_enviar, Enviador().enviar(mensajes)):
+            if not resultado.intentado:
+                # Sin conexión: no salió, vuelve a la cola.
+                mail_obj.estado = 'PENDIENTE'
+                self.stderr.write(self.style.WARNING(f"Sin enviar (sin conexión): {mail_obj.email}"))
+            elif resultado.ok:
+                mail_obj.estado = 'ENVIADO'
+                mail_obj.enviado_en = ahora
                 sent_count += 1
                 self.stdout.write(self.style.SUCCESS(f"✅ Enviado a: {mail_obj.nombre} ({mail_obj.email})"))
-                
-            except Exception as e:
-                mail_obj.marcar_como_fallido()
+            else:
+                mail_obj.estado = 'FALLIDO'
                 failed_count += 1
-                self.stderr.write(self.style.ERROR(f"❌ Error enviando a {mail_obj.email}: {e}"))
+                self.stderr.write(self.style.ERROR(f"❌ Error enviando a {mail_obj.email}: {resultado.error}"))
+
+        MailParaEnviar.objects.bulk_update(emails_pendientes, ['estado', 'enviado_en', 'notas'])
 
         # Contar pendientes restantes
         pendientes_restantes = MailParaEnviar.objects.filter(estado='PENDIENTE').count()
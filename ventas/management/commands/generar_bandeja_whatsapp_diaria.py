@@ -36,14 +36,19 @@ Algoritmo:
        Descartar None (no califica).
     4. Ordenar por (prioridad ASC, gasto_total DESC).
     5. Tomar primeros --limit (default 50).
-    6. Para cada candidato:
-       a. Calcular salva = count(ContactoWhatsApp enviados al cliente) + 1
+    6. Precargar para TODOS los candidatos (precargar_bandeja): salvas
+       enviadas, Refugio reciente, último servicio principal y reservas
+       para el patrón día/hora, en pocas consultas agrupadas. Los scripts
+       activos se cargan una sola vez.
+    7. Para cada candidato (en memoria, sin DB):
+       a. salva = salvas enviadas al cliente + 1
        b. Saltar si salva > 3 (ya agotó las 3 salvas históricas)
        c. Buscar script en cascada de 5 niveles
        d. Si no hay script → loguear warning, saltar
        e. Renderizar mensaje con SafeDict (tolerante a placeholders faltantes)
-       f. Crear ContactoWhatsApp con snapshot completo
-    7. Reportar por consola: cuántos generados, por prioridad, warnings.
+       f. Armar ContactoWhatsApp con snapshot completo
+    8. Escribir todos los contactos con un bulk_create.
+    9. Reportar por consola: cuántos generados, por prioridad, warnings.
 
 Notas:
     - El cron `recalcular_taxonomia_clientes` debe correr ANTES (05:30) para
@@ -74,11 +79,12 @@ from ventas.models import (
     ScriptWhatsApp,
 )
 from ventas.services.bandeja_whatsapp_service import (
-    buscar_script_cascada,
     build_render_context,
     calcular_prioridad,
     califica_refugio,
-    buscar_script_refugio,
+    elegir_script,
+    precargar_bandeja,
+    script_id_refugio,
 )
 
 
@@ -506,6 +512,11 @@ class Command(BaseCommand):
     ) -> dict:
         """Para cada candidato resuelve script + render y crea ContactoWhatsApp.
 
+        Todo lo que depende del cliente se precarga en bloque antes del loop
+        (precargar_bandeja) y los contactos se escriben con un solo
+        bulk_create al final: las consultas no crecen con la cantidad de
+        candidatos.
+
         Args:
             ids_relleno: set de cliente_ids que entraron por fallback target.
                          Sus contactos quedan con es_relleno=True.
@@ -514,7 +525,9 @@ class Command(BaseCommand):
             dict con keys: 'creados', 'sin_script', 'agotados', 'por_prioridad',
             'sample' (lista de hasta 3 dicts para mostrar en stdout)
         """
-        scripts_qs = ScriptWhatsApp.objects.filter(activo=True)
+        # Orden del modelo (script_id): elegir_script toma el primero por nivel.
+        scripts = list(ScriptWhatsApp.objects.filter(activo=True))
+        scripts_por_id = {s.script_id: s for s in scripts}
         creados = 0
         sin_script = 0
         agotados = 0
@@ -530,19 +543,22 @@ class Command(BaseCommand):
             self._clientes_con_pendiente_hoy(fecha_obj) if not dry_run else set()
         )
 
+        # ---- Dedupe: cliente ya tiene pendiente del día ----
+        a_procesar = []
         for tax, prioridad in candidatos_priorizados:
-            cliente = tax.cliente
-
-            # ---- Dedupe: cliente ya tiene pendiente del día ----
-            if cliente.id in clientes_ya_en_bandeja:
+            if tax.cliente_id in clientes_ya_en_bandeja:
                 duplicados_arrastre += 1
-                continue
+            else:
+                a_procesar.append((tax, prioridad))
+
+        precarga = precargar_bandeja([tax.cliente_id for tax, _ in a_procesar], fecha_obj)
+        nuevos: List[ContactoWhatsApp] = []
+
+        for tax, prioridad in a_procesar:
+            cliente = tax.cliente
 
             # ---- Cuántas salvas ya recibió este cliente (en la vida) ----
-            salvas_previas = ContactoWhatsApp.objects.filter(
-                cliente_id=cliente.id, estado='enviado'
-            ).count()
-            salva = salvas_previas + 1
+            salva = precarga.salvas_enviadas.get(cliente.id, 0) + 1
 
             if salva > self.MAX_SALVAS:
                 agotados += 1
@@ -557,13 +573,13 @@ class Command(BaseCommand):
             # plantilla en VEZ de la cascada normal. Ver califica_refugio
             # en services/bandeja_whatsapp_service.py.
             script = None
-            if califica_refugio(cliente, tax.eje_valor, salva, hoy=fecha_obj):
-                script = buscar_script_refugio(cliente, tax.eje_valor)
+            if califica_refugio(cliente, tax.eje_valor, salva, hoy=fecha_obj, precarga=precarga):
+                script = scripts_por_id.get(script_id_refugio(cliente, tax.eje_valor))
 
             # ── Cascada normal (fallback si NO califica Refugio) ────
             if script is None:
-                script = buscar_script_cascada(
-                    scripts_qs,
+                script = elegir_script(
+                    scripts,
                     estado_valor=tax.eje_valor,
                     estilo=tax.eje_estilo,
                     contexto=tax.eje_contexto,
@@ -579,13 +595,13 @@ class Command(BaseCommand):
                 continue
 
             # ---- Renderizar mensaje ----
-            ctx = build_render_context(cliente, tax, fecha_obj)
+            ctx = build_render_context(cliente, tax, fecha_obj, precarga=precarga)
             mensaje = script.plantilla_texto.format_map(ctx)
 
             # ---- Persistir (o simular) ----
             es_relleno_flag = bool(ids_relleno) and cliente.id in ids_relleno
             if not dry_run:
-                ContactoWhatsApp.objects.create(
+                nuevos.append(ContactoWhatsApp(
                     cliente=cliente,
                     script=script,
                     eje_valor_snapshot=tax.eje_valor,
@@ -599,7 +615,7 @@ class Command(BaseCommand):
                     fecha_sugerido=fecha_obj,
                     estado='pendiente',
                     es_relleno=es_relleno_flag,
-                )
+                ))
 
             creados += 1
             por_prioridad[prioridad] += 1
@@ -621,6 +637,10 @@ class Command(BaseCommand):
                     'mensaje': mensaje,
                 })
 
+        if nuevos:
+            with transaction.atomic():
+                ContactoWhatsApp.objects.bulk_create(nuevos, batch_size=500)
+
         return {
             'creados': creados,
             'sin_script': sin_script,
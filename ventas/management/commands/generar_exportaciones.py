@@ -0,0 +1,34 @@
+"""
+Management command: genera las exportaciones encoladas (ExportacionArchivo)
+y borra las viejas.
+
+Los reportes que no conviene armar dentro de la petición (XLSX grandes, o
+cuando se pide `segundo_plano=1`) quedan pendientes; este comando escribe el
+archivo al storage y quedan para descargar en /ventas/exportaciones/.
+Ver ventas/services/exportacion_service.py.
+
+Uso:
+    python manage.py generar_exportaciones
+    python manage.py generar_exportaciones --limite 10 --purgar-dias 3
+"""
+from django.core.management.base import BaseCommand
+
+from ventas.services import exportacion_service
+
+
+class Command(BaseCommand):
+    help = 'Genera los archivos de las exportaciones pendientes y purga las antiguas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=5,
+                            help='Máximo de exportaciones a generar en esta corrida (default: 5)')
+        parser.add_argument('--purgar-dias', type=int, default=exportacion_service.DIAS_CONSERVACION,
+                            help='Borra las exportaciones de hace más de N días '
+                                 f'(default: {exportacion_service.DIAS_CONSERVACION})')
+
+    def handle(self, *args, **options):
+        listas, errores = exportacion_service.generar_pendientes(options['limite'])
+        purgadas = exportacion_service.purgar(options['purgar_dias'])
+        estilo = self.style.WARNING if errores else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"Exportaciones: {listas} generadas, {errores} con error, {purgadas} purgadas"))
@@ -0,0 +1,118 @@
+"""
+Management command: worker de la cola de trabajos en segundo plano (Trabajo).
+
+Toma trabajos con SELECT ... FOR UPDATE SKIP LOCKED (se pueden correr varios
+workers a la vez), respeta la concurrencia de cada cola y reintenta con
+backoff. Ver ventas/services/trabajos_service.py.
+
+Un worker corre un trabajo a la vez. Sin --colas, el comando es un
+supervisor: levanta un proceso hijo `--colas <cola>` por cada cupo de
+CONCURRENCIA (default ×2, avisos, campanas) y lo vuelve a levantar si muere
+(p. ej. cortado por tiempo máximo). Así una campaña de horas no frena las
+GiftCards de 'avisos' ni los crons de 'default'.
+
+En Render corre como Background Worker con el mismo Dockerfile (entrypoint.sh
+ejecuta los argumentos que reciba). Un SIGTERM (deploy) pasa a los hijos, que
+terminan el trabajo en curso y salen; si un proceso muere igual, deja de
+latir y `rescatar` devuelve su trabajo a la cola.
+
+Uso:
+    python manage.py procesar_trabajos                      # supervisor: un worker por cupo de cola
+    python manage.py procesar_trabajos --colas campanas     # un solo worker, solo esas colas
+    python manage.py procesar_trabajos --hasta-vaciar       # corre lo pendiente y sale (cron)
+"""
+import signal
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from ventas.services import trabajos_service
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de trabajos en segundo plano (campañas, crons, exportaciones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--colas', default='',
+                            help='Colas a atender, separadas por coma (default: todas)')
+        parser.add_argument('--espera', type=float, default=5,
+                            help='Segundos entre consultas cuando no hay trabajo (default: 5)')
+        parser.add_argument('--hasta-vaciar', action='store_true',
+                            help='Salir cuando no quede nada que correr ahora')
+        parser.add_argument('--max-trabajos', type=int, default=0,
+                            help='Salir después de N trabajos (0 = sin límite)')
+
+    def handle(self, *args, **options):
+        colas = [c.strip() for c in options['colas'].split(',') if c.strip()] or None
+        worker = trabajos_service.identificador_worker()
+        self._salir = False
+        anteriores = {s: signal.signal(s, self._pedir_salida) for s in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            if colas is None and not options['hasta_vaciar'] and not options['max_trabajos']:
+                self._supervisar(options)
+                return
+            hechos = self._procesar(colas, worker, options)
+        finally:
+            for senal, manejador in anteriores.items():
+                signal.signal(senal, manejador)
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker}: {hechos} trabajos procesados"))
+
+    def _lanzar(self, cola, options):
+        return subprocess.Popen([sys.executable, str(settings.BASE_DIR / 'manage.py'), 'procesar_trabajos',
+                                 '--colas', cola, '--espera', str(options['espera'])])
+
+    def _supervisar(self, options):
+        """Un hijo por cupo de cola; el que muere se vuelve a levantar."""
+        hijos = [(cola, self._lanzar(cola, options)) for cola in trabajos_service.workers_por_cola()]
+        self.stdout.write(f"Supervisor: {len(hijos)} workers ({', '.join(c for c, _ in hijos)})")
+        try:
+            while not self._salir:
+                for i, (cola, hijo) in enumerate(hijos):
+                    codigo = hijo.poll()
+                    if codigo is not None and not self._salir:
+                        self.stdout.write(f"Worker de '{cola}' (pid {hijo.pid}) salió con {codigo}: se relanza")
+                        hijos[i] = (cola, self._lanzar(cola, options))
+                time.sleep(options['espera'])
+        finally:
+            for _, hijo in hijos:
+                if hijo.poll() is None:
+                    hijo.send_signal(signal.SIGTERM)
+            for _, hijo in hijos:
+                hijo.wait()
+
+    def _procesar(self, colas, worker, options):
+        self.stdout.write(f"Worker {worker} atendiendo {', '.join(colas) if colas else 'todas las colas'}")
+        hechos = 0
+        ultimo_rescate = 0
+        while not self._salir:
+            # Proceso largo: soltar conexiones caídas o viejas como al final de
+            # una petición (dentro de un atomic, p. ej. en tests, no se tocan).
+            if not connection.in_atomic_block:
+                close_old_connections()
+            if time.monotonic() - ultimo_rescate > 60:
+                trabajos_service.rescatar()
+                ultimo_rescate = time.monotonic()
+
+            trabajo = trabajos_service.tomar(colas, worker)
+            if trabajo is None:
+                if options['hasta_vaciar']:
+                    break
+                time.sleep(options['espera'])
+                continue
+
+            inicio = time.monotonic()
+            estado = trabajos_service.ejecutar(trabajo)
+            hechos += 1
+            self.stdout.write(f"#{trabajo.pk} {trabajo.tarea} [{trabajo.cola}] → {estado} "
+                              f"en {time.monotonic() - inicio:.1f}s")
+            if options['max_trabajos'] and hechos >= options['max_trabajos']:
+                break
+        return hechos
+
+    def _pedir_salida(self, signum, frame):
+        self.stdout.write(f"Señal {signum}: se termina el trabajo en curso y se sale")
+        self._salir = True
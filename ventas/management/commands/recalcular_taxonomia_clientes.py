@@ -17,6 +17,10 @@ Uso:
     # Modo dry-run (no escribe a DB, solo reporta):
     python manage.py recalcular_taxonomia_clientes --dry-run
 
+    # Incremental (cron cada 5 minutos): solo los clientes encolados en
+    # TaxonomiaPendiente, más las 500 taxonomías calculadas antes de hoy:
+    python manage.py recalcular_taxonomia_clientes --pendientes --vencidas 500
+
 Diseño:
 - Reutiliza las funciones classifier del comando exploratorio
   `analyze_customer_taxonomy` (v4) para garantizar consistencia.
@@ -26,6 +30,14 @@ Diseño:
   eficiencia: ~14K clientes se procesan en <60 segundos.
 - statement_timeout 60s (en lugar de 8s) porque es un job batch que
   legítimamente puede tardar más que las queries de dashboard.
+- Con un filtro de clientes (--solo-modificados-desde, --pendientes) TODAS las
+  queries van acotadas a esos clientes: el costo es por cliente tocado, no por
+  la ventana completa.
+- --pendientes vacía la cola que llenan las señales de reservas (ver
+  ventas/services/taxonomia_pendiente_service.py) en lotes de --batch-size,
+  así que la memoria queda acotada al lote. Con --vencidas N, además, refresca
+  las N taxonomías más viejas (días sin venir, antigüedad y la ventana cambian
+  solos con el calendario): no hace falta la corrida completa nocturna.
 """
 
 from __future__ import annotations
@@ -127,6 +139,20 @@ class Command(BaseCommand):
             '--dry-run', action='store_true',
             help='No escribe a DB. Solo reporta qué pasaría.',
         )
+        parser.add_argument(
+            '--pendientes', action='store_true',
+            help=(
+                'Solo recalcula los clientes encolados en TaxonomiaPendiente '
+                '(reservas que cambiaron), por lotes de --batch-size.'
+            ),
+        )
+        parser.add_argument(
+            '--vencidas', type=int, default=0,
+            help=(
+                'Con --pendientes: encola antes hasta N clientes con la '
+                'taxonomía calculada antes de hoy (paso del tiempo).'
+            ),
+        )
         parser.add_argument(
             '--batch-size', type=int, default=500,
             help='Tamaño de batch para bulk_create/bulk_update (default 500).',
@@ -162,12 +188,16 @@ class Command(BaseCommand):
         evento_origen = opts['evento_origen']
 
         today = timezone.now().date()
-        # periodo_start = primer día del mes "hace 23 meses".
-        total_meses_atras = (today.year * 12 + (today.month - 1)) - (self.MESES_VENTANA - 1)
-        first_y = total_meses_atras // 12
-        first_m = (total_meses_atras % 12) + 1
-        periodo_start = date(first_y, first_m, 1)
-        periodo_stop = today
+        periodo_start, periodo_stop = self._periodo(today)
+
+        if opts['pendientes']:
+            if dry_run or modificados_desde_str:
+                raise CommandError("--pendientes no se combina con --dry-run ni --solo-modificados-desde.")
+            self._procesar_pendientes(
+                today=today, batch_size=batch_size, vencidas=opts['vencidas'],
+                registrar_movimientos=registrar_movimientos, t0=t0,
+            )
+            return
 
         self.stdout.write(self.style.NOTICE(
             f"Período sistema actual: {periodo_start} → {periodo_stop} "
@@ -255,6 +285,72 @@ class Command(BaseCommand):
                 ))
             self._print_distribution(features)
 
+    @classmethod
+    def _periodo(cls, today: date) -> Tuple[date, date]:
+        """Ventana del sistema actual: desde el primer día del mes "hace
+        MESES_VENTANA - 1 meses" hasta hoy."""
+        total_meses_atras = (today.year * 12 + (today.month - 1)) - (cls.MESES_VENTANA - 1)
+        first_y = total_meses_atras // 12
+        first_m = (total_meses_atras % 12) + 1
+        return date(first_y, first_m, 1), today
+
+    # -----------------------------------------------------------------------
+    # Modo incremental: la cola TaxonomiaPendiente, lote a lote
+    # -----------------------------------------------------------------------
+    def _procesar_pendientes(self, *, today: date, batch_size: int, vencidas: int,
+                             registrar_movimientos: bool, t0: float):
+        from ventas.models import TaxonomiaPendiente
+        from ventas.services.taxonomia_pendiente_service import (
+            confirmar, encolar_vencidas, tomar,
+        )
+
+        periodo_start, periodo_stop = self._periodo(today)
+        encoladas = encolar_vencidas(vencidas)
+        # Solo lo marcado hasta ahora: lo que se marque mientras corre queda
+        # para la próxima, así la corrida siempre termina.
+        hasta = timezone.now()
+        totales = Counter()
+        while True:
+            tomados = tomar(batch_size, hasta)
+            if not tomados:
+                break
+            corte = timezone.now()
+            motivos = dict(tomados)
+            with transaction.atomic():
+                features, _ = self._build_features(
+                    periodo_start=periodo_start, periodo_stop=periodo_stop,
+                    today=today, cliente_ids_filtro=set(motivos),
+                )
+                for f in features.values():
+                    f['eje_valor'] = _classify_eje_valor(f)
+                    f['eje_estilo'] = _classify_eje_estilo(f)
+                    f['eje_contexto'] = _classify_eje_contexto(f)
+                # El motivo de la cola es el evento_origen de los movimientos.
+                for motivo in (TaxonomiaPendiente.MOTIVO_RESERVA, TaxonomiaPendiente.MOTIVO_PASO_TIEMPO):
+                    grupo = {cid: f for cid, f in features.items() if motivos[cid] == motivo}
+                    if grupo:
+                        totales.update(self._persist(
+                            grupo, batch_size=batch_size,
+                            registrar_movimientos=registrar_movimientos,
+                            evento_origen=motivo,
+                        ))
+                # Recalculados aunque no cambien: que el refresco por paso del
+                # tiempo no los vuelva a tomar hoy.
+                ClienteTaxonomia.objects.filter(cliente_id__in=list(motivos)).update(calculado_en=corte)
+                confirmar(list(motivos), corte)
+            totales['procesados'] += len(motivos)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"OK pendientes: {totales['procesados']:,} clientes ({encoladas:,} por paso del tiempo): "
+            f"{totales['created']:,} creados, {totales['updated']:,} actualizados, "
+            f"{totales['unchanged']:,} sin cambios. Tiempo: {time.time() - t0:.1f}s"
+        ))
+        if registrar_movimientos:
+            self.stdout.write(self.style.NOTICE(
+                f"Bitácora viva: {totales['movimientos_creados']:,} movimientos, "
+                f"{totales['celebraciones_creadas']:,} celebraciones"
+            ))
+
     # -----------------------------------------------------------------------
     # Construcción de features por cliente (dates como `date`, no strings).
     # Misma lógica del comando exploratorio v4 pero adaptada para persistencia.
@@ -268,18 +364,26 @@ class Command(BaseCommand):
         cliente_ids_filtro: Optional[Set[int]] = None,
     ) -> Tuple[Dict[int, dict], dict]:
 
+        # Con filtro, cada query va acotada a esos clientes (índice por cliente).
+        de_los_clientes = {}
+        if cliente_ids_filtro is not None:
+            de_los_clientes = {'cliente_id__in': cliente_ids_filtro}
+
         # 1) Clientes con VentaReserva no cancelada en período
         ventas_qs = VentaReserva.objects.filter(
             fecha_creacion__date__gte=periodo_start,
             fecha_creacion__date__lte=periodo_stop,
+            **de_los_clientes,
         ).exclude(estado_pago='cancelado').values('cliente_id')
         cliente_ids_sistema = {v['cliente_id'] for v in ventas_qs if v['cliente_id']}
 
-        # 2) Clientes con ServiceHistory
-        sh_agg = ServiceHistory.objects.values('cliente_id').annotate(
+        # 2) Clientes con ServiceHistory (la tabla no la crea Django: en un
+        # entorno sin la importación no hay historial)
+        from ventas.services.metricas_cliente_service import hay_historial
+        sh_agg = ServiceHistory.objects.filter(**de_los_clientes).values('cliente_id').annotate(
             count=Count('id'),
             primera=Min('service_date'),
-        )
+        ) if hay_historial() else []
         sh_by_cliente: Dict[int, dict] = {
             row['cliente_id']: {
                 'count': row['count'],
@@ -308,7 +412,8 @@ class Command(BaseCommand):
         if servicios_romanticos_ids:
             cliente_ids_romanticos = set(
                 ReservaServicio.objects
-                .filter(servicio_id__in=servicios_romanticos_ids)
+                .filter(servicio_id__in=servicios_romanticos_ids,
+                        **{f'venta_reserva__{k}': v for k, v in de_los_clientes.items()})
                 .exclude(venta_reserva__estado_pago='cancelado')
                 .values_list('venta_reserva__cliente_id', flat=True)
                 .distinct()
@@ -0,0 +1,48 @@
+"""
+Management command: rearma la tabla de hechos de ventas (HechoVentaDiaria).
+
+Las señales la mantienen al día (ver ventas/services/hechos_ventas_service.py);
+este comando la llena por primera vez después de migrar y corrige lo que haya
+cambiado sin pasar por señales (`.update()`, backfills, SQL a mano).
+
+Uso:
+    python manage.py reconstruir_hechos_ventas                     # toda la historia
+    python manage.py reconstruir_hechos_ventas --dias 60           # últimos 60 días (y 60 hacia adelante)
+    python manage.py reconstruir_hechos_ventas --desde 2025-01-01 --hasta 2025-12-31
+"""
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ventas.services.hechos_ventas_service import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Rearma la tabla de hechos diaria que leen los dashboards de ventas y operativo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día (YYYY-MM-DD)')
+        parser.add_argument('--hasta', help='Último día (YYYY-MM-DD)')
+        parser.add_argument(
+            '--dias', type=int,
+            help='Solo los últimos N días y los N próximos (servicios ya agendados)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else None
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if options['dias']:
+            hoy = timezone.localdate()
+            desde, hasta = hoy - timedelta(days=options['dias']), hoy + timedelta(days=options['dias'])
+
+        inicio = time.monotonic()
+        filas = reconstruir(desde, hasta)
+        rango = f"{desde or 'inicio'} → {hasta or 'fin'}"
+        self.stdout.write(self.style.SUCCESS(
+            f"Hechos de ventas reconstruidos ({rango}): {filas:,} filas en "
+            f"{time.monotonic() - inicio:.1f}s"))
@@ -0,0 +1,28 @@
+"""
+Management command: rearma las métricas por cliente de la segmentación
+(MetricaCliente).
+
+Las señales las mantienen al día (ver ventas/services/metricas_cliente_service.py);
+este comando las llena por primera vez después de migrar y corrige lo que haya
+cambiado sin pasar por señales (`.update()`, la importación de
+crm_service_history, SQL a mano).
+
+Uso:
+    python manage.py reconstruir_metricas_clientes
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.services.metricas_cliente_service import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Rearma la tabla de métricas por cliente que lee la segmentación por gasto'
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        filas = reconstruir()
+        self.stdout.write(self.style.SUCCESS(
+            f"Métricas de clientes reconstruidas: {filas:,} teléfonos en "
+            f"{time.monotonic() - inicio:.1f}s"))
@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
+from django.utils import timezone
 from ventas.models import CommunicationLog, Contact
+from ventas.services.envio_email_service import Enviador, ListaSupresion, liberar_colgados, reclamar
 
 
 class Command(BaseCommand):
@@ -40,12 +42,15 @@ class Command(BaseCommand):
         msg_types = dict(CommunicationLog.MESSAGE_TYPES)
         promo_key = 'PROMOTIONAL' if 'PROMOTIONAL' in msg_types else 'PROMOCIONAL'
 
-        pending_logs = CommunicationLog.objects.filter(
+        pendientes = CommunicationLog.objects.filter(
             communication_type='EMAIL',
             message_type=promo_key,
-            status='PENDING'
-        ).order_by('created_at', 'id')[:batch_size]
+        ).order_by('created_at', 'id')
 
+        # Reclamados (PENDING → SENDING) antes de enviar: si la corrida se cae,
+        # la próxima no los repite; vencido el reclamo, pasan a FAILED.
+        liberar_colgados(pendientes, 'status', 'SENDING', 'FAILED', 'updated_at')
+        pending_logs = reclamar(pendientes, 'status', 'PENDING', 'SENDING', batch_size, marca='updated_at')
         if not pending_logs:
             self.stdout.write("Sin pendientes.")
             return
@@ -55,54 +60,77 @@ class Command(BaseCommand):
         from_email = getattr(settings, 'EMAIL_HOST_USER', None) or getattr(settings, 'VENTAS_FROM_EMAIL', 'ventas@aremko.cl')
         reply_to = [getattr(settings, 'VENTAS_FROM_EMAIL', 'ventas@aremko.cl')]
 
+        # Una consulta para los nombres de todo el lote (antes: una por email)
+        contactos = {}
+        for contact in Contact.objects.filter(email__in=[log.destination for log in pending_logs]):
+            contactos.setdefault(contact.email, contact)
+        supresion = ListaSupresion.cargar()
+
+        a_enviar = []
+        mensajes = []
         for log in pending_logs:
-            try:
-                # Determinar asunto y contenido
-                if use_stored_content and log.subject and log.content:
-                    subject = log.subject
-                    body_template = log.content
-                else:
-                    subject = fallback_subject
-                    body_template = fallback_body
-
-                # Personalización básica
-                contact = Contact.objects.filter(email=log.destination).first()
-                nombre = (contact.first_name if contact and contact.first_name else '').strip()
-                body = body_template.replace('[Nombre]', nombre or 'Hola')
-
-                # Crear email
-                email = EmailMultiAlternatives(
-                    subject=subject,
-                    body=body,
-                    from_email=from_email,
-                    to=[log.destination],
-                    reply_to=reply_to,
-                )
-                
-                # Adjuntar HTML si corresponde
-                if '<' in body and '>' in body:
-                    email.attach_alternative(body, 'text/html')
-
-                # Enviar
-                email.send()
-                
+            # Determinar asunto y contenido
+            if use_stored_content and log.subject and log.content:
+                subject = log.subject
+                body_template = log.content
+            else:
+                subject = fallback_subject
+                body_template = fallback_body
+
+            if supresion.excluye(log.destination):
+                log.status = 'BLOCKED'
+                self.stdout.write(self.style.WARNING(f"Excluido (baja/blacklist): {log.destination}"))
+                continue
+
+            # Personalización básica
+            contact = contactos.get(log.destination)
+            nombre = (contact.first_name if contact and contact.first_name else '').strip()
+            body = body_template.replace('[Nombre]', nombre or 'Hola')
+
+            # Crear email
+            email = EmailMultiAlternatives(
+                subject=subject,
+                body=body,
+                from_email=from_email,
+                to=[log.destination],
+                reply_to=reply_to,
+            )
+
+            # Adjuntar HTML si corresponde
+            if '<' in body and '>' in body:
+                email.attach_alternative(body, 'text/html')
+
+            a_enviar.append((log, subject, body, body_template))
+            mensajes.append(email)
+
+        ahora = timezone.now()
+        for (log, subject, body, body_template), resultado in zip(
+                a_enviar, Enviador().enviar(mensajes)):
+            if not resultado.intentado:
+                # Sin conexión: no salió, vuelve a la cola.
+                log.status = 'PENDING'
+                self.stderr.write(self.style.WARNING(f"Sin enviar (sin conexión): {log.destination}"))
+            elif resultado.ok:
                 # Marcar como enviado
                 log.subject = subject
                 log.content = body
-                log.mark_as_sent()
-                
+                log.status = 'SENT'
+                log.sent_at = ahora
                 sent_count += 1
                 self.stdout.write(self.style.SUCCESS(f"Enviado a: {log.destination}"))
-                
-            except Exception as e:
+            else:
                 log.status = 'FAILED'
                 if not log.subject:
                     log.subject = subject
                 if not log.content:
                     log.content = body_template
-                log.save(update_fields=['status', 'content', 'subject'])
                 failed_count += 1
-                self.stderr.write(self.style.ERROR(f"Error enviando a {log.destination}: {e}"))
+                self.stderr.write(self.style.ERROR(f"Error enviando a {log.destination}: {resultado.error}"))
+
+        for log in pending_logs:
+            log.updated_at = ahora
+        CommunicationLog.objects.bulk_update(
+            pending_logs, ['status', 'subject', 'content', 'sent_at', 'updated_at'])
 
         # Actualizar progreso en cache
         from django.core.cache import cache
@@ -9,6 +9,11 @@ Primera vez en la Shell, sin escribir nada:
 
     python manage.py sincronizar_calendarios_ota --dry-run
 
+Si un feed no cambió desde el último espejo, esa cabaña no se reescribe. Para
+reconstruir todo igual (p. ej. si alguien borró a mano un bloqueo [OTA]):
+
+    python manage.py sincronizar_calendarios_ota --forzar
+
 La lógica vive en `ventas/ota_sync.py` (reglas: espejar-no-acumular, lectura
 fallida no toca nada, lo importado no se reexporta).
 """
@@ -24,9 +29,12 @@ class Command(BaseCommand):
         parser.add_argument(
             '--dry-run', action='store_true',
             help='Lee y muestra qué haría, sin escribir bloqueos.')
+        parser.add_argument(
+            '--forzar', action='store_true',
+            help='Reescribe los bloqueos aunque el feed no haya cambiado.')
 
     def handle(self, *args, **opts):
-        informes = sincronizar_todo(dry_run=opts['dry_run'])
+        informes = sincronizar_todo(dry_run=opts['dry_run'], forzar=opts['forzar'])
         if not informes:
             self.stdout.write('Sin calendarios activos con URL de OTA que leer.')
             return
@@ -0,0 +1,56 @@
+"""
+Middleware de perfilado: latencia, consultas y caché por nombre de URL.
+
+Se prende con PERFILADO_ACTIVO=true (env). Apagado, Django lo saca de la
+cadena al arrancar (MiddlewareNotUsed) y no cuesta nada. Las muestras y el
+tablero viven en ventas/services/perfilado_service.py.
+"""
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .services import perfilado_service
+
+
+class PerfiladoMiddleware:
+    """
+    Mide cada request (o una fracción, PERFILADO_MUESTREO) y deja la muestra en
+    el buffer circular. Agrega un header Server-Timing para verlo en el
+    navegador (pestaña Network → Timing).
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFILADO_ACTIVO', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.muestreo = getattr(settings, 'PERFILADO_MUESTREO', 1.0)
+
+    def __call__(self, request):
+        if self.muestreo < 1.0 and random.random() >= self.muestreo:
+            return self.get_response(request)
+
+        medicion, token = perfilado_service.iniciar()
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            perfilado_service.terminar(token)
+        ms = (time.perf_counter() - inicio) * 1000
+
+        # Por nombre de URL y no por path: /ventas/ical/<token>/… son todas la
+        # misma vista.
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            vista = '(sin resolver)'
+        else:
+            vista = match.view_name or f'(sin nombre) {request.path}'
+        perfilado_service.guardar_muestra(vista, request.method, response.status_code, ms, medicion)
+        response['Server-Timing'] = (f'total;dur={ms:.1f}, '
+                                     f'db;dur={medicion.ms_db:.1f};desc="{medicion.consultas} consultas"')
+        return response
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""`ReservaServicio.minuto_inicio`: la hora de inicio como entero canónico.
+
+`hora_inicio` es un CharField(5) y convive con '16:00', '9:00' y algún
+'16:00:00' truncado; un filtro `hora_inicio='16:00'` no ve las otras formas.
+La columna nueva guarda los minutos desde la medianoche (960) y la escribe
+`ReservaServicio.save()`; las consultas de disponibilidad pasan a filtrar por
+ella y por el índice (servicio, fecha_agendamiento, minuto_inicio).
+
+Aditiva y nullable: no hay ventana de corte. El backfill recorre la tabla por
+lotes de id y escribe con bulk_update (no dispara señales ni recalcula totales).
+Las filas cuya hora no se puede interpretar quedan en NULL, igual que antes no
+matcheaban ningún slot.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+LOTE = 2000
+
+
+def _minutos(valor):
+    # Copia de ventas.models.hora_a_minutos: las migraciones no importan el
+    # modelo actual (puede cambiar después de escrita la migración).
+    partes = str(valor or '').strip().split(':')
+    if len(partes) < 2 or not partes[0].isdigit() or not partes[1][:2].isdigit():
+        return None
+    horas, minutos = int(partes[0]), int(partes[1][:2])
+    if horas > 23 or minutos > 59:
+        return None
+    return horas * 60 + minutos
+
+
+def backfill_minuto_inicio(apps, schema_editor):
+    ReservaServicio = apps.get_model('ventas', 'ReservaServicio')
+    ultimo_id = 0
+    while True:
+        lote = list(ReservaServicio.objects.filter(id__gt=ultimo_id)
+                    .order_by('id').only('id', 'hora_inicio')[:LOTE])
+        if not lote:
+            break
+        for rs in lote:
+            rs.minuto_inicio = _minutos(rs.hora_inicio)
+        ReservaServicio.objects.bulk_update(lote, ['minuto_inicio'])
+        ultimo_id = lote[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0135_calendariocabana'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservaservicio',
+            name='minuto_inicio',
+            field=models.PositiveSmallIntegerField(
+                blank=True, editable=False, null=True,
+                help_text='Minutos desde la medianoche de hora_inicio (se calcula al guardar).'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaservicio',
+            index=models.Index(fields=['servicio', 'fecha_agendamiento', 'minuto_inicio'],
+                               name='reservaserv_slot_idx'),
+        ),
+        migrations.RunPython(backfill_minuto_inicio, migrations.RunPython.noop),
+    ]
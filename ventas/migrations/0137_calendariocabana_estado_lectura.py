@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""`CalendarioCabana.estado_lectura`: validadores del último feed espejado.
+
+`sincronizar_calendarios_ota` corre cada 15 minutos y el feed de Booking casi
+nunca cambia entre corridas. Con el ETag / Last-Modified (GET condicional) y el
+hash del cuerpo guardados por fuente, una cabaña cuyo feed no cambió no se
+vuelve a espejar (no se borran ni recrean sus bloqueos [OTA]).
+
+Aditiva, con default {}: la primera corrida tras el deploy espeja todo como
+siempre y deja el estado escrito.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0136_reservaservicio_minuto_inicio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendariocabana',
+            name='estado_lectura',
+            field=models.JSONField(
+                blank=True, default=dict, editable=False,
+                help_text='ETag, Last-Modified y hash del último feed espejado, '
+                          'por fuente. Si la OTA no cambió nada, no se '
+                          'reescriben bloqueos.'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Estado "en curso" para los envíos de email por goteo.
+
+`send_next_campaign_drip` y `enviar_emails_programados` reclaman su lote antes
+de enviar (CommunicationLog PENDING → SENDING, MailParaEnviar PENDIENTE →
+ENVIANDO): una corrida que se cae a mitad de lote no reenvía esas filas. Solo
+cambian las choices; no hay SQL.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0137_calendariocabana_estado_lectura'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='communicationlog',
+            name='status',
+            field=models.CharField(
+                choices=[('PENDING', 'Pendiente'), ('SENDING', 'Enviando'), ('SENT', 'Enviado'),
+                         ('DELIVERED', 'Entregado'), ('READ', 'Leído'), ('REPLIED', 'Respondido'),
+                         ('FAILED', 'Falló'), ('BLOCKED', 'Bloqueado por límites')],
+                default='PENDING', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.AlterField(
+            model_name='mailparaenviar',
+            name='estado',
+            field=models.CharField(
+                choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ENVIADO', 'Enviado'),
+                         ('FALLIDO', 'Fallido'), ('PAUSADO', 'Pausado')],
+                default='PENDIENTE', max_length=20, verbose_name='Estado'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Tabla de hechos diaria para los dashboards de ventas y operativo.
+
+Nace vacía: se llena con `python manage.py reconstruir_hechos_ventas` después
+de migrar y de ahí en más la mantienen las señales (ver
+ventas/services/hechos_ventas_service.py).
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0138_envio_email_estado_en_curso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HechoVentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(
+                    choices=[('venta', 'Venta completa (por fecha de venta)'),
+                             ('servicio_vendido', 'Servicio (por fecha de venta)'),
+                             ('servicio_agendado', 'Servicio (por fecha de agendamiento)'),
+                             ('producto', 'Producto (por fecha de venta)'),
+                             ('pago', 'Pago (por fecha de venta)')],
+                    max_length=20)),
+                ('fecha', models.DateField(help_text='Fecha de venta (hora de Chile) o de agendamiento, según el tipo.')),
+                ('estado_pago', models.CharField(max_length=20)),
+                ('estado_reserva', models.CharField(max_length=20)),
+                ('metodo_pago', models.CharField(blank=True, max_length=100)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cantidad', models.PositiveIntegerField(
+                    default=0, help_text='Líneas de servicio, unidades de producto, ventas o pagos.')),
+                ('reservas', models.PositiveIntegerField(
+                    default=0, help_text='Ventas distintas del día, cada una contada en UNA sola fila del día.')),
+                ('reservas_categoria', models.PositiveIntegerField(
+                    default=0, help_text='Ventas distintas del día y la categoría, contadas en UNA fila de la categoría.')),
+                ('categoria', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    related_name='+', to='ventas.categoriaservicio')),
+                ('producto', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+', to='ventas.producto')),
+                ('servicio', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.CASCADE,
+                    related_name='+', to='ventas.servicio')),
+            ],
+            options={
+                'verbose_name': 'Hecho de venta diario',
+                'verbose_name_plural': 'Hechos de venta diarios',
+                'indexes': [
+                    models.Index(fields=['tipo', 'fecha'], name='idx_hvd_tipo_fecha'),
+                    models.Index(fields=['tipo', 'categoria', 'fecha'], name='idx_hvd_tipo_cat_fecha'),
+                ],
+            },
+        ),
+    ]
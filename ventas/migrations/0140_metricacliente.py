@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tabla de métricas por cliente para la segmentación por gasto.
+
+Nace vacía: se llena con `python manage.py reconstruir_metricas_clientes`
+después de migrar y de ahí en más la mantienen las señales (ver
+ventas/services/metricas_cliente_service.py).
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0139_hechoventadiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaCliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('telefono', models.CharField(help_text='Teléfono normalizado (+56XXXXXXXXX).', max_length=20,
+                                              unique=True)),
+                ('nombre', models.CharField(max_length=100)),
+                ('email', models.EmailField(blank=True, default='', max_length=254)),
+                ('servicios_actuales', models.PositiveIntegerField(default=0)),
+                ('gasto_actual', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('servicios_historicos', models.PositiveIntegerField(default=0)),
+                ('gasto_historico', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_servicios', models.PositiveIntegerField(default=0)),
+                ('total_gasto', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('cliente', models.ForeignKey(
+                    help_text='Representante: el cliente de menor id con este teléfono.',
+                    on_delete=django.db.models.deletion.CASCADE, related_name='+', to='ventas.cliente')),
+                ('comuna', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    related_name='+', to='ventas.comuna')),
+            ],
+            options={
+                'verbose_name': 'Métrica de cliente',
+                'verbose_name_plural': 'Métricas de clientes',
+                'indexes': [
+                    models.Index(fields=['total_gasto'], name='idx_mc_total_gasto'),
+                    models.Index(fields=['comuna', 'total_gasto'], name='idx_mc_comuna_gasto'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Cola de clientes con la taxonomía por recalcular.
+
+La llenan las señales (ver ventas/services/taxonomia_pendiente_service.py) y la
+vacía `recalcular_taxonomia_clientes --pendientes`.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0140_metricacliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxonomiaPendiente',
+            fields=[
+                ('cliente', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                    related_name='+', serialize=False, to='ventas.cliente')),
+                ('motivo', models.CharField(
+                    choices=[('reserva', 'Cambió una reserva, pago o servicio histórico'),
+                             ('paso_tiempo', 'Taxonomía calculada antes de hoy')],
+                    default='reserva', max_length=20)),
+                ('marcado_en', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Taxonomía pendiente',
+                'verbose_name_plural': 'Taxonomías pendientes',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Exportaciones grandes generadas en segundo plano.
+
+Las encolan los reportes (ver ventas/services/exportacion_service.py) y las
+escribe `generar_exportaciones`. `storage=_storage_exportaciones` se define en
+el MODELO; no afecta el esquema (la columna es solo varchar con la ruta).
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ventas', '0141_taxonomiapendiente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportacionArchivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Clave en exportacion_service.EXPORTACIONES.', max_length=40)),
+                ('formato', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel (XLSX)')],
+                                             default='xlsx', max_length=4)),
+                ('parametros', models.JSONField(blank=True, default=dict,
+                                                help_text='Filtros del reporte (strings de GET).')),
+                ('estado', models.CharField(
+                    choices=[('pendiente', 'Pendiente'), ('generando', 'Generando'),
+                             ('listo', 'Listo para descargar'), ('error', 'Error')],
+                    default='pendiente', max_length=12)),
+                ('archivo', models.FileField(blank=True, max_length=255, null=True, upload_to='exportaciones/')),
+                ('filas', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+                ('solicitado_por', models.ForeignKey(
+                    blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                    related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportación',
+                'verbose_name_plural': 'Exportaciones',
+                'ordering': ['-creado_en'],
+                'indexes': [models.Index(fields=['estado', 'creado_en'], name='idx_exportacion_estado')],
+            },
+        ),
+    ]
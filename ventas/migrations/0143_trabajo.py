@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Cola persistente de trabajos en segundo plano.
+
+La llenan los endpoints de cron y las vistas de campañas, y la vacía
+`procesar_trabajos` (ver ventas/services/trabajos_service.py). El índice único
+parcial sobre `clave` evita encolar dos veces lo mismo mientras está activo.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0142_exportacionarchivo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trabajo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cola', models.CharField(default='default', max_length=30)),
+                ('tarea', models.CharField(help_text='Nombre registrado en trabajos_service (ej. comando).',
+                                           max_length=60)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('clave', models.CharField(
+                    blank=True, max_length=120, null=True,
+                    help_text='Si se indica, no puede haber dos trabajos activos con la misma clave.')),
+                ('estado', models.CharField(
+                    choices=[('pendiente', 'Pendiente'), ('corriendo', 'Corriendo'), ('listo', 'Listo'),
+                             ('fallido', 'Fallido'), ('cancelado', 'Cancelado')],
+                    default='pendiente', max_length=12)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('ejecutar_desde', models.DateTimeField(default=django.utils.timezone.now,
+                                                        help_text='No se toma antes (backoff).')),
+                ('tomado_en', models.DateTimeField(blank=True, null=True)),
+                ('tomado_por', models.CharField(blank=True, help_text='host:pid del worker.', max_length=80)),
+                ('terminado_en', models.DateTimeField(blank=True, null=True)),
+                ('resultado', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo en segundo plano',
+                'verbose_name_plural': 'Trabajos en segundo plano',
+                'ordering': ['-creado_en'],
+                'indexes': [models.Index(fields=['estado', 'cola', 'ejecutar_desde'], name='idx_trabajo_cola')],
+                'constraints': [models.UniqueConstraint(
+                    condition=models.Q(estado__in=['pendiente', 'corriendo']), fields=('clave',),
+                    name='uniq_trabajo_clave_activa')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Slots retenidos mientras se paga en Flow (RetencionSlot).
+
+Cada PendingReservation retiene los bloques de su carrito hasta su
+`expires_at`; los demás checkouts y Luna los cuentan como ocupados (ver
+ventas/services/reservation_service.py).
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0143_trabajo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetencionSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('minuto_inicio', models.PositiveSmallIntegerField()),
+                ('minuto_fin', models.PositiveSmallIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pending_reservation', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='retenciones',
+                    to='ventas.pendingreservation')),
+                ('servicio', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE, related_name='retenciones',
+                    to='ventas.servicio')),
+            ],
+            options={
+                'verbose_name': 'Slot retenido (pago Flow en curso)',
+                'verbose_name_plural': 'Slots retenidos (pago Flow en curso)',
+                'indexes': [models.Index(fields=['servicio', 'fecha', 'minuto_inicio'], name='retencion_slot_idx')],
+            },
+        ),
+    ]
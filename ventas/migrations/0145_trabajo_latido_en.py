@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""Latido del worker en `Trabajo`.
+
+`rescatar` devuelve a la cola solo lo que dejó de latir (worker muerto), en
+vez de todo lo que lleva más de un tiempo fijo corriendo: una campaña de horas
+ya no pierde su cupo mientras sigue viva (ver ventas/services/trabajos_service.py).
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0144_retencionslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajo',
+            name='latido_en',
+            field=models.DateTimeField(
+                blank=True, null=True,
+                help_text='Último latido del worker mientras corre (ver rescatar).'),
+        ),
+    ]
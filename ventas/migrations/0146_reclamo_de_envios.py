@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Hora del reclamo en las filas que envía `envio_email_service.reclamar`.
+
+Con ella `liberar_colgados` saca de 'sending'/'ENVIANDO' lo que dejó una
+corrida que murió; antes quedaba ahí para siempre y la campaña no terminaba
+nunca. CommunicationLog usa su `updated_at`.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0145_trabajo_latido_en'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailrecipient',
+            name='claimed_at',
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name='Reclamado en',
+                help_text='Cuándo lo reclamó una corrida de envío (ver liberar_colgados).'),
+        ),
+        migrations.AddField(
+            model_name='mailparaenviar',
+            name='reclamado_en',
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name='Reclamado en',
+                help_text='Cuándo lo reclamó una corrida de envío (ver liberar_colgados).'),
+        ),
+    ]
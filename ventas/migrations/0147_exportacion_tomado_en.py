@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Hora en que una exportación pasó a 'generando'.
+
+Con ella `exportacion_service.vencer_colgadas` pasa a error las que dejó una
+corrida que murió; antes quedaban 'generando' para siempre.
+
+Escrita a mano: `makemigrations ventas` arrastra el drift AR-033/034.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0146_reclamo_de_envios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacionarchivo',
+            name='tomado_en',
+            field=models.DateTimeField(
+                blank=True, null=True,
+                help_text='Cuándo pasó a generando (ver exportacion_service.vencer_colgadas).'),
+        ),
+    ]
@@ -1192,34 +1192,59 @@ class VentaReserva(models.Model):
     def __str__(self):
         return f"Venta/Reserva #{self.id} de {self.cliente}"
 
-    def calcular_total(self):
-        # OPTIMIZACIÓN: Usar precios congelados (precio_unitario_venta) si existen,
-        # sino usar precio actual del catálogo (precio_base) como fallback
+    # Campos que escribe el recálculo de totales: se guardan con update_fields para
+    # no pisar lo que otra parte del código tenga a medio editar en memoria.
+    CAMPOS_TOTALES = ('total', 'pagado', 'saldo_pendiente', 'estado_pago')
 
-        # Para productos: usar precio_unitario_venta si existe, sino precio_base
-        total_productos = self.reservaproductos.aggregate(
-            total=models.Sum(
-                Coalesce(models.F('precio_unitario_venta'), models.F('producto__precio_base')) * models.F('cantidad')
+    @classmethod
+    def con_totales_calculados(cls, ids):
+        """Las ventas `ids` con los subtotales de `calcular_total` anotados, en UNA
+        consulta (antes: 4 aggregates + el de pagos, por venta).
+
+        OPTIMIZACIÓN de precios: usa el congelado (precio_unitario_venta) si existe,
+        sino el precio actual del catálogo (precio_base). Servicios: precio ×
+        cantidad_personas para todos los tipos — el checkout fuerza
+        cantidad_personas = capacidad_maxima para cabañas y tinas de precio plano
+        (AR-014 en add_to_cart).
+        """
+        def _suma(qs, expresion):
+            return models.Subquery(
+                qs.filter(venta_reserva=models.OuterRef('pk')).order_by()
+                .values('venta_reserva').annotate(s=Sum(expresion)).values('s')[:1],
+                output_field=DecimalField(max_digits=14, decimal_places=2),
             )
-        )['total'] or 0
 
-        # Para servicios: usar precio_unitario_venta si existe, sino precio_base.
-        # El checkout fuerza cantidad_personas = capacidad_maxima para cabañas
-        # y tinas de precio plano (AR-014 en add_to_cart), por lo que el total
-        # es precio × cantidad_personas para todos los tipos sin excepción.
-        total_servicios = self.reservaservicios.aggregate(
-            total=models.Sum(
+        return cls.objects.filter(pk__in=ids).annotate(
+            _t_productos=_suma(
+                ReservaProducto.objects.all(),
+                Coalesce(models.F('precio_unitario_venta'), models.F('producto__precio_base')) * models.F('cantidad')),
+            _t_servicios=_suma(
+                ReservaServicio.objects.all(),
                 Coalesce(models.F('precio_unitario_venta'), models.F('servicio__precio_base')) *
-                models.F('cantidad_personas')
-            )
-        )['total'] or 0
+                models.F('cantidad_personas')),
+            _t_giftcards=_suma(GiftCard.objects.all(), models.F('monto_inicial')),
+            _t_descuentos=_suma(Pago.objects.filter(metodo_pago='descuento'), models.F('monto')),
+            _t_pagos=_suma(Pago.objects.exclude(metodo_pago='descuento'), models.F('monto')),
+        )
 
-        total_giftcards = self.giftcards.aggregate(total=models.Sum('monto_inicial'))['total'] or 0
-        total_pagos_descuentos = self.pagos.filter(metodo_pago='descuento').aggregate(total=models.Sum('monto'))['total'] or 0
+    def aplicar_totales(self, fila):
+        """Copia a `self` el resultado de `con_totales_calculados` (misma regla de
+        siempre para total, saldo y estado_pago). No guarda."""
+        self.total = ((fila._t_productos or 0) + (fila._t_servicios or 0)
+                      + (fila._t_giftcards or 0) - (fila._t_descuentos or 0))
+        self.pagado = fila._t_pagos or 0
+        self.saldo_pendiente = self.total - self.pagado
+        if self.saldo_pendiente <= 0:
+            self.estado_pago = 'pagado'
+        elif self.pagado > 0:
+            self.estado_pago = 'parcial'
+        else:
+            self.estado_pago = 'pendiente'
 
-        self.total = total_productos + total_servicios + total_giftcards - total_pagos_descuentos
-        self.save()
-        self.actualizar_saldo()  # Llama a actualizar_saldo después de calcular_total
+    def calcular_total(self):
+        """Recalcula total, pagado, saldo y estado_pago: 1 consulta + 1 save."""
+        from ventas.services.totales_service import recalcular_totales
+        recalcular_totales([self.pk], instancias=[self])
 
     def actualizar_saldo(self):
         total_pagos = self.pagos.exclude(metodo_pago='descuento').aggregate(total=models.Sum('monto'))['total'] or 0
@@ -1231,7 +1256,8 @@ class VentaReserva(models.Model):
             self.estado_pago = 'parcial'
         else:
             self.estado_pago = 'pendiente'
-        self.save()
+        # `total` va incluido: hay callers que lo fijan a mano justo antes de llamar acá.
+        self.save(update_fields=list(self.CAMPOS_TOTALES))
 
     def actualizar_total(self):
         self.calcular_total()
@@ -1285,21 +1311,37 @@ class VentaReserva(models.Model):
         )['total'] or 0
         return total
 
-    def agregar_servicio(self, servicio, fecha_agendamiento, cantidad_personas=1):
+    def agregar_servicio(self, servicio, fecha_agendamiento, cantidad_personas=1, hora_inicio=None,
+                         proveedor_asignado=None):
+        """Agrega `servicio` a la venta si su bloque horario no choca con otras
+        reservas (capacidad simultánea del servicio y agenda del proveedor).
+
+        `fecha_agendamiento` puede ser un datetime (la API de pre-reservas lo
+        manda así): de ahí sale la hora si no viene `hora_inicio`.
+        """
+        from ventas.services.disponibilidad_service import buscar_conflictos
+
+        if hora_inicio is None and isinstance(fecha_agendamiento, datetime):
+            hora_inicio = fecha_agendamiento.strftime('%H:%M')
+        if isinstance(fecha_agendamiento, datetime):
+            fecha_agendamiento = fecha_agendamiento.date()
+
         with transaction.atomic():
-            duracion_servicio = servicio.duracion
-            fecha_fin = fecha_agendamiento + duracion_servicio
-
-            if ReservaServicio.objects.filter(servicio=servicio).filter(
-                fecha_agendamiento__lt=fecha_fin,
-                fecha_agendamiento__gte=fecha_agendamiento - timedelta(hours=duracion_servicio.total_seconds() / 3600)
-            ).exists():
-                raise ValidationError(f"El servicio {servicio.nombre} ya está reservado entre {fecha_agendamiento} y {fecha_fin}. Por favor, elige otro horario.")
-
-            self.servicios.add(servicio, through_defaults={
-                'fecha_agendamiento': fecha_agendamiento,
-                'cantidad_personas': cantidad_personas
-            })
+            conflictos = buscar_conflictos(servicio, fecha_agendamiento, hora_inicio,
+                                           proveedor=proveedor_asignado)
+            if conflictos:
+                raise ValidationError(
+                    f"El servicio {servicio.nombre} no está disponible el {fecha_agendamiento} "
+                    f"a las {hora_inicio}: {conflictos[0].mensaje}. Por favor, elige otro horario.")
+
+            ReservaServicio.objects.create(
+                venta_reserva=self,
+                servicio=servicio,
+                fecha_agendamiento=fecha_agendamiento,
+                hora_inicio=hora_inicio or '',
+                cantidad_personas=cantidad_personas,
+                proveedor_asignado=proveedor_asignado,
+            )
             self.calcular_total() # <-- Llama a calcular_total aquí
 
 class Pago(models.Model):
@@ -1355,7 +1397,8 @@ class Pago(models.Model):
                     raise ValidationError("No debe seleccionar una gift card para este método de pago.")
 
             super().save(*args, **kwargs)
-            self.venta_reserva.calcular_total()
+            from ventas.services.totales_service import marcar_total_pendiente
+            marcar_total_pendiente(self.venta_reserva_id, self.venta_reserva)
 
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -1365,7 +1408,8 @@ class Pago(models.Model):
                 self.giftcard.estado = 'por_cobrar'
                 self.giftcard.save()
             super().delete(*args, **kwargs)
-            self.venta_reserva.calcular_total()
+            from ventas.services.totales_service import marcar_total_pendiente
+            marcar_total_pendiente(self.venta_reserva_id, self.venta_reserva)
 
 class MovimientoCliente(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
@@ -1426,11 +1470,47 @@ class ReservaProducto(models.Model):
         return f"${valor:,.0f}".replace(',', '.')
     mostrar_valor_total.short_description = 'Valor Total'
 
+def hora_a_minutos(valor):
+    """'16:00' / '16:00:00' / '9:00' / time(16, 0) → 960 (minutos desde la
+    medianoche). None si no se puede interpretar."""
+    if valor is None:
+        return None
+    if hasattr(valor, 'hour') and hasattr(valor, 'minute'):
+        return valor.hour * 60 + valor.minute
+    partes = str(valor).strip().split(':')
+    if len(partes) < 2 or not partes[0].isdigit() or not partes[1][:2].isdigit():
+        return None
+    horas, minutos = int(partes[0]), int(partes[1][:2])
+    if horas > 23 or minutos > 59:
+        return None
+    return horas * 60 + minutos
+
+
+# Criterio ÚNICO de "esta línea no ocupa agenda" (solapes, grillas, Luna, iCal,
+# OTA): venta cancelada por `estado_pago` (el de las choices) o por el
+# `estado_reserva='cancelada'` que todavía traen ventas viejas. Sirve para
+# cualquier modelo con FK `venta_reserva`.
+VENTA_CANCELADA = (models.Q(venta_reserva__estado_pago='cancelado')
+                   | models.Q(venta_reserva__estado_reserva='cancelada'))
+
+
+def minutos_a_hora(minutos):
+    """960 → '16:00'."""
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
 class ReservaServicio(models.Model):
     venta_reserva = models.ForeignKey(VentaReserva, on_delete=models.CASCADE, related_name='reservaservicios')
     servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE)
     fecha_agendamiento = models.DateField()
     hora_inicio = models.CharField(max_length=5)
+    # Forma canónica de hora_inicio: minutos desde la medianoche ('16:00' → 960).
+    # La escribe save(); las consultas de disponibilidad filtran por este campo
+    # (igualdad y rangos enteros) en vez de comparar strings '16:00' vs '16:00:00'.
+    minuto_inicio = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False,
+        help_text='Minutos desde la medianoche de hora_inicio (se calcula al guardar).'
+    )
     # Default to 1, but enforce max 2 for cabins during booking if needed
     cantidad_personas = models.PositiveIntegerField(
         default=1,
@@ -1541,6 +1621,44 @@ class ReservaServicio(models.Model):
 
     # Consider adding validation in save() as well if needed, clean() isn't called automatically everywhere.
 
+    class Meta:
+        indexes = [
+            # Búsqueda por slot: (servicio, día, minuto) — disponibilidad y solapes.
+            models.Index(fields=['servicio', 'fecha_agendamiento', 'minuto_inicio'],
+                         name='reservaserv_slot_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.minuto_inicio = hora_a_minutos(self.hora_inicio)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'hora_inicio' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'minuto_inicio'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def solapadas(cls, servicio, fecha, minuto_inicio, duracion=None, proveedor=None):
+        """Reservas de `servicio` en `fecha` cuyo bloque [inicio, inicio+duración)
+        se cruza con [minuto_inicio, minuto_inicio+duracion). Comparación de
+        enteros sobre el índice (servicio, fecha, minuto); la duración de cada
+        reserva es la de su servicio. Las líneas de ventas canceladas
+        (`VENTA_CANCELADA`) no ocupan.
+
+        Con `proveedor`, incluye además las reservas de ESE proveedor en
+        cualquier servicio (una masajista no puede estar en dos salas)."""
+        duracion = servicio.duracion if duracion is None else duracion
+        de_quien = models.Q(servicio=servicio)
+        if proveedor is not None:
+            de_quien |= models.Q(proveedor_asignado=proveedor)
+        return cls.objects.filter(
+            de_quien,
+            fecha_agendamiento=fecha,
+            minuto_inicio__lt=minuto_inicio + duracion,
+        ).exclude(
+            VENTA_CANCELADA,
+        ).annotate(
+            _minuto_fin=models.F('minuto_inicio') + models.F('servicio__duracion'),
+        ).filter(_minuto_fin__gt=minuto_inicio)
+
 
 # --- Modelos para Sistema de Pagos a Masajistas ---
 
@@ -2311,6 +2429,7 @@ class CommunicationLog(models.Model):
     
     STATUS_CHOICES = [
         ('PENDING', 'Pendiente'),
+        ('SENDING', 'Enviando'),
         ('SENT', 'Enviado'),
         ('DELIVERED', 'Entregado'),
         ('READ', 'Leído'),
@@ -2388,6 +2507,7 @@ class MailParaEnviar(models.Model):
     """
     ESTADO_CHOICES = [
         ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
         ('ENVIADO', 'Enviado'),
         ('FALLIDO', 'Fallido'),
         ('PAUSADO', 'Pausado'),
@@ -2410,6 +2530,8 @@ class MailParaEnviar(models.Model):
     # Timestamps
     creado_en = models.DateTimeField(auto_now_add=True, verbose_name="Creado en")
     enviado_en = models.DateTimeField(null=True, blank=True, verbose_name="Enviado en")
+    reclamado_en = models.DateTimeField(null=True, blank=True, verbose_name="Reclamado en",
+                                        help_text="Cuándo lo reclamó una corrida de envío (ver liberar_colgados).")
     
     # Metadatos
     campana = models.CharField(max_length=100, blank=True, verbose_name="Campaña")
@@ -2694,6 +2816,8 @@ class EmailRecipient(models.Model):
     # Metadatos de envío
     scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name="Programado para")
     sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Enviado en")
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="Reclamado en",
+                                      help_text="Cuándo lo reclamó una corrida de envío (ver liberar_colgados).")
     delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Entregado en")
     opened_at = models.DateTimeField(null=True, blank=True, verbose_name="Abierto en")
     clicked_at = models.DateTimeField(null=True, blank=True, verbose_name="Click en")
@@ -2906,8 +3030,9 @@ class ClienteTaxonomia(models.Model):
     de marketing dirigidas. El snapshot evita recalcular en cada consulta.
 
     Se llena/refresca con el management command `recalcular_taxonomia_clientes`
-    (Paso 2). Un cron nocturno (Paso 5) recalcula los clientes que tuvieron
-    cambios en las últimas 24h.
+    (Paso 2). Los cambios en reservas encolan al cliente en TaxonomiaPendiente
+    y el cron `taxonomia-pendientes` (cada 5 minutos) recalcula solo esos,
+    más las filas calculadas antes de hoy.
 
     Diseño:
     - OneToOne con Cliente: 1 cliente = máximo 1 fila.
@@ -6310,6 +6435,33 @@ class PendingReservation(models.Model):
         self.save(update_fields=['estado', 'notas', 'updated_at'])
 
 
+class RetencionSlot(models.Model):
+    """Slot retenido mientras el cliente paga en Flow (ver reservation_service).
+
+    Una por servicio del carrito de una `PendingReservation`, con su mismo
+    `expires_at`: mientras no venza ocupa el bloque como una reserva más para
+    los demás checkouts y para Luna. Se borra al materializar la venta; una
+    vencida no cuenta aunque el cleanup todavía no la haya borrado.
+    """
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='retenciones')
+    fecha = models.DateField()
+    minuto_inicio = models.PositiveSmallIntegerField()
+    # Fin del bloque guardado: el cruce de intervalos no necesita el join a Servicio.
+    minuto_fin = models.PositiveSmallIntegerField()
+    pending_reservation = models.ForeignKey(
+        PendingReservation, on_delete=models.CASCADE, related_name='retenciones')
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Slot retenido (pago Flow en curso)'
+        verbose_name_plural = 'Slots retenidos (pago Flow en curso)'
+        indexes = [models.Index(fields=['servicio', 'fecha', 'minuto_inicio'], name='retencion_slot_idx')]
+
+    def __str__(self):
+        return f'{self.servicio_id} {self.fecha} {self.minuto_inicio}-{self.minuto_fin} (pending #{self.pending_reservation_id})'
+
+
 class MetaSnapshot(models.Model):
     """Snapshot consolidado de Meta (Facebook + Instagram + Ads).
 
@@ -8095,6 +8247,10 @@ class CalendarioCabana(models.Model):
     ultima_lectura_ok = models.DateTimeField(
         null=True, blank=True, verbose_name='Última lectura de las OTAs',
         help_text='Cuándo se leyeron con éxito las URLs de arriba (Fase 2).')
+    estado_lectura = models.JSONField(
+        default=dict, blank=True, editable=False,
+        help_text='ETag, Last-Modified y hash del último feed espejado, por '
+                  'fuente. Si la OTA no cambió nada, no se reescriben bloqueos.')
     creado = models.DateTimeField(auto_now_add=True)
     modificado = models.DateTimeField(auto_now=True)
 
@@ -8120,3 +8276,250 @@ class CalendarioCabana(models.Model):
         self.token = secrets.token_urlsafe(24)[:48]
         self.save(update_fields=['token', 'modificado'])
         return self.token
+
+
+class HechoVentaDiaria(models.Model):
+    """Tabla de hechos diaria de los dashboards de ventas (`analytics_views`).
+
+    Una fila por día × tipo × servicio (o producto, o método de pago) × estado
+    de pago × estado de reserva, con los montos ya sumados. `dashboard_ventas`,
+    `dashboard_operativo` y `exportar_estadisticas_csv` leen de acá en vez de
+    agregar `ReservaServicio` de años completos en cada carga.
+
+    La mantiene al día `ventas/services/hechos_ventas_service.py`: las señales
+    marcan los días tocados y se recalculan al confirmar la transacción. El
+    comando `reconstruir_hechos_ventas` la rearma entera (o un rango).
+    """
+
+    TIPO_VENTA = 'venta'
+    TIPO_SERVICIO_VENDIDO = 'servicio_vendido'
+    TIPO_SERVICIO_AGENDADO = 'servicio_agendado'
+    TIPO_PRODUCTO = 'producto'
+    TIPO_PAGO = 'pago'
+    TIPO_CHOICES = [
+        (TIPO_VENTA, 'Venta completa (por fecha de venta)'),
+        (TIPO_SERVICIO_VENDIDO, 'Servicio (por fecha de venta)'),
+        (TIPO_SERVICIO_AGENDADO, 'Servicio (por fecha de agendamiento)'),
+        (TIPO_PRODUCTO, 'Producto (por fecha de venta)'),
+        (TIPO_PAGO, 'Pago (por fecha de venta)'),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    fecha = models.DateField(help_text='Fecha de venta (hora de Chile) o de agendamiento, según el tipo.')
+    estado_pago = models.CharField(max_length=20)
+    estado_reserva = models.CharField(max_length=20)
+    servicio = models.ForeignKey('Servicio', on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='+')
+    categoria = models.ForeignKey(CategoriaServicio, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='+')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='+')
+    metodo_pago = models.CharField(max_length=100, blank=True)
+
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cantidad = models.PositiveIntegerField(
+        default=0, help_text='Líneas de servicio, unidades de producto, ventas o pagos.')
+    reservas = models.PositiveIntegerField(
+        default=0, help_text='Ventas distintas del día, cada una contada en UNA sola fila del día.')
+    reservas_categoria = models.PositiveIntegerField(
+        default=0, help_text='Ventas distintas del día y la categoría, contadas en UNA fila de la categoría.')
+
+    class Meta:
+        verbose_name = 'Hecho de venta diario'
+        verbose_name_plural = 'Hechos de venta diarios'
+        indexes = [
+            models.Index(fields=['tipo', 'fecha'], name='idx_hvd_tipo_fecha'),
+            models.Index(fields=['tipo', 'categoria', 'fecha'], name='idx_hvd_tipo_cat_fecha'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} {self.fecha}: {self.total}'
+
+
+class MetricaCliente(models.Model):
+    """Métricas de gasto por cliente para la segmentación (`reporting_views`).
+
+    Una fila por teléfono normalizado: los clientes duplicados con el mismo
+    número (formatos distintos, importaciones) suman juntos y se muestran con
+    el de menor id. Gasto actual = `VentaReserva.total` de las ventas pagadas o
+    con pago parcial; gasto histórico = `crm_service_history` sin las fechas
+    placeholder de la importación.
+
+    La mantiene al día `ventas/services/metricas_cliente_service.py`: las
+    señales marcan los clientes tocados y se recalculan al confirmar la
+    transacción. El comando `reconstruir_metricas_clientes` la rearma entera.
+    """
+
+    telefono = models.CharField(max_length=20, unique=True, help_text='Teléfono normalizado (+56XXXXXXXXX).')
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='+',
+                                help_text='Representante: el cliente de menor id con este teléfono.')
+    nombre = models.CharField(max_length=100)
+    email = models.EmailField(blank=True, default='')
+    comuna = models.ForeignKey(Comuna, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    servicios_actuales = models.PositiveIntegerField(default=0)
+    gasto_actual = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    servicios_historicos = models.PositiveIntegerField(default=0)
+    gasto_historico = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_servicios = models.PositiveIntegerField(default=0)
+    total_gasto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Métrica de cliente'
+        verbose_name_plural = 'Métricas de clientes'
+        indexes = [
+            models.Index(fields=['total_gasto'], name='idx_mc_total_gasto'),
+            models.Index(fields=['comuna', 'total_gasto'], name='idx_mc_comuna_gasto'),
+        ]
+
+    def __str__(self):
+        return f'{self.telefono} ({self.nombre}): {self.total_gasto}'
+
+
+class TaxonomiaPendiente(models.Model):
+    """Cola de clientes con la taxonomía (`ClienteTaxonomia`) por recalcular.
+
+    Las señales de reservas, pagos y servicios históricos encolan al cliente
+    al confirmar la transacción (una fila por cliente: volver a marcarlo solo
+    corre `marcado_en`). `recalcular_taxonomia_clientes --pendientes` recalcula
+    solo esos clientes, por lotes, y borra lo que procesó.
+    Ver ventas/services/taxonomia_pendiente_service.py.
+    """
+
+    MOTIVO_RESERVA = 'reserva'
+    MOTIVO_PASO_TIEMPO = 'paso_tiempo'
+    MOTIVO_CHOICES = [
+        (MOTIVO_RESERVA, 'Cambió una reserva, pago o servicio histórico'),
+        (MOTIVO_PASO_TIEMPO, 'Taxonomía calculada antes de hoy'),
+    ]
+
+    cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    motivo = models.CharField(max_length=20, choices=MOTIVO_CHOICES, default=MOTIVO_RESERVA)
+    marcado_en = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'Taxonomía pendiente'
+        verbose_name_plural = 'Taxonomías pendientes'
+
+    def __str__(self):
+        return f'{self.cliente_id} ({self.motivo}, {self.marcado_en:%Y-%m-%d %H:%M})'
+
+
+def _storage_exportaciones():
+    """Con Cloudinary el storage por defecto solo acepta imágenes: los CSV/XLSX
+    van como `raw`. En GCS o local, el de siempre."""
+    from django.conf import settings
+    from django.core.files.storage import default_storage
+
+    if getattr(settings, 'DEFAULT_FILE_STORAGE', '').endswith('.MediaCloudinaryStorage'):
+        return RawMediaCloudinaryStorage()
+    return default_storage
+
+
+class ExportacionArchivo(models.Model):
+    """Exportación grande generada en segundo plano.
+
+    Los reportes que exceden `UMBRAL_SEGUNDO_PLANO` filas en XLSX (o cuando se
+    pide `segundo_plano=1`) no se arman en la petición: quedan aquí como
+    pendientes, el comando `generar_exportaciones` (cron) escribe el archivo y
+    el usuario lo descarga desde /ventas/exportaciones/.
+    Ver ventas/services/exportacion_service.py.
+    """
+
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_GENERANDO = 'generando'
+    ESTADO_LISTO = 'listo'
+    ESTADO_ERROR = 'error'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_GENERANDO, 'Generando'),
+        (ESTADO_LISTO, 'Listo para descargar'),
+        (ESTADO_ERROR, 'Error'),
+    ]
+    FORMATO_CHOICES = [('csv', 'CSV'), ('xlsx', 'Excel (XLSX)')]
+
+    tipo = models.CharField(max_length=40, help_text='Clave en exportacion_service.EXPORTACIONES.')
+    formato = models.CharField(max_length=4, choices=FORMATO_CHOICES, default='xlsx')
+    parametros = models.JSONField(default=dict, blank=True, help_text='Filtros del reporte (strings de GET).')
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    archivo = models.FileField(upload_to='exportaciones/', storage=_storage_exportaciones,
+                               max_length=255, null=True, blank=True)
+    filas = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    creado_en = models.DateTimeField(auto_now_add=True)
+    tomado_en = models.DateTimeField(
+        null=True, blank=True,
+        help_text='Cuándo pasó a generando (ver exportacion_service.vencer_colgadas).')
+    terminado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Exportación'
+        verbose_name_plural = 'Exportaciones'
+        ordering = ['-creado_en']
+        indexes = [
+            models.Index(fields=['estado', 'creado_en'], name='idx_exportacion_estado'),
+        ]
+
+    def __str__(self):
+        return f'{self.tipo}.{self.formato} #{self.pk} ({self.estado})'
+
+
+class Trabajo(models.Model):
+    """Trabajo en segundo plano (cola persistente en la base).
+
+    Los endpoints de cron y las vistas de campañas encolan aquí en vez de
+    correr el comando dentro de la petición o en un `threading.Thread` que
+    muere con el proceso. `procesar_trabajos` los toma con
+    `SELECT ... FOR UPDATE SKIP LOCKED`, respeta la concurrencia de cada cola y
+    reintenta con backoff. Ver ventas/services/trabajos_service.py.
+    """
+
+    ESTADO_PENDIENTE = 'pendiente'
+    ESTADO_CORRIENDO = 'corriendo'
+    ESTADO_LISTO = 'listo'
+    ESTADO_FALLIDO = 'fallido'
+    ESTADO_CANCELADO = 'cancelado'
+    ESTADO_CHOICES = [
+        (ESTADO_PENDIENTE, 'Pendiente'),
+        (ESTADO_CORRIENDO, 'Corriendo'),
+        (ESTADO_LISTO, 'Listo'),
+        (ESTADO_FALLIDO, 'Fallido'),
+        (ESTADO_CANCELADO, 'Cancelado'),
+    ]
+    ACTIVOS = (ESTADO_PENDIENTE, ESTADO_CORRIENDO)
+
+    cola = models.CharField(max_length=30, default='default')
+    tarea = models.CharField(max_length=60, help_text='Nombre registrado en trabajos_service (ej. comando).')
+    argumentos = models.JSONField(default=dict, blank=True)
+    clave = models.CharField(
+        max_length=120, null=True, blank=True,
+        help_text='Si se indica, no puede haber dos trabajos activos con la misma clave.')
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default=ESTADO_PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    ejecutar_desde = models.DateTimeField(default=timezone.now, help_text='No se toma antes (backoff).')
+    tomado_en = models.DateTimeField(null=True, blank=True)
+    latido_en = models.DateTimeField(
+        null=True, blank=True, help_text='Último latido del worker mientras corre (ver rescatar).')
+    tomado_por = models.CharField(max_length=80, blank=True, help_text='host:pid del worker.')
+    terminado_en = models.DateTimeField(null=True, blank=True)
+    resultado = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Trabajo en segundo plano'
+        verbose_name_plural = 'Trabajos en segundo plano'
+        ordering = ['-creado_en']
+        indexes = [
+            models.Index(fields=['estado', 'cola', 'ejecutar_desde'], name='idx_trabajo_cola'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['clave'], condition=models.Q(estado__in=['pendiente', 'corriendo']),
+                                    name='uniq_trabajo_clave_activa'),
+        ]
+
+    def __str__(self):
+        return f'#{self.pk} {self.tarea} [{self.cola}] {self.estado}'
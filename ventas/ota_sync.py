@@ -28,14 +28,24 @@ Tres reglas de diseño, cada una con su motivo:
 
 Un choque entre lo importado y una reserva Aremko existente es un OVERBOOKING
 real: el bloqueo se crea igual (espejo fiel) y se grita en el log con los IDs.
+
+Lectura: los feeds se piden en paralelo (un pool acotado, solo HTTP en los
+hilos) para que una OTA lenta no frene el cron entero, y con GET condicional
+(ETag / Last-Modified) + hash del cuerpo guardados en
+`CalendarioCabana.estado_lectura`. Si ningún feed de la cabaña cambió desde el
+último espejo, `espejar_cabana` no corre: no se borran ni recrean bloqueos,
+pero el chequeo de overbooking corre igual contra los bloqueos `[OTA]` que ya
+están (una reserva Aremko nueva puede chocar con un feed que no cambió).
 """
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, timedelta
 
 from django.db import transaction
 from django.utils import timezone
 
-from ventas.models import (CalendarioCabana, ReservaServicio, ServicioBloqueo)
+from ventas.models import (VENTA_CANCELADA, CalendarioCabana, ReservaServicio, ServicioBloqueo)
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +53,12 @@ logger = logging.getLogger(__name__)
 # sobra espacio (la trampa varchar(16) de P-26 no aplica acá).
 MOTIVO_PREFIJO_OTA = '[OTA]'
 
+# Feeds leídos a la vez. Acotado: son 2 URLs por cabaña y no queremos que
+# Booking nos vea como un scraper.
+LECTURAS_SIMULTANEAS = 6
+
+USER_AGENT = 'Aremko-Sync/1.0 (+https://www.aremko.cl)'
+
 
 # ---------------------------------------------------------------------------
 # Parser iCal (solo lo que las OTAs publican: eventos de día completo)
@@ -119,28 +135,21 @@ def parsear_ics(texto):
 # Espejo sobre ServicioBloqueo
 # ---------------------------------------------------------------------------
 
-def espejar_cabana(cal, eventos, hoy=None):
+def espejar_cabana(cal, eventos, hoy=None, estado_lectura=None):
     """Reescribe los bloqueos [OTA] de la cabaña según lo que publica la OTA.
 
     `eventos` = [(fuente, inicio, fin_exclusivo, uid, resumen)] ya parseados de
-    TODOS los feeds de la cabaña. Devuelve
+    TODOS los feeds de la cabaña. `estado_lectura` (si viene) se guarda en la
+    misma transacción que los bloqueos: el hash solo queda escrito si el espejo
+    se completó. Devuelve
     {'creados', 'borrados', 'overbookings': [(venta_id, inicio, fin_exc, fuente)]}.
     """
     hoy = hoy or timezone.localdate()
     # El pasado no se espeja: un bloqueo de una noche ya vivida no protege nada.
     vigentes = [e for e in eventos if e[2] > hoy]
 
-    overbookings = []
-    for fuente, inicio, fin_exc, _uid, _resumen in vigentes:
-        chocan = (ReservaServicio.objects
-                  .filter(servicio_id=cal.servicio_id,
-                          venta_reserva__isnull=False,
-                          fecha_agendamiento__gte=inicio,
-                          fecha_agendamiento__lt=fin_exc)
-                  .exclude(venta_reserva__estado_reserva='cancelada')
-                  .values_list('venta_reserva_id', flat=True).distinct())
-        for venta_id in chocan:
-            overbookings.append((venta_id, inicio, fin_exc, fuente))
+    overbookings = buscar_overbookings(
+        cal, [(fuente, inicio, fin_exc) for fuente, inicio, fin_exc, _u, _r in vigentes])
 
     with transaction.atomic():
         borrados, _detalle = (ServicioBloqueo.objects
@@ -169,44 +178,170 @@ def espejar_cabana(cal, eventos, hoy=None):
         ]
         ServicioBloqueo.objects.bulk_create(nuevos)
         cal.ultima_lectura_ok = timezone.now()
-        cal.save(update_fields=['ultima_lectura_ok', 'modificado'])
+        campos = ['ultima_lectura_ok', 'modificado']
+        if estado_lectura is not None:
+            cal.estado_lectura = estado_lectura
+            campos.append('estado_lectura')
+        cal.save(update_fields=campos)
+
+    return {'creados': len(nuevos), 'borrados': borrados,
+            'overbookings': overbookings}
+
+
+def buscar_overbookings(cal, tramos):
+    """Reservas Aremko no canceladas de la cabaña que caen dentro de algún
+    tramo importado. `tramos` = [(fuente, inicio, fin_exclusivo)]. Deja cada
+    choque en el log y devuelve [(venta_id, inicio, fin_exc, fuente)]."""
+    overbookings = []
+    for fuente, inicio, fin_exc in tramos:
+        chocan = (ReservaServicio.objects
+                  .filter(servicio_id=cal.servicio_id,
+                          venta_reserva__isnull=False,
+                          fecha_agendamiento__gte=inicio,
+                          fecha_agendamiento__lt=fin_exc)
+                  .exclude(VENTA_CANCELADA)
+                  .values_list('venta_reserva_id', flat=True).distinct())
+        for venta_id in chocan:
+            overbookings.append((venta_id, inicio, fin_exc, fuente))
 
     for venta_id, inicio, fin_exc, fuente in overbookings:
         logger.warning('[ota_sync] ⚠️ OVERBOOKING %s: RES-%s choca con %s %s→%s',
                        cal.servicio.nombre, venta_id, fuente, inicio, fin_exc)
-    return {'creados': len(nuevos), 'borrados': borrados,
-            'overbookings': overbookings}
+    return overbookings
 
 
-def leer_url(url):
+def tramos_espejados(cal, hoy=None):
+    """Los bloqueos [OTA] vigentes de la cabaña como [(fuente, inicio, fin_exc)]:
+    lo que dejó el último espejo, para revisar overbookings sin reescribirlo."""
+    hoy = hoy or timezone.localdate()
+    tramos = []
+    for motivo, inicio, fin in (ServicioBloqueo.objects
+                                .filter(servicio_id=cal.servicio_id,
+                                        motivo__startswith=MOTIVO_PREFIJO_OTA,
+                                        fecha_fin__gte=hoy)
+                                .order_by('fecha_inicio')
+                                .values_list('motivo', 'fecha_inicio', 'fecha_fin')):
+        fuente = motivo[len(MOTIVO_PREFIJO_OTA):].split(' — ')[0].strip()
+        tramos.append((fuente, inicio, fin + timedelta(days=1)))
+    return tramos
+
+
+def _lineas_overbooking(overbookings):
+    return ''.join(f'\n  ⚠️ OVERBOOKING: RES-{venta_id} choca con {fuente} '
+                   f'{inicio.strftime("%d/%m")}→{fin_exc.strftime("%d/%m")}'
+                   for venta_id, inicio, fin_exc, fuente in overbookings)
+
+
+def leer_url_condicional(url, validadores=None):
+    """GET con If-None-Match / If-Modified-Since del último feed espejado.
+
+    Devuelve (texto, etag, last_modified); `texto` es None si la OTA respondió
+    304 (no cambió nada).
+    """
     import requests
 
-    resp = requests.get(url, timeout=20,
-                        headers={'User-Agent': 'Aremko-Sync/1.0 (+https://www.aremko.cl)'})
+    validadores = validadores or {}
+    headers = {'User-Agent': USER_AGENT}
+    if validadores.get('etag'):
+        headers['If-None-Match'] = validadores['etag']
+    if validadores.get('last_modified'):
+        headers['If-Modified-Since'] = validadores['last_modified']
+    resp = requests.get(url, timeout=20, headers=headers)
+    if resp.status_code == 304:
+        return None, validadores.get('etag', ''), validadores.get('last_modified', '')
     resp.raise_for_status()
-    return resp.text
+    return resp.text, resp.headers.get('ETag', ''), resp.headers.get('Last-Modified', '')
+
 
+def leer_url(url):
+    return leer_url_condicional(url)[0]
+
+
+def _leer_fuente(leer, url, validadores):
+    """Un feed → {'texto', 'estado'}, o None si respondió 304.
 
-def sincronizar_todo(dry_run=False, leer=None, hoy=None):
+    `leer` inyectado (tests) recibe solo la URL y devuelve el texto: sin
+    validadores HTTP, el hash del cuerpo alcanza para detectar "sin cambios".
+    """
+    if leer is not None:
+        texto, etag, modificado = leer(url), '', ''
+    else:
+        texto, etag, modificado = leer_url_condicional(url, validadores)
+    if texto is None:
+        return None
+    return {'texto': texto,
+            'estado': {'url': url, 'etag': etag, 'last_modified': modificado,
+                       'sha256': hashlib.sha256(texto.encode('utf-8')).hexdigest()}}
+
+
+def _leer_cabana(fuentes, previo, leer):
+    """Lee y parsea los feeds de UNA cabaña. Corre en un hilo del pool: NO toca
+    la base de datos.
+
+    Devuelve {'eventos', 'estado', 'fallas', 'sin_cambios'}. `sin_cambios` es
+    True solo si TODAS las fuentes respondieron 304 o el mismo hash que el
+    último espejo (y son las mismas fuentes, con las mismas URLs).
+    """
+    # Validadores del último espejo, solo si la URL sigue siendo la misma.
+    anteriores = {f: previo[f] for f, url in fuentes
+                  if isinstance(previo.get(f), dict) and previo[f].get('url') == url}
+    lecturas, fallas = {}, []
+    for fuente, url in fuentes:
+        try:
+            lecturas[fuente] = _leer_fuente(leer, url, anteriores.get(fuente))
+        except Exception as e:  # noqa: BLE001 — la falla se informa, no tumba el cron
+            fallas.append(f'{fuente}: {e}')
+    if fallas:
+        return {'eventos': [], 'estado': None, 'fallas': fallas, 'sin_cambios': False}
+
+    sin_cambios = (set(previo) == {f for f, _u in fuentes} == set(anteriores)
+                   and all(l is None or l['estado']['sha256'] == anteriores[f].get('sha256')
+                           for f, l in lecturas.items()))
+    if sin_cambios:
+        estado = {f: (l['estado'] if l else anteriores[f]) for f, l in lecturas.items()}
+        return {'eventos': [], 'estado': estado, 'fallas': [], 'sin_cambios': True}
+
+    eventos, estado = [], {}
+    for fuente, url in fuentes:
+        try:
+            lectura = lecturas[fuente]
+            if lectura is None:
+                # 304 de este feed, pero otro cambió: el espejo se reconstruye
+                # con TODOS los feeds, así que este se vuelve a pedir entero.
+                lectura = _leer_fuente(leer, url, None)
+            for inicio, fin_exc, uid, resumen in parsear_ics(lectura['texto']):
+                eventos.append((fuente, inicio, fin_exc, uid, resumen))
+            estado[fuente] = lectura['estado']
+        except Exception as e:  # noqa: BLE001
+            fallas.append(f'{fuente}: {e}')
+    return {'eventos': eventos, 'estado': estado, 'fallas': fallas, 'sin_cambios': False}
+
+
+def sincronizar_todo(dry_run=False, leer=None, hoy=None, forzar=False):
     """Corre el espejo para cada calendario activo con URL. Devuelve informes
-    (una línea por cabaña, con ⚠️ si detectó overbooking)."""
-    leer = leer or leer_url
-    informes = []
+    (una línea por cabaña, con ⚠️ si detectó overbooking).
+
+    `forzar` (y `dry_run`) ignoran el estado guardado: leen todo completo y,
+    fuera del dry-run, reescriben los bloqueos aunque el feed no haya cambiado.
+    """
+    trabajos = []
     for cal in (CalendarioCabana.objects.select_related('servicio')
                 .filter(activo=True).order_by('servicio__nombre')):
         fuentes = [(f, u) for f, u in (('Booking', cal.url_booking),
                                        ('Airbnb', cal.url_airbnb)) if u]
-        if not fuentes:
-            continue
+        if fuentes:
+            previo = {} if (dry_run or forzar) else (cal.estado_lectura or {})
+            trabajos.append((cal, fuentes, previo))
+    if not trabajos:
+        return []
 
-        eventos, fallas = [], []
-        for fuente, url in fuentes:
-            try:
-                for inicio, fin_exc, uid, resumen in parsear_ics(leer(url)):
-                    eventos.append((fuente, inicio, fin_exc, uid, resumen))
-            except Exception as e:  # noqa: BLE001 — la falla se informa, no tumba el cron
-                fallas.append(f'{fuente}: {e}')
+    with ThreadPoolExecutor(max_workers=min(LECTURAS_SIMULTANEAS, len(trabajos)),
+                            thread_name_prefix='ota_sync') as pool:
+        lecturas = list(pool.map(lambda t: _leer_cabana(t[1], t[2], leer), trabajos))
 
+    informes = []
+    for (cal, _fuentes, _previo), lectura in zip(trabajos, lecturas):
+        eventos, fallas = lectura['eventos'], lectura['fallas']
         nombre = cal.servicio.nombre
         if fallas:
             # Regla 2: con lectura incompleta NO se reconstruye. Reconstruir
@@ -221,12 +356,20 @@ def sincronizar_todo(dry_run=False, leer=None, hoy=None):
             informes.append(f'{nombre}: leería {len(eventos)} eventos '
                             f'({detalle}) — dry-run, sin escribir')
             continue
+        if lectura['sin_cambios']:
+            # La lectura fue completa (avanza `ultima_lectura_ok`), pero los
+            # bloqueos [OTA] ya son el espejo de este mismo feed. El overbooking
+            # se revisa igual: lo que cambia entre corridas suelen ser las
+            # reservas de Aremko, no el feed.
+            cal.ultima_lectura_ok = timezone.now()
+            cal.estado_lectura = lectura['estado']
+            cal.save(update_fields=['ultima_lectura_ok', 'estado_lectura', 'modificado'])
+            overbookings = buscar_overbookings(cal, tramos_espejados(cal, hoy=hoy))
+            informes.append(f'{nombre}: feed igual al último espejo — bloqueos OTA intactos'
+                            + _lineas_overbooking(overbookings))
+            continue
 
-        r = espejar_cabana(cal, eventos, hoy=hoy)
-        linea = (f'{nombre}: {r["creados"]} bloqueos OTA vigentes '
-                 f'(reemplazaron {r["borrados"]})')
-        for venta_id, inicio, fin_exc, fuente in r['overbookings']:
-            linea += (f'\n  ⚠️ OVERBOOKING: RES-{venta_id} choca con {fuente} '
-                      f'{inicio.strftime("%d/%m")}→{fin_exc.strftime("%d/%m")}')
-        informes.append(linea)
+        r = espejar_cabana(cal, eventos, hoy=hoy, estado_lectura=lectura['estado'])
+        informes.append(f'{nombre}: {r["creados"]} bloqueos OTA vigentes '
+                        f'(reemplazaron {r["borrados"]})' + _lineas_overbooking(r['overbookings']))
     return informes
@@ -18,16 +18,19 @@ Contiene:
     compania_habitual        — "tu pareja" / "solos" / "con tu grupo"
     calcular_prioridad       — 0 a 6 o None (no califica)
     buscar_script_cascada    — match en 5 niveles (más específico → más genérico)
+    elegir_script            — la misma cascada sobre scripts ya cargados en memoria
     calcular_servicio_recomendado — cruce tinas/masajes/cabañas
     calcular_sugerencia_dia_hora  — moda histórica del cliente
     obtener_ultimo_servicio_nombre
     build_render_context     — arma dict de variables para .format_map(SafeDict)
+    precargar_bandeja        — salvas, Refugio, último servicio y patrón día/hora
+                               de TODOS los candidatos en pocas consultas agrupadas
 """
 
 from __future__ import annotations
 
 import hashlib
-from collections import Counter
+from collections import Counter, defaultdict
 from datetime import date, timedelta
 from typing import Optional, Sequence, Tuple
 
@@ -288,24 +291,40 @@ def buscar_script_cascada(
         salva=salva,
         activo=True,
     )
+    return elegir_script(list(base), estado_valor, estilo, contexto, salva, region)
+
+
+def elegir_script(
+    scripts: Sequence, estado_valor: str, estilo: str, contexto: str, salva: int,
+    region: str = '',
+):
+    """Cascada de `buscar_script_cascada` sobre scripts ya cargados (sin DB).
+
+    La bandeja diaria carga una vez los scripts activos y elige aquí para cada
+    candidato; `buscar_script_cascada` delega en esta función para que las dos
+    vías no diverjan. `scripts` debe venir en el orden del modelo (script_id):
+    en cada nivel gana el primero, igual que `.first()`.
+    """
+    base = [
+        s for s in scripts
+        if s.estado_valor_target == estado_valor and s.salva == salva and s.activo
+    ]
+
+    def _primero(bloque, estilo_target: str, contexto_target: str):
+        for s in bloque:
+            if s.cohorte_estilo == estilo_target and s.cohorte_contexto == contexto_target:
+                return s
+        return None
 
     def _buscar_en_bloque(region_target: str):
         """4 niveles de cascada dentro de una región fija."""
-        bloque = base.filter(region_geografica_target=region_target)
-        # Nivel 1: exacto
-        s = bloque.filter(cohorte_estilo=estilo, cohorte_contexto=contexto).first()
-        if s:
-            return s
-        # Nivel 2: estilo + cualquier contexto
-        s = bloque.filter(cohorte_estilo=estilo, cohorte_contexto='').first()
-        if s:
-            return s
-        # Nivel 3: cualquier estilo + contexto
-        s = bloque.filter(cohorte_estilo='', cohorte_contexto=contexto).first()
-        if s:
-            return s
-        # Nivel 4: genérico
-        return bloque.filter(cohorte_estilo='', cohorte_contexto='').first()
+        bloque = [s for s in base if s.region_geografica_target == region_target]
+        return (
+            _primero(bloque, estilo, contexto)       # Nivel 1: exacto
+            or _primero(bloque, estilo, '')          # Nivel 2: estilo + cualquier contexto
+            or _primero(bloque, '', contexto)        # Nivel 3: cualquier estilo + contexto
+            or _primero(bloque, '', '')              # Nivel 4: genérico
+        )
 
     # Si caller NO pasó región (compat), comportamiento original sobre region=''
     if not region:
@@ -345,7 +364,7 @@ REFUGIO_REGIONES_ELEGIBLES = ('nacional', 'sin_clasificar')
 REFUGIO_ESTADOS_ELEGIBLES = ('En Riesgo', 'Dormido')
 
 
-def califica_refugio(cliente, eje_valor: str, salva: int, hoy=None) -> bool:
+def califica_refugio(cliente, eje_valor: str, salva: int, hoy=None, precarga=None) -> bool:
     """Decide si este cliente recibe plantilla Refugio en vez de la normal.
 
     Args:
@@ -353,6 +372,8 @@ def califica_refugio(cliente, eje_valor: str, salva: int, hoy=None) -> bool:
         eje_valor: 'En Riesgo' / 'Dormido' / etc. (de ClienteTaxonomia)
         salva: 1, 2 o 3
         hoy: date opcional para tests (default: timezone.now().date())
+        precarga: PrecargaBandeja opcional; si viene, la anti-saturación se
+                  lee de ahí en vez de consultar ContactoWhatsApp.
 
     Returns:
         True si califica para recibir un B.refugio-*.
@@ -369,6 +390,8 @@ def califica_refugio(cliente, eje_valor: str, salva: int, hoy=None) -> bool:
         return False
 
     # Anti-saturación: si recibió un Refugio enviado en los últimos 60 días, skip
+    if precarga is not None:
+        return cliente.id not in precarga.refugio_reciente
     if hoy is None:
         hoy = timezone.now().date()
     desde = hoy - timedelta(days=REFUGIO_VENTANA_SATURACION_DIAS)
@@ -394,12 +417,17 @@ def buscar_script_refugio(cliente, eje_valor: str):
     """
     from ventas.models import ScriptWhatsApp
 
+    return ScriptWhatsApp.objects.filter(
+        script_id=script_id_refugio(cliente, eje_valor), activo=True,
+    ).first()
+
+
+def script_id_refugio(cliente, eje_valor: str) -> str:
+    """script_id de la plantilla Refugio que le toca al cliente (sin DB)."""
     region_suffix = 'N' if cliente.region_geografica == 'nacional' else 'SC'
     if eje_valor == 'Dormido':
-        script_id = f'B.refugio-DOR-{region_suffix}'
-    else:  # En Riesgo
-        script_id = f'B.refugio-{region_suffix}'
-    return ScriptWhatsApp.objects.filter(script_id=script_id, activo=True).first()
+        return f'B.refugio-DOR-{region_suffix}'
+    return f'B.refugio-{region_suffix}'  # En Riesgo
 
 
 def obtener_ultimo_servicio_nombre(cliente_id: int) -> str:
@@ -410,23 +438,15 @@ def obtener_ultimo_servicio_nombre(cliente_id: int) -> str:
     ("Servicio Anulado") ni un servicio dado de baja. Devuelve '' si el cliente no tiene
     ninguno (el SafeDict lo render vacío; el call-site cae a un genérico).
     """
-    from ventas.models import ReservaServicio
-
     # Filtro en capas:
     # 1) tipo principal (tina/masaje/cabana) → descarta 'otro' (desayunos, decoraciones,
     #    productos, placeholders tipo "Servicio Anulado").
     # 2) activo=True → descarta servicios dados de baja / anulados.
     # 3) exclude(complementos del M2M del agente) → atrapa complementos que SON tipo 'tina'
     #    (tina de niño/fría), que el filtro por tipo no descartaría.
-    from whatsapp_agent.models import WhatsAppAgentConfig
-    comp = WhatsAppAgentConfig.get_solo().ids_complementarios()
-
     rs = (
-        ReservaServicio.objects
+        _reservas_principales()
         .filter(venta_reserva__cliente_id=cliente_id)
-        .filter(servicio__tipo_servicio__in=('tina', 'masaje', 'cabana'))
-        .filter(servicio__activo=True)
-        .exclude(servicio_id__in=comp)
         .select_related('servicio')
         .order_by('-fecha_agendamiento', '-id')
         .first()
@@ -436,6 +456,23 @@ def obtener_ultimo_servicio_nombre(cliente_id: int) -> str:
     return ''
 
 
+def _reservas_principales():
+    """ReservaServicio de servicios PRINCIPALES reales (ver obtener_ultimo_servicio_nombre).
+
+    Los complementos salen de la caché compartida de la config del agente: la
+    bandeja pide esto para cada candidato y no tiene por qué releer la config.
+    """
+    from ventas.models import ReservaServicio
+    from whatsapp_agent.models import WhatsAppAgentConfig
+
+    return (
+        ReservaServicio.objects
+        .filter(servicio__tipo_servicio__in=('tina', 'masaje', 'cabana'))
+        .filter(servicio__activo=True)
+        .exclude(servicio_id__in=WhatsAppAgentConfig.ids_complementarios_cacheados())
+    )
+
+
 def calcular_servicio_recomendado(pct_tinas: float, pct_masajes: float, pct_cabanas: float) -> str:
     """Heurística de recomendación cruzada basada en el mix histórico del cliente.
 
@@ -502,7 +539,15 @@ def calcular_sugerencia_dia_hora(cliente_id: int) -> Tuple[str, str, bool]:
         .filter(venta_reserva__cliente_id=cliente_id)
         .values_list('fecha_agendamiento', 'hora_inicio')
     )
+    return patron_dia_hora(reservas)
+
 
+def patron_dia_hora(reservas: Sequence[Tuple[Optional[date], str]]) -> Tuple[str, str, bool]:
+    """Moda de día de semana y hora sobre [(fecha_agendamiento, hora_inicio)].
+
+    Parte pura de calcular_sugerencia_dia_hora: la bandeja la aplica sobre las
+    reservas ya precargadas de cada candidato.
+    """
     if len(reservas) < 2:
         return ('viernes', '17:00', False)
 
@@ -570,13 +615,15 @@ def fecha_limite_natural(hoy: date, dias_validez: int = 15) -> str:
 # Contexto de renderizado completo
 # ============================================================================
 
-def build_render_context(cliente, cliente_tax, hoy: date) -> SafeDict:
+def build_render_context(cliente, cliente_tax, hoy: date, precarga=None) -> SafeDict:
     """Construye el dict de variables para inyectar en plantilla_texto.
 
     Args:
         cliente: instancia de Cliente
         cliente_tax: instancia de ClienteTaxonomia (puede ser None para Pre-sistema)
         hoy: fecha de referencia (inyectada para testabilidad)
+        precarga: PrecargaBandeja opcional (bandeja diaria). Con ella el render
+                  no toca la DB; sin ella se consulta cliente por cliente.
 
     Returns:
         SafeDict con todas las keys que pueden aparecer en plantillas.
@@ -621,7 +668,12 @@ def build_render_context(cliente, cliente_tax, hoy: date) -> SafeDict:
             fecha_limite=fecha_limite_natural(hoy),
         )
 
-    dia, hora, es_patron_real = calcular_sugerencia_dia_hora(cliente.id)
+    if precarga is not None:
+        dia, hora, es_patron_real = precarga.sugerencia_dia_hora(cliente.id)
+        ultimo_servicio = precarga.ultimo_servicio.get(cliente.id, '')
+    else:
+        dia, hora, es_patron_real = calcular_sugerencia_dia_hora(cliente.id)
+        ultimo_servicio = obtener_ultimo_servicio_nombre(cliente.id)
     if es_patron_real:
         sugerencia_dia_val = dia
         sugerencia_hora_val = hora
@@ -646,7 +698,7 @@ def build_render_context(cliente, cliente_tax, hoy: date) -> SafeDict:
         ),
         # Fallback genérico si no hay servicio principal real → nunca dejar el mensaje
         # cortado ("primera visita a  ").
-        ultimo_servicio=(obtener_ultimo_servicio_nombre(cliente.id) or 'nuestro spa'),
+        ultimo_servicio=(ultimo_servicio or 'nuestro spa'),
         compania_habitual=compania_habitual(cliente_tax.eje_contexto),
         servicio_recomendado=servicio_rec,
         sugerencia_dia=sugerencia_dia_val,
@@ -656,3 +708,93 @@ def build_render_context(cliente, cliente_tax, hoy: date) -> SafeDict:
         mes_proximo=mes_proximo_nombre(hoy),
         fecha_limite=fecha_limite_natural(hoy),
     )
+
+
+# ============================================================================
+# Precarga por lotes (bandeja diaria)
+# ============================================================================
+
+class PrecargaBandeja:
+    """Lo que la bandeja necesita saber de cada candidato, leído de una vez.
+
+    Atributos (por cliente_id; un cliente ausente = sin datos):
+        salvas_enviadas  — {id: nº de ContactoWhatsApp enviados}
+        refugio_reciente — {ids} con un Refugio enviado dentro de la ventana
+        ultimo_servicio  — {id: nombre del último servicio principal}
+        reservas         — {id: [(fecha_agendamiento, hora_inicio), ...]}
+    """
+
+    def __init__(self):
+        self.salvas_enviadas: dict = {}
+        self.refugio_reciente: set = set()
+        self.ultimo_servicio: dict = {}
+        self.reservas: dict = defaultdict(list)
+
+    def sugerencia_dia_hora(self, cliente_id: int) -> Tuple[str, str, bool]:
+        """Igual que calcular_sugerencia_dia_hora, sin consultar la DB."""
+        return patron_dia_hora(self.reservas.get(cliente_id, ()))
+
+
+def precargar_bandeja(cliente_ids: Sequence[int], hoy: date) -> PrecargaBandeja:
+    """Carga en 4 consultas agrupadas (más la config cacheada del agente) los
+    datos que antes se pedían candidato por candidato: salvas enviadas,
+    Refugio reciente, último servicio principal y reservas para el patrón
+    día/hora. El costo ya no crece con el número de candidatos, solo con las
+    filas que devuelve cada consulta.
+    """
+    from django.db.models import Count, OuterRef, Subquery
+    from ventas.models import Cliente, ContactoWhatsApp, ReservaServicio
+
+    precarga = PrecargaBandeja()
+    ids = list(cliente_ids)
+    if not ids:
+        return precarga
+
+    precarga.salvas_enviadas = dict(
+        ContactoWhatsApp.objects
+        .filter(cliente_id__in=ids, estado='enviado')
+        .values('cliente_id')
+        .annotate(n=Count('id'))
+        .values_list('cliente_id', 'n')
+    )
+
+    desde = hoy - timedelta(days=REFUGIO_VENTANA_SATURACION_DIAS)
+    precarga.refugio_reciente = set(
+        ContactoWhatsApp.objects
+        .filter(
+            cliente_id__in=ids,
+            script__script_id__startswith='B.refugio',
+            estado='enviado',
+            fecha_envio__date__gte=desde,
+        )
+        .values_list('cliente_id', flat=True)
+        .distinct()
+    )
+
+    # Una fila por cliente: el último principal sale de una subconsulta
+    # correlacionada con el mismo orden que obtener_ultimo_servicio_nombre.
+    ultimo = (
+        _reservas_principales()
+        .filter(venta_reserva__cliente_id=OuterRef('pk'))
+        .order_by('-fecha_agendamiento', '-id')
+        .values('servicio__nombre')[:1]
+    )
+    precarga.ultimo_servicio = {
+        cid: nombre
+        for cid, nombre in (
+            Cliente.objects
+            .filter(id__in=ids)
+            .annotate(ultimo_servicio=Subquery(ultimo))
+            .values_list('id', 'ultimo_servicio')
+        )
+        if nombre
+    }
+
+    for cid, fecha, hora in (
+        ReservaServicio.objects
+        .filter(venta_reserva__cliente_id__in=ids)
+        .values_list('venta_reserva__cliente_id', 'fecha_agendamiento', 'hora_inicio')
+    ):
+        precarga.reservas[cid].append((fecha, hora))
+
+    return precarga
@@ -0,0 +1,125 @@
+"""Caché compartida por dominios (namespaces) con invalidación por versión.
+
+Con `LocMemCache` cada worker de gunicorn tenía su propia copia fría y borrar una
+clave en un worker no llegaba a los demás. Con `REDIS_URL` configurado la caché
+`default` pasa a ser Redis (compartida); sin Redis sigue en memoria del proceso,
+que es lo que usan los tests y el desarrollo local — este módulo funciona igual
+en los dos casos.
+
+Cada dominio tiene un número de versión guardado en la misma caché y las claves
+lo llevan adentro (`ns:disponibilidad:v17:...`). Invalidar un dominio entero es
+subir la versión: las claves viejas quedan huérfanas y expiran solas, sin tener
+que saber cuáles eran. Las señales de `ventas/signals/cache_signals.py` invalidan
+al cambiar `Servicio`, `ReservaServicio`, bloqueos, etc.
+
+Un `ambito` divide el dominio en partes que se invalidan por separado (el .ics
+de una cabaña no se descarta porque cambió otra): cada ámbito tiene su propia
+versión.
+
+Uso:
+    from ventas.services.cache_service import cache_ns
+    datos = cache_ns('catalogo').get_or_set('categorias_menu', calcular)
+    cache_ns('catalogo').invalidar()
+    cache_ns('ical', ambito=servicio_id).invalidar()
+"""
+import logging
+import random
+import time
+
+from django.core.cache import cache
+
+from .perfilado_service import registrar_cache
+
+logger = logging.getLogger(__name__)
+
+_FALTA = object()
+
+# Dominio → TTL por defecto (segundos). La invalidación por señal es la que
+# mantiene los datos al día; el TTL es solo el techo por si una señal no corre
+# (ej. un UPDATE masivo con .update()).
+NAMESPACES = {
+    'catalogo': 60 * 60,       # servicios, categorías, menú
+    'disponibilidad': 5 * 60,  # grillas de slots libres
+    'homepage': 10 * 60,       # bloques de la portada
+    'luna_config': 60 * 60,    # configuración del agente y foto del catálogo de Luna
+    'ical': 30 * 60,           # .ics por cabaña (ámbito = servicio_id) y tokens
+    'giftcards': 60 * 60,      # datos de experiencia que se imprimen en la carta
+    'paginas': 30 * 60,        # HTML completo de páginas públicas (pagina_cache_service)
+}
+
+
+def _version_inicial():
+    # Basada en el reloj (+ azar, por si cae en el mismo milisegundo) y no en 1:
+    # si la clave de versión se pierde (eviction, reinicio de Redis) no se
+    # reviven entradas viejas de una versión ya usada.
+    return int(time.time() * 1000) * 1000 + random.randint(0, 999)
+
+
+class CacheNamespace:
+    """Vista de la caché `default` limitada a un dominio de `NAMESPACES`
+    (y opcionalmente a un `ambito` dentro de él)."""
+
+    def __init__(self, nombre, ambito=None):
+        if nombre not in NAMESPACES:
+            raise ValueError(f"Namespace de caché desconocido: {nombre}")
+        self.nombre = nombre
+        self.timeout = NAMESPACES[nombre]
+        self._prefijo = f'ns:{nombre}' if ambito is None else f'ns:{nombre}:{ambito}'
+        self._clave_version = f'{self._prefijo}:version'
+        # La versión de un dominio no expira. La de un ámbito sí (con el TTL
+        # del dominio): hay uno por objeto y no deben acumularse para siempre;
+        # perderla no revive nada porque la nueva sale del reloj.
+        self._timeout_version = None if ambito is None else self.timeout
+
+    def version(self):
+        version = cache.get(self._clave_version)
+        if version is None:
+            cache.add(self._clave_version, _version_inicial(), self._timeout_version)
+            version = cache.get(self._clave_version) or _version_inicial()
+        return version
+
+    def clave(self, key):
+        return f'{self._prefijo}:v{self.version()}:{key}'
+
+    def get(self, key, default=None):
+        value = cache.get(self.clave(key), _FALTA)
+        registrar_cache(value is not _FALTA)
+        return default if value is _FALTA else value
+
+    def set(self, key, value, timeout=None):
+        cache.set(self.clave(key), value, self.timeout if timeout is None else timeout)
+
+    def get_or_set(self, key, calcular, timeout=None):
+        """Devuelve la entrada o la calcula con `calcular()` y la guarda.
+        `None` no se guarda (se recalcula la próxima vez)."""
+        clave = self.clave(key)
+        value = cache.get(clave)
+        registrar_cache(value is not None)
+        if value is None:
+            value = calcular()
+            if value is not None:
+                cache.set(clave, value, self.timeout if timeout is None else timeout)
+        return value
+
+    def delete(self, key):
+        cache.delete(self.clave(key))
+
+    def invalidar(self):
+        """Descarta TODAS las entradas del dominio (sube la versión)."""
+        try:
+            cache.incr(self._clave_version)
+        except ValueError:
+            # La versión no existía (o expiró): una nueva basada en el reloj
+            # nunca coincide con las que ya se usaron.
+            cache.set(self._clave_version, _version_inicial(), self._timeout_version)
+        except Exception as exc:  # noqa: BLE001 — Redis caído no rompe el guardado
+            logger.warning("No se pudo invalidar la caché '%s': %s", self.nombre, exc)
+
+
+def cache_ns(nombre, ambito=None):
+    return CacheNamespace(nombre, ambito)
+
+
+def invalidar(*nombres):
+    for nombre in nombres:
+        cache_ns(nombre).invalidar()
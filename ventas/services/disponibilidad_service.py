@@ -0,0 +1,322 @@
+"""Motor de disponibilidad por LOTE: una foto de la ocupación para muchos servicios.
+
+`verificar_disponibilidad` + `ServicioSlotBloqueo.slot_bloqueado` +
+`ServicioBloqueo.servicio_bloqueado_en_fecha` hacen cada uno su propia consulta, y
+quien recorre todos los servicios × todos los slots (Luna, un sábado cargado)
+termina haciendo cientos de idas y vueltas a la base por una sola pregunta.
+
+Acá se carga TODO lo que esas funciones miran —bloqueos de día, bloqueos de slot y
+bloques ocupados— para N servicios y un rango de fechas en un número FIJO de
+consultas (3), y después se responde en memoria con exactamente las mismas reglas.
+Las reglas NO se reinventan: cada método dice a qué función existente reemplaza.
+
+`buscar_conflictos` es el chequeo por intervalo (no por slot exacto) para agregar
+un servicio: bloques de varias horas, capacidad simultánea y agenda del proveedor.
+`cargar_bloques_ocupados` es lo mismo para un carrito entero (reservation_service).
+
+Lo que se OFRECE (get_available_hours, la grilla por rango, Luna) sale de la
+misma regla que lo que se VALIDA al agregar: un slot tiene cupo si el pico de
+bloques que se pisan con [hora, hora + duración) —reservas y `RetencionSlot`
+vigentes (pagos Flow en curso)— no llega a `max_servicios_simultaneos`. Solo el
+admin mira slots exactos, sin retenciones.
+"""
+from datetime import timedelta
+
+from django.db.models import F, IntegerField, Value
+from django.utils import timezone
+
+from ..models import (VENTA_CANCELADA, RetencionSlot, ReservaServicio, ServicioBloqueo,
+                      ServicioSlotBloqueo, hora_a_minutos)
+
+DIAS_SEMANA_EN = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def _slots_del_dia(servicio, fecha):
+    """Grilla del día como la leen `verificar_disponibilidad` y `get_available_hours`:
+    SOLO el formato dict por día de semana; una lista plana no define días."""
+    slots_config = servicio.slots_disponibles if isinstance(servicio.slots_disponibles, dict) else {}
+    return slots_config.get(DIAS_SEMANA_EN[fecha.weekday()], []) or []
+
+
+class OcupacionRango:
+    """Foto de la ocupación de un rango de fechas para un conjunto de servicios.
+
+    Se construye con `cargar_ocupacion_rango`; no toca la base después de eso.
+    """
+
+    def __init__(self, desde, hasta, dias_bloqueados, slots_bloqueados, filas):
+        self.desde = desde
+        self.hasta = hasta
+        self._dias_bloqueados = dias_bloqueados      # {(servicio_id, fecha)}
+        self._slots_bloqueados = slots_bloqueados    # {(servicio_id, fecha, 'HH:MM')}
+        self._bloques = {}                           # {(servicio_id, fecha): [(inicio, fin)]}
+        self._personas = {}                          # {(servicio_id, fecha, minuto_inicio): personas}
+        self._noches = {}                            # {servicio_id: {fecha}}
+        for servicio_id, fecha, inicio, fin, personas in filas:
+            self._noches.setdefault(servicio_id, set()).add(fecha)
+            if inicio is None:
+                continue
+            self._bloques.setdefault((servicio_id, fecha), []).append((inicio, fin or inicio))
+            clave = (servicio_id, fecha, inicio)
+            self._personas[clave] = self._personas.get(clave, 0) + (personas or 0)
+        for servicio_id, fecha in dias_bloqueados:
+            self._noches.setdefault(servicio_id, set()).add(fecha)
+
+    def fechas(self):
+        f = self.desde
+        while f <= self.hasta:
+            yield f
+            f += timedelta(days=1)
+
+    def dia(self, fecha):
+        return OcupacionDia(self, fecha)
+
+    def servicio_bloqueado(self, servicio_id, fecha):
+        """= `ServicioBloqueo.servicio_bloqueado_en_fecha(servicio_id, fecha)`."""
+        return (servicio_id, fecha) in self._dias_bloqueados
+
+    def slot_bloqueado(self, servicio_id, fecha, hora):
+        """= `ServicioSlotBloqueo.slot_bloqueado(servicio_id, fecha, hora)`."""
+        return (servicio_id, fecha, hora) in self._slots_bloqueados
+
+    def cupos_libres(self, servicio, fecha, hora):
+        """Reservas más que entran con bloque [hora, hora + duración): la regla de
+        `buscar_conflictos(..., contar_retenciones=True)`. 0 si el día o el slot
+        están bloqueados o la hora no se entiende."""
+        inicio = hora_a_minutos(hora)
+        if (inicio is None or self.servicio_bloqueado(servicio.id, fecha)
+                or self.slot_bloqueado(servicio.id, fecha, str(hora))):
+            return 0
+        fin = inicio + max(servicio.duracion or 0, 1)
+        max_simultaneos = getattr(servicio, 'max_servicios_simultaneos', 1) or 1
+        pico = _pico_simultaneas(self._bloques.get((servicio.id, fecha), []), inicio, fin)
+        return max(0, max_simultaneos - pico)
+
+    def personas_en_slot(self, servicio_id, fecha, hora):
+        """Personas ya reservadas en ese slot (por `minuto_inicio`)."""
+        return self._personas.get((servicio_id, fecha, hora_a_minutos(hora)), 0)
+
+    def noches_ocupadas(self, servicio_id):
+        """Fechas del rango en que el servicio tiene ALGUNA reserva o retención, o
+        un bloqueo de día (OTA, mantención). Regla de alojamiento: una cabaña con
+        cualquier reserva esa noche no está libre, sin mirar slots ni capacidad."""
+        return self._noches.get(servicio_id, set())
+
+    def libre_entre(self, servicio_id, llegada, salida):
+        """¿Libre TODAS las noches de [llegada, salida)? (salida = check-out)."""
+        ocupadas = self.noches_ocupadas(servicio_id)
+        f = llegada
+        while f < salida:
+            if f in ocupadas:
+                return False
+            f += timedelta(days=1)
+        return True
+
+    def grilla(self, servicio):
+        """Cupos libres por día y por slot (`cupos_libres`); bloqueado = 0.
+
+        Devuelve {'YYYY-MM-DD': {'bloqueado': bool, 'slots': {'HH:MM': libres}}}.
+        Un día sin grilla configurada (ej. martes cerrado) trae `slots` vacío.
+        """
+        return {
+            fecha.isoformat(): {
+                'bloqueado': self.servicio_bloqueado(servicio.id, fecha),
+                'slots': {str(hora): self.cupos_libres(servicio, fecha, hora)
+                          for hora in _slots_del_dia(servicio, fecha)},
+            }
+            for fecha in self.fechas()
+        }
+
+
+class OcupacionDia:
+    """Vista de UN día de una `OcupacionRango` (lo que consulta Luna)."""
+
+    def __init__(self, rango, fecha):
+        self.rango = rango
+        self.fecha = fecha
+
+    def servicio_bloqueado(self, servicio_id):
+        return self.rango.servicio_bloqueado(servicio_id, self.fecha)
+
+    def slot_bloqueado(self, servicio_id, hora):
+        return self.rango.slot_bloqueado(servicio_id, self.fecha, hora)
+
+    def personas_en_slot(self, servicio_id, hora):
+        return self.rango.personas_en_slot(servicio_id, self.fecha, hora)
+
+    def cupos_libres(self, servicio, hora):
+        return self.rango.cupos_libres(servicio, self.fecha, hora)
+
+    def slot_admite(self, servicio, hora, cantidad_personas=1):
+        """La hora tiene que estar en la grilla del día, entrar por intervalo
+        (`cupos_libres`, lo mismo que valida el checkout) y, como en
+        `verificar_disponibilidad`, las personas del slot + las nuevas no pueden
+        pasar `capacidad_maxima`."""
+        hora_str = str(hora)
+        minuto = hora_a_minutos(hora_str)
+        if minuto is None or minuto not in {hora_a_minutos(s) for s in _slots_del_dia(servicio, self.fecha)}:
+            return False
+        if self.cupos_libres(servicio, hora_str) < 1:
+            return False
+        capacidad_maxima = getattr(servicio, 'capacidad_maxima', 1)
+        return (self.personas_en_slot(servicio.id, hora_str) + cantidad_personas) <= capacidad_maxima
+
+
+def cargar_ocupacion_rango(servicio_ids, desde, hasta, excluir_pending=None):
+    """Carga bloqueos de día, bloqueos de slot y bloques ocupados (reservas y
+    retenciones vigentes) entre `desde` y `hasta` (inclusive) para todos los
+    `servicio_ids` en 3 consultas, sin importar cuántos servicios, días o slots
+    sean."""
+    servicio_ids = list(servicio_ids)
+    if not servicio_ids:
+        return OcupacionRango(desde, hasta, set(), set(), [])
+
+    dias_bloqueados, slots_bloqueados = cargar_bloqueos(servicio_ids, desde, hasta)
+    fechas = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    filas = _filas_ocupadas(servicio_ids, fechas, excluir_pending)
+    return OcupacionRango(desde, hasta, dias_bloqueados, slots_bloqueados, filas)
+
+
+def cargar_bloqueos(servicio_ids, desde, hasta):
+    """Bloqueos de día {(servicio_id, fecha)} y de slot {(servicio_id, fecha, 'HH:MM')}
+    activos entre `desde` y `hasta` (2 consultas)."""
+    dias_bloqueados = set()
+    for servicio_id, inicio, fin in ServicioBloqueo.objects.filter(
+        servicio_id__in=servicio_ids,
+        fecha_inicio__lte=hasta,
+        fecha_fin__gte=desde,
+        activo=True,
+    ).values_list('servicio_id', 'fecha_inicio', 'fecha_fin'):
+        f = max(inicio, desde)
+        while f <= min(fin, hasta):
+            dias_bloqueados.add((servicio_id, f))
+            f += timedelta(days=1)
+
+    slots_bloqueados = set(ServicioSlotBloqueo.objects.filter(
+        servicio_id__in=servicio_ids,
+        fecha__gte=desde,
+        fecha__lte=hasta,
+        activo=True,
+    ).values_list('servicio_id', 'fecha', 'hora_slot'))
+    return dias_bloqueados, slots_bloqueados
+
+
+def cargar_ocupacion_dia(servicio_ids, fecha):
+    """`cargar_ocupacion_rango` de un solo día (3 consultas)."""
+    return cargar_ocupacion_rango(servicio_ids, fecha, fecha).dia(fecha)
+
+
+def retenciones_vigentes(excluir_pending=None):
+    """`RetencionSlot` que todavía no vencen (las de `excluir_pending` no: son
+    del mismo pago que se está confirmando)."""
+    qs = RetencionSlot.objects.filter(expires_at__gt=timezone.now())
+    if excluir_pending is not None:
+        qs = qs.exclude(pending_reservation=excluir_pending)
+    return qs
+
+
+def _filas_ocupadas(servicio_ids, fechas, excluir_pending=None):
+    """(servicio_id, fecha, inicio, fin, personas) de reservas y retenciones
+    vigentes, en UNA consulta (UNION ALL). Como en `ReservaServicio.solapadas`,
+    el fin de una reserva sale de la duración de su servicio y las ventas
+    canceladas (`VENTA_CANCELADA`) no ocupan. Una reserva con hora ilegible
+    viene con inicio None: ocupa la noche, no un bloque."""
+    reservas = ReservaServicio.objects.filter(
+        servicio_id__in=servicio_ids, fecha_agendamiento__in=fechas,
+    ).exclude(VENTA_CANCELADA).annotate(
+        _fin=F('minuto_inicio') + F('servicio__duracion'),
+        _personas=F('cantidad_personas'),
+    ).values_list('servicio_id', 'fecha_agendamiento', 'minuto_inicio', '_fin', '_personas').order_by()
+    # Mismas anotaciones en el mismo orden: el SQL pone las columnas anotadas
+    # al final, y el UNION empareja por posición.
+    retenciones = retenciones_vigentes(excluir_pending).filter(
+        servicio_id__in=servicio_ids, fecha__in=fechas,
+    ).annotate(
+        _fin=F('minuto_fin'),
+        _personas=Value(0, output_field=IntegerField()),
+    ).values_list('servicio_id', 'fecha', 'minuto_inicio', '_fin', '_personas').order_by()
+    return reservas.union(retenciones, all=True)
+
+
+def cargar_bloques_ocupados(servicio_ids, fechas, excluir_pending=None):
+    """Bloques [inicio, fin) en minutos que ya ocupan reservas y retenciones
+    vigentes, por (servicio_id, fecha): lo que `buscar_conflictos` mira para
+    un servicio, cargado para todo un carrito en UNA consulta."""
+    bloques = {}
+    for servicio_id, fecha, inicio, fin, _personas in _filas_ocupadas(servicio_ids, fechas, excluir_pending):
+        if inicio is not None:
+            bloques.setdefault((servicio_id, fecha), []).append((inicio, fin or inicio))
+    return bloques
+
+
+class Conflicto:
+    """Un motivo por el que un bloque horario no entra, con las reservas que lo causan."""
+
+    def __init__(self, motivo, mensaje, reservas):
+        self.motivo = motivo        # 'hora' | 'capacidad' | 'proveedor'
+        self.mensaje = mensaje
+        self.reservas = reservas
+
+    def __repr__(self):
+        return f'<Conflicto {self.motivo}: {self.mensaje}>'
+
+
+def _pico_simultaneas(bloques, inicio, fin):
+    """Máximo de bloques [a, b) que se pisan en algún instante de [inicio, fin).
+    Basta mirar `inicio` y cada comienzo que cae dentro del rango."""
+    puntos = {inicio} | {a for a, _ in bloques if inicio < a < fin}
+    return max((sum(1 for a, b in bloques if a <= t < b) for t in puntos), default=0)
+
+
+def buscar_conflictos(servicio, fecha, hora, unidades=1, proveedor=None, excluir=None,
+                      contar_retenciones=False):
+    """Chequeo de solapes por INTERVALO, compartido por admin, checkout y Luna.
+
+    El bloque pedido es [hora, hora + servicio.duracion). Entra si:
+    · en ningún instante del bloque el servicio supera `max_servicios_simultaneos`
+      reservas (contando las `unidades` nuevas), y
+    · `proveedor` (si viene) no tiene otra reserva que se cruce, de ningún servicio.
+
+    Una consulta sobre el índice (servicio, fecha, minuto): cuesta lo que las
+    reservas de ESE día, no lo que la tabla entera. `excluir` es la reserva que
+    se está editando. Con `contar_retenciones`, los slots retenidos por pagos
+    Flow en curso también ocupan (una consulta más). Devuelve [] si entra, o la
+    lista de `Conflicto`.
+    """
+    inicio = hora_a_minutos(hora)
+    if inicio is None:
+        return [Conflicto('hora', f'hora inválida: {hora!r}', [])]
+    duracion = max(servicio.duracion or 0, 1)  # un servicio sin duración igual ocupa su minuto
+    fin = inicio + duracion
+
+    qs = ReservaServicio.solapadas(servicio, fecha, inicio, duracion, proveedor=proveedor)
+    if excluir is not None and excluir.pk:
+        qs = qs.exclude(pk=excluir.pk)
+    cruzadas = list(qs.select_related('servicio', 'proveedor_asignado'))
+
+    conflictos = []
+    del_servicio = [r for r in cruzadas if r.servicio_id == servicio.id]
+    max_simultaneos = getattr(servicio, 'max_servicios_simultaneos', 1) or 1
+    bloques = [(r.minuto_inicio, r._minuto_fin) for r in del_servicio]
+    if contar_retenciones:
+        bloques += list(retenciones_vigentes().filter(
+            servicio=servicio, fecha=fecha, minuto_inicio__lt=fin, minuto_fin__gt=inicio,
+        ).values_list('minuto_inicio', 'minuto_fin'))
+    if _pico_simultaneas(bloques, inicio, fin) + unidades > max_simultaneos:
+        conflictos.append(Conflicto(
+            'capacidad',
+            f'{servicio.nombre} ya tiene {len(del_servicio)} reserva(s) que se cruzan '
+            f'(máximo simultáneo: {max_simultaneos})',
+            del_servicio,
+        ))
+
+    if proveedor is not None:
+        del_proveedor = [r for r in cruzadas if r.proveedor_asignado_id == proveedor.pk]
+        if del_proveedor:
+            conflictos.append(Conflicto(
+                'proveedor',
+                f'{proveedor.nombre} ya está asignado a {del_proveedor[0].servicio.nombre} '
+                f'a las {del_proveedor[0].hora_inicio}',
+                del_proveedor,
+            ))
+    return conflictos
@@ -0,0 +1,213 @@
+"""Motor de envío masivo de email: campañas (`enviar_campana_email`), goteo de
+CommunicationLog (`send_next_campaign_drip`) y cola MailParaEnviar
+(`enviar_emails_programados`).
+
+Antes cada comando abría una conexión por destinatario, consultaba la lista
+negra y las bajas dos veces por email, escribía un log por fila y espaciaba los
+lotes con `time.sleep(intervalo * 60)`. Acá:
+
+    ListaSupresion  lista negra activa + bajas del newsletter, en un set
+                    (2 consultas por carga, no 2 por email)
+    LimitadorTasa   token bucket: ritmo sostenido con ráfaga inicial; cada
+                    envío toma una ficha en vez de dormir lote a lote
+    Enviador        una conexión del backend (SMTP o API) abierta para todo
+                    el lote; si se cae a mitad, se reabre y sigue. Si no
+                    abre, lo que falta vuelve como no intentado
+                    (`intentado=False`) y quien llama lo devuelve a pendiente
+    reclamar        pasa filas de pendiente → en curso ANTES de enviar, con
+                    FOR UPDATE SKIP LOCKED donde la base lo soporta, y marca
+                    la hora del reclamo
+    liberar_colgados
+                    lo que lleva RECLAMO_VENCIDO en curso (la corrida que lo
+                    reclamó murió) pasa a fallido
+
+Reanudar sin duplicar: lo reclamado deja de ser pendiente, así que una corrida
+que se cae a mitad de lote no vuelve a mandar esas filas — quedan "en curso"
+(`sending` / `SENDING` / `ENVIANDO`) y, vencido el reclamo, fallidas para
+revisarlas a mano (no pendientes: pudieron haber salido). La corrida
+siguiente sigue con lo que quedó pendiente. Lo peor que deja un crash es un
+lote sin confirmar, nunca un email repetido.
+"""
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+from itertools import chain
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se relee la supresión en una corrida larga: respeta las bajas
+# que llegan mientras la campaña está enviando.
+REFRESCO_SUPRESION_S = 60
+
+# Un lote en curso más viejo que esto es de una corrida que murió: el lote
+# más lento (intervalo del limitador + IA por destinatario) tarda bastante menos.
+RECLAMO_VENCIDO = timedelta(hours=2)
+
+# intentado=False: no llegó a salir (sin conexión); vuelve a pendiente.
+Resultado = namedtuple('Resultado', 'ok error ms intentado', defaults=(True,))
+
+
+class ListaSupresion:
+    """Emails a los que no se les envía: lista negra activa o baja del newsletter."""
+
+    def __init__(self, emails=()):
+        self.emails = frozenset(emails)
+        self.cargada = time.monotonic()
+
+    @classmethod
+    def cargar(cls):
+        from ventas.models import EmailBlacklist, NewsletterSubscriber
+
+        negra = EmailBlacklist.objects.filter(is_active=True).values_list('email', flat=True)
+        bajas = NewsletterSubscriber.objects.filter(is_active=False).values_list('email', flat=True)
+        return cls(e.strip().lower() for e in chain(negra, bajas) if e)
+
+    def vencida(self):
+        return time.monotonic() - self.cargada > REFRESCO_SUPRESION_S
+
+    def excluye(self, email):
+        email = (email or '').strip().lower()
+        return not email or email in self.emails
+
+
+class LimitadorTasa:
+    """Token bucket: `por_minuto` fichas por minuto, hasta `rafaga` acumuladas.
+
+    Arranca lleno, así que la primera ráfaga sale sin esperar (el modo cron de
+    un lote por corrida se comporta igual que antes). `por_minuto` vacío o 0 =
+    sin límite. `reloj` y `dormir` se inyectan en los tests.
+    """
+
+    def __init__(self, por_minuto, rafaga=1, reloj=time.monotonic, dormir=time.sleep):
+        self.por_segundo = (por_minuto or 0) / 60
+        self.rafaga = max(1, rafaga)
+        self.fichas = float(self.rafaga)
+        self.reloj = reloj
+        self.dormir = dormir
+        self._ultimo = reloj()
+
+    def _recargar(self):
+        ahora = self.reloj()
+        self.fichas = min(self.rafaga, self.fichas + (ahora - self._ultimo) * self.por_segundo)
+        self._ultimo = ahora
+
+    def tomar(self):
+        """Espera (si hace falta) hasta tener una ficha y la consume."""
+        if not self.por_segundo:
+            return
+        self._recargar()
+        if self.fichas < 1:
+            self.dormir((1 - self.fichas) / self.por_segundo)
+            self._recargar()
+        self.fichas -= 1
+
+
+class Enviador:
+    """Envía una lista de EmailMessage por UNA conexión del backend configurado.
+
+    Si la conexión no abre (SMTP caído), los mensajes que faltan vuelven con
+    `intentado=False` en vez de levantar la excepción: quien llama ya reclamó
+    el lote y los devuelve a pendiente. `sin_conexion` queda en True para que
+    una corrida de varios lotes corte ahí.
+    """
+
+    def __init__(self, limitador=None, conexion=None):
+        self.limitador = limitador
+        self.conexion = conexion
+        self.sin_conexion = False
+
+    def _abrir(self, conexion):
+        try:
+            return conexion.open(), ''
+        except Exception as e:  # noqa: BLE001 — se devuelve como resultado
+            self.sin_conexion = True
+            error = f'Sin conexión con el backend de email: {str(e) or e.__class__.__name__}'
+            logger.error(error)
+            return None, error
+
+    def enviar(self, mensajes):
+        """[Resultado(ok, error, ms, intentado)] en el mismo orden que
+        `mensajes`. Un error en un mensaje no corta el lote; una conexión que
+        no abre deja el resto sin intentar."""
+        mensajes = list(mensajes)
+        conexion = self.conexion or get_connection()
+        abierta, error_conexion = self._abrir(conexion)
+        if error_conexion:
+            return [Resultado(False, error_conexion, 0, False) for _ in mensajes]
+        resultados = []
+        try:
+            for mensaje in mensajes:
+                if error_conexion:
+                    resultados.append(Resultado(False, error_conexion, 0, False))
+                    continue
+                if self.limitador:
+                    self.limitador.tomar()
+                mensaje.connection = conexion
+                inicio = time.perf_counter()
+                try:
+                    ok = bool(conexion.send_messages([mensaje]))
+                    error = '' if ok else 'El backend no aceptó el mensaje'
+                except Exception as e:  # noqa: BLE001 — se registra por destinatario
+                    ok, error = False, str(e) or e.__class__.__name__
+                    logger.warning("Envío a %s falló: %s", mensaje.to, error)
+                    # La conexión puede haber quedado rota: reabrir para el resto.
+                    try:
+                        conexion.close()
+                    except Exception:  # noqa: BLE001
+                        pass
+                    _reabierta, error_conexion = self._abrir(conexion)
+                resultados.append(Resultado(ok, error, (time.perf_counter() - inicio) * 1000))
+        finally:
+            if abierta and not error_conexion:
+                conexion.close()
+        return resultados
+
+
+def reclamar(qs, campo, pendiente, en_curso, limite, marca=None):
+    """Marca hasta `limite` filas de `qs` con `campo == pendiente` como
+    `en_curso` (y la hora en el campo `marca`) y las devuelve (en el orden
+    de `qs`).
+
+    En PostgreSQL las filas que otra corrida está reclamando se saltan
+    (SKIP LOCKED) en vez de esperar; en SQLite el lock es de toda la base.
+    """
+    modelo = qs.model
+    cambios = {campo: en_curso}
+    if marca:
+        cambios[marca] = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            qs.filter(**{campo: pendiente})
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:limite]
+        )
+        if not ids:
+            return []
+        modelo._default_manager.filter(id__in=ids).update(**cambios)
+    por_id = modelo._default_manager.in_bulk(ids)
+    filas = [por_id[i] for i in ids if i in por_id]
+    for fila in filas:
+        for nombre, valor in cambios.items():
+            setattr(fila, nombre, valor)
+    return filas
+
+
+def liberar_colgados(qs, campo, en_curso, fallido, marca, vencido=RECLAMO_VENCIDO, **cambios):
+    """Pasa a `fallido` las filas de `qs` que llevan más de `vencido` en
+    `en_curso` (o sin `marca`: reclamadas antes de que existiera): la corrida
+    que las reclamó murió sin confirmar. Fallidas y no pendientes porque
+    pudieron haber salido. Devuelve cuántas liberó."""
+    limite = timezone.now() - vencido
+    n = qs.filter(**{campo: en_curso}).filter(
+        Q(**{f'{marca}__lt': limite}) | Q(**{f'{marca}__isnull': True}),
+    ).update(**{campo: fallido}, **cambios)
+    if n:
+        logger.warning("%s %s colgados en '%s' desde antes de %s: pasan a '%s'",
+                       n, qs.model.__name__, en_curso, limite, fallido)
+    return n
@@ -0,0 +1,301 @@
+"""Exportaciones CSV / XLSX sin armar el archivo completo en memoria.
+
+`servicios_vendidos_view`, `exportar_clientes_excel`, `exportar_estadisticas_csv`
+y las acciones de admin armaban una lista con todas las filas y un libro xlwt
+en memoria antes de responder: con un año de datos el worker se cortaba por
+tiempo (y el .xls no pasa de 65.536 filas). Ahora:
+
+    respuesta_csv     StreamingHttpResponse: las filas salen a medida que se
+                      leen, con `.iterator(chunk_size=FILAS_POR_TROZO)` (cursor
+                      del lado del servidor en PostgreSQL)
+    respuesta_xlsx    openpyxl en modo write_only: las filas van a un archivo
+                      temporal en disco y se sirve con FileResponse
+    responder         lo que usan las vistas: CSV o XLSX según `export`, o en
+                      segundo plano si el XLSX es grande o se pidió
+    encolar /         la exportación queda en `ExportacionArchivo`; el comando
+    generar_pendientes `generar_exportaciones` (cron) escribe el archivo al
+                      storage y se descarga desde /ventas/exportaciones/
+    vencer_colgadas   las que quedaron 'generando' de una corrida que murió
+                      pasan a error (las ve quien las pidió o un administrador)
+
+Cada exportación de EXPORTACIONES es una función parámetros → (encabezados,
+queryset, fila): el queryset es un values_list y `fila` lo pasa a celdas. Los
+parámetros son los strings de GET, para poder guardarlos en JSON.
+"""
+import csv
+import itertools
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from django.contrib import messages
+from django.core.files import File
+from django.http import FileResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FILAS_POR_TROZO = 2000
+# Sobre esto un XLSX no se arma en la petición: el CSV sale en streaming a
+# cualquier tamaño, el XLSX tiene que escribirse completo antes de enviarse.
+UMBRAL_SEGUNDO_PLANO = 50000
+DIAS_CONSERVACION = 7
+# Una exportación 'generando' desde hace más que esto es de una corrida que
+# murió (el trabajo generar_exportaciones se corta a la hora).
+GENERACION_VENCIDA = timedelta(hours=2)
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+# --- Escritura ---------------------------------------------------------------
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def lineas_csv(encabezados, filas):
+    """Genera el CSV (con BOM para Excel) en trozos de FILAS_POR_TROZO líneas."""
+    escritor = csv.writer(_Eco())
+    trozo = ['\ufeff']
+    if encabezados:
+        trozo.append(escritor.writerow(encabezados))
+    for fila in filas:
+        trozo.append(escritor.writerow(fila))
+        if len(trozo) >= FILAS_POR_TROZO:
+            yield ''.join(trozo)
+            trozo = []
+    if trozo:
+        yield ''.join(trozo)
+
+
+def escribir_xlsx(destino, hoja, encabezados, filas):
+    """Escribe un XLSX en `destino` (ruta o archivo) sin tener las filas en
+    memoria. Devuelve cuántas filas de datos escribió."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    libro = Workbook(write_only=True)
+    ws = libro.create_sheet(hoja[:31])
+    negrita = Font(bold=True)
+    titulos = []
+    for titulo in encabezados:
+        celda = WriteOnlyCell(ws, value=titulo)
+        celda.font = negrita
+        titulos.append(celda)
+    ws.append(titulos)
+    n = 0
+    for fila in filas:
+        ws.append([_celda_xlsx(v) for v in fila])
+        n += 1
+    libro.save(destino)
+    return n
+
+
+def _celda_xlsx(valor):
+    # openpyxl no acepta datetimes con zona horaria.
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def respuesta_csv(nombre, encabezados, filas):
+    respuesta = StreamingHttpResponse(lineas_csv(encabezados, filas), content_type='text/csv; charset=utf-8')
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
+
+
+def respuesta_xlsx(nombre, hoja, encabezados, filas):
+    # Archivo temporal anónimo: FileResponse lo cierra (y el SO lo borra) al terminar.
+    archivo = tempfile.TemporaryFile()
+    escribir_xlsx(archivo, hoja, encabezados, filas)
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename=nombre, content_type=CONTENT_TYPE_XLSX)
+
+
+# --- Exportaciones -----------------------------------------------------------
+
+def _fecha(valor, defecto):
+    try:
+        return datetime.strptime(valor or '', '%Y-%m-%d').date()
+    except ValueError:
+        return defecto
+
+
+def _clientes(parametros):
+    from ventas.models import Cliente
+
+    encabezados = ['ID', 'Nombre', 'Teléfono', 'Email', 'Documento Identidad', 'Ciudad']
+    qs = Cliente.objects.order_by('nombre', 'id').values_list(
+        'id', 'nombre', 'telefono', 'email', 'documento_identidad', 'ciudad')
+    return encabezados, qs, lambda f: [f[0], f[1]] + [v or '' for v in f[2:]]
+
+
+def _servicios_vendidos(parametros):
+    """Mismos filtros que `servicios_vendidos_view`: rango de fecha_agendamiento,
+    categoría y venta. Precio congelado si existe, si no el del catálogo."""
+    from ventas.models import ReservaServicio
+
+    hoy = timezone.localdate()
+    qs = ReservaServicio.objects.filter(
+        servicio__isnull=False,
+        fecha_agendamiento__gte=_fecha(parametros.get('fecha_inicio'), hoy),
+        fecha_agendamiento__lte=_fecha(parametros.get('fecha_fin'), hoy),
+    )
+    if parametros.get('categoria'):
+        qs = qs.filter(servicio__categoria_id=parametros['categoria'])
+    if (parametros.get('venta_reserva_id') or '').isdigit():
+        qs = qs.filter(venta_reserva_id=int(parametros['venta_reserva_id']))
+    qs = qs.order_by('-fecha_agendamiento', 'hora_inicio', 'id').values_list(
+        'venta_reserva_id', 'venta_reserva__cliente__nombre', 'servicio__categoria__nombre',
+        'servicio__nombre', 'venta_reserva__estado_reserva', 'fecha_agendamiento', 'hora_inicio',
+        'cantidad_personas', 'precio_unitario_venta', 'servicio__precio_base', 'proveedor_asignado__nombre')
+
+    def fila(f):
+        (venta, cliente, categoria, servicio, estado, fecha, hora, personas,
+         precio_venta, precio_base, proveedor) = f
+        return [venta or 'N/A', cliente or 'N/A', categoria or 'N/A', servicio, estado or 'N/A',
+                fecha, hora or '', personas, (precio_venta or precio_base) * personas, proveedor or 'N/A']
+
+    encabezados = ['ID Venta/Reserva', 'Cliente', 'Categoría del Servicio', 'Servicio', 'Estado',
+                   'Fecha de Agendamiento', 'Hora de Agendamiento', 'Cantidad de Personas',
+                   'Monto Total', 'Proveedor Asignado']
+    return encabezados, qs, fila
+
+
+# tipo → (título de la hoja y del archivo, función)
+EXPORTACIONES = {
+    'clientes': ('Clientes', _clientes),
+    'servicios_vendidos': ('Servicios Vendidos', _servicios_vendidos),
+}
+
+
+def _filas(queryset, fila):
+    return (fila(f) for f in queryset.iterator(chunk_size=FILAS_POR_TROZO))
+
+
+def _nombre_archivo(tipo, formato, cuando=None):
+    titulo = EXPORTACIONES[tipo][0].replace(' ', '_')
+    return f"{titulo}_{(cuando or datetime.now()):%Y%m%d_%H%M%S}.{formato}"
+
+
+def responder(request, tipo, parametros=None):
+    """Respuesta de exportación para una vista: `export=csv` sale en streaming;
+    si no, XLSX. Con `segundo_plano=1`, o si el XLSX pasa de
+    UMBRAL_SEGUNDO_PLANO filas, se encola y redirige a las exportaciones."""
+    parametros = {k: v for k, v in (parametros or {}).items() if v not in (None, '')}
+    titulo, armar = EXPORTACIONES[tipo]
+    formato = 'csv' if request.GET.get('export') == 'csv' else 'xlsx'
+    encabezados, qs, fila = armar(parametros)
+
+    if request.GET.get('segundo_plano') or (formato == 'xlsx' and qs.count() > UMBRAL_SEGUNDO_PLANO):
+        exportacion = encolar(tipo, parametros, formato, request.user)
+        messages.info(request, f"La exportación #{exportacion.pk} se está generando; "
+                               "aparecerá aquí para descargar en unos minutos.")
+        return redirect('ventas:exportaciones')
+
+    nombre = _nombre_archivo(tipo, formato)
+    if formato == 'csv':
+        return respuesta_csv(nombre, encabezados, _filas(qs, fila))
+    return respuesta_xlsx(nombre, titulo, encabezados, _filas(qs, fila))
+
+
+# --- Segundo plano -----------------------------------------------------------
+
+def encolar(tipo, parametros, formato='xlsx', usuario=None):
+    from ventas.models import ExportacionArchivo
+
+    if tipo not in EXPORTACIONES:
+        raise ValueError(f"Exportación desconocida: {tipo}")
+    return ExportacionArchivo.objects.create(
+        tipo=tipo, formato=formato, parametros=parametros or {},
+        solicitado_por=usuario if getattr(usuario, 'is_authenticated', False) else None)
+
+
+def generar(exportacion):
+    """Escribe el archivo de una exportación ya tomada (estado generando)."""
+    from ventas.models import ExportacionArchivo
+
+    titulo, armar = EXPORTACIONES[exportacion.tipo]
+    encabezados, qs, fila = armar(exportacion.parametros)
+    with tempfile.TemporaryFile() as archivo:
+        if exportacion.formato == 'csv':
+            # zip avanza el contador una vez por fila: al final vale cuántas hubo.
+            contador = itertools.count()
+            filas = (celdas for celdas, _ in zip(_filas(qs, fila), contador))
+            for trozo in lineas_csv(encabezados, filas):
+                archivo.write(trozo.encode('utf-8'))
+            n = next(contador)
+        else:
+            n = escribir_xlsx(archivo, titulo, encabezados, _filas(qs, fila))
+        archivo.seek(0)
+        nombre = _nombre_archivo(exportacion.tipo, exportacion.formato, timezone.localtime(exportacion.creado_en))
+        exportacion.archivo.save(nombre, File(archivo), save=False)
+    exportacion.filas = n
+    exportacion.estado = ExportacionArchivo.ESTADO_LISTO
+    exportacion.terminado_en = timezone.now()
+    exportacion.save(update_fields=['archivo', 'filas', 'estado', 'terminado_en'])
+
+
+def vencer_colgadas(vencida=GENERACION_VENCIDA):
+    """Pasa a error las exportaciones que quedaron 'generando' por más de
+    `vencida` (o sin hora de toma): el proceso que las generaba murió y, si no,
+    quedarían así para siempre. Devuelve cuántas."""
+    from django.db.models import Q
+
+    from ventas.models import ExportacionArchivo
+
+    ahora = timezone.now()
+    n = ExportacionArchivo.objects.filter(
+        Q(tomado_en__lt=ahora - vencida) | Q(tomado_en__isnull=True),
+        estado=ExportacionArchivo.ESTADO_GENERANDO,
+    ).update(estado=ExportacionArchivo.ESTADO_ERROR, terminado_en=ahora,
+             error='Sin terminar: el proceso que la generaba se cortó. Vuelve a pedirla.')
+    if n:
+        logger.warning("%s exportación(es) colgadas en 'generando' pasaron a error", n)
+    return n
+
+
+def generar_pendientes(limite=5):
+    """Genera hasta `limite` exportaciones pendientes, las más viejas primero,
+    después de vencer las colgadas. Devuelve (listas, con error)."""
+    from ventas.models import ExportacionArchivo
+
+    vencer_colgadas()
+    listas = errores = 0
+    for pk in list(ExportacionArchivo.objects.filter(estado=ExportacionArchivo.ESTADO_PENDIENTE)
+                   .order_by('creado_en').values_list('pk', flat=True)[:limite]):
+        # Tomarla solo si sigue pendiente: dos crons a la vez no la generan dos veces.
+        if not ExportacionArchivo.objects.filter(pk=pk, estado=ExportacionArchivo.ESTADO_PENDIENTE) \
+                .update(estado=ExportacionArchivo.ESTADO_GENERANDO, tomado_en=timezone.now()):
+            continue
+        exportacion = ExportacionArchivo.objects.get(pk=pk)
+        try:
+            generar(exportacion)
+            listas += 1
+        except Exception as e:
+            logger.exception("No se pudo generar la exportación #%s", pk)
+            ExportacionArchivo.objects.filter(pk=pk).update(
+                estado=ExportacionArchivo.ESTADO_ERROR, error=str(e)[:2000], terminado_en=timezone.now())
+            errores += 1
+    return listas, errores
+
+
+def purgar(dias=DIAS_CONSERVACION):
+    """Borra las exportaciones (y sus archivos) de hace más de `dias` días."""
+    from ventas.models import ExportacionArchivo
+
+    n = 0
+    for exportacion in ExportacionArchivo.objects.filter(creado_en__lt=timezone.now() - timedelta(days=dias)):
+        if exportacion.archivo:
+            try:
+                exportacion.archivo.delete(save=False)
+            except Exception:
+                logger.warning("No se pudo borrar el archivo de la exportación #%s", exportacion.pk,
+                               exc_info=True)
+        exportacion.delete()
+        n += 1
+    return n
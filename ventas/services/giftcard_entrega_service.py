@@ -0,0 +1,95 @@
+"""Entrega de GiftCards pagadas: estado 'cobrado' + email con los PDFs.
+
+La señal `post_save` de `Pago` hacía todo dentro del guardado del pago: volvía
+a calcular el total, guardaba cada GiftCard una por una, diagramaba los PDFs
+con WeasyPrint y mandaba el email por SMTP. El webhook de Flow o el admin
+esperaban todo eso (y si el SMTP fallaba, el email no se reintentaba nunca).
+Ahora:
+
+    programar     lo que llaman la señal y el webhook de Flow: al confirmar la
+                  transacción (el total ya está recalculado) reclama las
+                  GiftCards por_cobrar de la venta con UN update → 'cobrado'
+                  y encola `entregar_giftcards` con sus ids
+    entregar      la tarea (worker `procesar_trabajos`, cola 'avisos'): arma
+                  los PDFs, manda el email y marca enviado_email. Si el envío
+                  falla, el trabajo se reintenta con backoff
+
+Idempotente: una GiftCard solo pasa de por_cobrar a cobrado una vez (la
+reclama un solo pago, aunque lleguen dos a la vez), y la entrega salta las que
+ya tienen enviado_email.
+"""
+import logging
+from functools import partial
+
+from django.db import transaction
+
+from . import trabajos_service
+from .giftcard_pdf_service import GiftCardPDFService
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_PAGO_ENTREGA = ('pagado', 'parcial')
+
+
+def programar(venta_reserva_id):
+    """Reclama y encola la entrega de las GiftCards de la venta cuando se
+    confirme la transacción en curso (en el acto si no hay una)."""
+    transaction.on_commit(partial(_reclamar_y_encolar, venta_reserva_id))
+
+
+def _reclamar_y_encolar(venta_reserva_id):
+    from ventas.models import GiftCard, VentaReserva
+
+    try:
+        with transaction.atomic():
+            estado_pago = VentaReserva.objects.filter(pk=venta_reserva_id).values_list(
+                'estado_pago', flat=True).first()
+            if estado_pago not in ESTADOS_PAGO_ENTREGA:
+                return None
+            ids = list(GiftCard.objects.select_for_update()
+                       .filter(venta_reserva_id=venta_reserva_id, estado='por_cobrar')
+                       .order_by('id').values_list('id', flat=True))
+            if not ids:
+                return None
+            GiftCard.objects.filter(id__in=ids).update(estado='cobrado')
+            trabajo, _ = trabajos_service.encolar(
+                'entregar_giftcards', {'venta_reserva_id': venta_reserva_id, 'giftcard_ids': ids},
+                cola='avisos', clave=f'giftcards:{venta_reserva_id}:{ids[0]}')
+        logger.info(f"VentaReserva #{venta_reserva_id}: {len(ids)} GiftCard(s) cobradas, "
+                    f"entrega encolada (trabajo #{trabajo.pk})")
+        return trabajo
+    except Exception as e:
+        # Corre después del commit: no puede romper la respuesta del pago.
+        logger.error(f"Error al programar la entrega de GiftCards de VentaReserva #{venta_reserva_id}: {e}",
+                     exc_info=True)
+        return None
+
+
+def entregar(venta_reserva_id, giftcard_ids):
+    """Manda al comprador el email con las GiftCards `giftcard_ids` que aún no
+    se enviaron. Lanza excepción si el envío falla (el trabajo se reintenta)."""
+    from ventas.models import GiftCard, VentaReserva
+
+    venta = VentaReserva.objects.select_related('cliente').get(pk=venta_reserva_id)
+    giftcards = list(GiftCard.objects.filter(id__in=giftcard_ids).exclude(enviado_email=True).order_by('id'))
+    if not giftcards:
+        return "Sin GiftCards por enviar (ya enviadas)"
+
+    comprador = venta.cliente
+    # Si el comprador no tiene email, usar el de la primera GiftCard
+    email_comprador = comprador.email or giftcards[0].comprador_email
+    if not email_comprador:
+        # Reintentar no lo arregla: queda registrado en el log y en el trabajo.
+        logger.error(f"No se pueden enviar GiftCards: comprador de VentaReserva #{venta.id} no tiene email")
+        return f"Sin email de comprador: {len(giftcards)} GiftCard(s) sin enviar"
+
+    giftcards_data = [GiftCardPDFService.datos_carta(gc) for gc in giftcards]
+    if not GiftCardPDFService.enviar_giftcard_por_email(
+            comprador_email=email_comprador,
+            comprador_nombre=comprador.nombre,
+            giftcards_data=giftcards_data):
+        raise RuntimeError(f"Falló el envío de {len(giftcards)} GiftCard(s) a {email_comprador}")
+
+    GiftCard.objects.filter(id__in=[gc.id for gc in giftcards]).update(enviado_email=True)
+    logger.info(f"Email con {len(giftcards)} GiftCard(s) enviado a {email_comprador}")
+    return f"{len(giftcards)} GiftCard(s) enviadas a {email_comprador}"
@@ -1,14 +1,32 @@
 # -*- coding: utf-8 -*-
 """
 Servicio para generar PDFs de GiftCards y enviar emails
+
+Los PDFs de un lote (email de entrega, pedido corporativo de decenas de
+cartas) salen de `renderizar_lote`: cada carta se diagrama por separado, con
+las hojas de estilo y la configuración de fuentes armadas una vez por proceso;
+sobre LOTE_MINIMO_POOL cartas se reparten en procesos (spawn: esto corre dentro
+de los workers de procesar_trabajos, que tienen hilos), y el resumen se arma
+uniendo los PDFs individuales. Cada PDF queda en caché un rato (TTL_PDF) por el
+hash de su contenido: el email de entrega y la descarga que le sigue diagraman
+la carta una sola vez.
 """
 
 from django.conf import settings
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
+import itertools
+import json
 import logging
+import multiprocessing
 import io
+import os
+
+from .cache_service import cache_ns
+
 try:
     from weasyprint import HTML, CSS
     from weasyprint.text.fonts import FontConfiguration
@@ -19,8 +37,76 @@ except ImportError:
     CSS = None
     FontConfiguration = None
 
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+    PdfReader = None
+    PdfWriter = None
+
 logger = logging.getLogger(__name__)
 
+# Recursos que baja WeasyPrint (fotos de las experiencias) por URL, en memoria
+# del proceso. Las URLs de Cloudinary llevan la versión: si la foto cambia,
+# cambia la URL.
+_RECURSOS = {}
+MAX_RECURSOS = 50
+
+# Hojas de estilo y FontConfiguration por formato, armadas una vez por proceso.
+_ESTILOS = {}
+
+# Corto a propósito: los PDFs pesan y la caché es Redis, no un archivo. Alcanza
+# para la entrega y la descarga de la página de confirmación.
+TTL_PDF = 15 * 60
+# Con menos cartas, levantar procesos (spawn: cada uno carga Django) cuesta más
+# de lo que ahorra.
+LOTE_MINIMO_POOL = 12
+MAX_PROCESOS = 4
+
+CSS_A4 = """
+@page {
+    size: A4;
+    margin: 10mm;
+    @bottom-center {
+        content: "AREMKO Spa - www.aremko.cl";
+        font-size: 9px;
+        color: #999;
+    }
+}
+body {
+    font-size: 16px;
+    line-height: 1.5;
+}
+.giftcard-container {
+    max-width: 100%;
+    box-shadow: none;
+    border: 3px solid #ffc107;
+    padding: 16px;
+}
+.logo {
+    font-size: 28px;
+}
+.codigo {
+    font-size: 18px;
+    letter-spacing: 0.5px;
+    word-break: break-all;
+}
+.precio {
+    font-size: 24px;
+}
+.detail-section {
+    background-color: rgba(255, 193, 7, 0.15) !important;
+    -webkit-print-color-adjust: exact;
+    color-adjust: exact;
+}
+.instrucciones {
+    background-color: rgba(37, 211, 102, 0.15) !important;
+    -webkit-print-color-adjust: exact;
+    color-adjust: exact;
+}
+"""
+
 
 class GiftCardPDFService:
     """
@@ -45,6 +131,11 @@ class GiftCardPDFService:
                         'Vale por el monto indicado, para usar en cualquier experiencia de Aremko Spa Boutique.'),
     }
 
+    # Subirla al cambiar la plantilla de la carta (HTML/CSS) o qué datos de la
+    # experiencia se imprimen: descarta los datos y PDFs guardados en caché con
+    # la versión anterior.
+    VERSION_PLANTILLA = 1
+
     @staticmethod
     def datos_carta(giftcard):
         """Fuente ÚNICA de los datos que se imprimen en la carta del regalo
@@ -57,9 +148,33 @@ class GiftCardPDFService:
         carta debe seguir mostrando la experiencia aunque el catálogo cambie);
         fallback al mapa EXPERIENCIAS_LEGADO para las vendidas antes del catálogo.
         """
+        sid = giftcard.servicio_asociado or ''
+        if sid:
+            # Una compra corporativa trae N cartas de la misma experiencia: una
+            # consulta por experiencia, no por carta (se invalida al editarla).
+            nombre, descripcion, foto = cache_ns('giftcards').get_or_set(
+                f'experiencia:v{GiftCardPDFService.VERSION_PLANTILLA}:{sid}',
+                lambda: GiftCardPDFService._datos_experiencia(sid))
+        else:
+            nombre, descripcion, foto = GiftCardPDFService._datos_experiencia(sid)
+
+        return {
+            'codigo': giftcard.codigo,
+            'experiencia_nombre': nombre,
+            'experiencia_descripcion': descripcion,
+            'experiencia_imagen_url': foto,
+            'destinatario_nombre': giftcard.destinatario_nombre or 'Invitado Especial',
+            'mensaje_seleccionado': giftcard.mensaje_personalizado or 'Un regalo especial para ti',
+            'precio': giftcard.monto_inicial,
+            'fecha_emision': giftcard.fecha_emision,
+            'fecha_vencimiento': giftcard.fecha_vencimiento,
+        }
+
+    @staticmethod
+    def _datos_experiencia(sid):
+        """(nombre, descripción, foto) de la experiencia de la carta."""
         from ..models import GiftCardExperiencia
 
-        sid = giftcard.servicio_asociado or ''
         nombre, descripcion, foto = None, None, ''
 
         if sid:
@@ -85,17 +200,24 @@ class GiftCardPDFService:
         elif not foto.startswith('http'):
             foto = ''
 
-        return {
-            'codigo': giftcard.codigo,
-            'experiencia_nombre': nombre,
-            'experiencia_descripcion': descripcion,
-            'experiencia_imagen_url': foto,
-            'destinatario_nombre': giftcard.destinatario_nombre or 'Invitado Especial',
-            'mensaje_seleccionado': giftcard.mensaje_personalizado or 'Un regalo especial para ti',
-            'precio': giftcard.monto_inicial,
-            'fecha_emision': giftcard.fecha_emision,
-            'fecha_vencimiento': giftcard.fecha_vencimiento,
-        }
+        return nombre, descripcion, foto
+
+    @staticmethod
+    def _url_fetcher(url):
+        """url_fetcher de WeasyPrint que guarda lo descargado (la foto de la
+        experiencia) en memoria del proceso: las cartas de una misma experiencia
+        no vuelven a bajar la misma imagen de Cloudinary una por una."""
+        from weasyprint import default_url_fetcher
+
+        recurso = _RECURSOS.get(url)
+        if recurso is None:
+            recurso = default_url_fetcher(url)
+            if 'file_obj' in recurso:
+                recurso['string'] = recurso.pop('file_obj').read()
+            if len(_RECURSOS) >= MAX_RECURSOS:
+                _RECURSOS.pop(next(iter(_RECURSOS)))
+            _RECURSOS[url] = recurso
+        return dict(recurso)
 
     @staticmethod
     def generar_html_giftcard(giftcard_data):
@@ -662,6 +784,48 @@ class GiftCardPDFService:
 """
         return html_template
 
+    @staticmethod
+    def _documento(giftcard_data, formato='mobile'):
+        """Carta ya diagramada (weasyprint Document)."""
+        if formato == 'mobile':
+            # No necesita CSS adicional, todo está inline
+            html_content = GiftCardPDFService.generar_html_giftcard_mobile(giftcard_data)
+        else:
+            # Formato A4 tradicional
+            html_content = GiftCardPDFService.generar_html_giftcard(giftcard_data)
+        stylesheets, font_config = _estilos(formato)
+        html_doc = HTML(string=html_content, url_fetcher=GiftCardPDFService._url_fetcher)
+        return html_doc.render(stylesheets=stylesheets, font_config=font_config)
+
+    @staticmethod
+    def clave_pdf(giftcard_data, formato='mobile'):
+        """Clave de caché del PDF de una carta: hash de todo lo que se imprime."""
+        contenido = json.dumps(giftcard_data, sort_keys=True, default=str)
+        digest = hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+        return f'pdf:v{GiftCardPDFService.VERSION_PLANTILLA}:{formato}:{digest}'
+
+    @staticmethod
+    def renderizar_lote(giftcards_data, formato='mobile'):
+        """PDFs de un lote de cartas: (resumen o None si es una sola, [PDF por carta]).
+
+        Las que ya están en caché (mismo contenido) no se diagraman; el resto
+        se diagrama en procesos si son LOTE_MINIMO_POOL o más. El resumen une
+        los PDFs individuales sin volver a diagramar."""
+        if not WEASYPRINT_AVAILABLE:
+            raise RuntimeError("WeasyPrint no disponible: no se pueden generar los PDFs de las GiftCards")
+        cache = cache_ns('giftcards')
+        claves = [GiftCardPDFService.clave_pdf(gc, formato) for gc in giftcards_data]
+        pdfs = [cache.get(clave) for clave in claves]
+        faltan = [i for i, pdf in enumerate(pdfs) if pdf is None]
+        if faltan:
+            nuevos = _renderizar_varias([giftcards_data[i] for i in faltan], formato)
+            for i, pdf in zip(faltan, nuevos):
+                pdfs[i] = pdf
+                cache.set(claves[i], pdf, TTL_PDF)
+            logger.info(f"PDFs de GiftCards: {len(faltan)} diagramados, {len(pdfs) - len(faltan)} desde caché")
+        resumen = _unir_pdfs(giftcards_data, pdfs, formato) if len(pdfs) > 1 else None
+        return resumen, pdfs
+
     @staticmethod
     def generar_pdf_giftcard(giftcard_data, formato='mobile'):
         """
@@ -679,69 +843,7 @@ class GiftCardPDFService:
             return None
 
         try:
-            # Seleccionar template según formato
-            if formato == 'mobile':
-                html_content = GiftCardPDFService.generar_html_giftcard_mobile(giftcard_data)
-                # No necesita CSS adicional, todo está inline
-                css_pdf = None
-            else:
-                # Formato A4 tradicional
-                html_content = GiftCardPDFService.generar_html_giftcard(giftcard_data)
-                css_pdf = CSS(string="""
-                    @page {
-                        size: A4;
-                        margin: 10mm;
-                        @bottom-center {
-                            content: "AREMKO Spa - www.aremko.cl";
-                            font-size: 9px;
-                            color: #999;
-                        }
-                    }
-                    body {
-                        font-size: 16px;
-                        line-height: 1.5;
-                    }
-                    .giftcard-container {
-                        max-width: 100%;
-                        box-shadow: none;
-                        border: 3px solid #ffc107;
-                        padding: 16px;
-                    }
-                    .logo {
-                        font-size: 28px;
-                    }
-                    .codigo {
-                        font-size: 18px;
-                        letter-spacing: 0.5px;
-                        word-break: break-all;
-                    }
-                    .precio {
-                        font-size: 24px;
-                    }
-                    .detail-section {
-                        background-color: rgba(255, 193, 7, 0.15) !important;
-                        -webkit-print-color-adjust: exact;
-                        color-adjust: exact;
-                    }
-                    .instrucciones {
-                        background-color: rgba(37, 211, 102, 0.15) !important;
-                        -webkit-print-color-adjust: exact;
-                        color-adjust: exact;
-                    }
-                """)
-
-            # Configuración de fuentes
-            font_config = FontConfiguration()
-
-            # Crear PDF desde HTML
-            html_doc = HTML(string=html_content)
-            if css_pdf:
-                pdf_bytes = html_doc.write_pdf(
-                    stylesheets=[css_pdf],
-                    font_config=font_config
-                )
-            else:
-                pdf_bytes = html_doc.write_pdf(font_config=font_config)
+            pdf_bytes = GiftCardPDFService.renderizar_lote([giftcard_data], formato)[1][0]
 
             logger.info(f"✅ PDF generado exitosamente para GiftCard {giftcard_data['codigo']} (formato: {formato})")
             return pdf_bytes
@@ -755,6 +857,11 @@ class GiftCardPDFService:
         """
         Genera múltiples PDFs de GiftCards y los combina en un solo archivo
 
+        Antes concatenaba el HTML de todas las cartas en un solo documento y lo
+        diagramaba de una vez; ahora usa `renderizar_lote` (carta por carta,
+        con caché y en procesos si son muchas). En A4 el pie ya no numera las
+        páginas: cada carta se diagrama por separado.
+
         Args:
             giftcards_data (list): Lista de datos de GiftCards
             formato (str): 'mobile' para 5.5x9.8 pulgadas, 'a4' para formato tradicional
@@ -767,84 +874,9 @@ class GiftCardPDFService:
             return None
 
         try:
-            # Si es solo una GiftCard, usar función simple
-            if len(giftcards_data) == 1:
-                return GiftCardPDFService.generar_pdf_giftcard(giftcards_data[0], formato=formato)
-
-            # Para múltiples GiftCards, combinar HTML
-            html_content = ""
-            for i, giftcard_data in enumerate(giftcards_data):
-                if formato == 'mobile':
-                    html_content += GiftCardPDFService.generar_html_giftcard_mobile(giftcard_data)
-                else:
-                    html_content += GiftCardPDFService.generar_html_giftcard(giftcard_data)
-                # Agregar salto de página entre gift cards (excepto la última)
-                if i < len(giftcards_data) - 1:
-                    html_content += '<div style="page-break-after: always;"></div>'
-
-            # CSS para múltiples páginas según formato
-            if formato == 'mobile':
-                # No necesita CSS adicional para móvil, todo está inline
-                css_pdf = None
-            else:
-                css_pdf = CSS(string="""
-                    @page {
-                        size: A4;
-                        margin: 10mm;
-                        @bottom-center {
-                            content: "AREMKO Spa - www.aremko.cl - Página " counter(page);
-                            font-size: 9px;
-                            color: #999;
-                        }
-                    }
-                    body {
-                        font-size: 16px;
-                        line-height: 1.5;
-                    }
-                    .giftcard-container {
-                        max-width: 100%;
-                        box-shadow: none;
-                        border: 3px solid #ffc107;
-                        margin-bottom: 16px;
-                        padding: 16px;
-                    }
-                    .logo {
-                        font-size: 28px;
-                    }
-                    .codigo {
-                        font-size: 18px;
-                        letter-spacing: 0.5px;
-                        word-break: break-all;
-                    }
-                    .precio {
-                        font-size: 24px;
-                    }
-                    /* Optimizaciones para PDF múltiple */
-                    .detail-section {
-                        background-color: rgba(255, 193, 7, 0.15) !important;
-                        -webkit-print-color-adjust: exact;
-                        color-adjust: exact;
-                    }
-                    .instrucciones {
-                        background-color: rgba(37, 211, 102, 0.15) !important;
-                        -webkit-print-color-adjust: exact;
-                        color-adjust: exact;
-                    }
-                """)
-
-            # Crear PDF combinado
-            font_config = FontConfiguration()
-            html_doc = HTML(string=html_content)
-            if css_pdf:
-                pdf_bytes = html_doc.write_pdf(
-                    stylesheets=[css_pdf],
-                    font_config=font_config
-                )
-            else:
-                pdf_bytes = html_doc.write_pdf(font_config=font_config)
-
+            resumen, individuales = GiftCardPDFService.renderizar_lote(giftcards_data, formato=formato)
             logger.info(f"✅ PDF combinado generado exitosamente para {len(giftcards_data)} GiftCards (formato: {formato})")
-            return pdf_bytes
+            return resumen or individuales[0]
 
         except Exception as e:
             logger.error(f"❌ Error generando PDF combinado: {str(e)}", exc_info=True)
@@ -1048,27 +1080,18 @@ www.aremko.cl
             email.attach_alternative(email_html_con_footer, "text/html")
 
             # Generar y adjuntar PDFs - usando formato móvil por defecto
+            pdf_resumen, pdfs_individuales = GiftCardPDFService.renderizar_lote(giftcards_data, formato='mobile')
+            fecha = datetime.now().strftime('%Y%m%d')
+            if pdf_resumen:
+                # 1. PDF Resumen con todas las GiftCards
+                email.attach(f"Resumen_GiftCards_Aremko_{fecha}.pdf", pdf_resumen, 'application/pdf')
+            # 2. PDFs individuales para cada GiftCard
+            for giftcard_data, pdf_individual in zip(giftcards_data, pdfs_individuales):
+                # Limpiar nombre del destinatario para nombre de archivo
+                nombre_limpio = giftcard_data['destinatario_nombre'].replace(' ', '_').replace('.', '').replace(',', '')
+                email.attach(f"GiftCard_{nombre_limpio}_{fecha}.pdf", pdf_individual, 'application/pdf')
             if es_multiple:
-                # 1. PDF Resumen con todas las GiftCards (formato móvil)
-                pdf_resumen = GiftCardPDFService.generar_multiples_pdfs(giftcards_data, formato='mobile')
-                filename_resumen = f"Resumen_GiftCards_Aremko_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_resumen, pdf_resumen, 'application/pdf')
-
-                # 2. PDFs individuales para cada GiftCard (formato móvil)
-                for giftcard_data in giftcards_data:
-                    pdf_individual = GiftCardPDFService.generar_pdf_giftcard(giftcard_data, formato='mobile')
-                    # Limpiar nombre del destinatario para nombre de archivo
-                    nombre_limpio = giftcard_data['destinatario_nombre'].replace(' ', '_').replace('.', '').replace(',', '')
-                    filename_individual = f"GiftCard_{nombre_limpio}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                    email.attach(filename_individual, pdf_individual, 'application/pdf')
-
                 logger.info(f"✅ Generados {len(giftcards_data)} PDFs individuales + 1 PDF resumen (formato móvil)")
-            else:
-                # Una sola GiftCard - PDF individual únicamente (formato móvil)
-                pdf_individual = GiftCardPDFService.generar_pdf_giftcard(giftcards_data[0], formato='mobile')
-                nombre_limpio = giftcards_data[0]['destinatario_nombre'].replace(' ', '_').replace('.', '').replace(',', '')
-                filename_individual = f"GiftCard_{nombre_limpio}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                email.attach(filename_individual, pdf_individual, 'application/pdf')
 
             # Enviar email
             email.send()
@@ -1083,3 +1106,63 @@ www.aremko.cl
         except Exception as e:
             logger.error(f"❌ Error al enviar email con PDFs de GiftCard: {str(e)}", exc_info=True)
             return False
+
+
+# --- Render por lotes (funciones de módulo: se mandan a otros procesos) -------
+
+def _estilos(formato):
+    """(hojas de estilo, FontConfiguration) del formato, armadas una vez por
+    proceso y reutilizadas en cada carta."""
+    if formato not in _ESTILOS:
+        font_config = FontConfiguration()
+        hojas = None if formato == 'mobile' else [CSS(string=CSS_A4, font_config=font_config)]
+        _ESTILOS[formato] = (hojas, font_config)
+    return _ESTILOS[formato]
+
+
+def _renderizar_carta(giftcard_data, formato):
+    return GiftCardPDFService._documento(giftcard_data, formato).write_pdf()
+
+
+def _iniciar_proceso(recursos):
+    """Arranque de cada proceso del pool: Django y las fotos ya bajadas."""
+    import django
+    django.setup()
+    _RECURSOS.update(recursos)
+
+
+def _renderizar_varias(giftcards_data, formato):
+    """PDF de cada carta, en el mismo orden. Con LOTE_MINIMO_POOL o más, en
+    procesos nuevos (spawn, no fork: el worker de procesar_trabajos tiene el
+    hilo del Vigilante y un fork copiaría sus locks tomados). No tocan la base."""
+    procesos = min(MAX_PROCESOS, os.cpu_count() or 1, len(giftcards_data))
+    if len(giftcards_data) < LOTE_MINIMO_POOL or procesos < 2:
+        return [_renderizar_carta(gc, formato) for gc in giftcards_data]
+
+    # Bajar las fotos antes de repartir: se le pasan a cada proceso y un pedido
+    # corporativo de una sola experiencia baja su foto una vez, no una por proceso.
+    recursos = {}
+    for url in {gc.get('experiencia_imagen_url') for gc in giftcards_data} - {None, ''}:
+        try:
+            recursos[url] = GiftCardPDFService._url_fetcher(url)
+        except Exception:
+            logger.warning(f"No se pudo bajar {url} antes de diagramar las GiftCards", exc_info=True)
+
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_iniciar_proceso, initargs=(recursos,)) as pool:
+        return list(pool.map(_renderizar_carta, giftcards_data, itertools.repeat(formato)))
+
+
+def _unir_pdfs(giftcards_data, pdfs, formato):
+    """Resumen con todas las cartas: une los PDFs individuales. Sin pypdf,
+    diagrama las cartas en este proceso y junta sus páginas."""
+    if PYPDF_AVAILABLE:
+        escritor = PdfWriter()
+        for pdf in pdfs:
+            escritor.append(PdfReader(io.BytesIO(pdf)))
+        salida = io.BytesIO()
+        escritor.write(salida)
+        return salida.getvalue()
+    documentos = [GiftCardPDFService._documento(gc, formato) for gc in giftcards_data]
+    paginas = [pagina for doc in documentos for pagina in doc.pages]
+    return documentos[0].copy(paginas).write_pdf()
@@ -0,0 +1,310 @@
+"""Tabla de hechos diaria de ventas (`HechoVentaDiaria`).
+
+`dashboard_ventas`, `dashboard_operativo` y `exportar_estadisticas_csv`
+agregaban `Coalesce(precio_unitario_venta, precio_base) * cantidad_personas`
+sobre todas las líneas del año (y del año anterior, para la comparativa) en cada
+carga. Ahora leen filas ya sumadas por día:
+
+    venta              VentaReserva.total y cantidad de ventas, por fecha_reserva
+    servicio_vendido   líneas de servicio, por fecha_reserva de su venta
+    servicio_agendado  líneas de servicio, por fecha_agendamiento
+    producto           líneas de producto, por fecha_reserva de su venta
+    pago               pagos por método, por fecha_reserva de su venta
+
+Los estados de la venta (pago y reserva) van como dimensión: cada dashboard les
+aplica su propio filtro, igual que antes sobre VentaReserva.
+
+Cómo se mantiene al día:
+
+    marcar       las señales anotan los días (o las ventas) que tocaron
+    al confirmar se recalculan esos días, una vez por transacción
+    recalcular   borra y reescribe días completos
+    reconstruir  lo mismo por rangos (comando `reconstruir_hechos_ventas`)
+
+No hay deltas: recalcular un día son pocas consultas acotadas a ese día, y el
+día queda igual que si se reconstruyera. Lo que cambia sin pasar por señales
+(`.update()`, SQL a mano) lo corrige el comando.
+
+Ventas distintas: `reservas` y `reservas_categoria` cuentan cada venta en UNA
+sola fila del día (la de su servicio de menor id), así que se suman entre
+servicios sin contar dos veces. Por fecha de venta suman exacto entre días; por
+fecha de agendamiento una venta con servicios en dos días cuenta en cada día.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .lote_transaccion import lote_de_la_transaccion
+
+logger = logging.getLogger(__name__)
+
+# Días por pasada al recalcular: acota la memoria de cada consulta.
+DIAS_POR_TRAMO = 31
+
+
+def _tipos():
+    from ventas.models import HechoVentaDiaria as H
+    por_venta = (H.TIPO_VENTA, H.TIPO_SERVICIO_VENDIDO, H.TIPO_PRODUCTO, H.TIPO_PAGO)
+    return por_venta, (H.TIPO_SERVICIO_AGENDADO,)
+
+
+def como_fecha(valor):
+    """date / datetime (aware → hora de Chile) / 'YYYY-MM-DD…' → date. None si no se puede."""
+    if isinstance(valor, datetime):
+        return timezone.localdate(valor) if timezone.is_aware(valor) else valor.date()
+    if isinstance(valor, date):
+        return valor
+    if isinstance(valor, str):
+        try:
+            return date.fromisoformat(valor[:10])
+        except ValueError:
+            return None
+    return None
+
+
+def _tramos(dias, largo=DIAS_POR_TRAMO):
+    """Días sueltos → [(desde, hasta)] de días consecutivos, de a lo más `largo`."""
+    tramos = []
+    for dia in sorted(set(dias)):
+        if tramos and dia == tramos[-1][1] + timedelta(days=1) and (dia - tramos[-1][0]).days < largo:
+            tramos[-1][1] = dia
+        else:
+            tramos.append([dia, dia])
+    return [tuple(t) for t in tramos]
+
+
+def _limites(desde, hasta):
+    """[desde 00:00, hasta+1 00:00) en hora de Chile. Por rango y no con
+    `fecha_reserva__date`, que envuelve la columna y no usa el índice."""
+    return (timezone.make_aware(datetime.combine(desde, time.min)),
+            timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)))
+
+
+def _monto(precio_catalogo, cantidad):
+    return ExpressionWrapper(
+        Coalesce(F('precio_unitario_venta'), F(precio_catalogo)) * F(cantidad),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def _filas_servicio(tipo, lineas):
+    """(fecha, estado_pago, estado_reserva, venta, servicio, categoria, monto) → filas."""
+    from ventas.models import HechoVentaDiaria
+
+    celdas = {}
+    estados = {}
+    primera = {}        # (fecha, venta) → menor servicio_id del día
+    primera_cat = {}    # (fecha, venta, categoria) → menor servicio_id de la categoría
+    for fecha, estado_pago, estado_reserva, venta, servicio, categoria, monto in lineas:
+        clave = (fecha, estado_pago, estado_reserva, servicio)
+        celda = celdas.get(clave)
+        if celda is None:
+            celda = celdas[clave] = HechoVentaDiaria(
+                tipo=tipo, fecha=fecha, estado_pago=estado_pago, estado_reserva=estado_reserva,
+                servicio_id=servicio, categoria_id=categoria, total=Decimal(0))
+        celda.total += monto or 0
+        celda.cantidad += 1
+        estados[venta] = (estado_pago, estado_reserva)
+        primera[(fecha, venta)] = min(primera.get((fecha, venta), servicio), servicio)
+        primera_cat[(fecha, venta, categoria)] = min(primera_cat.get((fecha, venta, categoria), servicio), servicio)
+
+    for (fecha, venta), servicio in primera.items():
+        celdas[(fecha, *estados[venta], servicio)].reservas += 1
+    for (fecha, venta, _), servicio in primera_cat.items():
+        celdas[(fecha, *estados[venta], servicio)].reservas_categoria += 1
+    return list(celdas.values())
+
+
+def _filas_por_venta(desde, hasta):
+    """Filas venta / servicio_vendido / producto / pago de las ventas con
+    fecha_reserva en [desde, hasta]."""
+    from ventas.models import HechoVentaDiaria as H, Pago, ReservaProducto, ReservaServicio, VentaReserva
+
+    inicio, fin = _limites(desde, hasta)
+    de_la_venta = {'venta_reserva__fecha_reserva__gte': inicio, 'venta_reserva__fecha_reserva__lt': fin}
+    dims = ('venta_reserva__fecha_reserva', 'venta_reserva__estado_pago', 'venta_reserva__estado_reserva')
+
+    ventas = defaultdict(lambda: [Decimal(0), 0])
+    for fecha, estado_pago, estado_reserva, total in (
+            VentaReserva.objects.filter(fecha_reserva__gte=inicio, fecha_reserva__lt=fin)
+            .values_list('fecha_reserva', 'estado_pago', 'estado_reserva', 'total')):
+        celda = ventas[(timezone.localdate(fecha), estado_pago, estado_reserva)]
+        celda[0] += total or 0
+        celda[1] += 1
+    filas = [H(tipo=H.TIPO_VENTA, fecha=fecha, estado_pago=estado_pago, estado_reserva=estado_reserva,
+               total=total, cantidad=n, reservas=n)
+             for (fecha, estado_pago, estado_reserva), (total, n) in ventas.items()]
+
+    lineas = (ReservaServicio.objects.filter(**de_la_venta)
+              .annotate(monto=_monto('servicio__precio_base', 'cantidad_personas'))
+              .values_list(*dims, 'venta_reserva_id', 'servicio_id', 'servicio__categoria_id', 'monto'))
+    filas += _filas_servicio(H.TIPO_SERVICIO_VENDIDO,
+                             ((timezone.localdate(f), *resto) for f, *resto in lineas))
+
+    productos = {}
+    for fecha, estado_pago, estado_reserva, venta, producto, cantidad, monto in (
+            ReservaProducto.objects.filter(**de_la_venta)
+            .annotate(monto=_monto('producto__precio_base', 'cantidad'))
+            .values_list(*dims, 'venta_reserva_id', 'producto_id', 'cantidad', 'monto')):
+        clave = (timezone.localdate(fecha), estado_pago, estado_reserva, producto)
+        celda = productos.get(clave)
+        if celda is None:
+            celda = productos[clave] = (H(tipo=H.TIPO_PRODUCTO, fecha=clave[0], estado_pago=estado_pago,
+                                          estado_reserva=estado_reserva, producto_id=producto,
+                                          total=Decimal(0)), set())
+        celda[0].total += monto or 0
+        celda[0].cantidad += cantidad or 0
+        celda[1].add(venta)
+    for fila, ventas_del_producto in productos.values():
+        fila.reservas = len(ventas_del_producto)
+        filas.append(fila)
+
+    pagos = {}
+    for fecha, estado_pago, estado_reserva, metodo, monto in (
+            Pago.objects.filter(**de_la_venta).values_list(*dims, 'metodo_pago', 'monto')):
+        clave = (timezone.localdate(fecha), estado_pago, estado_reserva, metodo)
+        fila = pagos.get(clave)
+        if fila is None:
+            fila = pagos[clave] = H(tipo=H.TIPO_PAGO, fecha=clave[0], estado_pago=estado_pago,
+                                    estado_reserva=estado_reserva, metodo_pago=metodo, total=Decimal(0))
+        fila.total += monto or 0
+        fila.cantidad += 1
+    return filas + list(pagos.values())
+
+
+def _filas_por_agenda(desde, hasta):
+    """Filas servicio_agendado de las líneas con fecha_agendamiento en [desde, hasta]."""
+    from ventas.models import HechoVentaDiaria as H, ReservaServicio
+
+    lineas = (ReservaServicio.objects.filter(fecha_agendamiento__range=(desde, hasta))
+              .annotate(monto=_monto('servicio__precio_base', 'cantidad_personas'))
+              .values_list('fecha_agendamiento', 'venta_reserva__estado_pago',
+                           'venta_reserva__estado_reserva', 'venta_reserva_id', 'servicio_id',
+                           'servicio__categoria_id', 'monto'))
+    return _filas_servicio(H.TIPO_SERVICIO_AGENDADO, lineas)
+
+
+def _reescribir(tipos, desde, hasta, filas):
+    from ventas.models import HechoVentaDiaria
+
+    with transaction.atomic():
+        HechoVentaDiaria.objects.filter(tipo__in=tipos, fecha__range=(desde, hasta)).delete()
+        HechoVentaDiaria.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+def recalcular(dias_venta=(), dias_agenda=()):
+    """Reescribe los días pedidos: `dias_venta` (fecha de venta) y `dias_agenda`
+    (fecha de agendamiento). Devuelve cuántas filas quedaron escritas."""
+    por_venta, por_agenda = _tipos()
+    escritas = 0
+    for desde, hasta in _tramos(d for d in dias_venta if d):
+        escritas += _reescribir(por_venta, desde, hasta, _filas_por_venta(desde, hasta))
+    for desde, hasta in _tramos(d for d in dias_agenda if d):
+        escritas += _reescribir(por_agenda, desde, hasta, _filas_por_agenda(desde, hasta))
+    return escritas
+
+
+def rango_con_datos():
+    """(primer día, último día) con ventas o servicios agendados; (None, None) si no hay."""
+    from ventas.models import ReservaServicio, VentaReserva
+
+    ventas = VentaReserva.objects.aggregate(desde=Min('fecha_reserva'), hasta=Max('fecha_reserva'))
+    agenda = ReservaServicio.objects.aggregate(desde=Min('fecha_agendamiento'), hasta=Max('fecha_agendamiento'))
+    desdes = [d for d in (como_fecha(ventas['desde']), agenda['desde']) if d]
+    hastas = [d for d in (como_fecha(ventas['hasta']), agenda['hasta']) if d]
+    return (min(desdes), max(hastas)) if desdes else (None, None)
+
+
+def reconstruir(desde=None, hasta=None):
+    """Rearma la tabla entre `desde` y `hasta` (ambos incluidos). Sin rango:
+    todo lo que hay en la base, y se borra lo que haya quedado fuera de él."""
+    from ventas.models import HechoVentaDiaria
+
+    completo = desde is None and hasta is None
+    primero, ultimo = rango_con_datos()
+    desde, hasta = desde or primero, hasta or ultimo
+    if completo:
+        fuera = HechoVentaDiaria.objects.all()
+        if desde:
+            fuera = fuera.exclude(fecha__range=(desde, hasta))
+        fuera.delete()
+    if not desde or not hasta or desde > hasta:
+        return 0
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    return recalcular(dias, dias)
+
+
+# --- Mantenimiento incremental ------------------------------------------------
+
+class _Lote:
+    """Lo marcado durante una transacción; se recalcula al confirmarla."""
+
+    def __init__(self):
+        self.dias_venta = set()
+        self.dias_agenda = set()
+        self.ventas = set()           # → su fecha de venta
+        self.ventas_agenda = set()    # → las fechas de agendamiento de sus líneas
+
+    def vaciar(self):
+        # Corre después del commit: si falla, el guardado ya está hecho y no se
+        # toca; el día queda viejo hasta la próxima marca o el comando.
+        try:
+            from ventas.models import ReservaServicio, VentaReserva
+
+            dias_venta, dias_agenda = set(self.dias_venta), set(self.dias_agenda)
+            if self.ventas:
+                dias_venta.update(como_fecha(f) for f in VentaReserva.objects.filter(
+                    pk__in=self.ventas, fecha_reserva__isnull=False).values_list('fecha_reserva', flat=True))
+            if self.ventas_agenda:
+                dias_agenda.update(ReservaServicio.objects.filter(
+                    venta_reserva_id__in=self.ventas_agenda).values_list('fecha_agendamiento', flat=True))
+            recalcular(dias_venta, dias_agenda)
+        except Exception:
+            logger.exception("No se pudo recalcular la tabla de hechos de ventas")
+
+
+def marcar(dias_venta=(), dias_agenda=(), ventas=(), ventas_agenda=()):
+    """Anota qué recalcular. Dentro de una transacción se junta todo y se
+    recalcula UNA vez al confirmarla; en autocommit se recalcula en el acto."""
+    lote = lote_de_la_transaccion('hechos_ventas', _Lote)
+    en_el_acto = lote is None
+    if en_el_acto:
+        lote = _Lote()
+    lote.dias_venta.update(d for d in map(como_fecha, dias_venta) if d)
+    lote.dias_agenda.update(d for d in map(como_fecha, dias_agenda) if d)
+    lote.ventas.update(v for v in ventas if v)
+    lote.ventas_agenda.update(v for v in ventas_agenda if v)
+    if en_el_acto:
+        lote.vaciar()
+
+
+def marcar_cambio_servicio(servicio_id, categoria=False, precio=False):
+    """Un servicio cambió de categoría (sus filas cambian de grupo) o de
+    precio_base (cambian las líneas sin precio congelado)."""
+    from ventas.models import HechoVentaDiaria, ReservaServicio
+
+    if categoria:
+        dias = defaultdict(set)
+        for tipo, fecha in (HechoVentaDiaria.objects.filter(servicio_id=servicio_id)
+                            .values_list('tipo', 'fecha').distinct()):
+            dias[tipo == HechoVentaDiaria.TIPO_SERVICIO_AGENDADO].add(fecha)
+        marcar(dias_venta=dias[False], dias_agenda=dias[True])
+    if precio:
+        lineas = list(ReservaServicio.objects.filter(servicio_id=servicio_id, precio_unitario_venta__isnull=True)
+                      .values_list('venta_reserva_id', 'fecha_agendamiento'))
+        marcar(ventas={v for v, _ in lineas}, dias_agenda={f for _, f in lineas})
+
+
+def marcar_cambio_producto(producto_id):
+    """Un producto cambió de precio_base: cambian las líneas sin precio congelado."""
+    from ventas.models import ReservaProducto
+
+    marcar(ventas=ReservaProducto.objects.filter(producto_id=producto_id, precio_unitario_venta__isnull=True)
+           .values_list('venta_reserva_id', flat=True).distinct())
@@ -0,0 +1,50 @@
+"""Lote por transacción: lo que las señales marcan mientras una transacción
+está abierta se procesa UNA vez al confirmarla.
+
+Lo usan la tabla de hechos de ventas, las métricas por cliente y la cola de
+taxonomía. Solo con API pública de Django (`transaction.get_connection` y
+`on_commit`; antes cada servicio buscaba su callback en la lista privada
+`connection.run_on_commit`):
+
+    lote_de_la_transaccion(clave, crear)
+        devuelve el lote `clave` de la transacción en curso; si no hay uno
+        vivo lo crea con `crear()` y engancha su `vaciar` al on_commit. None
+        en autocommit (quien llama procesa en el acto).
+
+¿Sigue enganchado el lote? El callback que se pasa a on_commit es lo único
+que lo mantiene vivo; el registro lo mira por weakref. Si la transacción o
+el savepoint donde se registró se revierten, Django lo suelta y el weakref
+muere: la próxima marca arranca un lote nuevo. Al confirmarse corre, sale
+del registro y vacía el lote. Lo marcado dentro de un savepoint revertido
+que cayó en un lote vivo se procesa igual: recalcular de más no rompe nada.
+"""
+import threading
+import weakref
+
+from django.db import transaction
+
+_registro = threading.local()
+
+
+def lote_de_la_transaccion(clave, crear):
+    """El lote `clave` enganchado a la transacción en curso (lo crea con
+    `crear()` si hace falta), o None en autocommit."""
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        return None
+    lotes = _registro.__dict__.setdefault('lotes', {})
+    llave = (conexion.alias, clave)
+    lote, disparo = lotes.get(llave, (None, None))
+    if lote is not None and disparo() is not None:
+        return lote
+
+    lote = crear()
+
+    def _vaciar():
+        if lotes.get(llave, (None,))[0] is lote:
+            del lotes[llave]
+        lote.vaciar()
+
+    lotes[llave] = (lote, weakref.ref(_vaciar))
+    transaction.on_commit(_vaciar)
+    return lote
@@ -0,0 +1,215 @@
+"""Métricas de gasto por cliente para la segmentación (`MetricaCliente`).
+
+`cliente_segmentation_view`, `client_list_by_segment_view` y
+`client_list_custom_filter_view` corrían en cada carga un CTE con cuatro
+subconsultas correlacionadas por teléfono sobre ventas, servicios y
+`crm_service_history` (más una consulta a information_schema), y después
+filtraban el resultado completo en Python. Ahora leen una fila ya calculada por
+teléfono normalizado y filtran por `total_gasto`, que está indexado.
+
+Mismas reglas que la consulta anterior:
+
+    gasto_actual        suma de VentaReserva.total, ventas pagadas o con pago parcial
+    servicios_actuales  líneas de servicio de esas mismas ventas
+    *_historico         crm_service_history, sin la fecha placeholder 2021-01-01
+    total_*             actual + histórico
+
+Los clientes con el mismo teléfono (en cualquier formato) suman en una sola
+fila; la representa el de menor id. Un teléfono que no se puede normalizar
+agrupa tal cual viene.
+
+Cómo se mantiene al día:
+
+    marcar               las señales anotan los clientes, ventas o teléfonos tocados
+    al confirmar         se recalculan esos teléfonos, una vez por transacción
+    recalcular_telefonos borra y reescribe las filas de esos teléfonos
+    reconstruir          toda la tabla (comando `reconstruir_metricas_clientes`)
+
+Lo que cambia sin pasar por señales (`.update()`, la importación del historial
+por SQL) lo corrige el comando.
+"""
+import logging
+import re
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .lote_transaccion import lote_de_la_transaccion
+from .phone_service import PhoneService
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_CON_GASTO = ('pagado', 'parcial')
+# Fecha que la importación histórica puso a los servicios sin fecha real.
+FECHA_PLACEHOLDER_HISTORIAL = date(2021, 1, 1)
+
+# Lo que devuelve PhoneService.normalize_phone: se salta la llamada (y su log)
+# para los teléfonos que Cliente.save() ya dejó normalizados.
+_NORMALIZADO = re.compile(r'^\+(?:569\d{8}|(?!56)\d{10,15})$')
+
+_hay_historial = None
+
+
+def clave_telefono(telefono):
+    """Teléfono → clave de la fila: normalizado, o tal cual si no se puede normalizar."""
+    telefono = (telefono or '').strip()
+    if not telefono or _NORMALIZADO.match(telefono):
+        return telefono or None
+    return PhoneService.normalize_phone(telefono) or telefono
+
+
+def hay_historial():
+    """¿Existe `crm_service_history`? La tabla no la maneja Django; se mira una
+    vez por proceso."""
+    global _hay_historial
+    if _hay_historial is None:
+        from ventas.models import ServiceHistory
+        try:
+            _hay_historial = ServiceHistory._meta.db_table in connection.introspection.table_names()
+        except Exception:
+            logger.warning("No se pudo revisar si existe crm_service_history", exc_info=True)
+            return False
+    return _hay_historial
+
+
+def _por_cliente(ids):
+    """{cliente_id: [servicios_actuales, gasto_actual, servicios_historicos,
+    gasto_historico]} de los clientes `ids` (None = todos)."""
+    from ventas.models import ReservaServicio, ServiceHistory, VentaReserva
+
+    de_los_clientes = {} if ids is None else {'cliente_id__in': ids}
+    metricas = defaultdict(lambda: [0, Decimal(0), 0, Decimal(0)])
+
+    for cliente, gasto in (VentaReserva.objects.filter(estado_pago__in=ESTADOS_CON_GASTO, **de_los_clientes)
+                           .order_by().values('cliente_id').annotate(gasto=Sum('total'))
+                           .values_list('cliente_id', 'gasto')):
+        metricas[cliente][1] = gasto or Decimal(0)
+    for cliente, n in (ReservaServicio.objects
+                       .filter(venta_reserva__estado_pago__in=ESTADOS_CON_GASTO,
+                               **{f'venta_reserva__{k}': v for k, v in de_los_clientes.items()})
+                       .order_by().values('venta_reserva__cliente_id').annotate(n=Count('id'))
+                       .values_list('venta_reserva__cliente_id', 'n')):
+        metricas[cliente][0] = n
+    if hay_historial():
+        for cliente, n, gasto in (ServiceHistory.objects.filter(**de_los_clientes)
+                                  .exclude(service_date=FECHA_PLACEHOLDER_HISTORIAL)
+                                  .order_by().values('cliente_id')
+                                  .annotate(n=Count('id'), gasto=Sum('price_paid'))
+                                  .values_list('cliente_id', 'n', 'gasto')):
+            metricas[cliente][2:] = [n, gasto or Decimal(0)]
+    return metricas
+
+
+def _filas(clientes, ids=None):
+    """`clientes`: [(id, telefono, nombre, email, comuna_id)] → una MetricaCliente
+    por teléfono. El nombre es el del representante; email y comuna, el primero
+    que haya entre los duplicados empezando por él."""
+    from ventas.models import MetricaCliente
+
+    grupos = defaultdict(list)
+    for fila in clientes:
+        clave = clave_telefono(fila[1])
+        if clave:
+            grupos[clave].append(fila)
+    metricas = _por_cliente(ids)
+
+    filas = []
+    for clave, miembros in grupos.items():
+        miembros.sort()
+        fila = MetricaCliente(
+            telefono=clave, cliente_id=miembros[0][0], nombre=miembros[0][2] or '',
+            email=next((m[3] for m in miembros if m[3]), ''),
+            comuna_id=next((m[4] for m in miembros if m[4]), None),
+            gasto_actual=Decimal(0), gasto_historico=Decimal(0))
+        for miembro in miembros:
+            servicios, gasto, servicios_hist, gasto_hist = metricas.get(miembro[0], (0, 0, 0, 0))
+            fila.servicios_actuales += servicios
+            fila.gasto_actual += gasto
+            fila.servicios_historicos += servicios_hist
+            fila.gasto_historico += gasto_hist
+        fila.total_servicios = fila.servicios_actuales + fila.servicios_historicos
+        fila.total_gasto = fila.gasto_actual + fila.gasto_historico
+        filas.append(fila)
+    return filas
+
+
+CAMPOS_CLIENTE = ('id', 'telefono', 'nombre', 'email', 'comuna_id')
+
+
+def recalcular_telefonos(claves):
+    """Reescribe las filas de los teléfonos `claves` (ya normalizados). Devuelve
+    cuántas quedaron escritas."""
+    from ventas.models import Cliente, MetricaCliente
+
+    claves = {c for c in claves if c}
+    if not claves:
+        return 0
+    variantes = set(claves)
+    for clave in claves:
+        variantes.update(PhoneService.generate_search_variants(clave))
+    clientes = [c for c in Cliente.objects.filter(telefono__in=variantes).values_list(*CAMPOS_CLIENTE)
+                if clave_telefono(c[1]) in claves]
+    filas = _filas(clientes, ids=[c[0] for c in clientes])
+
+    with transaction.atomic():
+        MetricaCliente.objects.filter(telefono__in=claves).delete()
+        MetricaCliente.objects.bulk_create(filas)
+    return len(filas)
+
+
+def reconstruir():
+    """Rearma la tabla completa. Devuelve cuántas filas quedaron escritas."""
+    from ventas.models import Cliente, MetricaCliente
+
+    clientes = Cliente.objects.exclude(telefono='').values_list(*CAMPOS_CLIENTE).iterator(chunk_size=2000)
+    filas = _filas(clientes)
+    with transaction.atomic():
+        MetricaCliente.objects.all().delete()
+        MetricaCliente.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+# --- Mantenimiento incremental ------------------------------------------------
+
+class _Lote:
+    """Lo marcado durante una transacción; se recalcula al confirmarla."""
+
+    def __init__(self):
+        self.telefonos = set()
+        self.clientes = set()     # → su teléfono
+        self.ventas = set()       # → el teléfono de su cliente
+
+    def vaciar(self):
+        # Corre después del commit: si falla, el guardado ya está hecho y la
+        # fila queda vieja hasta la próxima marca o el comando.
+        try:
+            from ventas.models import Cliente, VentaReserva
+
+            clientes = set(self.clientes)
+            if self.ventas:
+                clientes.update(VentaReserva.objects.filter(pk__in=self.ventas)
+                                .values_list('cliente_id', flat=True))
+            claves = set(self.telefonos)
+            if clientes:
+                claves.update(map(clave_telefono, Cliente.objects.filter(pk__in=clientes)
+                                  .values_list('telefono', flat=True)))
+            recalcular_telefonos(claves)
+        except Exception:
+            logger.exception("No se pudieron recalcular las métricas de clientes")
+
+
+def marcar(telefonos=(), clientes=(), ventas=()):
+    """Anota qué recalcular. Dentro de una transacción se junta todo y se
+    recalcula UNA vez al confirmarla; en autocommit se recalcula en el acto."""
+    lote = lote_de_la_transaccion('metricas_cliente', _Lote)
+    en_el_acto = lote is None
+    if en_el_acto:
+        lote = _Lote()
+    lote.telefonos.update(c for c in map(clave_telefono, telefonos) if c)
+    lote.clientes.update(c for c in clientes if c)
+    lote.ventas.update(v for v in ventas if v)
+    if en_el_acto:
+        lote.vaciar()
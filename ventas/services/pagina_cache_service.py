@@ -0,0 +1,101 @@
+"""Caché de página completa para las páginas públicas de visitantes anónimos.
+
+La portada, las páginas de categoría y las landings (masajes, Refugio, Ritual,
+Pausa) volvían a consultar `Servicio`, `CategoriaServicio` y los singletons de
+configuración y a armar el JSON-LD en cada visita, aunque para un visitante
+anónimo el HTML sale igual. Con el tráfico de los anuncios eso se nota.
+
+`@cache_pagina_publica` guarda el HTML entero en el dominio 'paginas' de la
+caché compartida (cache_service), con clave por esquema + host + ruta + los
+parámetros GET que cambian la página (`?classic=1`, los UTM de Refugio) y el
+commit desplegado. El resto de la query string (gclid, fbclid...) no abre
+entradas nuevas. Se invalida al guardar servicios, categorías, contenido SEO y
+las configuraciones de las landings (ventas/signals/cache_signals.py).
+
+Huecos por visitante:
+    csrf     el HTML se guarda con un marcador en vez del token de cada
+             `{% csrf_token %}`; al servir se pone el token de quien pide
+             (y se le deja la cookie, como al renderizar)
+    carrito  solo se sirve y guarda para quien tiene el carrito vacío: las
+             páginas de categoría llevan los servicios del carrito en la página
+             (json_script que usa el modal de reserva), no solo el contador.
+             Quien ya agregó algo recibe la página renderizada para él.
+
+Usuarios autenticados (staff), POST y respuestas que no son 200 no pasan por
+la caché.
+"""
+import functools
+import hashlib
+import os
+import re
+
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .cache_service import cache_ns
+
+# Un deploy cambia plantillas: las páginas del commit anterior no se sirven.
+# Render define RENDER_GIT_COMMIT; en local queda vacío.
+VERSION_DEPLOY = os.getenv('RENDER_GIT_COMMIT', '')[:12]
+
+PARAMETROS_VARIANTE = ('classic',)
+
+_CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[A-Za-z0-9]+(")')
+_HUECO_CSRF = b'__aremko_csrf__'
+
+
+def carrito_vacio(request):
+    cart = request.session.get('cart') or {}
+    return not (cart.get('servicios') or cart.get('giftcards'))
+
+
+def _cacheable(request):
+    return (request.method in ('GET', 'HEAD')
+            and not request.user.is_authenticated
+            and carrito_vacio(request))
+
+
+def clave_pagina(request, parametros=PARAMETROS_VARIANTE):
+    variante = '&'.join(f'{p}={request.GET[p]}' for p in parametros if p in request.GET)
+    crudo = f'{request.scheme}://{request.get_host()}{request.path}?{variante}#{VERSION_DEPLOY}'
+    return 'pagina:' + hashlib.sha256(crudo.encode()).hexdigest()
+
+
+def _guardable(response):
+    return (response.status_code == 200 and not response.streaming
+            and not response.cookies and 'text/html' in response.get('Content-Type', ''))
+
+
+def _servir(request, guardada):
+    contenido = guardada['contenido']
+    if _HUECO_CSRF in contenido:
+        contenido = contenido.replace(_HUECO_CSRF, get_token(request).encode())
+    response = HttpResponse(contenido, content_type=guardada['content_type'])
+    response['X-Cache-Pagina'] = 'hit'
+    return response
+
+
+def cache_pagina_publica(parametros=PARAMETROS_VARIANTE):
+    """Decorador de vistas públicas: sirve el HTML desde la caché a visitantes
+    anónimos con el carrito vacío. `parametros`: los GET que cambian la página."""
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if not _cacheable(request):
+                return vista(request, *args, **kwargs)
+            paginas = cache_ns('paginas')
+            clave = clave_pagina(request, parametros)
+            guardada = paginas.get(clave)
+            if guardada is not None:
+                return _servir(request, guardada)
+
+            response = vista(request, *args, **kwargs)
+            if _guardable(response):
+                paginas.set(clave, {
+                    'contenido': _CSRF_INPUT.sub(rb'\g<1>' + _HUECO_CSRF + rb'\g<2>', response.content),
+                    'content_type': response['Content-Type'],
+                })
+                response['X-Cache-Pagina'] = 'miss'
+            return response
+        return envoltura
+    return decorador
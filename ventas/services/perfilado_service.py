@@ -0,0 +1,165 @@
+"""Perfilado por request: latencia, consultas SQL, N+1 y caché, por nombre de URL.
+
+`ventas.middleware_perfilado.PerfiladoMiddleware` mide cada request (si
+`PERFILADO_ACTIVO`) y deja una muestra en un buffer circular acotado
+(`PERFILADO_MUESTRAS`); el tablero `/ventas/diagnostico/perfilado/` agrega las
+muestras por vista y ordena de la peor a la mejor.
+
+El buffer es de CADA proceso: con varios workers de gunicorn el tablero muestra
+lo que vio el worker que atendió la página. Para encontrar los endpoints más
+caros alcanza (la carga se reparte parejo entre workers); no es contabilidad.
+
+Una "huella" de consulta es el SQL con los literales reemplazados por `?`: la
+misma huella repetida muchas veces en UN request es el síntoma de un N+1
+(`for r in reservas: r.servicio.nombre`).
+"""
+import math
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Repeticiones de una misma huella en un request a partir de las cuales se
+# marca como N+1 sospechoso.
+UMBRAL_DUPLICADAS = 5
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_ESPACIOS = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_muestras = deque(maxlen=getattr(settings, 'PERFILADO_MUESTRAS', 2000))
+
+# Medición del request en curso (None fuera de un request perfilado). ContextVar
+# y no threading.local: sirve igual bajo ASGI.
+_actual = ContextVar('perfilado_actual', default=None)
+
+
+def huella(sql):
+    """SQL sin literales: `... WHERE id = 17` y `... id = 18` dan la misma."""
+    sql = _LITERALES.sub('?', sql or '')
+    sql = _LISTAS.sub('(?...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()[:300]
+
+
+class Medicion:
+    """Lo que se junta durante UN request."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.ms_db = 0.0
+        self.huellas = {}
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Para `connection.execute_wrapper`: cuenta y cronometra cada consulta."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.ms_db += (time.perf_counter() - inicio) * 1000
+            self.consultas += 1
+            h = huella(sql)
+            self.huellas[h] = self.huellas.get(h, 0) + 1
+
+    def duplicadas(self):
+        """[(huella, veces)] con al menos UMBRAL_DUPLICADAS, de más a menos."""
+        return sorted(((h, n) for h, n in self.huellas.items() if n >= UMBRAL_DUPLICADAS),
+                      key=lambda x: -x[1])
+
+
+def iniciar():
+    medicion = Medicion()
+    return medicion, _actual.set(medicion)
+
+
+def terminar(token):
+    _actual.reset(token)
+
+
+def registrar_cache(acierto):
+    """Lo llama `cache_service` en cada lectura; no hace nada fuera de un request
+    perfilado."""
+    medicion = _actual.get()
+    if medicion is None:
+        return
+    if acierto:
+        medicion.cache_aciertos += 1
+    else:
+        medicion.cache_fallos += 1
+
+
+def guardar_muestra(vista, metodo, status, ms, medicion):
+    with _lock:
+        _muestras.append({
+            'vista': vista,
+            'metodo': metodo,
+            'status': status,
+            'ms': ms,
+            'consultas': medicion.consultas,
+            'ms_db': medicion.ms_db,
+            'duplicadas': medicion.duplicadas()[:3],
+            'cache_aciertos': medicion.cache_aciertos,
+            'cache_fallos': medicion.cache_fallos,
+            'cuando': time.time(),
+        })
+
+
+def muestras():
+    with _lock:
+        return list(_muestras)
+
+
+def capacidad():
+    return _muestras.maxlen
+
+
+def vaciar():
+    with _lock:
+        _muestras.clear()
+
+
+def percentil(ordenados, p):
+    """Rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0
+    k = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+
+def resumen():
+    """Una fila por vista, de la peor p95 a la mejor."""
+    por_vista = {}
+    for m in muestras():
+        por_vista.setdefault(m['vista'], []).append(m)
+
+    filas = []
+    for vista, lista in por_vista.items():
+        tiempos = sorted(m['ms'] for m in lista)
+        consultas = [m['consultas'] for m in lista]
+        aciertos = sum(m['cache_aciertos'] for m in lista)
+        lecturas = aciertos + sum(m['cache_fallos'] for m in lista)
+        n_mas_1 = {}
+        for m in lista:
+            for h, veces in m['duplicadas']:
+                n_mas_1[h] = max(n_mas_1.get(h, 0), veces)
+        filas.append({
+            'vista': vista,
+            'requests': len(lista),
+            'p50': percentil(tiempos, 50),
+            'p95': percentil(tiempos, 95),
+            'p99': percentil(tiempos, 99),
+            'max': tiempos[-1],
+            'consultas_prom': sum(consultas) / len(consultas),
+            'consultas_max': max(consultas),
+            'ms_db_prom': sum(m['ms_db'] for m in lista) / len(lista),
+            'errores': sum(1 for m in lista if m['status'] >= 500),
+            'cache_ratio': (aciertos / lecturas) if lecturas else None,
+            'n_mas_1': sorted(n_mas_1.items(), key=lambda x: -x[1])[:3],
+        })
+    filas.sort(key=lambda f: -f['p95'])
+    return filas
@@ -5,24 +5,37 @@ Reutilizado por:
 - flow_views.flow_confirmation (cuando Flow confirma el pago)
 
 Centraliza la logica para evitar drift entre los dos puntos de creacion.
+
+Concurrencia (web, retorno de Flow y Luna comprando a la vez):
+- `bloquear_slots` toma un advisory lock de PostgreSQL por (servicio, fecha)
+  hasta el fin de la transaccion. Dos checkouts del mismo servicio y dia se
+  turnan para revalidar y crear; los de otros servicios no se esperan.
+- Mientras el cliente paga en Flow, `retener_slots_carrito` deja una
+  RetencionSlot por servicio del carrito con el mismo vencimiento que la
+  PendingReservation. Los demas checkouts la cuentan como ocupada. Al
+  confirmar el pago se borran.
+- `validar_disponibilidad_carrito` carga todo el carrito en un numero fijo de
+  consultas (antes: 4 por servicio).
 """
 from datetime import datetime, timedelta
 import traceback
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models.signals import pre_save
 from django.utils import timezone
 
 from ..models import (
     Cliente,
     GiftCard,
+    RetencionSlot,
     ReservaServicio,
     Servicio,
-    ServicioBloqueo,
-    ServicioSlotBloqueo,
     VentaReserva,
+    hora_a_minutos,
 )
 from ..signals import validar_disponibilidad_admin
+from .disponibilidad_service import _pico_simultaneas, cargar_bloqueos, cargar_bloques_ocupados
+from .totales_service import totales_diferidos
 from whatsapp_agent.prompt import nombre_presentable
 
 
@@ -34,50 +47,153 @@ class SlotUnavailableError(Exception):
         super().__init__(', '.join(slots))
 
 
-def validar_disponibilidad_carrito(cart_data):
-    """Revisa que todos los slots del carrito sigan disponibles.
+def _fecha_item(servicio_item):
+    try:
+        return datetime.strptime(servicio_item['fecha'], '%Y-%m-%d').date()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _pares_del_carrito(cart_data):
+    """(servicio_id, fecha) de los servicios del carrito que se pueden leer."""
+    pares = set()
+    for servicio_item in cart_data.get('servicios', []):
+        fecha = _fecha_item(servicio_item)
+        try:
+            pares.add((int(servicio_item.get('id')), fecha))
+        except (TypeError, ValueError):
+            continue
+    return {(s, f) for s, f in pares if f is not None}
+
 
-    Devuelve la lista de slots no disponibles (vacia si todo OK).
+def bloquear_slots(pares):
+    """Lock exclusivo por (servicio_id, fecha) hasta el fin de la transaccion en
+    curso (llamar dentro de transaction.atomic). Por dia y no por hora de
+    inicio: los bloques se cruzan por intervalo (una tina de 14:00 choca con
+    la de 15:00).
+
+    Un solo viaje a la base, en orden fijo para que dos carritos con los
+    mismos servicios no se bloqueen mutuamente. Usa la forma de dos enteros
+    (servicio_id, dia ordinal): sin colisiones de hash y en otro espacio de
+    claves que los locks de la cola de trabajos. En SQLite no hace nada (ya
+    serializa las escrituras).
     """
-    unavailable = []
+    claves = sorted({(int(servicio_id), fecha.toordinal()) for servicio_id, fecha in pares})
+    if not claves or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(s, d) FROM unnest(%s::int[], %s::int[]) AS t(s, d)',
+            [[s for s, _ in claves], [d for _, d in claves]],
+        )
+
+
+def _revisar_carrito(cart_data, pending=None):
+    """Devuelve (no disponibles, bloques [(servicio, fecha, inicio, fin)] que
+    entran). 4 consultas sin importar cuantos servicios traiga el carrito."""
+    items = []
+    ids = set()
     for servicio_item in cart_data.get('servicios', []):
         servicio_id = servicio_item.get('id')
         if not servicio_id:
             continue
         try:
-            servicio_obj = Servicio.objects.get(id=servicio_id)
-        except Servicio.DoesNotExist:
+            ids.add(int(servicio_id))
+        except (TypeError, ValueError):
+            pass
+        items.append(servicio_item)
+    if not items:
+        return [], []
+
+    servicios = Servicio.objects.in_bulk(ids)
+    fechas = {f for f in map(_fecha_item, items) if f is not None}
+    if fechas:
+        dias_bloqueados, slots_bloqueados = cargar_bloqueos(list(servicios), min(fechas), max(fechas))
+        ocupados = cargar_bloques_ocupados(list(servicios), fechas, excluir_pending=pending)
+    else:
+        dias_bloqueados, slots_bloqueados, ocupados = set(), set(), {}
+
+    unavailable = []
+    aceptados = []
+    for servicio_item in items:
+        servicio_id = servicio_item.get('id')
+        try:
+            servicio_obj = servicios.get(int(servicio_id))
+        except (TypeError, ValueError):
+            servicio_obj = None
+        if servicio_obj is None:
             unavailable.append(f"Servicio {servicio_id} ya no existe")
             continue
 
-        try:
-            fecha = datetime.strptime(servicio_item['fecha'], '%Y-%m-%d').date()
-        except (KeyError, ValueError):
+        fecha = _fecha_item(servicio_item)
+        if fecha is None:
             unavailable.append(f"Fecha invalida para {servicio_obj.nombre}")
             continue
 
         hora = servicio_item.get('hora')
 
-        if ServicioBloqueo.servicio_bloqueado_en_fecha(servicio_id, fecha):
+        if (servicio_obj.id, fecha) in dias_bloqueados:
             unavailable.append(
                 f"{servicio_obj.nombre} no esta disponible en {fecha.strftime('%d/%m/%Y')} (fuera de servicio)"
             )
             continue
 
-        if ServicioSlotBloqueo.slot_bloqueado(servicio_id, fecha, hora):
+        if (servicio_obj.id, fecha, hora) in slots_bloqueados:
             unavailable.append(
                 f"Slot {hora} para {servicio_obj.nombre} en {fecha.strftime('%d/%m/%Y')} no esta disponible"
             )
             continue
 
-        if ReservaServicio.objects.filter(
-            servicio=servicio_obj,
-            fecha_agendamiento=fecha,
-            hora_inicio=hora,
-        ).exists():
+        # Por intervalo y respetando max_servicios_simultaneos, con las mismas
+        # reglas que buscar_conflictos. Cuentan tambien las retenciones de otros
+        # pagos en curso y los servicios anteriores de este mismo carrito.
+        inicio = hora_a_minutos(hora)
+        fin = None if inicio is None else inicio + max(servicio_obj.duracion or 0, 1)
+        bloques = ocupados.setdefault((servicio_obj.id, fecha), [])
+        max_simultaneos = servicio_obj.max_servicios_simultaneos or 1
+        if inicio is None or _pico_simultaneas(bloques, inicio, fin) + 1 > max_simultaneos:
             unavailable.append(f"Slot {hora} no disponible para {servicio_obj.nombre}")
+            continue
+        bloques.append((inicio, fin))
+        aceptados.append((servicio_obj, fecha, inicio, fin))
 
-    return unavailable
+    return unavailable, aceptados
+
+
+def validar_disponibilidad_carrito(cart_data, pending=None):
+    """Revisa que todos los slots del carrito sigan disponibles.
+
+    Devuelve la lista de slots no disponibles (vacia si todo OK). Las
+    retenciones de `pending` (el pago que se esta confirmando) no cuentan.
+    Sin lock: para reservar, `materializar_venta_desde_carrito` o
+    `retener_slots_carrito` revalidan bajo `bloquear_slots`.
+    """
+    return _revisar_carrito(cart_data, pending)[0]
+
+
+def retener_slots_carrito(pending):
+    """Valida y retiene los slots del carrito de `pending` hasta su expires_at,
+    bajo lock: dos pagos Flow no pueden quedar esperando por el mismo slot.
+
+    Raises:
+        SlotUnavailableError si algun slot ya no esta libre (no retiene nada).
+    """
+    cart_data = pending.cart_data
+    with transaction.atomic():
+        bloquear_slots(_pares_del_carrito(cart_data))
+        unavailable, aceptados = _revisar_carrito(cart_data, pending)
+        if unavailable:
+            raise SlotUnavailableError(unavailable)
+        return RetencionSlot.objects.bulk_create([
+            RetencionSlot(servicio=servicio, fecha=fecha, minuto_inicio=inicio, minuto_fin=fin,
+                          pending_reservation=pending, expires_at=pending.expires_at)
+            for servicio, fecha, inicio, fin in aceptados
+        ])
+
+
+def liberar_retenciones(pending):
+    """Suelta los slots retenidos por `pending` (pago confirmado, rechazado o cancelado)."""
+    return RetencionSlot.objects.filter(pending_reservation=pending).delete()[0]
 
 
 def _crear_cliente_destinatario(giftcard_item):
@@ -119,7 +235,8 @@ def _crear_cliente_destinatario(giftcard_item):
     return None
 
 
-def materializar_venta_desde_carrito(cliente, cart_data, comprador_form_data=None, revalidar=True):
+def materializar_venta_desde_carrito(cliente, cart_data, comprador_form_data=None, revalidar=True,
+                                     pending=None):
     """Crea VentaReserva + ReservaServicio + GiftCards a partir del cliente y cart_data.
 
     Args:
@@ -127,6 +244,8 @@ def materializar_venta_desde_carrito(cliente, cart_data, comprador_form_data=Non
         cart_data: dict con keys 'servicios', 'giftcards', 'total', 'descuentos', 'total_descuentos'.
         comprador_form_data: dict opcional con datos del form (nombre, email, telefono) para snapshot en GiftCard.
         revalidar: si True (default), valida disponibilidad de slots antes de crear.
+        pending: PendingReservation que se materializa; sus retenciones no cuentan
+            como ocupadas y se sueltan al crear la venta.
 
     Returns:
         VentaReserva creada.
@@ -134,17 +253,22 @@ def materializar_venta_desde_carrito(cliente, cart_data, comprador_form_data=Non
     Raises:
         SlotUnavailableError si un slot ya no esta disponible.
     """
-    if revalidar:
-        unavailable = validar_disponibilidad_carrito(cart_data)
-        if unavailable:
-            raise SlotUnavailableError(unavailable)
-
     comprador_form_data = comprador_form_data or {}
     nombre = comprador_form_data.get('nombre', cliente.nombre)
     email = comprador_form_data.get('email', cliente.email or '')
     telefono = comprador_form_data.get('telefono', cliente.telefono or '')
 
-    with transaction.atomic():
+    # totales_diferidos: cada línea creada ya no recalcula el total de la venta;
+    # se recalcula una sola vez con el calcular_total() del final.
+    with transaction.atomic(), totales_diferidos():
+        # Revalidar y crear bajo el lock de los (servicio, fecha) del carrito:
+        # otro checkout de los mismos slots espera aqui a que este termine.
+        bloquear_slots(_pares_del_carrito(cart_data))
+        if revalidar:
+            unavailable = validar_disponibilidad_carrito(cart_data, pending=pending)
+            if unavailable:
+                raise SlotUnavailableError(unavailable)
+
         signal_disconnected = False
         try:
             pre_save.disconnect(validar_disponibilidad_admin, sender=ReservaServicio)
@@ -217,6 +341,9 @@ def materializar_venta_desde_carrito(cliente, cart_data, comprador_form_data=Non
                     servicio_asociado=giftcard_item.get('experiencia_id', ''),
                 )
 
+            if pending is not None:
+                liberar_retenciones(pending)
+
             venta.calcular_total()
             return venta
         finally:
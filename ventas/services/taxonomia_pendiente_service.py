@@ -0,0 +1,115 @@
+"""Cola de clientes con la taxonomía por recalcular (`TaxonomiaPendiente`).
+
+`recalcular_taxonomia_clientes` recorría cada noche todas las ventas de la
+ventana de 24 meses y todo `crm_service_history` para refrescar las ~14K filas
+de `ClienteTaxonomia`, aunque hubieran cambiado unas decenas. Ahora:
+
+    marcar             las señales anotan los clientes cuyas reservas o
+                       servicios históricos cambiaron (los pagos entran por el
+                       estado_pago de la venta)
+    al confirmar       se encolan, una fila por cliente
+    encolar_vencidas   encola las N taxonomías más viejas calculadas antes de
+                       hoy: días sin venir, antigüedad y la ventana de 24 meses
+                       cambian solos con el calendario
+    tomar / confirmar  el comando (`--pendientes`) toma un lote, recalcula solo
+                       esos clientes y borra lo que procesó
+
+Confirmar borra solo las filas marcadas hasta el inicio del lote: un cliente
+que se vuelve a marcar mientras se recalcula queda en la cola para la próxima.
+"""
+import logging
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from .lote_transaccion import lote_de_la_transaccion
+
+logger = logging.getLogger(__name__)
+
+
+def encolar(clientes, motivo=None):
+    """Encola los clientes (los que sigan existiendo). Si ya estaban, corre su
+    `marcado_en` y les pone este motivo. Devuelve cuántos quedaron en la cola."""
+    from ventas.models import Cliente, TaxonomiaPendiente
+
+    ids = {c for c in clientes if c}
+    if not ids:
+        return 0
+    ahora = timezone.now()
+    filas = [TaxonomiaPendiente(cliente_id=c, motivo=motivo or TaxonomiaPendiente.MOTIVO_RESERVA,
+                                marcado_en=ahora)
+             for c in Cliente.objects.filter(pk__in=ids).values_list('pk', flat=True)]
+    TaxonomiaPendiente.objects.bulk_create(
+        filas, update_conflicts=True, unique_fields=['cliente'], update_fields=['motivo', 'marcado_en'])
+    return len(filas)
+
+
+def encolar_vencidas(limite):
+    """Encola hasta `limite` clientes con la taxonomía calculada antes de hoy,
+    los más viejos primero. No toca a los que ya estaban en la cola."""
+    from ventas.models import ClienteTaxonomia, TaxonomiaPendiente
+
+    if not limite or limite <= 0:
+        return 0
+    inicio_de_hoy = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    ids = list(ClienteTaxonomia.objects.filter(calculado_en__lt=inicio_de_hoy)
+               .exclude(cliente_id__in=TaxonomiaPendiente.objects.values('cliente_id'))
+               .order_by('calculado_en').values_list('cliente_id', flat=True)[:limite])
+    ahora = timezone.now()
+    TaxonomiaPendiente.objects.bulk_create(
+        [TaxonomiaPendiente(cliente_id=c, motivo=TaxonomiaPendiente.MOTIVO_PASO_TIEMPO, marcado_en=ahora)
+         for c in ids],
+        ignore_conflicts=True)
+    return len(ids)
+
+
+def tomar(lote, hasta):
+    """Hasta `lote` (cliente_id, motivo) marcados hasta `hasta`, los más viejos primero."""
+    from ventas.models import TaxonomiaPendiente
+
+    return list(TaxonomiaPendiente.objects.filter(marcado_en__lte=hasta)
+                .order_by('marcado_en').values_list('cliente_id', 'motivo')[:lote])
+
+
+def confirmar(clientes, corte):
+    """Saca de la cola a los clientes procesados que no se volvieron a marcar después de `corte`."""
+    from ventas.models import TaxonomiaPendiente
+
+    TaxonomiaPendiente.objects.filter(cliente_id__in=clientes, marcado_en__lte=corte).delete()
+
+
+# --- Marcado desde señales -------------------------------------------------------
+
+class _Lote:
+    """Lo marcado durante una transacción; se encola al confirmarla."""
+
+    def __init__(self):
+        self.clientes = set()
+        self.ventas = set()       # → su cliente
+
+    def vaciar(self):
+        # Corre después del commit: si falla, el guardado ya está hecho y el
+        # cliente se refresca igual con el paso del tiempo.
+        try:
+            from ventas.models import VentaReserva
+
+            clientes = set(self.clientes)
+            if self.ventas:
+                clientes.update(VentaReserva.objects.filter(pk__in=self.ventas)
+                                .values_list('cliente_id', flat=True))
+            encolar(clientes)
+        except Exception:
+            logger.exception("No se pudieron encolar clientes para la taxonomía")
+
+
+def marcar(clientes=(), ventas=()):
+    """Anota clientes (o ventas, por su cliente) a encolar. Dentro de una
+    transacción se encola UNA vez al confirmarla; en autocommit, en el acto."""
+    lote = lote_de_la_transaccion('taxonomia_pendiente', _Lote)
+    en_el_acto = lote is None
+    if en_el_acto:
+        lote = _Lote()
+    lote.clientes.update(c for c in clientes if c)
+    lote.ventas.update(v for v in ventas if v)
+    if en_el_acto:
+        lote.vaciar()
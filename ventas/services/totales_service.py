@@ -0,0 +1,108 @@
+"""Recálculo de totales de VentaReserva: diferido y agrupado.
+
+Cada `ReservaServicio`/`ReservaProducto`/`Pago`/`GiftCard` guardado o borrado
+dispara un recálculo del total de su venta. Una reserva de 6 líneas guardada desde
+el inline del admin recalculaba 6+ veces, cada vez con 5 aggregates y 2 `save()`
+completos.
+
+Ahora las señales solo MARCAN la venta como pendiente (`marcar_total_pendiente`):
+
+- Dentro de un bloque `totales_diferidos()` las ventas marcadas se juntan y se
+  recalculan UNA vez al cerrar el bloque, todas en una sola consulta.
+- Fuera de un bloque se recalcula en el acto, como siempre (el que guarda una
+  línea suelta y lee `venta.total` en la línea siguiente lo sigue viendo al día).
+
+El bloque abre su propia transacción y recalcula ANTES de cerrarla: líneas y
+totales se confirman juntos o no se confirma nada.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_estado = threading.local()
+
+
+def _pendientes():
+    """{venta_id: [instancias en memoria a refrescar]} del bloque activo, o None."""
+    return getattr(_estado, 'pendientes', None)
+
+
+@contextmanager
+def totales_diferidos():
+    """Junta los recálculos de total disparados dentro del bloque y los hace una
+    sola vez al salir. Anidable: solo el bloque más externo recalcula."""
+    if _pendientes() is not None:
+        yield
+        return
+    _estado.pendientes = {}
+    try:
+        with transaction.atomic():
+            yield
+            pendientes = _estado.pendientes
+            _estado.pendientes = None
+            if pendientes:
+                recalcular_totales(
+                    pendientes.keys(),
+                    instancias=[i for lista in pendientes.values() for i in lista],
+                    solo_si_cambia=True,
+                )
+    finally:
+        _estado.pendientes = None
+
+
+def marcar_total_pendiente(venta_reserva_id, instancia=None):
+    """Lo que llaman las señales en vez de `venta.calcular_total()`.
+
+    `instancia` es la VentaReserva en memoria del que disparó el cambio (si la
+    tiene a mano): se refresca con los totales nuevos para que no quede vieja.
+    """
+    if not venta_reserva_id:
+        return
+    pendientes = _pendientes()
+    if pendientes is None:
+        recalcular_totales([venta_reserva_id],
+                           instancias=[instancia] if instancia is not None else (),
+                           solo_si_cambia=True)
+        return
+    lista = pendientes.setdefault(venta_reserva_id, [])
+    if instancia is not None and not any(i is instancia for i in lista):
+        lista.append(instancia)
+
+
+def recalcular_totales(venta_ids, instancias=(), solo_si_cambia=False):
+    """Recalcula total/pagado/saldo/estado_pago de `venta_ids` con UNA consulta y
+    un `save(update_fields=...)` por venta.
+
+    `instancias`: VentaReserva en memoria que se refrescan con el resultado (y
+    se usan para guardar, así los receptores de post_save ven el mismo objeto).
+    `solo_si_cambia`: no guardar las ventas cuyos totales quedaron iguales — lo
+    usan las señales; `calcular_total()` explícito guarda siempre, como antes.
+    Las ventas que ya no existen (borrado en cascada) se ignoran.
+    """
+    from ventas.models import VentaReserva
+
+    venta_ids = {v for v in venta_ids if v}
+    if not venta_ids:
+        return
+    por_id = {}
+    for inst in instancias:
+        if inst is not None and inst.pk:
+            por_id.setdefault(inst.pk, []).append(inst)
+
+    for fila in VentaReserva.con_totales_calculados(venta_ids):
+        antes = tuple(getattr(fila, c) for c in VentaReserva.CAMPOS_TOTALES)
+        fila.aplicar_totales(fila)
+        despues = tuple(getattr(fila, c) for c in VentaReserva.CAMPOS_TOTALES)
+
+        en_memoria = por_id.get(fila.pk, [])
+        for inst in en_memoria:
+            for campo, valor in zip(VentaReserva.CAMPOS_TOTALES, despues):
+                setattr(inst, campo, valor)
+        if solo_si_cambia and antes == despues:
+            continue
+        destino = en_memoria[0] if en_memoria else fila
+        destino.save(update_fields=list(VentaReserva.CAMPOS_TOTALES))
@@ -0,0 +1,315 @@
+"""Cola de trabajos en segundo plano sobre la base (`Trabajo`).
+
+Los endpoints de `cron_views` corrían comandos de minutos (campañas, bandeja
+WhatsApp, triggers de comunicación) con `call_command` dentro de la petición,
+ocupando un worker de gunicorn; las vistas de campañas lanzaban
+`threading.Thread` que morían con el proceso (deploy, --max-requests). Ahora
+encolan y responden al tiro, y `procesar_trabajos` los corre aparte:
+
+    encolar / encolar_comando
+                  deja el trabajo pendiente. Con `clave`, si ya hay uno activo
+                  con esa clave devuelve ese: el cron que vuelve a llamar
+                  mientras el anterior corre no apila copias
+    tomar         SELECT ... FOR UPDATE SKIP LOCKED del más antiguo listo para
+                  correr; la toma se serializa por cola (advisory lock) para
+                  respetar CONCURRENCIA sin bloquear a las otras colas
+    ejecutar      corre la tarea fuera de la transacción; si falla vuelve a
+                  pendiente con backoff exponencial hasta max_intentos.
+                  Mientras corre, un `Vigilante` marca `latido_en` cada
+                  LATIDO y corta el proceso si pasa su tiempo máximo
+    rescatar      los que quedaron 'corriendo' sin latido desde hace
+                  LATIDO_VENCIDO (su worker murió) vuelven a la cola, o fallan
+                  si ya no les quedan intentos. Uno que sigue latiendo no se
+                  toca, aunque lleve horas: una campaña larga no pierde su cupo
+
+Cada cola tiene su propio worker (`procesar_trabajos` sin --colas levanta un
+proceso por cupo de CONCURRENCIA): una campaña de horas en 'campanas' no
+frena las GiftCards de 'avisos' ni los crons de 'default'.
+
+Tareas: 'comando' (cualquier management command, con su tiempo máximo en
+TIEMPO_MAXIMO_COMANDO) y las funciones registradas con @tarea. El estado se
+ve en el admin (Trabajos en segundo plano).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Trabajos corriendo a la vez por cola; las que no están aquí, 1.
+CONCURRENCIA = {
+    'default': 2,
+    'avisos': 1,      # emails/WhatsApp transaccionales (premios, triggers, seguimientos)
+    'campanas': 1,    # envíos masivos: uno a la vez para no saturar el SMTP
+}
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAXIMO = timedelta(hours=1)
+MAX_RESULTADO = 20000
+
+# El worker marca `latido_en` cada LATIDO; sin latido por LATIDO_VENCIDO, el
+# trabajo es de un worker muerto.
+LATIDO = timedelta(seconds=30)
+LATIDO_VENCIDO = timedelta(minutes=5)
+
+# Tiempo máximo corriendo: pasado eso el worker lo da por fallido y se reinicia.
+TIEMPO_MAXIMO_DEFAULT = timedelta(minutes=30)
+TIEMPO_MAXIMO_COMANDO = {
+    'enviar_campana_email': timedelta(hours=24),       # espaciada por el limitador (lotes cada N min)
+    'enviar_campana_giftcard': timedelta(hours=6),
+    'generar_bandeja_whatsapp_diaria': timedelta(hours=1),
+    'gen_atencion_clientes': timedelta(hours=1),
+    'generar_exportaciones': timedelta(hours=1),
+    'normalizar_ciudades_clientes': timedelta(hours=1),
+    'recalcular_taxonomia_clientes': timedelta(hours=2),
+}
+
+# Código de salida del proceso cortado por tiempo máximo.
+EXIT_TIEMPO_MAXIMO = 75
+
+TAREAS = {}  # nombre → (función, tiempo máximo corriendo; None = según el comando)
+
+
+def tarea(nombre, tiempo_maximo=TIEMPO_MAXIMO_DEFAULT):
+    """Registra una función como tarea encolable. Recibe los `argumentos` del
+    trabajo como kwargs; lo que devuelva se guarda como resultado."""
+    def registrar(funcion):
+        TAREAS[nombre] = (funcion, tiempo_maximo)
+        return funcion
+    return registrar
+
+
+def tiempo_maximo(trabajo):
+    """Cuánto puede correr `trabajo`: el de su tarea o, si es un comando, el
+    de ese comando en TIEMPO_MAXIMO_COMANDO."""
+    _, maximo = TAREAS.get(trabajo.tarea, (None, TIEMPO_MAXIMO_DEFAULT))
+    if maximo is None:
+        maximo = TIEMPO_MAXIMO_COMANDO.get((trabajo.argumentos or {}).get('nombre'), TIEMPO_MAXIMO_DEFAULT)
+    return maximo
+
+
+def workers_por_cola():
+    """Una entrada por worker a levantar: cada cola tantas veces como su cupo."""
+    return [cola for cola, cupo in CONCURRENCIA.items() for _ in range(cupo)]
+
+
+@tarea('comando', tiempo_maximo=None)
+def _comando(nombre, args=(), opciones=None):
+    salida = StringIO()
+    call_command(nombre, *args, stdout=salida, **(opciones or {}))
+    return salida.getvalue()
+
+
+@tarea('campana_visual', tiempo_maximo=timedelta(hours=24))
+def _campana_visual(campaign_pk):
+    # Duerme entre lotes (batch_delay_minutes): puede tardar horas.
+    from ventas.views.visual_campaign_views import send_visual_campaign_async
+
+    send_visual_campaign_async(campaign_pk)
+
+
+@tarea('entregar_giftcards', tiempo_maximo=timedelta(minutes=30))
+def _entregar_giftcards(venta_reserva_id, giftcard_ids):
+    from ventas.services.giftcard_entrega_service import entregar
+
+    return entregar(venta_reserva_id, giftcard_ids)
+
+
+# --- Encolar -----------------------------------------------------------------
+
+def encolar(nombre_tarea, argumentos=None, *, cola='default', clave=None, max_intentos=3, ejecutar_desde=None):
+    """Encola un trabajo. Devuelve (trabajo, creado); creado=False si ya había
+    uno activo con la misma `clave`."""
+    from ventas.models import Trabajo
+
+    if nombre_tarea not in TAREAS:
+        raise ValueError(f"Tarea desconocida: {nombre_tarea}")
+    if cola not in CONCURRENCIA:
+        # Sin cupo en CONCURRENCIA no hay worker que la atienda.
+        raise ValueError(f"Cola desconocida: {cola}")
+    if clave:
+        existente = Trabajo.objects.filter(clave=clave, estado__in=Trabajo.ACTIVOS).first()
+        if existente:
+            return existente, False
+    try:
+        with transaction.atomic():
+            return Trabajo.objects.create(
+                tarea=nombre_tarea, argumentos=argumentos or {}, cola=cola, clave=clave,
+                max_intentos=max_intentos, ejecutar_desde=ejecutar_desde or timezone.now()), True
+    except IntegrityError:
+        # Otro proceso encoló la misma clave entre la consulta y el insert.
+        existente = Trabajo.objects.filter(clave=clave, estado__in=Trabajo.ACTIVOS).first() if clave else None
+        if existente is None:
+            raise
+        return existente, False
+
+
+def encolar_comando(nombre, *args, cola='default', clave=None, max_intentos=3, **opciones):
+    """Encola `call_command(nombre, *args, **opciones)`."""
+    return encolar('comando', {'nombre': nombre, 'args': list(args), 'opciones': opciones},
+                   cola=cola, clave=clave, max_intentos=max_intentos)
+
+
+# --- Tomar y ejecutar ----------------------------------------------------------
+
+def identificador_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'[:80]
+
+
+def _cola_libre(cola):
+    """¿Puede correr uno más en `cola`? En PostgreSQL toma antes un advisory
+    lock de la cola hasta el fin de la transacción: dos workers no pueden
+    contar 'corriendo' a la vez y pasarse del tope."""
+    from ventas.models import Trabajo
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'trabajos:{cola}'])
+    corriendo = Trabajo.objects.filter(cola=cola, estado=Trabajo.ESTADO_CORRIENDO).count()
+    return corriendo < CONCURRENCIA.get(cola, 1)
+
+
+def tomar(colas=None, worker=''):
+    """Toma el próximo trabajo listo para correr (de `colas`, o de todas) y lo
+    deja 'corriendo'. None si no hay nada que se pueda correr ahora."""
+    from ventas.models import Trabajo
+
+    llenas = set()
+    while True:
+        with transaction.atomic():
+            qs = Trabajo.objects.filter(estado=Trabajo.ESTADO_PENDIENTE, ejecutar_desde__lte=timezone.now())
+            if colas:
+                qs = qs.filter(cola__in=colas)
+            if llenas:
+                qs = qs.exclude(cola__in=llenas)
+            trabajo = qs.select_for_update(skip_locked=True).order_by('ejecutar_desde', 'id').first()
+            if trabajo is None:
+                return None
+            if _cola_libre(trabajo.cola):
+                trabajo.estado = Trabajo.ESTADO_CORRIENDO
+                trabajo.intentos += 1
+                trabajo.tomado_en = trabajo.latido_en = timezone.now()
+                trabajo.tomado_por = worker
+                trabajo.save(update_fields=['estado', 'intentos', 'tomado_en', 'latido_en', 'tomado_por'])
+                return trabajo
+        llenas.add(trabajo.cola)
+
+
+def _backoff(intentos):
+    espera = min(BACKOFF_BASE * 2 ** max(intentos - 1, 0), BACKOFF_MAXIMO)
+    return espera * random.uniform(0.8, 1.2)
+
+
+def _fallo(trabajo, error):
+    """Vuelve a la cola con backoff o queda fallido si no le quedan intentos."""
+    from ventas.models import Trabajo
+
+    ahora = timezone.now()
+    if trabajo.intentos < trabajo.max_intentos:
+        cambios = {'estado': Trabajo.ESTADO_PENDIENTE, 'ejecutar_desde': ahora + _backoff(trabajo.intentos)}
+    else:
+        cambios = {'estado': Trabajo.ESTADO_FALLIDO, 'terminado_en': ahora}
+    Trabajo.objects.filter(pk=trabajo.pk, estado=Trabajo.ESTADO_CORRIENDO).update(
+        error=error[-MAX_RESULTADO:], **cambios)
+    return cambios['estado']
+
+
+class Vigilante(threading.Thread):
+    """Acompaña a un trabajo mientras corre: marca su `latido_en` cada LATIDO
+    y, si pasa su tiempo máximo, lo da por fallido y termina el proceso. Un
+    hilo de Python no se puede matar; el proceso sí, y quien lo supervisa
+    (`procesar_trabajos` o Render) levanta otro. `terminar` se inyecta en los
+    tests."""
+
+    def __init__(self, trabajo, terminar=None):
+        super().__init__(name=f'trabajo-{trabajo.pk}', daemon=True)
+        self.trabajo = trabajo
+        self.maximo = tiempo_maximo(trabajo)
+        self.limite = (trabajo.tomado_en or timezone.now()) + self.maximo
+        self.terminar = terminar or (lambda: os._exit(EXIT_TIEMPO_MAXIMO))
+        self._fin = threading.Event()
+
+    def run(self):
+        try:
+            while not self._fin.wait(LATIDO.total_seconds()):
+                if not self.latir():
+                    return
+        finally:
+            connection.close()
+
+    def latir(self):
+        """Un latido. False si el trabajo pasó su tiempo máximo (y se cortó)."""
+        from ventas.models import Trabajo
+
+        if timezone.now() > self.limite:
+            logger.error("Trabajo #%s (%s) pasó su tiempo máximo de %s: se corta el worker",
+                         self.trabajo.pk, self.trabajo.tarea, self.maximo)
+            _fallo(self.trabajo, f"Superó su tiempo máximo ({self.maximo}); se cortó el worker "
+                                 f"{self.trabajo.tomado_por}")
+            self.terminar()
+            return False
+        try:
+            Trabajo.objects.filter(pk=self.trabajo.pk, estado=Trabajo.ESTADO_CORRIENDO).update(
+                latido_en=timezone.now())
+        except Exception:  # noqa: BLE001 — un latido perdido no corta el trabajo
+            logger.warning("No se pudo marcar el latido del trabajo #%s", self.trabajo.pk, exc_info=True)
+        return True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self.join()
+
+
+def ejecutar(trabajo):
+    """Corre un trabajo ya tomado. Devuelve el estado en que quedó."""
+    from ventas.models import Trabajo
+
+    funcion, _ = TAREAS.get(trabajo.tarea, (None, None))
+    if funcion is None:
+        return _fallo(trabajo, f"Tarea desconocida: {trabajo.tarea}")
+    try:
+        with Vigilante(trabajo):
+            resultado = funcion(**trabajo.argumentos)
+    except Exception:
+        logger.exception("Falló el trabajo #%s (%s, intento %s/%s)", trabajo.pk, trabajo.tarea,
+                         trabajo.intentos, trabajo.max_intentos)
+        return _fallo(trabajo, traceback.format_exc())
+    # Si lo cancelaron desde el admin mientras corría, queda cancelado.
+    Trabajo.objects.filter(pk=trabajo.pk, estado=Trabajo.ESTADO_CORRIENDO).update(
+        estado=Trabajo.ESTADO_LISTO, resultado=str(resultado or '')[-MAX_RESULTADO:],
+        error='', terminado_en=timezone.now())
+    return Trabajo.ESTADO_LISTO
+
+
+def rescatar():
+    """Devuelve a la cola los trabajos 'corriendo' que llevan LATIDO_VENCIDO
+    sin latido: su worker murió (deploy, memoria). Los que siguen latiendo no
+    se tocan aunque lleven horas; el tiempo máximo lo corta el propio worker.
+    Devuelve cuántos rescató."""
+    from django.db.models import Q
+
+    from ventas.models import Trabajo
+
+    vencido = timezone.now() - LATIDO_VENCIDO
+    n = 0
+    for trabajo in Trabajo.objects.filter(
+            Q(latido_en__lt=vencido) | Q(latido_en__isnull=True, tomado_en__lt=vencido),
+            estado=Trabajo.ESTADO_CORRIENDO):
+        ultimo = trabajo.latido_en or trabajo.tomado_en
+        logger.warning("Trabajo #%s sin latido desde %s (%s): se rescata", trabajo.pk, ultimo,
+                       trabajo.tomado_por)
+        _fallo(trabajo, f"El worker {trabajo.tomado_por} dejó de latir ({ultimo:%Y-%m-%d %H:%M:%S})")
+        n += 1
+    return n
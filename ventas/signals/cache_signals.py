@@ -0,0 +1,140 @@
+"""Invalidación de la caché por dominios (`ventas/services/cache_service.py`).
+
+Cada cambio a un modelo sube la versión de los dominios que lo muestran; las
+entradas viejas quedan huérfanas en TODOS los workers a la vez (la versión vive
+en la caché compartida). Nunca propaga una excepción: la caché no puede romper
+el guardado.
+
+La versión se sube al CONFIRMAR la transacción (`on_commit`), no al guardar:
+una lectura que cae entre el guardado y el commit todavía ve los datos viejos,
+y si la versión ya hubiera subido los guardaría bajo la nueva (un .ics viejo
+por 30 minutos: la ventana de overbooking que esto cierra).
+
+El .ics de cada cabaña (dominio 'ical') se invalida SOLO para la cabaña tocada:
+la de antes y la de después si una reserva o un bloqueo cambió de cabaña, y
+todas las de una venta que se cancela o se reactiva.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from ..models import (CalendarioCabana, CategoriaServicio, GiftCardExperiencia,
+                      HomepageConfig, MasajesLandingConfig, Producto, RefugioConfig,
+                      RefugioImagen, ReservaServicio, RitualRioLandingConfig, SEOContent,
+                      Servicio, ServicioBloqueo, ServicioSlotBloqueo, VentaReserva)
+from ..services.cache_service import cache_ns, invalidar
+from .estado_previo import antes_y_ahora, recordar
+
+logger = logging.getLogger(__name__)
+
+# Modelo → dominios que dependen de él.
+DOMINIOS_POR_MODELO = [
+    (Servicio, ('catalogo', 'disponibilidad', 'homepage', 'luna_config', 'ical', 'paginas')),
+    # 'luna_config' guarda además la foto del catálogo de Luna (whatsapp_agent/snapshot.py):
+    # productos con stock y ambientaciones (por nombre de categoría) salen en su prompt.
+    (CategoriaServicio, ('catalogo', 'homepage', 'luna_config', 'paginas')),
+    (Producto, ('luna_config',)),
+    (HomepageConfig, ('homepage', 'paginas')),
+    # HTML completo de las páginas públicas (services/pagina_cache_service.py).
+    (SEOContent, ('paginas',)),
+    (MasajesLandingConfig, ('paginas',)),
+    (RitualRioLandingConfig, ('paginas',)),   # Ritual, Pausa
+    (RefugioConfig, ('paginas',)),
+    (RefugioImagen, ('paginas',)),
+    (ReservaServicio, ('disponibilidad',)),
+    (ServicioBloqueo, ('disponibilidad',)),
+    (ServicioSlotBloqueo, ('disponibilidad',)),
+    (CalendarioCabana, ('ical',)),   # token → cabaña
+    (GiftCardExperiencia, ('giftcards',)),
+]
+
+
+def _al_confirmar(invalidar_ahora, mensaje, *args):
+    """Corre `invalidar_ahora()` cuando confirma la transacción en curso (al
+    tiro si no hay una). Un error va al log con `mensaje` % `args`."""
+    def _correr():
+        try:
+            invalidar_ahora()
+        except Exception:
+            logger.warning(mensaje, *args, exc_info=True)
+    transaction.on_commit(_correr)
+
+
+def _invalidador(dominios):
+    def _receptor(sender, instance=None, **kwargs):
+        _al_confirmar(lambda: invalidar(*dominios),
+                      "No se pudo invalidar la caché %s tras cambiar %s", dominios, sender.__name__)
+    return _receptor
+
+
+# weak=False: los receptores son closures sin otra referencia.
+for _modelo, _dominios in DOMINIOS_POR_MODELO:
+    _receptor = _invalidador(_dominios)
+    for _evento, _senal in (('save', post_save), ('delete', post_delete)):
+        _senal.connect(_receptor, sender=_modelo, weak=False,
+                       dispatch_uid=f'cache_ns_{_evento}_{_modelo.__name__}')
+
+
+def _conectar_config_luna():
+    from whatsapp_agent.models import WhatsAppAgentConfig
+
+    _receptor = _invalidador(('luna_config',))
+    post_save.connect(_receptor, sender=WhatsAppAgentConfig, weak=False,
+                      dispatch_uid='cache_ns_luna_config')
+    m2m_changed.connect(_receptor, sender=WhatsAppAgentConfig.servicios_complementarios.through,
+                        weak=False, dispatch_uid='cache_ns_luna_config_complementarios')
+
+
+_conectar_config_luna()
+
+
+# --- .ics por cabaña: un ámbito por servicio_id ------------------------------
+
+def _invalidar_feeds(*servicio_ids):
+    ids = {s for s in servicio_ids if s}
+
+    def _invalidar():
+        for servicio_id in ids:
+            cache_ns('ical', ambito=servicio_id).invalidar()
+    _al_confirmar(_invalidar, "No se pudo invalidar el .ics de %s", sorted(ids))
+
+
+def _feed_por_servicio(sender, instance=None, **kwargs):
+    try:
+        (anterior,), (actual,) = antes_y_ahora(instance, 'ical', 'servicio_id')
+        _invalidar_feeds(actual, anterior)
+    except Exception:
+        logger.warning("No se pudo invalidar el .ics tras cambiar %s", sender.__name__, exc_info=True)
+
+
+def _feed_por_estado_de_venta(sender, instance=None, created=False, **kwargs):
+    (anterior,), (actual,) = antes_y_ahora(instance, 'ical', 'estado_reserva')
+    # Solo importa entrar o salir de 'cancelada' (tramos_ocupados las excluye).
+    if created or anterior == actual or 'cancelada' not in (anterior, actual):
+        return
+    try:
+        _invalidar_feeds(*instance.reservaservicios.values_list('servicio_id', flat=True).distinct())
+    except Exception:
+        logger.warning("No se pudo invalidar el .ics de la venta %s", instance.pk, exc_info=True)
+
+
+def _feed_del_servicio(sender, instance=None, **kwargs):
+    try:
+        _invalidar_feeds(instance.pk)   # el nombre va en X-WR-CALNAME
+    except Exception:
+        logger.warning("No se pudo invalidar el .ics del servicio %s", instance.pk, exc_info=True)
+
+
+for _modelo in (ReservaServicio, ServicioBloqueo):
+    recordar(_modelo, 'servicio_id')
+    for _evento, _senal in (('save', post_save), ('delete', post_delete)):
+        _senal.connect(_feed_por_servicio, sender=_modelo, weak=False,
+                       dispatch_uid=f'ical_{_evento}_{_modelo.__name__}')
+
+recordar(VentaReserva, 'estado_reserva')
+post_save.connect(_feed_por_estado_de_venta, sender=VentaReserva, weak=False,
+                  dispatch_uid='ical_save_VentaReserva')
+post_save.connect(_feed_del_servicio, sender=Servicio, weak=False,
+                  dispatch_uid='ical_save_Servicio')
@@ -0,0 +1,57 @@
+"""Estado "de antes" de una instancia, para los receptores post_save/post_delete
+que necesitan saber qué cambió (tabla de hechos, métricas por cliente...).
+
+Un solo receptor post_init por modelo guarda los campos que pidió cualquiera de
+esos módulos: cargar una VentaReserva corre UNA función, no una por módulo.
+Cada módulo lleva después su propio "último visto" (`clave`), porque lo
+actualiza al procesar el guardado y no puede pisar el de los demás.
+
+Por __dict__: con .only()/.defer() leer el atributo dispararía una consulta.
+"""
+
+import functools
+
+from django.db.models.signals import post_init
+
+_CAMPOS = {}   # modelo -> campos que se recuerdan al cargar
+
+
+def recordar(modelo, *campos):
+    """Pide que `modelo` recuerde `campos` al cargarse (se llama al importar
+    cada módulo de señales)."""
+    if modelo not in _CAMPOS:
+        _CAMPOS[modelo] = set()
+        post_init.connect(_al_cargar, sender=modelo, weak=False,
+                          dispatch_uid=f'estado_previo_init_{modelo.__name__}')
+    _CAMPOS[modelo].update(campos)
+
+
+def _al_cargar(sender, instance, **kwargs):
+    valores = instance.__dict__
+    instance._estado_previo = {c: valores.get(c) for c in _CAMPOS[sender]}
+
+
+def antes_y_ahora(instance, clave, *campos):
+    """(antes, ahora) de `campos` para el módulo `clave`. `antes` es lo último
+    que ESE módulo vio de la instancia (lo cargado, la primera vez); `ahora`
+    queda como el próximo `antes`."""
+    previo = instance.__dict__.get('_estado_previo', {})
+    visto = instance.__dict__.setdefault('_estado_visto', {}).setdefault(clave, {})
+    antes = tuple(visto.get(c, previo.get(c)) for c in campos)
+    ahora = tuple(getattr(instance, c) for c in campos)
+    visto.update(zip(campos, ahora))
+    return antes, ahora
+
+
+def seguro(logger, mensaje):
+    """Decorador de receptores que nunca propagan: la excepción va a `logger`
+    con `mensaje` (%s = nombre del modelo)."""
+    def decorador(receptor):
+        @functools.wraps(receptor)
+        def _envuelto(sender, instance=None, **kwargs):
+            try:
+                receptor(sender, instance, **kwargs)
+            except Exception:
+                logger.warning(mensaje, sender.__name__, exc_info=True)
+        return _envuelto
+    return decorador
@@ -0,0 +1,92 @@
+"""Mantenimiento incremental de la tabla de hechos de ventas
+(`ventas/services/hechos_ventas_service.py`).
+
+Cada cambio marca los días que toca —el de antes y el de después si cambió la
+fecha o la venta— y el servicio los recalcula al confirmar la transacción.
+Nunca propaga una excepción: la tabla de hechos no puede romper el guardado.
+"""
+
+import logging
+
+from django.db.models.signals import post_delete, post_save
+
+from ..models import Pago, Producto, ReservaProducto, ReservaServicio, Servicio, VentaReserva
+from ..services.hechos_ventas_service import marcar, marcar_cambio_producto, marcar_cambio_servicio
+from .estado_previo import antes_y_ahora, recordar, seguro
+
+logger = logging.getLogger(__name__)
+
+
+_seguro = seguro(logger, "No se pudo marcar la tabla de hechos tras cambiar %s")
+
+
+def _antes_y_ahora(instance, *campos):
+    return antes_y_ahora(instance, 'hechos', *campos)
+
+
+CAMPOS_VENTA = ('fecha_reserva', 'estado_pago', 'estado_reserva')
+
+
+@_seguro
+def _venta_guardada(sender, instance, created=False, **kwargs):
+    (fecha, *estados), (_, *estados_ahora) = _antes_y_ahora(instance, *CAMPOS_VENTA)
+    # Las filas por fecha de agendamiento llevan los estados de la venta.
+    cambian_estados = not created and estados != estados_ahora
+    marcar(dias_venta=[fecha], ventas=[instance.pk],
+           ventas_agenda=[instance.pk] if cambian_estados else ())
+
+
+@_seguro
+def _venta_borrada(sender, instance, **kwargs):
+    # Sus líneas se borran en cascada y marcan sus propios días.
+    marcar(dias_venta=[instance.fecha_reserva])
+
+
+@_seguro
+def _linea_servicio(sender, instance, **kwargs):
+    (venta, fecha), (venta_ahora, fecha_ahora) = _antes_y_ahora(
+        instance, 'venta_reserva_id', 'fecha_agendamiento')
+    marcar(dias_agenda=[fecha, fecha_ahora], ventas=[venta, venta_ahora])
+
+
+@_seguro
+def _linea_de_venta(sender, instance, **kwargs):
+    (venta,), (venta_ahora,) = _antes_y_ahora(instance, 'venta_reserva_id')
+    marcar(ventas=[venta, venta_ahora])
+
+
+@_seguro
+def _servicio_guardado(sender, instance, created=False, **kwargs):
+    (categoria, precio), ahora = _antes_y_ahora(instance, 'categoria_id', 'precio_base')
+    if not created:
+        marcar_cambio_servicio(instance.pk, categoria=categoria != ahora[0], precio=precio != ahora[1])
+
+
+@_seguro
+def _producto_guardado(sender, instance, created=False, **kwargs):
+    (precio,), (precio_ahora,) = _antes_y_ahora(instance, 'precio_base')
+    if not created and precio != precio_ahora:
+        marcar_cambio_producto(instance.pk)
+
+
+recordar(VentaReserva, *CAMPOS_VENTA)
+post_save.connect(_venta_guardada, sender=VentaReserva, weak=False,
+                  dispatch_uid='hechos_save_VentaReserva')
+post_delete.connect(_venta_borrada, sender=VentaReserva, weak=False,
+                    dispatch_uid='hechos_delete_VentaReserva')
+
+recordar(ReservaServicio, 'venta_reserva_id', 'fecha_agendamiento')
+for _modelo, _receptor in ((ReservaServicio, _linea_servicio),
+                           (ReservaProducto, _linea_de_venta),
+                           (Pago, _linea_de_venta)):
+    recordar(_modelo, 'venta_reserva_id')
+    for _evento, _senal in (('save', post_save), ('delete', post_delete)):
+        _senal.connect(_receptor, sender=_modelo, weak=False,
+                       dispatch_uid=f'hechos_{_evento}_{_modelo.__name__}')
+
+recordar(Servicio, 'categoria_id', 'precio_base')
+post_save.connect(_servicio_guardado, sender=Servicio, weak=False,
+                  dispatch_uid='hechos_save_Servicio')
+recordar(Producto, 'precio_base')
+post_save.connect(_producto_guardado, sender=Producto, weak=False,
+                  dispatch_uid='hechos_save_Producto')
@@ -15,6 +15,7 @@ from ..middleware import get_current_user  # Importa el middleware
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from ..calendar_utils import verificar_disponibilidad  # Import the verificar_disponibilidad function
+from ..services.totales_service import marcar_total_pendiente
 
 logger = logging.getLogger(__name__)
 
@@ -382,30 +383,26 @@ def get_or_create_system_user():
 
 # Signals for updating totals (Keep these active)
 
-# Using pre_delete for total updates might be more reliable than post_delete
+# Los totales ya no se recalculan en cada señal: se MARCA la venta y el recálculo
+# se agrupa (ver ventas/services/totales_service.py). Fuera de un bloque
+# `totales_diferidos()` el recálculo sigue siendo inmediato.
+def _venta_en_memoria(instance):
+    """La VentaReserva ya cargada en la línea (sin ir a la base), o None."""
+    campo = type(instance).venta_reserva
+    return instance.venta_reserva if campo.is_cached(instance) else None
+
+
 @receiver(post_delete, sender=ReservaProducto)
 def actualizar_total_despues_eliminar_producto(sender, instance, **kwargs):
     try:
-        # Guardar referencia a venta_reserva antes de que pueda perderse
-        venta_reserva = instance.venta_reserva
-        if venta_reserva:
-            # Calcular total DESPUÉS de que el producto fue eliminado
-            venta_reserva.calcular_total()
-    except ObjectDoesNotExist:
-        logger.warning(f"VentaReserva not found when updating total after ReservaProducto {instance.pk} deletion.")
+        marcar_total_pendiente(instance.venta_reserva_id, _venta_en_memoria(instance))
     except Exception as e:
             logger.error(f"Error updating total after ReservaProducto {instance.pk} deletion: {e}")
 
 @receiver(post_delete, sender=ReservaServicio) # Keep this signal for total updates
 def actualizar_total_despues_eliminar_servicio(sender, instance, **kwargs):
     try:
-        # Guardar referencia a venta_reserva antes de que pueda perderse
-        venta_reserva = instance.venta_reserva
-        if venta_reserva:
-            # Calcular total DESPUÉS de que el servicio fue eliminado
-            venta_reserva.calcular_total()
-    except ObjectDoesNotExist:
-        logger.warning(f"VentaReserva not found when updating total after ReservaServicio {instance.pk} deletion.")
+        marcar_total_pendiente(instance.venta_reserva_id, _venta_en_memoria(instance))
     except Exception as e:
             logger.error(f"Error updating total after ReservaServicio {instance.pk} deletion: {e}")
 
@@ -413,10 +410,8 @@ def actualizar_total_despues_eliminar_servicio(sender, instance, **kwargs):
 @receiver(post_save, sender=ReservaServicio) # Keep this signal for total updates
 def actualizar_total_al_guardar_servicio(sender, instance, created, raw, using, update_fields, **kwargs):
     try:
-        if instance.venta_reserva and not raw: # Avoid recalculating during fixture loading
-             instance.venta_reserva.calcular_total()
-    except ObjectDoesNotExist:
-        logger.warning(f"VentaReserva not found when updating total after ReservaServicio {instance.pk} save.")
+        if not raw: # Avoid recalculating during fixture loading
+            marcar_total_pendiente(instance.venta_reserva_id, _venta_en_memoria(instance))
     except Exception as e:
             logger.error(f"Error updating total after ReservaServicio {instance.pk} save: {e}")
 
@@ -488,10 +483,8 @@ def asegurar_bebida_ambientacion(sender, instance, created, raw, using, update_f
 @receiver(post_save, sender=ReservaProducto) # Keep this signal for total updates
 def actualizar_total_al_guardar_producto(sender, instance, created, raw, using, update_fields, **kwargs):
     try:
-        if instance.venta_reserva and not raw: # Avoid recalculating during fixture loading
-             instance.venta_reserva.calcular_total()
-    except ObjectDoesNotExist:
-        logger.warning(f"VentaReserva not found when updating total after ReservaProducto {instance.pk} save.")
+        if not raw: # Avoid recalculating during fixture loading
+            marcar_total_pendiente(instance.venta_reserva_id, _venta_en_memoria(instance))
     except Exception as e:
         logger.error(f"Error updating total after ReservaProducto {instance.pk} save: {e}")
 
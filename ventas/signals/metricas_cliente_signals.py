@@ -0,0 +1,95 @@
+"""Mantenimiento incremental de las métricas por cliente
+(`ventas/services/metricas_cliente_service.py`).
+
+Cada cambio que mueve el gasto o los servicios de un cliente —o sus datos de
+contacto— marca el cliente (o el teléfono, el de antes y el de después) y el
+servicio lo recalcula al confirmar la transacción. Nunca propaga una
+excepción: las métricas no pueden romper el guardado.
+"""
+
+import logging
+
+from django.db.models.signals import post_delete, post_save
+
+from ..models import Cliente, ReservaServicio, ServiceHistory, VentaReserva
+from ..services.metricas_cliente_service import marcar
+from .estado_previo import antes_y_ahora, recordar, seguro
+
+logger = logging.getLogger(__name__)
+
+
+_seguro = seguro(logger, "No se pudieron marcar las métricas tras cambiar %s")
+
+
+def _antes_y_ahora(instance, *campos):
+    return antes_y_ahora(instance, 'metricas', *campos)
+
+
+CAMPOS_CLIENTE = ('telefono', 'nombre', 'email', 'comuna_id')
+CAMPOS_VENTA = ('cliente_id', 'estado_pago', 'total')
+
+
+@_seguro
+def _cliente_guardado(sender, instance, created=False, **kwargs):
+    antes, ahora = _antes_y_ahora(instance, *CAMPOS_CLIENTE)
+    if created or antes != ahora:
+        marcar(telefonos=[antes[0], ahora[0]])
+
+
+@_seguro
+def _cliente_borrado(sender, instance, **kwargs):
+    # Si era el representante, la fila pasa al siguiente duplicado.
+    marcar(telefonos=[instance.telefono])
+
+
+@_seguro
+def _venta_guardada(sender, instance, created=False, **kwargs):
+    antes, ahora = _antes_y_ahora(instance, *CAMPOS_VENTA)
+    if created or antes != ahora:
+        marcar(clientes=[antes[0], ahora[0]])
+
+
+@_seguro
+def _venta_borrada(sender, instance, **kwargs):
+    marcar(clientes=[instance.cliente_id])
+
+
+@_seguro
+def _linea_guardada(sender, instance, created=False, **kwargs):
+    (venta,), (venta_ahora,) = _antes_y_ahora(instance, 'venta_reserva_id')
+    if created or venta != venta_ahora:
+        marcar(ventas=[venta, venta_ahora])
+
+
+@_seguro
+def _linea_borrada(sender, instance, **kwargs):
+    # Si se borra con su venta, la venta ya marcó al cliente.
+    marcar(ventas=[instance.venta_reserva_id])
+
+
+@_seguro
+def _historial(sender, instance, **kwargs):
+    marcar(clientes=[instance.cliente_id])
+
+
+recordar(Cliente, *CAMPOS_CLIENTE)
+post_save.connect(_cliente_guardado, sender=Cliente, weak=False,
+                  dispatch_uid='metricas_save_Cliente')
+post_delete.connect(_cliente_borrado, sender=Cliente, weak=False,
+                    dispatch_uid='metricas_delete_Cliente')
+
+recordar(VentaReserva, *CAMPOS_VENTA)
+post_save.connect(_venta_guardada, sender=VentaReserva, weak=False,
+                  dispatch_uid='metricas_save_VentaReserva')
+post_delete.connect(_venta_borrada, sender=VentaReserva, weak=False,
+                    dispatch_uid='metricas_delete_VentaReserva')
+
+recordar(ReservaServicio, 'venta_reserva_id')
+post_save.connect(_linea_guardada, sender=ReservaServicio, weak=False,
+                  dispatch_uid='metricas_save_ReservaServicio')
+post_delete.connect(_linea_borrada, sender=ReservaServicio, weak=False,
+                    dispatch_uid='metricas_delete_ReservaServicio')
+
+for _evento, _senal in (('save', post_save), ('delete', post_delete)):
+    _senal.connect(_historial, sender=ServiceHistory, weak=False,
+                   dispatch_uid=f'metricas_{_evento}_ServiceHistory')
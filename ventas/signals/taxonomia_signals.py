@@ -0,0 +1,75 @@
+"""Encola en `TaxonomiaPendiente` a los clientes cuyas reservas o servicios
+históricos cambian (ver ventas/services/taxonomia_pendiente_service.py).
+
+Los pagos no tienen receptor propio: mueven el estado_pago de la venta, que ya
+encola al cliente. Nunca propaga una excepción: la cola no puede romper el
+guardado.
+"""
+
+import logging
+
+from django.db.models.signals import post_delete, post_save
+
+from ..models import ReservaServicio, ServiceHistory, VentaReserva
+from ..services.taxonomia_pendiente_service import marcar
+from .estado_previo import antes_y_ahora, recordar, seguro
+
+logger = logging.getLogger(__name__)
+
+# Lo que leen las features de la venta (recalcular_taxonomia_clientes._build_features).
+# Un guardado con update_fields que no toca ninguno no encola.
+CAMPOS_VENTA = {'cliente', 'cliente_id', 'estado_pago', 'fecha_creacion'}
+
+
+_seguro = seguro(logger, "No se pudo encolar la taxonomía tras cambiar %s")
+
+
+def _antes_y_ahora(instance, campo):
+    (antes,), (ahora,) = antes_y_ahora(instance, 'taxonomia', campo)
+    return antes, ahora
+
+
+@_seguro
+def _venta_guardada(sender, instance, update_fields=None, **kwargs):
+    antes, ahora = _antes_y_ahora(instance, 'cliente_id')
+    if update_fields is None or CAMPOS_VENTA & set(update_fields):
+        marcar(clientes=[antes, ahora])
+
+
+@_seguro
+def _venta_borrada(sender, instance, **kwargs):
+    marcar(clientes=[instance.cliente_id])
+
+
+@_seguro
+def _linea_guardada(sender, instance, **kwargs):
+    antes, ahora = _antes_y_ahora(instance, 'venta_reserva_id')
+    marcar(ventas=[antes, ahora])
+
+
+@_seguro
+def _linea_borrada(sender, instance, **kwargs):
+    # Si se borra con su venta, la venta ya encoló al cliente.
+    marcar(ventas=[instance.venta_reserva_id])
+
+
+@_seguro
+def _historial(sender, instance, **kwargs):
+    marcar(clientes=[instance.cliente_id])
+
+
+recordar(VentaReserva, 'cliente_id')
+post_save.connect(_venta_guardada, sender=VentaReserva, weak=False,
+                  dispatch_uid='taxonomia_save_VentaReserva')
+post_delete.connect(_venta_borrada, sender=VentaReserva, weak=False,
+                    dispatch_uid='taxonomia_delete_VentaReserva')
+
+recordar(ReservaServicio, 'venta_reserva_id')
+post_save.connect(_linea_guardada, sender=ReservaServicio, weak=False,
+                  dispatch_uid='taxonomia_save_ReservaServicio')
+post_delete.connect(_linea_borrada, sender=ReservaServicio, weak=False,
+                    dispatch_uid='taxonomia_delete_ReservaServicio')
+
+for _evento, _senal in (('save', post_save), ('delete', post_delete)):
+    _senal.connect(_historial, sender=ServiceHistory, weak=False,
+                   dispatch_uid=f'taxonomia_{_evento}_ServiceHistory')
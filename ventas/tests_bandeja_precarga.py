@@ -0,0 +1,185 @@
+"""
+Tests de la bandeja diaria como pipeline por lotes (precargar_bandeja).
+
+Lo que estos tests clavan:
+    - La precarga devuelve lo mismo que las funciones cliente por cliente:
+      salvas enviadas, Refugio reciente, último servicio PRINCIPAL (sin
+      complementos) y patrón día/hora.
+    - elegir_script en memoria elige el mismo script que buscar_script_cascada.
+    - Las consultas del cron no crecen con la cantidad de candidatos.
+
+Ejecutar:
+    python manage.py test ventas.tests_bandeja_precarga
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ventas.models import (
+    Cliente,
+    ClienteTaxonomia,
+    ContactoWhatsApp,
+    ReservaServicio,
+    ScriptWhatsApp,
+    Servicio,
+    VentaReserva,
+)
+from ventas.services.bandeja_whatsapp_service import (
+    buscar_script_cascada,
+    calcular_sugerencia_dia_hora,
+    califica_refugio,
+    elegir_script,
+    obtener_ultimo_servicio_nombre,
+    precargar_bandeja,
+)
+from whatsapp_agent.models import WhatsAppAgentConfig
+
+
+HOY = date.today()
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+def _servicio(nombre, tipo='tina'):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio=tipo, precio_base=25000, duracion=120,
+        capacidad_minima=1, capacidad_maxima=4, slots_disponibles=SLOTS,
+    )
+
+
+def _cliente(telefono, region='sur', eje_valor='En Riesgo', dias_sin_venir=130):
+    cli = Cliente.objects.create(
+        nombre=f'Cliente {telefono[-4:]}', telefono=telefono, region_geografica=region,
+    )
+    ClienteTaxonomia.objects.create(
+        cliente=cli, eje_valor=eje_valor, eje_estilo='Amante de las Tinas',
+        eje_contexto='Visitante Pareja', dias_desde_ultima_visita=dias_sin_venir,
+        gasto_total=100000, ultima_visita=HOY - timedelta(days=dias_sin_venir),
+    )
+    return cli
+
+
+def _reservar(cliente, servicio, fecha, hora='16:00'):
+    venta = VentaReserva.objects.create(cliente=cliente, total=0)
+    return ReservaServicio.objects.create(
+        venta_reserva=venta, servicio=servicio, fecha_agendamiento=fecha,
+        hora_inicio=hora, cantidad_personas=2,
+    )
+
+
+def _script(script_id, estado='En Riesgo', region='sur', estilo='', contexto=''):
+    return ScriptWhatsApp.objects.create(
+        script_id=script_id, nombre=script_id, estado_valor_target=estado,
+        cohorte_estilo=estilo, cohorte_contexto=contexto, salva=1,
+        region_geografica_target=region,
+        plantilla_texto='Hola {nombre}, tu {ultimo_servicio} te espera {sugerencia_franja}.',
+        activo=True,
+    )
+
+
+class PrecargaEquivaleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tina = _servicio('Tina Calbuco')
+        self.masaje = _servicio('Masaje Descontracturante', tipo='masaje')
+        self.tina_nino = _servicio('Tina Niño')
+        WhatsAppAgentConfig.get_solo().servicios_complementarios.add(self.tina_nino)
+
+        self.ana = _cliente('+56911300001', region='nacional')
+        _reservar(self.ana, self.tina, HOY - timedelta(days=200))
+        _reservar(self.ana, self.masaje, HOY - timedelta(days=150))
+        _reservar(self.ana, self.tina_nino, HOY - timedelta(days=130))
+        refugio = _script('B.refugio-N', region='nacional')
+        ContactoWhatsApp.objects.create(
+            cliente=self.ana, script=refugio, salva=1, prioridad=5,
+            fecha_sugerido=HOY - timedelta(days=20), estado='enviado',
+            fecha_envio=timezone.now() - timedelta(days=20),
+        )
+
+        self.beto = _cliente('+56911300002', region='nacional')
+        _reservar(self.beto, self.tina, HOY - timedelta(days=130))
+
+        self.sin_nada = _cliente('+56911300003')
+
+    def test_mismos_datos_que_cliente_por_cliente(self):
+        clientes = (self.ana, self.beto, self.sin_nada)
+        precarga = precargar_bandeja([c.id for c in clientes], HOY)
+
+        for c in clientes:
+            self.assertEqual(precarga.ultimo_servicio.get(c.id, ''),
+                             obtener_ultimo_servicio_nombre(c.id))
+            self.assertEqual(precarga.sugerencia_dia_hora(c.id),
+                             calcular_sugerencia_dia_hora(c.id))
+            self.assertEqual(califica_refugio(c, 'En Riesgo', 1, hoy=HOY, precarga=precarga),
+                             califica_refugio(c, 'En Riesgo', 1, hoy=HOY))
+        self.assertEqual(precarga.ultimo_servicio[self.ana.id], 'Masaje Descontracturante')
+        self.assertEqual(precarga.salvas_enviadas, {self.ana.id: 1})
+        self.assertEqual(precarga.refugio_reciente, {self.ana.id})
+
+    def test_sin_candidatos_no_consulta(self):
+        with self.assertNumQueries(0):
+            precargar_bandeja([], HOY)
+
+    def test_cascada_en_memoria_igual_a_la_de_db(self):
+        _script('A.2', 'Dormido', estilo='Amante de las Tinas')
+        _script('A.1', 'Dormido', estilo='Amante de las Tinas')
+        _script('A.3', 'Dormido', region='')
+        _script('A.4', 'Dormido', region='nacional', contexto='Visitante Pareja')
+        qs = ScriptWhatsApp.objects.filter(activo=True)
+        scripts = list(qs)
+
+        for region in ('', 'sur', 'nacional', 'sin_clasificar'):
+            for estilo in ('Amante de las Tinas', 'Explorador'):
+                args = ('Dormido', estilo, 'Visitante Pareja', 1, region)
+                self.assertEqual(elegir_script(scripts, *args),
+                                 buscar_script_cascada(qs, *args), (region, estilo))
+
+
+@override_settings(OVC_TARGET_DIARIO=50, OVC_USAR_VARIACIONES_IA=False)
+class BandejaConsultasPlanasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        WhatsAppAgentConfig.get_solo()
+        self.tina = _servicio('Tina Calbuco')
+        _script('A.test-ER-sur')
+        self.n = 0
+
+    def _agregar_clientes(self, cuantos):
+        for _ in range(cuantos):
+            self.n += 1
+            cli = _cliente(f'+569114{self.n:05d}')
+            # Una fecha distinta por reserva: la tina tiene un solo slot.
+            _reservar(cli, self.tina, HOY - timedelta(days=130 + 2 * self.n))
+            _reservar(cli, self.tina, HOY - timedelta(days=131 + 2 * self.n))
+
+    def _consultas_del_cron(self):
+        ContactoWhatsApp.objects.all().delete()
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('generar_bandeja_whatsapp_diaria', '--no-campaign', stdout=StringIO())
+        return len(ctx.captured_queries)
+
+    def test_consultas_no_crecen_con_los_candidatos(self):
+        self._agregar_clientes(2)
+        con_dos = self._consultas_del_cron()
+        self.assertEqual(ContactoWhatsApp.objects.count(), 2)
+
+        self._agregar_clientes(10)
+        con_doce = self._consultas_del_cron()
+        self.assertEqual(ContactoWhatsApp.objects.count(), 12)
+
+        self.assertEqual(con_doce, con_dos)
+        c = ContactoWhatsApp.objects.order_by('id').first()
+        self.assertIn('Tina Calbuco', c.mensaje_renderizado)
+        self.assertIn('a las 16:00', c.mensaje_renderizado)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Caché compartida por dominios (`ventas/services/cache_service.py`).
+
+Sin REDIS_URL la caché `default` es LocMemCache: estos tests corren contra esa
+y verifican lo mismo que en producción con Redis.
+
+· Invalidar un dominio descarta todas sus claves y no toca los demás.
+· Guardar servicios, reservas y bloqueos invalida los dominios que los muestran.
+· La grilla de disponibilidad por rango sale de la caché hasta que algo cambia.
+
+Ejecutar:
+    python manage.py test ventas.tests_cache_namespaces
+"""
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ventas.models import Cliente, ReservaServicio, Servicio, ServicioSlotBloqueo, VentaReserva
+from ventas.services.cache_service import cache_ns, invalidar
+from whatsapp_agent.models import WhatsAppAgentConfig
+
+FECHA = date(2030, 11, 9)
+
+
+class CacheNamespaceTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidar_descarta_solo_su_dominio(self):
+        cache_ns('catalogo').set('menu', ['tinas'])
+        cache_ns('disponibilidad').set('menu', ['otro'])
+
+        invalidar('catalogo')
+
+        self.assertIsNone(cache_ns('catalogo').get('menu'))
+        self.assertEqual(cache_ns('disponibilidad').get('menu'), ['otro'])
+
+    def test_version_perdida_no_revive_claves_viejas(self):
+        ns = cache_ns('catalogo')
+        ns.set('menu', ['viejo'])
+        cache.delete('ns:catalogo:version')  # eviction / reinicio de Redis
+
+        ns.invalidar()
+
+        self.assertIsNone(ns.get('menu'))
+
+    def test_get_or_set_calcula_una_vez(self):
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            return {'x': 1}
+
+        ns = cache_ns('homepage')
+        self.assertEqual(ns.get_or_set('bloque', calcular), {'x': 1})
+        self.assertEqual(ns.get_or_set('bloque', calcular), {'x': 1})
+        self.assertEqual(len(llamadas), 1)
+
+    def test_dominio_desconocido(self):
+        with self.assertRaises(ValueError):
+            cache_ns('inventado')
+
+
+class InvalidacionPorSenalesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tina = Servicio.objects.create(
+            nombre='Tina Hornopirén', tipo_servicio='tina', precio_base=25000, duracion=120,
+            capacidad_minima=1, capacidad_maxima=4,
+            slots_disponibles={FECHA.strftime('%A').lower(): ['14:00', '18:00']})
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+
+    def test_servicio_invalida_catalogo_y_portada(self):
+        cache_ns('catalogo').set('menu', 1)
+        cache_ns('homepage').set('servicios', 1)
+
+        self.tina.precio_base = 30000
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tina.save()
+
+        self.assertIsNone(cache_ns('catalogo').get('menu'))
+        self.assertIsNone(cache_ns('homepage').get('servicios'))
+
+    def test_config_luna_se_invalida_al_marcar_complementos(self):
+        config = WhatsAppAgentConfig.get_solo()
+        self.assertEqual(WhatsAppAgentConfig.ids_complementarios_cacheados(), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            config.servicios_complementarios.add(self.tina)
+
+        self.assertEqual(WhatsAppAgentConfig.ids_complementarios_cacheados(), {self.tina.id})
+
+    def _grilla(self):
+        return self.client.get(reverse('ventas:disponibilidad_rango'), {
+            'servicios': str(self.tina.id),
+            'desde': FECHA.isoformat(), 'hasta': FECHA.isoformat()})
+
+    def test_grilla_cacheada_hasta_que_cambia_la_ocupacion(self):
+        primera = self._grilla()
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self._grilla()
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        self.assertFalse([q for q in ctx.captured_queries if 'ventas_reservaservicio' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ReservaServicio.objects.create(
+                venta_reserva=self.venta, servicio=self.tina, fecha_agendamiento=FECHA,
+                hora_inicio='14:00', cantidad_personas=2)
+        tras_reserva = self._grilla()
+        self.assertNotEqual(tras_reserva['ETag'], primera['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ServicioSlotBloqueo.objects.create(
+                servicio=self.tina, fecha=FECHA, hora_slot='18:00', motivo='Limpieza')
+        tras_bloqueo = self._grilla()
+        self.assertNotEqual(tras_bloqueo['ETag'], tras_reserva['ETag'])
+        slots = tras_bloqueo.json()['servicios'][0]['dias'][FECHA.isoformat()]['slots']
+        self.assertEqual(slots, {'14:00': 0, '18:00': 0})
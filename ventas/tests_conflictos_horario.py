@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Conflictos por INTERVALO (`buscar_conflictos`) y `VentaReserva.agregar_servicio`.
+
+Antes `agregar_servicio` restaba una duración (int) a una fecha, ignoraba la hora
+y recorría el historial completo del servicio. Lo que estos tests clavan:
+
+· Una cabaña de 3 h choca con la reserva que empieza 1 h después; pegadas no.
+· `max_servicios_simultaneos` se respeta en el PICO del bloque, no por slot.
+· La masajista no puede estar en dos servicios que se cruzan.
+· La reserva de una venta cancelada (por estado_pago o estado_reserva) no ocupa
+  el slot (tampoco para Luna).
+· Una consulta, sin importar cuántas reservas haya otros días.
+
+Ejecutar:
+    python manage.py test ventas.tests_conflictos_horario
+"""
+from datetime import date, datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ventas.models import Cliente, Proveedor, ReservaServicio, Servicio, VentaReserva
+from ventas.services.disponibilidad_service import buscar_conflictos
+from ventas.services.reservation_service import validar_disponibilidad_carrito
+
+FECHA = date(2030, 11, 9)
+DIA = FECHA.strftime('%A').lower()
+
+
+def _servicio(nombre, duracion, simultaneos=1, tipo='cabana'):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio=tipo, precio_base=50000, duracion=duracion,
+        capacidad_minima=1, capacidad_maxima=4, max_servicios_simultaneos=simultaneos,
+        slots_disponibles={DIA: ['10:00', '11:00', '13:00', '14:00']})
+
+
+class ConflictosHorarioTest(TestCase):
+
+    def setUp(self):
+        self.cabana = _servicio('Cabaña Torre', duracion=180)
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+
+    def _reservar(self, servicio, hora, fecha=FECHA, proveedor=None):
+        return ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=servicio, fecha_agendamiento=fecha,
+            hora_inicio=hora, cantidad_personas=1, proveedor_asignado=proveedor)
+
+    def test_bloque_largo_choca_aunque_no_sea_el_mismo_slot(self):
+        self._reservar(self.cabana, '10:00')   # 10:00–13:00
+
+        conflictos = buscar_conflictos(self.cabana, FECHA, '11:00')
+        self.assertEqual([c.motivo for c in conflictos], ['capacidad'])
+        self.assertEqual(buscar_conflictos(self.cabana, FECHA, '13:00'), [])
+
+    def test_max_simultaneos_en_el_pico(self):
+        tina = _servicio('Tina Calbuco', duracion=120, simultaneos=2, tipo='tina')
+        self._reservar(tina, '10:00')   # 10–12
+        self._reservar(tina, '13:00')   # 13–15: no se pisa con la de las 10
+        # 11:00–13:00 se cruza con ambas, pero nunca con las dos a la vez.
+        self.assertEqual(buscar_conflictos(tina, FECHA, '11:00'), [])
+
+        self._reservar(tina, '11:00')   # ahora 11–12 tiene dos
+        self.assertEqual([c.motivo for c in buscar_conflictos(tina, FECHA, '10:00')], ['capacidad'])
+
+    def test_masajista_ocupada_en_otro_servicio(self):
+        carolina = Proveedor.objects.create(nombre='Carolina Vidal')
+        descontracturante = _servicio('Masaje Descontracturante', 60, simultaneos=3, tipo='masaje')
+        piedras = _servicio('Masaje Piedras Calientes', 90, simultaneos=3, tipo='masaje')
+        self._reservar(descontracturante, '10:00', proveedor=carolina)
+
+        conflictos = buscar_conflictos(piedras, FECHA, '10:00', proveedor=carolina)
+        self.assertEqual([c.motivo for c in conflictos], ['proveedor'])
+        self.assertEqual(buscar_conflictos(piedras, FECHA, '11:00', proveedor=carolina), [])
+        self.assertEqual(buscar_conflictos(piedras, FECHA, '10:00'), [])
+
+    def test_excluir_la_reserva_que_se_edita(self):
+        propia = self._reservar(self.cabana, '10:00')
+        self.assertEqual(buscar_conflictos(self.cabana, FECHA, '11:00', excluir=propia), [])
+
+    def test_venta_cancelada_libera_el_slot(self):
+        self._reservar(self.cabana, '10:00')
+        self.assertTrue(buscar_conflictos(self.cabana, FECHA, '11:00', contar_retenciones=True))
+
+        VentaReserva.objects.filter(pk=self.venta.pk).update(estado_pago='cancelado')
+        self.assertEqual(buscar_conflictos(self.cabana, FECHA, '11:00', contar_retenciones=True), [])
+
+    def test_cancelada_por_estado_reserva_tambien_libera(self):
+        self._reservar(self.cabana, '10:00')
+        VentaReserva.objects.filter(pk=self.venta.pk).update(estado_reserva='cancelada')
+        self.assertEqual(buscar_conflictos(self.cabana, FECHA, '11:00'), [])
+
+    def test_una_consulta_sin_importar_el_historial(self):
+        for semanas in range(1, 30):
+            self._reservar(self.cabana, '10:00', fecha=FECHA - timedelta(weeks=semanas))
+        with CaptureQueriesContext(connection) as ctx:
+            buscar_conflictos(self.cabana, FECHA, '10:00')
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_agregar_servicio_con_datetime(self):
+        self.venta.agregar_servicio(self.cabana, datetime(2030, 11, 9, 10, 0))
+        rs = self.venta.reservaservicios.get()
+        self.assertEqual((rs.fecha_agendamiento, rs.hora_inicio, rs.minuto_inicio), (FECHA, '10:00', 600))
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, 50000)
+
+        with self.assertRaises(ValidationError):
+            self.venta.agregar_servicio(self.cabana, FECHA, hora_inicio='11:00')
+        self.assertEqual(self.venta.reservaservicios.count(), 1)
+
+    def test_carrito_respeta_max_simultaneos(self):
+        tina = _servicio('Tina Osorno', duracion=120, simultaneos=2, tipo='tina')
+        self._reservar(tina, '10:00')
+        carrito = {'servicios': [{'id': tina.id, 'fecha': FECHA.isoformat(), 'hora': '10:00'}]}
+        self.assertEqual(validar_disponibilidad_carrito(carrito), [])
+
+        self._reservar(tina, '10:00')
+        self.assertEqual(len(validar_disponibilidad_carrito(carrito)), 1)
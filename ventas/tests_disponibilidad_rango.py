@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Grilla de disponibilidad por rango (¿qué días del próximo mes está libre X?).
+
+Antes el checkout y Luna llamaban a get_available_hours una vez POR FECHA. Lo que
+estos tests clavan:
+
+· Misma regla por slot que get_available_hours (max_servicios_simultaneos, slot
+  bloqueado = 0, día bloqueado = todo 0, martes sin grilla = sin slots).
+· La regla es la del checkout: cuenta lo que se CRUZA con [hora, hora + duración)
+  —no solo lo que empieza a esa hora— y las retenciones de pagos en curso; una
+  venta cancelada (por estado_pago o estado_reserva) no ocupa.
+· Las consultas NO crecen con el largo del rango ni con la cantidad de servicios.
+· Repintar sin cambios es un 304; un cambio real cambia el ETag.
+
+Ejecutar:
+    python manage.py test ventas.tests_disponibilidad_rango
+"""
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ventas.models import (Cliente, PendingReservation, ReservaServicio, RetencionSlot, Servicio,
+                           ServicioBloqueo, ServicioSlotBloqueo, VentaReserva)
+from ventas.services.disponibilidad_service import cargar_ocupacion_rango
+from whatsapp_agent.tests.test_giftcards_luna import _SinSenalesDeVenta
+
+LUNES = date(2030, 11, 4)
+TODOS_MENOS_MARTES = {d: ['14:00', '18:00'] for d in (
+    'monday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')}
+
+
+def _servicio(nombre, simultaneos=1):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio='tina', precio_base=25000, duracion=120,
+        capacidad_minima=1, capacidad_maxima=4, max_servicios_simultaneos=simultaneos,
+        slots_disponibles=TODOS_MENOS_MARTES)
+
+
+class GrillaRangoTest(_SinSenalesDeVenta, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tina = _servicio('Tina Calbuco')
+        self.masaje = _servicio('Masaje Doble', simultaneos=2)
+        self.cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=self.cliente, total=0)
+
+    def _reservar(self, servicio, fecha, hora, venta=None):
+        ReservaServicio.objects.create(
+            venta_reserva=venta or self.venta, servicio=servicio, fecha_agendamiento=fecha,
+            hora_inicio=hora, cantidad_personas=2)
+
+    def _get(self, desde, hasta, servicios=None, **headers):
+        ids = servicios or [self.tina.id, self.masaje.id]
+        return self.client.get(reverse('ventas:disponibilidad_rango'), {
+            'servicios': ','.join(str(i) for i in ids),
+            'desde': desde.isoformat(), 'hasta': hasta.isoformat()}, **headers)
+
+    def test_regla_de_cupos_por_slot(self):
+        self._reservar(self.tina, LUNES, '14:00')
+        self._reservar(self.masaje, LUNES, '14:00')
+        ServicioSlotBloqueo.objects.create(
+            servicio=self.tina, fecha=LUNES, hora_slot='18:00', motivo='Limpieza')
+        jueves = LUNES + timedelta(days=3)
+        # `fecha`/`hora_slot`: campos del modelo fusionado (P-28), NOT NULL.
+        ServicioBloqueo.objects.create(
+            servicio=self.masaje, fecha_inicio=jueves, fecha_fin=jueves,
+            motivo='Mantención', fecha=jueves, hora_slot='N/A')
+
+        r = self._get(LUNES, LUNES + timedelta(days=3))
+        self.assertEqual(r.status_code, 200)
+        por_id = {s['id']: s['dias'] for s in r.json()['servicios']}
+
+        tina, masaje = por_id[self.tina.id], por_id[self.masaje.id]
+        self.assertEqual(tina['2030-11-04']['slots'], {'14:00': 0, '18:00': 0})
+        self.assertEqual(masaje['2030-11-04']['slots'], {'14:00': 1, '18:00': 2})
+        self.assertEqual(tina['2030-11-05']['slots'], {}, 'martes cerrado: sin grilla')
+        self.assertTrue(masaje['2030-11-07']['bloqueado'])
+        self.assertEqual(masaje['2030-11-07']['slots'], {'14:00': 0, '18:00': 0})
+        self.assertFalse(tina['2030-11-07']['bloqueado'])
+
+    def test_cruces_retenciones_y_canceladas(self):
+        # 17:00 a 19:00 (cargada a mano, fuera de grilla): pisa el slot de las 18:00.
+        self._reservar(self.tina, LUNES, '17:00')
+        pending = PendingReservation.objects.create(
+            cliente=self.cliente, cart_data={}, monto=50000,
+            expires_at=timezone.now() + timedelta(minutes=20))
+        RetencionSlot.objects.create(
+            servicio=self.masaje, fecha=LUNES, minuto_inicio=14 * 60, minuto_fin=16 * 60,
+            pending_reservation=pending, expires_at=pending.expires_at)
+        for estado in ({'estado_pago': 'cancelado'}, {'estado_reserva': 'cancelada'}):
+            venta = VentaReserva.objects.create(cliente=self.cliente, total=0)
+            self._reservar(self.masaje, LUNES, '18:00', venta=venta)
+            VentaReserva.objects.filter(pk=venta.pk).update(**estado)
+
+        dias = {s['id']: s['dias']['2030-11-04']['slots']
+                for s in self._get(LUNES, LUNES).json()['servicios']}
+        self.assertEqual(dias[self.tina.id], {'14:00': 1, '18:00': 0})
+        self.assertEqual(dias[self.masaje.id], {'14:00': 1, '18:00': 2})
+
+        horas = self.client.get(reverse('ventas:get_available_hours'), {
+            'servicio_id': self.tina.id, 'fecha': LUNES.isoformat()}).json()
+        self.assertEqual(horas['horas_disponibles'], ['14:00'])
+
+    def test_las_consultas_no_crecen_con_el_rango(self):
+        for i in range(8):
+            self._reservar(self.tina, LUNES + timedelta(days=i), '14:00')
+
+        with CaptureQueriesContext(connection) as semana:
+            cargar_ocupacion_rango([self.tina.id], LUNES, LUNES + timedelta(days=6))
+        with CaptureQueriesContext(connection) as dos_meses:
+            cargar_ocupacion_rango([self.tina.id, self.masaje.id],
+                                   LUNES, LUNES + timedelta(days=61))
+
+        self.assertEqual(len(semana.captured_queries), 3)
+        self.assertEqual(len(dos_meses.captured_queries), 3)
+
+    def test_etag_304_sin_cambios_y_200_con_cambios(self):
+        primera = self._get(LUNES, LUNES + timedelta(days=6))
+        etag = primera['ETag']
+        self.assertTrue(etag)
+
+        repintado = self._get(LUNES, LUNES + timedelta(days=6), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repintado.status_code, 304)
+        self.assertEqual(repintado.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reservar(self.tina, LUNES, '18:00')
+        cambiado = self._get(LUNES, LUNES + timedelta(days=6), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cambiado.status_code, 200)
+        self.assertNotEqual(cambiado['ETag'], etag)
+
+    def test_rango_invalido_o_demasiado_largo(self):
+        self.assertEqual(self._get(LUNES, LUNES - timedelta(days=1)).status_code, 400)
+        self.assertEqual(self._get(LUNES, LUNES + timedelta(days=90)).status_code, 400)
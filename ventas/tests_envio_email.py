@@ -0,0 +1,258 @@
+"""
+Tests del motor de envío masivo de email (ventas/services/envio_email_service.py)
+y de los tres comandos que lo usan.
+
+Lo que estos tests clavan:
+    - El limitador (token bucket) deja pasar la ráfaga y después espacia los
+      envíos al ritmo pedido, sin dormir lote a lote.
+    - Una conexión del backend por lote, no una por destinatario.
+    - Bajas y lista negra se cargan una vez y excluyen al enviar.
+    - Resultado y logs se escriben en bloque; emails_sent queda al día.
+    - Lo reclamado por una corrida que se cayó ("sending") no se reenvía; al
+      vencer el reclamo pasa a fallido y la campaña puede cerrar.
+    - Con el SMTP caído lo que no se intentó vuelve a pendiente (no queda
+      fallido ni colgado en "sending") y la corrida se corta.
+
+Ejecutar:
+    python manage.py test ventas.tests_envio_email
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ventas.models import (
+    Cliente,
+    CommunicationLog,
+    EmailBlacklist,
+    EmailCampaign,
+    EmailDeliveryLog,
+    EmailRecipient,
+    MailParaEnviar,
+    NewsletterSubscriber,
+)
+from ventas.services.envio_email_service import LimitadorTasa
+
+
+class BackendContador(EmailBackend):
+    """locmem que cuenta cuántas conexiones se abren."""
+    aperturas = 0
+
+    def open(self):
+        BackendContador.aperturas += 1
+        return True
+
+
+class BackendCaido(EmailBackend):
+    """SMTP caído: la conexión no abre."""
+
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class RelojFalso:
+
+    def __init__(self):
+        self.ahora = 0.0
+        self.esperas = []
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.esperas.append(round(segundos, 3))
+        self.ahora += segundos
+
+
+class LimitadorTasaTests(SimpleTestCase):
+
+    def test_rafaga_y_luego_ritmo(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(por_minuto=6, rafaga=3, reloj=reloj, dormir=reloj.dormir)
+        for _ in range(5):
+            limitador.tomar()
+        # 3 de ráfaga sin esperar; después una ficha cada 10 s.
+        self.assertEqual(reloj.esperas, [10.0, 10.0])
+
+    def test_el_tiempo_transcurrido_recarga(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(por_minuto=6, rafaga=1, reloj=reloj, dormir=reloj.dormir)
+        limitador.tomar()
+        reloj.ahora += 30
+        limitador.tomar()
+        self.assertEqual(reloj.esperas, [])
+
+    def test_sin_limite_no_espera(self):
+        reloj = RelojFalso()
+        limitador = LimitadorTasa(por_minuto=None, reloj=reloj, dormir=reloj.dormir)
+        for _ in range(50):
+            limitador.tomar()
+        self.assertEqual(reloj.esperas, [])
+
+
+@override_settings(EMAIL_BACKEND='ventas.tests_envio_email.BackendContador')
+class EnviarCampanaEmailTests(TestCase):
+
+    def setUp(self):
+        BackendContador.aperturas = 0
+        self.campana = EmailCampaign.objects.create(
+            name='Invierno', status='ready', email_subject_template='Hola',
+            email_body_template='Hola {nombre_cliente}', ai_variation_enabled=False,
+            schedule_config={'batch_size': 10, 'interval_minutes': 1},
+        )
+        self.n = 0
+        for i in range(4):
+            self._destinatario(f'cliente{i}@example.com')
+
+    def _destinatario(self, email, status='pending', claimed_at=None):
+        self.n += 1
+        cliente = Cliente.objects.create(nombre=email.split('@')[0], email=email,
+                                         telefono=f'+5691150{self.n:04d}')
+        return EmailRecipient.objects.create(
+            campaign=self.campana, client=cliente, email=email, name=cliente.nombre,
+            personalized_subject='Hola {nombre_cliente}',
+            personalized_body='<p>Hola {nombre_cliente}</p>', status=status,
+            claimed_at=claimed_at,
+        )
+
+    def _enviar(self):
+        call_command('enviar_campana_email', campaign_id=self.campana.id,
+                     ignore_schedule=True, stdout=StringIO())
+
+    def test_lote_por_una_conexion_con_supresion_y_logs(self):
+        EmailBlacklist.objects.create(email='cliente1@example.com', reason='hard_bounce',
+                                      domain='example.com')
+        NewsletterSubscriber.objects.create(email='CLIENTE2@example.com', is_active=False)
+
+        self._enviar()
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['cliente0@example.com', 'cliente3@example.com'])
+        self.assertEqual(BackendContador.aperturas, 1)
+        estados = dict(EmailRecipient.objects.values_list('email', 'status'))
+        self.assertEqual(estados, {
+            'cliente0@example.com': 'sent', 'cliente1@example.com': 'excluded',
+            'cliente2@example.com': 'excluded', 'cliente3@example.com': 'sent',
+        })
+        self.assertEqual(EmailDeliveryLog.objects.filter(log_type='send_attempt').count(), 2)
+        self.campana.refresh_from_db()
+        self.assertEqual(self.campana.emails_sent, 2)
+        self.assertEqual(self.campana.status, 'paused')   # hubo excluidos
+        self.assertIn('Hola cliente0', mail.outbox[0].body)
+
+    def test_lo_reclamado_por_una_corrida_caida_no_se_reenvia(self):
+        colgado = self._destinatario('colgado@example.com', status='sending', claimed_at=timezone.now())
+
+        self._enviar()
+
+        self.assertNotIn('colgado@example.com', [m.to[0] for m in mail.outbox])
+        self.assertEqual(len(mail.outbox), 4)
+        colgado.refresh_from_db()
+        self.assertEqual(colgado.status, 'sending')
+        self.campana.refresh_from_db()
+        self.assertEqual(self.campana.status, 'sending')  # no se cierra con uno sin confirmar
+
+        # Segunda corrida: nada pendiente, nada se repite.
+        self._enviar()
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_reclamo_vencido_pasa_a_fallido_y_la_campana_cierra(self):
+        colgado = self._destinatario('colgado@example.com', status='sending', claimed_at=timezone.now())
+        self._enviar()
+        self.campana.refresh_from_db()
+        self.assertEqual(self.campana.status, 'sending')
+
+        EmailRecipient.objects.filter(pk=colgado.pk).update(claimed_at=timezone.now() - timedelta(hours=3))
+        self._enviar()
+
+        colgado.refresh_from_db()
+        self.assertEqual(colgado.status, 'failed')
+        self.assertIn('Sin confirmar', colgado.error_message)
+        self.assertEqual(len(mail.outbox), 4)   # no se reenvía
+        self.campana.refresh_from_db()
+        self.assertEqual(self.campana.status, 'paused')
+
+    def test_single_batch_envia_un_lote(self):
+        self.campana.schedule_config = {'batch_size': 3, 'interval_minutes': 6}
+        self.campana.save()
+        call_command('enviar_campana_email', campaign_id=self.campana.id, ignore_schedule=True,
+                     single_batch=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailRecipient.objects.filter(status='pending').count(), 1)
+
+    def test_smtp_caido_escribe_el_lote_y_corta(self):
+        self.campana.schedule_config = {'batch_size': 2, 'interval_minutes': 1}
+        self.campana.save()
+
+        with override_settings(EMAIL_BACKEND='ventas.tests_envio_email.BackendCaido'):
+            self._enviar()
+
+        self.assertEqual(mail.outbox, [])
+        # Nada se intentó: todo vuelve a pendiente, nada en 'sending' ni 'failed'.
+        self.assertEqual(set(EmailRecipient.objects.values_list('status', flat=True)), {'pending'})
+        self.assertFalse(EmailDeliveryLog.objects.exists())
+        self.assertEqual(EmailRecipient.objects.filter(error_message__contains='Connection refused').count(), 2)
+        self.campana.refresh_from_db()
+        self.assertNotIn(self.campana.status, ('paused', 'completed'))
+
+
+@override_settings(EMAIL_BACKEND='ventas.tests_envio_email.BackendContador')
+class GoteoYProgramadosTests(TestCase):
+
+    def setUp(self):
+        BackendContador.aperturas = 0
+        EmailBlacklist.objects.create(email='bloqueado@example.com', reason='manual_block',
+                                      domain='example.com')
+
+    def test_drip_reclama_y_excluye(self):
+        cliente = Cliente.objects.create(nombre='Ana', email='ana@example.com',
+                                         telefono='+56911510001')
+        for destino in ('ana@example.com', 'bloqueado@example.com', 'otra@example.com'):
+            CommunicationLog.objects.create(
+                cliente=cliente, communication_type='EMAIL', message_type='PROMOTIONAL',
+                subject='Hola', content='<p>Hola [Nombre]</p>', destination=destino)
+        CommunicationLog.objects.filter(destination='otra@example.com').update(status='SENDING')
+
+        call_command('send_next_campaign_drip', '--use-stored-content', stdout=StringIO())
+
+        self.assertEqual([m.to for m in mail.outbox], [['ana@example.com']])
+        self.assertEqual(BackendContador.aperturas, 1)
+        estados = dict(CommunicationLog.objects.values_list('destination', 'status'))
+        self.assertEqual(estados, {'ana@example.com': 'SENT', 'bloqueado@example.com': 'BLOCKED',
+                                   'otra@example.com': 'SENDING'})
+
+    def test_programados_reclama_y_excluye(self):
+        for email in ('a@example.com', 'b@example.com', 'bloqueado@example.com'):
+            MailParaEnviar.objects.create(nombre='Empresa', email=email, asunto='Hola',
+                                          contenido_html='<p>Hola [Nombre]</p>')
+
+        call_command('enviar_emails_programados', '--batch-size', '5', '--ignore-schedule',
+                     stdout=StringIO())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(BackendContador.aperturas, 1)
+        self.assertEqual(MailParaEnviar.objects.get(email='bloqueado@example.com').estado, 'FALLIDO')
+        self.assertFalse(MailParaEnviar.objects.filter(estado__in=['PENDIENTE', 'ENVIANDO']).exists())
+
+    def test_smtp_caido_deja_pendiente_y_libera_los_vencidos(self):
+        for email in ('a@example.com', 'b@example.com'):
+            MailParaEnviar.objects.create(nombre='Empresa', email=email, asunto='Hola',
+                                          contenido_html='<p>Hola [Nombre]</p>')
+        colgado = MailParaEnviar.objects.create(
+            nombre='Empresa', email='c@example.com', asunto='Hola', contenido_html='<p>Hola</p>',
+            estado='ENVIANDO', reclamado_en=timezone.now() - timedelta(hours=3))
+
+        with override_settings(EMAIL_BACKEND='ventas.tests_envio_email.BackendCaido'):
+            call_command('enviar_emails_programados', '--batch-size', '5', '--ignore-schedule',
+                         stdout=StringIO(), stderr=StringIO())
+
+        estados = dict(MailParaEnviar.objects.values_list('email', 'estado'))
+        self.assertEqual(estados, {'a@example.com': 'PENDIENTE', 'b@example.com': 'PENDIENTE',
+                                   colgado.email: 'FALLIDO'})
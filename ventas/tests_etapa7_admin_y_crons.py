@@ -5,8 +5,9 @@ Cobertura:
     1. Endpoints cron HTTP (2):
        - GET sin token → 403
        - GET con token inválido → 403
-       - GET con token válido → 200, ejecuta el comando, responde resumen
-       - Verificar side effects en BD (bandeja generada / atribución realizada)
+       - GET con token válido → 200, encola el comando y responde el trabajo
+       - Verificar side effects en BD cuando el worker (procesar_trabajos) lo
+         corre (bandeja generada / atribución realizada)
 
     2. Admin Django (cobertura mínima):
        - Los 4 modelos nuevos están registrados
@@ -25,6 +26,7 @@ from io import StringIO
 
 from django.contrib.admin.sites import site as default_admin_site
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
@@ -36,6 +38,7 @@ from ventas.models import (
     EventoCelebracion,
     ScriptWhatsApp,
     TaxonomiaMovimiento,
+    Trabajo,
     VentaReserva,
 )
 
@@ -43,6 +46,10 @@ from ventas.models import (
 TEST_CRON_TOKEN = 'test-cron-token-789'
 
 
+def _correr_worker():
+    call_command('procesar_trabajos', '--hasta-vaciar', stdout=StringIO())
+
+
 # ============================================================================
 # Endpoints cron HTTP
 # ============================================================================
@@ -93,7 +100,7 @@ class CronGenerarBandejaEndpointTests(TestCase):
         finally:
             del os.environ['CRON_TOKEN']
 
-    def test_token_valido_200_ejecuta_comando(self):
+    def test_token_valido_200_encola_y_el_worker_ejecuta(self):
         import os
         os.environ['CRON_TOKEN'] = TEST_CRON_TOKEN
         try:
@@ -102,10 +109,12 @@ class CronGenerarBandejaEndpointTests(TestCase):
             data = r.json()
             self.assertTrue(data['ok'])
             self.assertEqual(data['command'], 'generar_bandeja_whatsapp_diaria')
-            self.assertIn('duracion_segundos', data)
-            self.assertIn('output', data)
+            self.assertTrue(data['encolado'])
+            self.assertEqual(ContactoWhatsApp.objects.count(), 0)
 
-            # Side effect: debe haber creado al menos 1 ContactoWhatsApp
+            # Side effect: al correrlo el worker crea al menos 1 ContactoWhatsApp
+            _correr_worker()
+            self.assertEqual(Trabajo.objects.get(pk=data['trabajo_id']).estado, Trabajo.ESTADO_LISTO)
             self.assertGreater(ContactoWhatsApp.objects.count(), 0)
         finally:
             del os.environ['CRON_TOKEN']
@@ -148,7 +157,8 @@ class CronCruzarReservasEndpointTests(TestCase):
             data = r.json()
             self.assertTrue(data['ok'])
             self.assertEqual(data['command'], 'cruzar_reservas_contactos_whatsapp')
-            self.assertIn('duracion_segundos', data)
+            _correr_worker()
+            self.assertEqual(Trabajo.objects.get(pk=data['trabajo_id']).estado, Trabajo.ESTADO_LISTO)
         finally:
             del os.environ['CRON_TOKEN']
 
@@ -179,6 +189,7 @@ class CronCruzarReservasEndpointTests(TestCase):
 
             r = self.client_http.get(self.URL + f'?token={TEST_CRON_TOKEN}')
             self.assertEqual(r.status_code, 200)
+            _correr_worker()
 
             # Verificar atribución
             contacto.refresh_from_db()
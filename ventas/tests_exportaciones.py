@@ -0,0 +1,217 @@
+"""
+Tests de las exportaciones por trozos (ventas/services/exportacion_service.py).
+
+Lo que estos tests clavan:
+    - El CSV sale en streaming (StreamingHttpResponse) con BOM y una línea por
+      fila; el XLSX es un libro válido con las mismas filas.
+    - servicios_vendidos exporta con los filtros de la vista y el precio
+      congelado si existe (si no, el del catálogo) por personas.
+    - Sobre UMBRAL_SEGUNDO_PLANO filas (o con segundo_plano=1) la exportación se
+      encola; `generar_exportaciones` escribe el archivo y se descarga.
+    - Exportar clientes es solo de administradores; quien no lo es ve y baja
+      solo las exportaciones que pidió.
+    - Una exportación colgada en 'generando' (corrida que murió) pasa a error.
+
+Ejecutar:
+    python manage.py test ventas.tests_exportaciones
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import shutil
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from ventas.models import (
+    CategoriaServicio,
+    Cliente,
+    ExportacionArchivo,
+    ReservaServicio,
+    Servicio,
+    VentaReserva,
+)
+from ventas.services import exportacion_service
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+def _csv(resp):
+    contenido = b''.join(resp.streaming_content).decode('utf-8')
+    return contenido, list(csv.reader(io.StringIO(contenido.lstrip('\ufeff'))))
+
+
+def _xlsx(contenido):
+    return [list(f) for f in load_workbook(io.BytesIO(contenido), read_only=True).active.values]
+
+
+class ExportacionesBase(TestCase):
+
+    def setUp(self):
+        categoria = CategoriaServicio.objects.create(nombre='Tinas')
+        self.tina = Servicio.objects.create(
+            nombre='Tina Calbuco', categoria=categoria, tipo_servicio='tina', precio_base=30000,
+            duracion=60, capacidad_minima=1, capacidad_maxima=4, slots_disponibles=SLOTS,
+        )
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+        self.n = 0
+
+    def _linea(self, fecha, personas, precio=None):
+        self.n += 1
+        cliente = Cliente.objects.create(nombre=f'Cliente {self.n}', telefono=f'+5691330{self.n:04d}',
+                                         email=f'cliente{self.n}@example.com')
+        venta = VentaReserva.objects.create(cliente=cliente)
+        ReservaServicio.objects.create(
+            venta_reserva=venta, servicio=self.tina, fecha_agendamiento=fecha, hora_inicio='16:00',
+            cantidad_personas=personas, precio_unitario_venta=precio)
+        return venta
+
+
+class ServiciosVendidosTests(ExportacionesBase):
+
+    def setUp(self):
+        super().setUp()
+        self.v1 = self._linea(date(2030, 8, 1), 2)
+        self.v2 = self._linea(date(2030, 8, 2), 3, precio=Decimal('25000'))
+        self._linea(date(2030, 9, 1), 1)    # fuera del rango
+        self.url = reverse('ventas:servicios_vendidos')
+        self.rango = {'fecha_inicio': '2030-08-01', 'fecha_fin': '2030-08-31'}
+
+    def test_csv_en_streaming(self):
+        resp = self.client.get(self.url, {**self.rango, 'export': 'csv'})
+        self.assertTrue(resp.streaming)
+        contenido, filas = _csv(resp)
+        self.assertTrue(contenido.startswith('\ufeff'))
+        self.assertEqual(filas[0][0], 'ID Venta/Reserva')
+        self.assertEqual([(f[0], f[1], f[5], f[8]) for f in filas[1:]],
+                         [(str(self.v2.id), 'Cliente 2', '2030-08-02', '75000.00'),
+                          (str(self.v1.id), 'Cliente 1', '2030-08-01', '60000.00')])
+
+    def test_xlsx_con_filtros(self):
+        resp = self.client.get(self.url, {**self.rango, 'export': 'excel', 'venta_reserva_id': self.v1.id})
+        self.assertEqual(resp['Content-Type'], exportacion_service.CONTENT_TYPE_XLSX)
+        filas = _xlsx(b''.join(resp.streaming_content))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual((filas[1][0], filas[1][3], filas[1][7], filas[1][8]),
+                         (self.v1.id, 'Tina Calbuco', 2, 60000))
+
+
+class ClientesTests(ExportacionesBase):
+
+    def test_exportar_clientes(self):
+        Cliente.objects.create(nombre='Beto', telefono='+56913309998', email='beto@example.com')
+        Cliente.objects.create(nombre='Ana', telefono='+56913309999', email='ana@example.com')
+        filas = _xlsx(b''.join(self.client.get(reverse('ventas:exportar_clientes_excel')).streaming_content))
+        self.assertEqual([f[1] for f in filas], ['Nombre', 'Ana', 'Beto'])
+
+        _, filas = _csv(self.client.get(reverse('ventas:exportar_clientes_excel'), {'export': 'csv'}))
+        self.assertEqual(filas[1][1:4], ['Ana', '+56913309999', 'ana@example.com'])
+
+    def test_exportar_clientes_solo_administradores(self):
+        self.client.force_login(User.objects.create_user('vendedor', password='x'))
+        resp = self.client.get(reverse('ventas:exportar_clientes_excel'))
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn(reverse('ventas:exportaciones'), resp['Location'])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class SegundoPlanoTests(ExportacionesBase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # El storage del campo se resuelve al cargar el modelo (Cloudinary en
+        # la config de desarrollo): sin esto el test sube a la red.
+        storage = mock.patch.object(ExportacionArchivo._meta.get_field('archivo'), 'storage',
+                                    FileSystemStorage(location=self.media))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+    def test_sobre_el_umbral_se_encola_y_se_descarga(self):
+        for dia in (1, 2, 3):
+            self._linea(date(2030, 8, dia), 1)
+        original = exportacion_service.UMBRAL_SEGUNDO_PLANO
+        exportacion_service.UMBRAL_SEGUNDO_PLANO = 2
+        try:
+            resp = self.client.get(reverse('ventas:servicios_vendidos'),
+                                   {'fecha_inicio': '2030-08-01', 'fecha_fin': '2030-08-31', 'export': 'excel'})
+        finally:
+            exportacion_service.UMBRAL_SEGUNDO_PLANO = original
+        self.assertRedirects(resp, reverse('ventas:exportaciones'))
+        exportacion = ExportacionArchivo.objects.get()
+        self.assertEqual((exportacion.tipo, exportacion.formato, exportacion.estado, exportacion.solicitado_por),
+                         ('servicios_vendidos', 'xlsx', ExportacionArchivo.ESTADO_PENDIENTE, self.staff))
+        self.assertEqual(exportacion.parametros, {'fecha_inicio': '2030-08-01', 'fecha_fin': '2030-08-31'})
+
+        out = StringIO()
+        call_command('generar_exportaciones', stdout=out)
+        self.assertIn('1 generadas, 0 con error', out.getvalue())
+        exportacion.refresh_from_db()
+        self.assertEqual((exportacion.estado, exportacion.filas), (ExportacionArchivo.ESTADO_LISTO, 3))
+
+        resp = self.client.get(reverse('ventas:exportaciones'))
+        self.assertContains(resp, reverse('ventas:descargar_exportacion', args=[exportacion.pk]))
+        resp = self.client.get(reverse('ventas:descargar_exportacion', args=[exportacion.pk]))
+        self.assertEqual(len(_xlsx(b''.join(resp.streaming_content))), 4)
+
+    def test_csv_pedido_en_segundo_plano(self):
+        Cliente.objects.create(nombre='Ana', telefono='+56913309999', email='ana@example.com')
+        self.client.get(reverse('ventas:exportar_clientes_excel'), {'export': 'csv', 'segundo_plano': 1})
+        call_command('generar_exportaciones', stdout=StringIO())
+        exportacion = ExportacionArchivo.objects.get()
+        self.assertEqual((exportacion.formato, exportacion.filas), ('csv', 1))
+        with exportacion.archivo.open('rb') as archivo:
+            self.assertIn('Ana,+56913309999', archivo.read().decode('utf-8'))
+
+    def test_quien_no_es_administrador_ve_solo_las_suyas(self):
+        self._linea(date(2030, 8, 1), 1)
+        ajena = exportacion_service.encolar('clientes', {}, 'csv', self.staff)
+        vendedor = User.objects.create_user('vendedor', password='x')
+        self.client.force_login(vendedor)
+        resp = self.client.get(reverse('ventas:servicios_vendidos'), {
+            'fecha_inicio': '2030-08-01', 'fecha_fin': '2030-08-31', 'export': 'csv', 'segundo_plano': 1})
+        self.assertRedirects(resp, reverse('ventas:exportaciones'))
+        call_command('generar_exportaciones', stdout=StringIO())
+        propia = ExportacionArchivo.objects.get(solicitado_por=vendedor)
+
+        resp = self.client.get(reverse('ventas:exportaciones'))
+        self.assertContains(resp, reverse('ventas:descargar_exportacion', args=[propia.pk]))
+        self.assertNotContains(resp, reverse('ventas:descargar_exportacion', args=[ajena.pk]))
+        self.assertEqual(self.client.get(
+            reverse('ventas:descargar_exportacion', args=[propia.pk])).status_code, 200)
+        self.assertEqual(self.client.get(
+            reverse('ventas:descargar_exportacion', args=[ajena.pk])).status_code, 404)
+
+    def test_colgada_en_generando_pasa_a_error(self):
+        ahora = timezone.now()
+        colgada = ExportacionArchivo.objects.create(
+            tipo='clientes', estado=ExportacionArchivo.ESTADO_GENERANDO,
+            tomado_en=ahora - exportacion_service.GENERACION_VENCIDA - timedelta(minutes=1))
+        en_curso = ExportacionArchivo.objects.create(
+            tipo='clientes', estado=ExportacionArchivo.ESTADO_GENERANDO, tomado_en=ahora)
+
+        call_command('generar_exportaciones', stdout=StringIO())
+
+        colgada.refresh_from_db()
+        en_curso.refresh_from_db()
+        self.assertEqual(colgada.estado, ExportacionArchivo.ESTADO_ERROR)
+        self.assertIn('Sin terminar', colgada.error)
+        self.assertEqual(en_curso.estado, ExportacionArchivo.ESTADO_GENERANDO)
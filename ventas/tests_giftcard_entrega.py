@@ -0,0 +1,134 @@
+"""
+Tests de la entrega de GiftCards fuera del guardado del Pago
+(services/giftcard_entrega_service.py).
+
+Lo que estos tests clavan:
+    - Guardar el Pago no arma PDFs ni manda email: al confirmar la transacción
+      las GiftCards pasan a 'cobrado' y queda encolado un trabajo.
+    - El worker manda UN email con todas las GiftCards y las marca enviadas;
+      volver a correr la entrega no reenvía.
+    - Un segundo pago de la misma venta no vuelve a reclamar ni a encolar.
+    - Si el envío falla, el trabajo queda para reintento y las GiftCards sin
+      marcar como enviadas.
+    - Los datos de la experiencia se leen una vez por experiencia (caché que se
+      invalida al editarla), no una vez por carta.
+
+Ejecutar:
+    python manage.py test ventas.tests_giftcard_entrega
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ventas.models import Cliente, GiftCard, GiftCardExperiencia, Pago, Trabajo, VentaReserva
+from ventas.services import giftcard_entrega_service
+from ventas.services.giftcard_pdf_service import GiftCardPDFService
+
+
+def _emails_giftcard():
+    return [m for m in mail.outbox if 'GiftCard' in m.subject]
+
+
+def _pdfs_falsos(giftcards_data, formato='mobile'):
+    resumen = b'%PDF-resumen' if len(giftcards_data) > 1 else None
+    return resumen, [b'%PDF-' + gc['codigo'].encode() for gc in giftcards_data]
+
+
+class GiftCardEntregaBase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.experiencia = GiftCardExperiencia.objects.create(
+            id_experiencia='tina_rio', categoria='tinas', nombre='Tina junto al río',
+            descripcion='Tina caliente para dos', monto_fijo=Decimal('50000'))
+        self.cliente = Cliente.objects.create(nombre='Compradora Regalo', telefono='+56912345001',
+                                              email='compradora@example.com')
+        self.venta = VentaReserva.objects.create(cliente=self.cliente)
+        self.giftcards = [
+            GiftCard.objects.create(
+                venta_reserva=self.venta, monto_inicial=Decimal('25000'), monto_disponible=Decimal('25000'),
+                fecha_vencimiento=timezone.localdate() + timedelta(days=365),
+                servicio_asociado='tina_rio', destinatario_nombre=f'Persona {i}')
+            for i in range(2)
+        ]
+
+    def _pagar(self, monto=50000):
+        with self.captureOnCommitCallbacks(execute=True):
+            Pago.objects.create(venta_reserva=self.venta, monto=Decimal(monto), metodo_pago='transferencia')
+
+    def _correr_worker(self):
+        with mock.patch.object(GiftCardPDFService, 'renderizar_lote', side_effect=_pdfs_falsos):
+            call_command('procesar_trabajos', '--hasta-vaciar', stdout=StringIO())
+
+
+class ProgramarTests(GiftCardEntregaBase):
+
+    def test_pago_cobra_y_encola_sin_enviar(self):
+        with mock.patch.object(GiftCardPDFService, 'enviar_giftcard_por_email') as enviar:
+            self._pagar()
+        enviar.assert_not_called()
+        self.assertEqual(_emails_giftcard(), [])
+        self.assertEqual(set(GiftCard.objects.values_list('estado', flat=True)), {'cobrado'})
+        trabajo = Trabajo.objects.get()
+        self.assertEqual((trabajo.tarea, trabajo.cola), ('entregar_giftcards', 'avisos'))
+        self.assertEqual(trabajo.argumentos['giftcard_ids'], [gc.id for gc in self.giftcards])
+
+    def test_segundo_pago_no_reclama_de_nuevo(self):
+        self._pagar(30000)
+        self._pagar(20000)
+        self.assertEqual(Trabajo.objects.count(), 1)
+
+
+class EntregarTests(GiftCardEntregaBase):
+
+    def test_worker_envia_un_email_y_no_reenvia(self):
+        self._pagar()
+        self._correr_worker()
+
+        self.assertEqual(len(_emails_giftcard()), 1)
+        email = _emails_giftcard()[0]
+        self.assertEqual(email.to, ['compradora@example.com'])
+        # Resumen + un PDF por GiftCard
+        self.assertEqual(len(email.attachments), 3)
+        self.assertTrue(all(GiftCard.objects.values_list('enviado_email', flat=True)))
+        self.assertEqual(Trabajo.objects.get().estado, Trabajo.ESTADO_LISTO)
+
+        trabajo = Trabajo.objects.get()
+        resultado = giftcard_entrega_service.entregar(**trabajo.argumentos)
+        self.assertIn('ya enviadas', resultado)
+        self.assertEqual(len(_emails_giftcard()), 1)
+
+    def test_envio_fallido_queda_para_reintento(self):
+        self._pagar()
+        with mock.patch.object(GiftCardPDFService, 'enviar_giftcard_por_email', return_value=False), \
+                self.assertLogs('ventas.services.trabajos_service', 'ERROR'):
+            call_command('procesar_trabajos', '--hasta-vaciar', stdout=StringIO())
+
+        trabajo = Trabajo.objects.get()
+        self.assertEqual(trabajo.estado, Trabajo.ESTADO_PENDIENTE)
+        self.assertGreater(trabajo.ejecutar_desde, timezone.now())
+        self.assertFalse(any(GiftCard.objects.values_list('enviado_email', flat=True)))
+
+
+class DatosCartaTests(GiftCardEntregaBase):
+
+    def test_experiencia_una_consulta_por_experiencia(self):
+        with self.assertNumQueries(1):
+            datos = [GiftCardPDFService.datos_carta(gc) for gc in self.giftcards]
+        self.assertEqual({d['experiencia_nombre'] for d in datos}, {'Tina junto al río'})
+
+        self.experiencia.nombre = 'Tina Calbuco junto al río'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.experiencia.save()
+        self.assertEqual(GiftCardPDFService.datos_carta(self.giftcards[0])['experiencia_nombre'],
+                         'Tina Calbuco junto al río')
@@ -0,0 +1,115 @@
+"""
+Tests del render por lotes de GiftCardPDFService (`renderizar_lote`).
+
+Lo que estos tests clavan:
+    - El PDF de cada carta queda en caché por el hash de su contenido: volver
+      a pedir la misma carta no la diagrama; cambiar un dato sí.
+    - Sobre LOTE_MINIMO_POOL cartas se diagraman en otros procesos y vuelven
+      en el mismo orden. Los procesos se levantan con spawn, nunca fork (el
+      worker de trabajos tiene hilos).
+    - El resumen une los PDFs individuales (con pypdf) sin volver a diagramar.
+
+WeasyPrint no está en el entorno de tests: se reemplaza el diagramado de una
+carta (`_renderizar_carta`) por uno falso.
+
+Ejecutar:
+    python manage.py test ventas.tests_giftcard_pdf_lote
+"""
+
+from __future__ import annotations
+
+import io
+import multiprocessing
+import os
+from datetime import date
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from ventas.services import giftcard_pdf_service
+from ventas.services.giftcard_pdf_service import GiftCardPDFService
+
+LLAMADAS = []
+
+
+def _pdf_falso(giftcard_data, formato):
+    LLAMADAS.append(giftcard_data['codigo'])
+    return f"%PDF-{giftcard_data['codigo']}-{os.getpid()}".encode()
+
+
+def _carta(codigo, destinatario='Ana'):
+    return {
+        'codigo': codigo, 'experiencia_nombre': 'Tina junto al río', 'experiencia_descripcion': 'Para dos',
+        'experiencia_imagen_url': '', 'destinatario_nombre': destinatario,
+        'mensaje_seleccionado': 'Feliz cumpleaños', 'precio': Decimal('50000'),
+        'fecha_emision': date(2026, 10, 1), 'fecha_vencimiento': date(2027, 10, 1),
+    }
+
+
+@mock.patch.object(giftcard_pdf_service, 'WEASYPRINT_AVAILABLE', True)
+@mock.patch.object(giftcard_pdf_service, '_renderizar_carta', _pdf_falso)
+@mock.patch.object(giftcard_pdf_service, '_unir_pdfs', lambda data, pdfs, formato: b'|'.join(pdfs))
+class RenderizarLoteTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        LLAMADAS.clear()
+
+    def test_cache_por_contenido(self):
+        cartas = [_carta('AAA111'), _carta('BBB222')]
+        resumen, pdfs = GiftCardPDFService.renderizar_lote(cartas)
+        self.assertEqual(LLAMADAS, ['AAA111', 'BBB222'])
+        self.assertEqual(resumen, b'|'.join(pdfs))
+
+        LLAMADAS.clear()
+        self.assertEqual(GiftCardPDFService.renderizar_lote(cartas)[1], pdfs)
+        self.assertEqual(LLAMADAS, [])
+
+        GiftCardPDFService.renderizar_lote([_carta('AAA111', destinatario='Beatriz'), cartas[1]])
+        self.assertEqual(LLAMADAS, ['AAA111'])
+        # Otra versión de la plantilla no reutiliza lo guardado
+        LLAMADAS.clear()
+        with mock.patch.object(GiftCardPDFService, 'VERSION_PLANTILLA', 2):
+            GiftCardPDFService.renderizar_lote([cartas[1]])
+        self.assertEqual(LLAMADAS, ['BBB222'])
+
+    def test_una_sola_carta_sin_resumen(self):
+        resumen, pdfs = GiftCardPDFService.renderizar_lote([_carta('CCC333')])
+        self.assertIsNone(resumen)
+        self.assertEqual(len(pdfs), 1)
+
+    @mock.patch.object(giftcard_pdf_service, 'LOTE_MINIMO_POOL', 3)
+    @mock.patch.object(giftcard_pdf_service, 'MAX_PROCESOS', 2)
+    @mock.patch.object(giftcard_pdf_service, '_estilos', mock.Mock())
+    def test_lote_grande_en_procesos_y_en_orden(self):
+        cartas = [_carta(f'LOTE{i:02d}') for i in range(4)]
+        with mock.patch.object(giftcard_pdf_service.os, 'cpu_count', return_value=2), \
+                mock.patch.object(giftcard_pdf_service.multiprocessing, 'get_context',
+                                  wraps=multiprocessing.get_context) as contexto:
+            _, pdfs = GiftCardPDFService.renderizar_lote(cartas)
+        contexto.assert_called_once_with('spawn')
+        self.assertEqual([pdf.split(b'-')[1].decode() for pdf in pdfs], [c['codigo'] for c in cartas])
+        pids = {int(pdf.split(b'-')[2]) for pdf in pdfs}
+        self.assertNotIn(os.getpid(), pids)
+        # Diagramadas en los procesos hijos: en este no se registró ninguna
+        self.assertEqual(LLAMADAS, [])
+
+
+@skipUnless(giftcard_pdf_service.PYPDF_AVAILABLE, 'pypdf no instalado')
+class UnirPdfsTests(SimpleTestCase):
+
+    def _pdf(self, paginas):
+        escritor = giftcard_pdf_service.PdfWriter()
+        for _ in range(paginas):
+            escritor.add_blank_page(width=396, height=705)
+        salida = io.BytesIO()
+        escritor.write(salida)
+        return salida.getvalue()
+
+    def test_une_las_paginas_sin_diagramar(self):
+        with mock.patch.object(GiftCardPDFService, '_documento') as documento:
+            resumen = giftcard_pdf_service._unir_pdfs([{}, {}], [self._pdf(1), self._pdf(2)], 'mobile')
+        documento.assert_not_called()
+        self.assertEqual(len(giftcard_pdf_service.PdfReader(io.BytesIO(resumen)).pages), 3)
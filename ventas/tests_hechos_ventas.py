@@ -0,0 +1,208 @@
+"""
+Tests de la tabla de hechos diaria de ventas (HechoVentaDiaria) y de los
+dashboards que leen de ella.
+
+Lo que estos tests clavan:
+    - Reconstruir da los mismos totales que agregar ReservaServicio /
+      ReservaProducto / Pago directo, con el mismo Coalesce de precios.
+    - `reservas` y `reservas_categoria` suman ventas distintas sin contar dos
+      veces una venta con varios servicios.
+    - Las señales mantienen los días tocados al confirmar la transacción: alta,
+      cambio de fecha (el día viejo se vacía) y baja.
+    - dashboard_ventas / dashboard_operativo / el CSV leen de la tabla.
+    - El comando borra lo que quedó fuera de la historia.
+
+Ejecutar:
+    python manage.py test ventas.tests_hechos_ventas
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ventas.models import (
+    CategoriaServicio,
+    Cliente,
+    HechoVentaDiaria,
+    Pago,
+    Producto,
+    ReservaProducto,
+    ReservaServicio,
+    Servicio,
+    VentaReserva,
+)
+from ventas.services.hechos_ventas_service import reconstruir
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+H = HechoVentaDiaria
+
+
+def _servicio(nombre, categoria, precio=20000):
+    return Servicio.objects.create(
+        nombre=nombre, categoria=categoria, tipo_servicio='tina', precio_base=precio,
+        duracion=60, capacidad_minima=1, capacidad_maxima=4, slots_disponibles=SLOTS,
+    )
+
+
+class HechosVentasBase(TestCase):
+
+    def setUp(self):
+        self.tinas = CategoriaServicio.objects.create(nombre='Tinas')
+        self.masajes = CategoriaServicio.objects.create(nombre='Masajes')
+        self.calbuco = _servicio('Tina Calbuco', self.tinas)
+        self.osorno = _servicio('Tina Osorno', self.tinas, precio=30000)
+        self.masaje = _servicio('Masaje Relajación', self.masajes, precio=40000)
+        self.vino = Producto.objects.create(nombre='Vino', precio_base=8000, cantidad_disponible=100)
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.n = 0
+
+    def _venta(self, vendida, lineas, productos=(), pagar=True):
+        """`lineas`: [(servicio, fecha_agendamiento, personas, precio congelado o None)]."""
+        self.n += 1
+        cliente = Cliente.objects.create(nombre=f'Cliente {self.n}', telefono=f'+5691160{self.n:04d}',
+                                         email=f'cliente{self.n}@example.com')
+        venta = VentaReserva.objects.create(
+            cliente=cliente, fecha_reserva=timezone.make_aware(datetime.combine(vendida, time(12))))
+        for servicio, fecha, personas, precio in lineas:
+            ReservaServicio.objects.create(
+                venta_reserva=venta, servicio=servicio, fecha_agendamiento=fecha, hora_inicio='16:00',
+                cantidad_personas=personas, precio_unitario_venta=precio)
+        for producto, cantidad in productos:
+            ReservaProducto.objects.create(venta_reserva=venta, producto=producto, cantidad=cantidad)
+        venta.refresh_from_db()
+        if pagar:
+            # bulk_create: sin los receptores de Pago (tramos, premios, avisos), que
+            # no son lo que se prueba acá; calcular_total deja la venta pagada.
+            Pago.objects.bulk_create([Pago(venta_reserva=venta, monto=venta.total, metodo_pago='webpay',
+                                           usuario=self.staff)])
+            venta.calcular_total()
+        return venta
+
+
+class ReconstruirTests(HechosVentasBase):
+
+    def setUp(self):
+        super().setUp()
+        self._venta(date(2030, 3, 2), [(self.calbuco, date(2030, 3, 10), 2, None),
+                                      (self.osorno, date(2030, 3, 11), 2, Decimal('25000')),
+                                      (self.masaje, date(2030, 3, 10), 1, None)],
+                    productos=[(self.vino, 2)])
+        self._venta(date(2030, 3, 2), [(self.calbuco, date(2030, 3, 12), 3, None)])
+        self._venta(date(2030, 3, 5), [(self.masaje, date(2030, 3, 13), 2, None)], pagar=False)
+        HechoVentaDiaria.objects.all().delete()
+        reconstruir()
+
+    def test_mismos_totales_que_agregar_las_lineas(self):
+        directo = dict(
+            ReservaServicio.objects.values_list('servicio__categoria__nombre')
+            .annotate(t=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')))
+        )
+        por_venta = dict(H.objects.filter(tipo=H.TIPO_SERVICIO_VENDIDO)
+                         .values_list('servicio__categoria__nombre').annotate(t=Sum('total')))
+        por_agenda = dict(H.objects.filter(tipo=H.TIPO_SERVICIO_AGENDADO)
+                          .values_list('servicio__categoria__nombre').annotate(t=Sum('total')))
+        self.assertEqual(directo, {'Tinas': 150000, 'Masajes': 120000})
+        self.assertEqual(por_venta, directo)
+        self.assertEqual(por_agenda, directo)
+
+        ventas = H.objects.filter(tipo=H.TIPO_VENTA).aggregate(t=Sum('total'), n=Sum('cantidad'))
+        self.assertEqual(ventas, VentaReserva.objects.aggregate(t=Sum('total'), n=Count('id')))
+        producto = H.objects.get(tipo=H.TIPO_PRODUCTO)
+        self.assertEqual((producto.total, producto.cantidad, producto.fecha), (16000, 2, date(2030, 3, 2)))
+        self.assertEqual(H.objects.get(tipo=H.TIPO_PAGO).metodo_pago, 'webpay')
+
+    def test_ventas_distintas_sin_doble_conteo(self):
+        dia = H.objects.filter(tipo=H.TIPO_SERVICIO_VENDIDO, fecha=date(2030, 3, 2))
+        # Dos ventas ese día; la primera tiene tres servicios en dos categorías.
+        self.assertEqual(dia.aggregate(n=Sum('reservas'))['n'], 2)
+        self.assertEqual(dia.filter(categoria=self.tinas).aggregate(n=Sum('reservas_categoria'))['n'], 2)
+        self.assertEqual(dia.filter(categoria=self.masajes).aggregate(n=Sum('reservas_categoria'))['n'], 1)
+        self.assertEqual(dia.filter(categoria=self.tinas).aggregate(n=Sum('cantidad'))['n'], 3)
+
+    def test_comando_borra_lo_que_quedo_fuera(self):
+        H.objects.create(tipo=H.TIPO_VENTA, fecha=date(2019, 1, 1), estado_pago='pagado',
+                         estado_reserva='pendiente', total=1, cantidad=1)
+        antes = H.objects.count() - 1
+        call_command('reconstruir_hechos_ventas', stdout=StringIO())
+        self.assertFalse(H.objects.filter(fecha__year=2019).exists())
+        self.assertEqual(H.objects.count(), antes)
+
+
+class IncrementalTests(HechosVentasBase):
+
+    def test_alta_cambio_de_fecha_y_baja(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = self._venta(date(2030, 4, 1), [(self.calbuco, date(2030, 4, 8), 2, None)])
+        self.assertEqual(
+            H.objects.get(tipo=H.TIPO_SERVICIO_AGENDADO).fecha, date(2030, 4, 8))
+        self.assertEqual(H.objects.get(tipo=H.TIPO_VENTA).estado_pago, 'pagado')
+        self.assertEqual(H.objects.get(tipo=H.TIPO_SERVICIO_VENDIDO).total, 40000)
+
+        linea = venta.reservaservicios.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            linea.fecha_agendamiento = date(2030, 4, 9)
+            linea.save()
+        self.assertEqual(list(H.objects.filter(tipo=H.TIPO_SERVICIO_AGENDADO).values_list('fecha', flat=True)),
+                         [date(2030, 4, 9)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            linea.delete()
+        self.assertFalse(H.objects.filter(tipo__in=[H.TIPO_SERVICIO_AGENDADO, H.TIPO_SERVICIO_VENDIDO]).exists())
+        # La venta sigue, ahora en 0 y con el saldo a favor: no deja de contarse.
+        self.assertEqual(H.objects.get(tipo=H.TIPO_VENTA).total, 0)
+
+    def test_cambio_de_categoria_regrupa(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._venta(date(2030, 4, 1), [(self.calbuco, date(2030, 4, 8), 2, None)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.calbuco.categoria = self.masajes
+            self.calbuco.save()
+        self.assertEqual(set(H.objects.filter(servicio=self.calbuco).values_list('categoria_id', flat=True)),
+                         {self.masajes.id})
+
+
+class DashboardsTests(HechosVentasBase):
+
+    def setUp(self):
+        super().setUp()
+        self._venta(date(2030, 5, 3), [(self.calbuco, date(2030, 5, 10), 2, None),
+                                      (self.masaje, date(2030, 5, 10), 1, None)],
+                    productos=[(self.vino, 1)])
+        reconstruir()
+        self.client.force_login(self.staff)
+
+    def test_dashboard_ventas(self):
+        resp = self.client.get(reverse('ventas:analytics_dashboard_ventas'), {'year': 2030})
+        self.assertEqual(resp.status_code, 200)
+        resumen = resp.context['resumen']
+        self.assertEqual((resumen['total_servicios'], resumen['total_productos']), (80000, 8000))
+        self.assertEqual((resumen['total_ingresos'], resumen['total_reservas']), (88000, 1))
+
+        resp = self.client.get(reverse('ventas:analytics_dashboard_ventas'),
+                               {'year': 2030, 'categoria': self.masajes.id})
+        resumen = resp.context['resumen']
+        self.assertEqual((resumen['total_servicios'], resumen['total_reservas']), (40000, 1))
+
+    def test_dashboard_operativo(self):
+        resp = self.client.get(reverse('ventas:analytics_dashboard_operativo'), {'year': 2030, 'month': 5})
+        self.assertEqual(resp.status_code, 200)
+        resumen = resp.context['resumen']
+        self.assertEqual((resumen['total_ingresos'], resumen['total_servicios_prestados'],
+                          resumen['total_reservas']), (80000, 2, 1))
+
+    def test_csv(self):
+        resp = self.client.get(reverse('ventas:analytics_export_csv'), {'year': 2030})
+        contenido = b''.join(resp.streaming_content).decode('utf-8')
+        self.assertIn('Tina Calbuco,Tinas,"$40,000",1', contenido)
+        self.assertIn('Vino,"$8,000",1', contenido)
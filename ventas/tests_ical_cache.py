@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""El .ics por cabaña sale de la caché y responde con ETag (H-106).
+
+Booking y Airbnb leen la URL cada pocos minutos; casi nunca cambió nada. Lo que
+estos tests clavan:
+
+· Una relectura sin cambios no toca la base; con If-None-Match es un 304.
+· Una reserva o un bloqueo de ESA cabaña cambia el ETag; los de otra, no.
+· Mover una reserva de cabaña invalida las dos; cancelar la venta, también.
+· La versión sube al confirmar la transacción: una lectura entre el guardado
+  y el commit no deja el .ics viejo guardado bajo la versión nueva.
+
+Ejecutar:
+    python manage.py test ventas.tests_ical_cache
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ventas.models import (CalendarioCabana, Cliente, ReservaServicio, Servicio,
+                           ServicioBloqueo, VentaReserva)
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+def _cabana(nombre):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio='cabana', precio_base=60000, duracion=1440,
+        capacidad_maxima=2, capacidad_minima=1, publicado_web=True,
+        slots_disponibles=SLOTS)
+
+
+class IcsCacheadoTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.torre = _cabana('Cabaña Torre')
+        self.tepa = _cabana('Cabaña Tepa')
+        self.cal = CalendarioCabana.objects.create(servicio=self.torre)
+        self.cal_tepa = CalendarioCabana.objects.create(servicio=self.tepa)
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+        self.noche = timezone.localdate() + timedelta(days=10)
+
+    def _get(self, cal=None, **headers):
+        cal = cal or self.cal
+        return self.client.get(f'/ventas/ical/{cal.token}/cabana.ics', **headers)
+
+    def _reservar(self, cabana):
+        return ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=cabana, fecha_agendamiento=self.noche,
+            hora_inicio='16:00', cantidad_personas=2)
+
+    def test_relectura_sin_base_y_304(self):
+        primera = self._get()
+        with CaptureQueriesContext(connection) as ctx:
+            segunda = self._get()
+            no_cambio = self._get(HTTP_IF_NONE_MATCH=primera['ETag'])
+        self.assertEqual(ctx.captured_queries, [])
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(no_cambio.status_code, 304)
+        self.assertEqual(no_cambio.content, b'')
+        self.assertIn('no-store', no_cambio['Cache-Control'])
+
+    def test_solo_se_invalida_la_cabana_tocada(self):
+        etag_torre, etag_tepa = self._get()['ETag'], self._get(self.cal_tepa)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reservar(self.torre)
+
+        nueva = self._get()
+        self.assertNotEqual(nueva['ETag'], etag_torre)
+        self.assertIn(self.noche.strftime('%Y%m%d'), nueva.content.decode())
+        self.assertEqual(self._get(self.cal_tepa)['ETag'], etag_tepa)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ServicioBloqueo.objects.create(
+                servicio=self.tepa, fecha_inicio=self.noche, fecha_fin=self.noche,
+                fecha=self.noche, hora_slot='N/A', motivo='Mantención')
+        self.assertNotEqual(self._get(self.cal_tepa)['ETag'], etag_tepa)
+
+    def test_lectura_antes_del_commit_no_queda_como_nueva(self):
+        antes = self._get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reservar(self.torre)
+            # Otra conexión todavía ve la base sin la reserva: hasta el commit
+            # se sigue sirviendo (y guardando) bajo la versión vieja.
+            self.assertEqual(self._get()['ETag'], antes['ETag'])
+
+        despues = self._get()
+        self.assertNotEqual(despues['ETag'], antes['ETag'])
+        self.assertIn(self.noche.strftime('%Y%m%d'), despues.content.decode())
+
+    def test_mover_de_cabana_invalida_las_dos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            rs = self._reservar(self.torre)
+        etag_torre, etag_tepa = self._get()['ETag'], self._get(self.cal_tepa)['ETag']
+
+        rs = ReservaServicio.objects.get(pk=rs.pk)
+        rs.servicio = self.tepa
+        with self.captureOnCommitCallbacks(execute=True):
+            rs.save()
+
+        self.assertNotIn(self.noche.strftime('%Y%m%d'), self._get().content.decode())
+        self.assertNotEqual(self._get()['ETag'], etag_torre)
+        self.assertNotEqual(self._get(self.cal_tepa)['ETag'], etag_tepa)
+
+    def test_cancelar_la_venta_libera_la_noche(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._reservar(self.torre)
+        antes = self._get()
+
+        venta = VentaReserva.objects.get(pk=self.venta.pk)
+        venta.estado_reserva = 'cancelada'
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.save()
+
+        despues = self._get()
+        self.assertNotEqual(despues['ETag'], antes['ETag'])
+        self.assertNotIn(self.noche.strftime('%Y%m%d'), despues.content.decode())
+
+    def test_desactivar_el_calendario_corta_la_url_cacheada(self):
+        self.assertEqual(self._get().status_code, 200)
+        self.cal.activo = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cal.save()
+        self.assertEqual(self._get().status_code, 404)
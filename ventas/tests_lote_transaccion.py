@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Lote por transacción compartido (ventas/services/lote_transaccion.py).
+
+Lo que estos tests clavan:
+
+· Varias marcas en una transacción caen en UN lote que se vacía una vez al
+  confirmar.
+· Si el savepoint donde nació el lote se revierte, la marca siguiente arranca
+  uno nuevo (el viejo no se vacía nunca: su callback se fue con el savepoint).
+· Cada clave tiene su propio lote.
+· En autocommit no hay lote.
+
+Ejecutar:
+    python manage.py test ventas.tests_lote_transaccion
+"""
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+
+from ventas.services.lote_transaccion import lote_de_la_transaccion
+
+
+class _Lote:
+    vaciados = []
+
+    def __init__(self):
+        self.marcas = set()
+
+    def vaciar(self):
+        _Lote.vaciados.append(sorted(self.marcas))
+
+
+def _marcar(marca, clave='prueba'):
+    lote_de_la_transaccion(clave, _Lote).marcas.add(marca)
+
+
+class LoteTransaccionTest(TestCase):
+
+    def setUp(self):
+        _Lote.vaciados = []
+
+    def test_un_lote_por_transaccion(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            _marcar(1)
+            _marcar(2)
+            _marcar('x', clave='otra')
+        self.assertEqual(len(callbacks), 2)
+        self.assertCountEqual(_Lote.vaciados, [[1, 2], ['x']])
+
+    def test_savepoint_revertido_arranca_otro_lote(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    _marcar(1)
+                    raise RuntimeError('se revierte')
+            except RuntimeError:
+                pass
+            _marcar(2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(_Lote.vaciados, [[2]])
+
+    def test_lote_de_un_savepoint_confirmado_sigue_vivo(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                _marcar(1)
+            _marcar(2)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(_Lote.vaciados, [[1, 2]])
+
+
+class AutocommitTest(SimpleTestCase):
+
+    def test_en_autocommit_no_hay_lote(self):
+        self.assertIsNone(lote_de_la_transaccion('prueba', _Lote))
@@ -0,0 +1,182 @@
+"""
+Tests de las métricas por cliente (MetricaCliente) y de las vistas de
+segmentación que leen de ellas.
+
+Lo que estos tests clavan:
+    - Reconstruir suma solo ventas pagadas o con pago parcial: gasto =
+      VentaReserva.total, servicios = líneas de esas ventas.
+    - Clientes con el mismo teléfono en formatos distintos quedan en UNA fila,
+      representada por el de menor id.
+    - Las señales mantienen la fila al confirmar la transacción: pago, cambio
+      de teléfono (la fila vieja se va) y borrado de la venta.
+    - Las tres vistas cuentan y filtran por total_gasto y paginan en el servidor.
+
+Ejecutar:
+    python manage.py test ventas.tests_metricas_cliente
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ventas.models import (
+    CategoriaServicio,
+    Cliente,
+    Comuna,
+    MetricaCliente,
+    Pago,
+    Region,
+    ReservaServicio,
+    Servicio,
+    VentaReserva,
+)
+from ventas.services.metricas_cliente_service import reconstruir
+from ventas.views import reporting_views
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+class MetricasClienteBase(TestCase):
+
+    def setUp(self):
+        categoria = CategoriaServicio.objects.create(nombre='Tinas')
+        self.tina = Servicio.objects.create(
+            nombre='Tina Calbuco', categoria=categoria, tipo_servicio='tina', precio_base=30000,
+            duracion=60, capacidad_minima=1, capacidad_maxima=4, slots_disponibles=SLOTS,
+        )
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.dia = 0
+
+    def _cliente(self, nombre, telefono, **extra):
+        extra.setdefault('email', f'{nombre.lower()}@example.com')
+        return Cliente.objects.create(nombre=nombre, telefono=telefono, **extra)
+
+    def _venta(self, cliente, personas=1, pagar=True):
+        self.dia += 1
+        venta = VentaReserva.objects.create(cliente=cliente)
+        ReservaServicio.objects.create(
+            venta_reserva=venta, servicio=self.tina, fecha_agendamiento=date(2030, 6, self.dia),
+            hora_inicio='16:00', cantidad_personas=personas)
+        venta.refresh_from_db()
+        if pagar:
+            # bulk_create: sin los receptores de Pago; calcular_total deja la venta pagada.
+            Pago.objects.bulk_create([Pago(venta_reserva=venta, monto=venta.total, metodo_pago='webpay',
+                                           usuario=self.staff)])
+            venta.calcular_total()
+        return venta
+
+
+class ReconstruirTests(MetricasClienteBase):
+
+    def test_suma_solo_ventas_pagadas(self):
+        ana = self._cliente('Ana', '+56911110001')
+        self._venta(ana, personas=2)
+        self._venta(ana, personas=1)
+        self._venta(ana, personas=3, pagar=False)
+        self._cliente('Beto', '+56911110002')
+        reconstruir()
+
+        fila = MetricaCliente.objects.get(telefono='+56911110001')
+        self.assertEqual((fila.servicios_actuales, fila.gasto_actual), (2, Decimal('90000')))
+        self.assertEqual((fila.total_servicios, fila.total_gasto), (2, Decimal('90000')))
+        self.assertEqual(MetricaCliente.objects.get(telefono='+56911110002').total_gasto, 0)
+
+    def test_duplicados_por_telefono_en_una_fila(self):
+        ana = self._cliente('Ana', '+56911110003', email=None)
+        # Un alta vieja con el número sin normalizar (Cliente.save lo normalizaría).
+        Cliente.objects.bulk_create([Cliente(nombre='Ana B', telefono='911110003', email='ana@example.com')])
+        duplicada = Cliente.objects.get(telefono='911110003')
+        self._venta(ana)
+        self._venta(duplicada, personas=2)
+        call_command('reconstruir_metricas_clientes', stdout=StringIO())
+
+        fila = MetricaCliente.objects.get()
+        self.assertEqual((fila.telefono, fila.cliente_id, fila.nombre), ('+56911110003', ana.id, 'Ana'))
+        self.assertEqual(fila.email, 'ana@example.com')
+        self.assertEqual((fila.servicios_actuales, fila.total_gasto), (2, Decimal('90000')))
+
+
+class IncrementalTests(MetricasClienteBase):
+
+    def test_pago_cambio_de_telefono_y_baja(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ana = self._cliente('Ana', '+56911110004')
+            venta = self._venta(ana, personas=2)
+        self.assertEqual(MetricaCliente.objects.get(telefono='+56911110004').total_gasto, 60000)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ana.telefono = '+56911110005'
+            ana.save()
+        self.assertEqual(list(MetricaCliente.objects.values_list('telefono', 'total_gasto')),
+                         [('+56911110005', Decimal('60000'))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.delete()
+        fila = MetricaCliente.objects.get()
+        self.assertEqual((fila.servicios_actuales, fila.total_gasto), (0, 0))
+
+
+# Las plantillas extienden admin/base_site: sin collectstatic no hay manifiesto.
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class VistasSegmentacionTests(MetricasClienteBase):
+
+    def setUp(self):
+        super().setUp()
+        region, _ = Region.objects.get_or_create(codigo='X', defaults={'nombre': 'Los Lagos'})
+        self.puerto_varas = Comuna.objects.create(nombre='Puerto Varas', region=region)
+        alta = self._cliente('Alta', '+56911110010')
+        # .update(): Cliente.save clasifica la comuna con un caché de ciudades
+        # que sobrevive entre tests.
+        Cliente.objects.filter(pk=alta.pk).update(comuna=self.puerto_varas)
+        self._venta(alta, personas=4)
+        self._venta(self._cliente('Alto', '+56911110011'), personas=4)
+        self._venta(self._cliente('Media', '+56911110012'), personas=2)
+        self._venta(self._cliente('Baja', '+56911110013'), personas=1)
+        self._cliente('Cero', '+56911110014', email='')
+        # Un gasto sobre el umbral alto: 6 personas = 180.000
+        self._venta(alta, personas=2)
+        reconstruir()
+        self.client.force_login(self.staff)
+
+    def test_conteos_por_segmento(self):
+        resp = self.client.get(reverse('ventas:cliente_segmentation'))
+        self.assertEqual(resp.status_code, 200)
+        conteos = {k: v['count'] for k, v in resp.context['segments'].items()}
+        self.assertEqual(conteos, {'low_spend': 1, 'medium_spend': 2, 'high_spend': 1, 'zero_spend': 1})
+        self.assertEqual(resp.context['total_clients'], 5)
+
+    def test_lista_por_segmento_paginada(self):
+        url = reverse('ventas:client_list_by_segment', args=['medium_spend'])
+        resp = self.client.get(url)
+        self.assertEqual([m.nombre for m in resp.context['page_obj']], ['Alto', 'Media'])
+        self.assertContains(resp, reverse('ventas:cliente_detalle', args=[Cliente.objects.get(nombre='Alto').id]))
+
+        original = reporting_views.CLIENTES_POR_PAGINA
+        reporting_views.CLIENTES_POR_PAGINA = 1
+        try:
+            resp = self.client.get(url, {'page': 2})
+        finally:
+            reporting_views.CLIENTES_POR_PAGINA = original
+        self.assertEqual([m.nombre for m in resp.context['page_obj']], ['Media'])
+        self.assertEqual(resp.context['page_obj'].paginator.num_pages, 2)
+
+    def test_filtro_personalizado(self):
+        url = reverse('ventas:client_list_custom_filter')
+        resp = self.client.get(url, {'gasto_min': 100000})
+        self.assertEqual([m.nombre for m in resp.context['page_obj']], ['Alta', 'Alto'])
+
+        resp = self.client.get(url, {'gasto_min': 100000, 'comuna': self.puerto_varas.id})
+        self.assertEqual([m.nombre for m in resp.context['page_obj']], ['Alta'])
+        self.assertIn('Puerto Varas', resp.context['segment_label'])
+
+        resp = self.client.get(url, {'gasto_max': 0, 'email_filter': 'sin_email'})
+        self.assertEqual([m.nombre for m in resp.context['page_obj']], ['Cero'])
+        self.assertEqual(resp.context['querystring'], 'gasto_max=0&email_filter=sin_email')
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""`ReservaServicio.minuto_inicio`: la hora como entero canónico.
+
+Lo que estos tests clavan:
+
+· save() escribe minutos desde la medianoche para cualquier forma de la hora.
+· La disponibilidad cuenta una reserva '9:00' en el slot '09:00' (antes el
+  filtro por string exacto no la veía y el slot figuraba libre).
+· `solapadas` detecta el cruce de bloques de varias horas, no solo el mismo slot.
+· El backfill de la migración deja las filas viejas iguales a las nuevas.
+
+Ejecutar:
+    python manage.py test ventas.tests_minuto_inicio
+"""
+from datetime import date
+from importlib import import_module
+
+from django.apps import apps
+from django.test import TestCase
+
+from ventas.calendar_utils import verificar_disponibilidad
+from ventas.models import Cliente, ReservaServicio, Servicio, VentaReserva, hora_a_minutos
+
+FECHA = date(2030, 11, 9)
+DIA = FECHA.strftime('%A').lower()
+
+
+class MinutoInicioTest(TestCase):
+
+    def setUp(self):
+        self.cabana = Servicio.objects.create(
+            nombre='Cabaña Arrayán', tipo_servicio='cabana', precio_base=90000,
+            duracion=180, capacidad_minima=1, capacidad_maxima=2,
+            slots_disponibles={DIA: ['09:00', '12:00', '16:00']})
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+
+    def _reservar(self, hora, personas=2):
+        return ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=self.cabana, fecha_agendamiento=FECHA,
+            hora_inicio=hora, cantidad_personas=personas)
+
+    def test_hora_a_minutos(self):
+        self.assertEqual(hora_a_minutos('16:00'), 960)
+        self.assertEqual(hora_a_minutos('16:00:00'), 960)
+        self.assertEqual(hora_a_minutos('9:30'), 570)
+        self.assertIsNone(hora_a_minutos('24:00'))
+        self.assertIsNone(hora_a_minutos('mediodía'))
+        self.assertIsNone(hora_a_minutos(None))
+
+    def test_save_escribe_minuto_inicio(self):
+        rs = self._reservar('9:00')
+        self.assertEqual(rs.minuto_inicio, 540)
+
+        rs.hora_inicio = '12:00'
+        rs.save(update_fields=['hora_inicio'])
+        rs.refresh_from_db()
+        self.assertEqual(rs.minuto_inicio, 720)
+
+    def test_disponibilidad_no_depende_del_formato_del_string(self):
+        self._reservar('9:00')
+        self.assertFalse(verificar_disponibilidad(self.cabana, FECHA, '09:00', 1))
+        self.assertTrue(verificar_disponibilidad(self.cabana, FECHA, '16:00', 2))
+
+    def test_solapadas_cruza_bloques_de_varias_horas(self):
+        nueve = self._reservar('09:00')   # 09:00–12:00
+        self._reservar('16:00')           # 16:00–19:00
+
+        self.assertEqual(list(ReservaServicio.solapadas(self.cabana, FECHA, hora_a_minutos('11:00'))), [nueve])
+        # Pegados (12:00 empieza cuando termina la de las 09:00) no se solapan.
+        self.assertFalse(ReservaServicio.solapadas(self.cabana, FECHA, hora_a_minutos('12:00'), 60).exists())
+        self.assertEqual(ReservaServicio.solapadas(self.cabana, FECHA, hora_a_minutos('10:00'), 8 * 60).count(), 2)
+
+    def test_backfill_de_la_migracion(self):
+        migracion = import_module('ventas.migrations.0136_reservaservicio_minuto_inicio')
+        rs = self._reservar('16:00')
+        rara = self._reservar('--:--')
+        ReservaServicio.objects.update(minuto_inicio=None)  # filas previas a la columna
+
+        migracion.backfill_minuto_inicio(apps, None)
+
+        rs.refresh_from_db()
+        rara.refresh_from_db()
+        self.assertEqual(rs.minuto_inicio, 960)
+        self.assertIsNone(rara.minuto_inicio)
@@ -9,8 +9,13 @@ Lo que estos tests clavan, en orden de gravedad:
   noches vendidas reconstruyendo con un feed a medias.
 · **Sin eco** — el bloqueo importado NO vuelve a salir en nuestro .ics.
 · Los bloqueos manuales de Jorge jamás se tocan ni dejan de exportarse.
+· Un feed igual al último espejo NO reescribe los bloqueos, pero el
+  overbooking contra reservas Aremko nuevas se revisa igual; los feeds se
+  leen en paralelo y con GET condicional.
 """
+import threading
 from datetime import date, timedelta
+from unittest import mock
 
 from django.test import TestCase
 from django.utils import timezone
@@ -164,6 +169,23 @@ class OverbookingTest(_SinSenalesDeVenta, TestCase):
         # ...y el choque sale con el ID para resolverlo a mano.
         self.assertEqual([o[0] for o in r['overbookings']], [self.venta.id])
 
+    def test_feed_sin_cambios_igual_revisa_las_reservas_nuevas(self):
+        self.cal.url_booking = 'https://ical.booking.com/v1/export?t=x'
+        self.cal.save()
+        feed = _ics((date(2026, 10, 8), date(2026, 10, 10), 'u1'))
+        sincronizar_todo(leer=lambda url: feed, hoy=HOY)
+        nueva = VentaReserva.objects.create(cliente=self.venta.cliente, total=0,
+                                            estado_reserva='confirmada')
+        ReservaServicio.objects.create(
+            venta_reserva=nueva, servicio=self.torre,
+            fecha_agendamiento=date(2026, 10, 9), hora_inicio='16:00',
+            cantidad_personas=2)
+
+        informes = sincronizar_todo(leer=lambda url: feed, hoy=HOY)
+
+        self.assertIn('intactos', informes[0])
+        self.assertIn(f'OVERBOOKING: RES-{nueva.id} choca con Booking 08/10→10/10', informes[0])
+
 
 class SinEcoTest(TestCase):
     """Lo importado de la OTA no puede volver a la OTA por nuestro .ics."""
@@ -232,3 +254,92 @@ class SincronizarTodoTest(TestCase):
         self.cal.url_booking = ''
         self.cal.save()
         self.assertEqual(sincronizar_todo(leer=lambda url: '', hoy=HOY), [])
+
+
+class FeedSinCambiosTest(TestCase):
+
+    def setUp(self):
+        self.torre = _cabana()
+        self.cal = CalendarioCabana.objects.create(
+            servicio=self.torre,
+            url_booking='https://ical.booking.com/v1/export?t=x')
+        self.feed = _ics((date(2026, 10, 5), date(2026, 10, 7), 'u1'))
+
+    def _ota(self):
+        return ServicioBloqueo.objects.filter(
+            servicio=self.torre, motivo__startswith=MOTIVO_PREFIJO_OTA)
+
+    def test_mismo_feed_no_reescribe_los_bloqueos(self):
+        sincronizar_todo(leer=lambda url: self.feed, hoy=HOY)
+        bloqueo_id = self._ota().get().id
+        primera_lectura = CalendarioCabana.objects.get(pk=self.cal.pk).ultima_lectura_ok
+
+        informes = sincronizar_todo(leer=lambda url: self.feed, hoy=HOY)
+
+        self.assertIn('intactos', informes[0])
+        self.assertEqual(self._ota().get().id, bloqueo_id)  # no se borró y recreó
+        self.cal.refresh_from_db()
+        self.assertGreater(self.cal.ultima_lectura_ok, primera_lectura)
+
+    def test_feed_distinto_o_forzar_reescriben(self):
+        sincronizar_todo(leer=lambda url: self.feed, hoy=HOY)
+        nuevo = _ics((date(2026, 10, 5), date(2026, 10, 7), 'u1'),
+                     (date(2026, 10, 20), date(2026, 10, 21), 'u2'))
+        sincronizar_todo(leer=lambda url: nuevo, hoy=HOY)
+        self.assertEqual(self._ota().count(), 2)
+
+        antes = set(self._ota().values_list('id', flat=True))
+        informes = sincronizar_todo(leer=lambda url: nuevo, hoy=HOY, forzar=True)
+        self.assertIn('2 bloqueos OTA', informes[0])
+        self.assertFalse(antes & set(self._ota().values_list('id', flat=True)))
+
+    def test_get_condicional_y_304(self):
+        ok = mock.Mock(status_code=200, text=self.feed,
+                       headers={'ETag': '"v1"', 'Last-Modified': 'Sat, 15 Aug 2026 10:00:00 GMT'})
+        with mock.patch('requests.get', return_value=ok):
+            sincronizar_todo(hoy=HOY)
+        self.cal.refresh_from_db()
+        self.assertEqual(self.cal.estado_lectura['Booking']['etag'], '"v1"')
+
+        no_cambio = mock.Mock(status_code=304, text='', headers={})
+        with mock.patch('requests.get', return_value=no_cambio) as get:
+            informes = sincronizar_todo(hoy=HOY)
+        headers = get.call_args.kwargs['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(headers['If-Modified-Since'], 'Sat, 15 Aug 2026 10:00:00 GMT')
+        self.assertIn('intactos', informes[0])
+        self.assertEqual(self._ota().count(), 1)
+
+    def test_304_de_un_feed_con_el_otro_cambiado_relee_completo(self):
+        self.cal.url_airbnb = 'https://www.airbnb.cl/calendar/ical/1.ics'
+        self.cal.save()
+        airbnb = _ics((date(2026, 11, 1), date(2026, 11, 3), 'a1'))
+        sincronizar_todo(leer=lambda url: airbnb if 'airbnb' in url else self.feed, hoy=HOY)
+
+        def get(url, timeout, headers):
+            if 'airbnb' in url and 'If-None-Match' in headers:
+                return mock.Mock(status_code=304, text='', headers={})
+            texto = airbnb if 'airbnb' in url else self.feed.replace('u1', 'u9')
+            return mock.Mock(status_code=200, text=texto, headers={'ETag': '"x"'})
+
+        self.cal.refresh_from_db()
+        self.cal.estado_lectura['Airbnb']['etag'] = '"a"'
+        self.cal.save(update_fields=['estado_lectura'])
+        with mock.patch('requests.get', side_effect=get):
+            sincronizar_todo(hoy=HOY)
+        # Se reconstruye con AMBOS feeds: el bloqueo de Airbnb no se pierde.
+        self.assertEqual(self._ota().count(), 2)
+
+    def test_los_feeds_se_leen_en_paralelo(self):
+        CalendarioCabana.objects.create(
+            servicio=_cabana('Cabaña Laurel'),
+            url_booking='https://ical.booking.com/v1/export?t=y')
+        # Cada lectura espera a la otra: en serie, la barrera vence y falla.
+        barrera = threading.Barrier(2, timeout=5)
+
+        def leer_lento(url):
+            barrera.wait()
+            return self.feed
+
+        informes = sincronizar_todo(leer=leer_lento, hoy=HOY)
+        self.assertFalse([i for i in informes if 'SIN CAMBIOS' in i])
@@ -0,0 +1,105 @@
+"""
+Tests de la caché de página completa de las páginas públicas
+(services/pagina_cache_service.py).
+
+Lo que estos tests clavan:
+    - La segunda visita anónima sale de la caché sin tocar la BD; los
+      parámetros de anuncios (gclid, fbclid) no abren entradas nuevas y
+      `?classic=1` sí.
+    - Cada visitante recibe SU token CSRF: un POST con el token de una página
+      servida desde la caché pasa la verificación.
+    - Con algo en el carrito, o con sesión de staff, la página se renderiza
+      para esa persona y no se guarda.
+    - Guardar un servicio descarta las páginas guardadas.
+    - La landing de Refugio guarda los UTM en la sesión aunque salga de la caché.
+
+Ejecutar:
+    python manage.py test ventas.tests_pagina_cache
+"""
+
+from __future__ import annotations
+
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+from ventas.models import CategoriaServicio, RefugioConfig, Servicio
+
+
+def _token(response):
+    return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+
+
+@override_settings(ALLOWED_HOSTS=['*'],
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class CachePaginaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        categoria = CategoriaServicio.objects.create(nombre='Tinas')
+        self.tina = Servicio.objects.create(
+            nombre='Tina Hornopirén', categoria=categoria, tipo_servicio='tina', precio_base=25000,
+            duracion=120, capacidad_minima=1, capacidad_maxima=4, activo=True, publicado_web=True)
+        config = RefugioConfig.get_solo()
+        config.activo = True
+        config.save()
+
+    def test_segunda_visita_sale_de_la_cache(self):
+        primera = Client().get('/')
+        self.assertEqual(primera['X-Cache-Pagina'], 'miss')
+        self.assertContains(primera, 'Tina Hornopirén')
+
+        with self.assertNumQueries(0):
+            segunda = Client().get('/?gclid=otro-clic')
+        self.assertEqual(segunda['X-Cache-Pagina'], 'hit')
+        self.assertContains(segunda, 'Tina Hornopirén')
+
+        self.assertEqual(Client().get('/?classic=1')['X-Cache-Pagina'], 'miss')
+        self.assertEqual(Client().get('/?classic=1&fbclid=x')['X-Cache-Pagina'], 'hit')
+
+    def test_token_csrf_propio_en_la_pagina_cacheada(self):
+        Client().get('/refugio/')
+        visitante = Client(enforce_csrf_checks=True)
+        pagina = visitante.get('/refugio/')
+        self.assertEqual(pagina['X-Cache-Pagina'], 'hit')
+        self.assertNotIn(b'__aremko_csrf__', pagina.content)
+
+        r = visitante.post('/ventas/subscribe/', {'email': 'ana@example.com',
+                                                  'csrfmiddlewaretoken': _token(pagina)})
+        self.assertEqual(r.status_code, 302)
+
+    def test_con_carrito_o_staff_no_usa_la_cache(self):
+        con_carrito = Client()
+        sesion = con_carrito.session
+        sesion['cart'] = {'servicios': [{'id': self.tina.id, 'nombre': self.tina.nombre}], 'total': 25000}
+        sesion.save()
+        r = con_carrito.get('/')
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn('X-Cache-Pagina', r)
+
+        staff = Client()
+        staff.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        self.assertNotIn('X-Cache-Pagina', staff.get('/'))
+
+        # Ninguna de las dos quedó guardada
+        self.assertEqual(Client().get('/')['X-Cache-Pagina'], 'miss')
+
+    def test_guardar_servicio_descarta_las_paginas(self):
+        Client().get('/')
+        self.tina.nombre = 'Tina Calbuco'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tina.save()
+
+        r = Client().get('/')
+        self.assertEqual(r['X-Cache-Pagina'], 'miss')
+        self.assertContains(r, 'Tina Calbuco')
+
+    def test_refugio_guarda_utm_aunque_salga_de_la_cache(self):
+        Client().get('/refugio/?utm_source=meta&gclid=1')
+        visitante = Client()
+        r = visitante.get('/refugio/?utm_source=meta&gclid=2')
+        self.assertEqual(r['X-Cache-Pagina'], 'hit')
+        self.assertEqual(visitante.session['refugio_utm'], {'utm_source': 'meta'})
+        self.assertEqual(Client().get('/refugio/?utm_source=google')['X-Cache-Pagina'], 'miss')
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Perfilado por request (`PerfiladoMiddleware` + `perfilado_service`).
+
+Lo que estos tests clavan:
+
+· Apagado (default) no mide nada: el middleware ni entra en la cadena.
+· Prendido, cada request deja una muestra por NOMBRE de URL con consultas,
+  tiempo y un header Server-Timing.
+· La misma consulta con distintos literales cuenta como la misma huella (N+1).
+· Las lecturas de `cache_ns` suman aciertos y fallos al request en curso.
+· El resumen da percentiles por vista y ordena de la peor p95 a la mejor.
+
+Ejecutar:
+    python manage.py test ventas.tests_perfilado
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ventas.models import Servicio
+from ventas.services import perfilado_service
+from ventas.services.cache_service import cache_ns
+
+FECHA = date(2030, 11, 9)
+
+
+class PerfiladoMiddlewareTest(TestCase):
+
+    def setUp(self):
+        perfilado_service.vaciar()
+        self.tina = Servicio.objects.create(
+            nombre='Tina Calbuco', tipo_servicio='tina', precio_base=25000, duracion=120,
+            capacidad_minima=1, capacidad_maxima=4,
+            slots_disponibles={FECHA.strftime('%A').lower(): ['14:00', '18:00']})
+
+    def _horas(self):
+        return self.client.get(reverse('ventas:get_available_hours'),
+                               {'servicio_id': self.tina.id, 'fecha': FECHA.isoformat()})
+
+    def test_apagado_no_mide(self):
+        respuesta = self._horas()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('Server-Timing', respuesta)
+        self.assertEqual(perfilado_service.muestras(), [])
+
+    @override_settings(PERFILADO_ACTIVO=True)
+    def test_prendido_deja_una_muestra_por_vista(self):
+        respuesta = self._horas()
+        self._horas()
+
+        self.assertIn('db;dur=', respuesta['Server-Timing'])
+        muestras = perfilado_service.muestras()
+        self.assertEqual([m['vista'] for m in muestras], ['ventas:get_available_hours'] * 2)
+        self.assertGreater(muestras[0]['consultas'], 0)
+        fila, = perfilado_service.resumen()
+        self.assertEqual((fila['vista'], fila['requests']), ('ventas:get_available_hours', 2))
+
+    @override_settings(PERFILADO_ACTIVO=True)
+    def test_tablero_solo_para_staff(self):
+        self.assertEqual(self.client.get(reverse('ventas:perfilado')).status_code, 302)
+        staff = User.objects.create_user('recepcion', password='x', is_staff=True)
+        self.client.force_login(staff)
+        self._horas()
+        respuesta = self.client.get(reverse('ventas:perfilado'))
+        self.assertContains(respuesta, 'ventas:get_available_hours')
+
+        self.client.post(reverse('ventas:perfilado'))
+        # Solo queda la muestra del GET que siguió al POST (el redirect no se sigue).
+        self.assertEqual([m['vista'] for m in perfilado_service.muestras()], ['ventas:perfilado'])
+
+
+class PerfiladoServiceTest(TestCase):
+
+    def setUp(self):
+        perfilado_service.vaciar()
+        cache.clear()
+
+    def test_huella_ignora_literales(self):
+        self.assertEqual(
+            perfilado_service.huella('SELECT * FROM t WHERE id = 17 AND nombre = \'Tina\''),
+            perfilado_service.huella('SELECT *  FROM t WHERE id = 18 AND nombre = \'Cabaña\''))
+        self.assertEqual(perfilado_service.huella('... WHERE id IN (1, 2, 3)'),
+                         perfilado_service.huella('... WHERE id IN (4, 5)'))
+
+    def test_n_mas_1(self):
+        medicion = perfilado_service.Medicion()
+        ejecutar = lambda sql, params, many, context: None  # noqa: E731
+        for servicio_id in range(7):
+            medicion.execute_wrapper(ejecutar, f'SELECT nombre FROM servicio WHERE id = {servicio_id}',
+                                     None, False, {})
+        medicion.execute_wrapper(ejecutar, 'SELECT 1', None, False, {})
+
+        self.assertEqual(medicion.consultas, 8)
+        (huella, veces), = medicion.duplicadas()
+        self.assertEqual((huella, veces), ('SELECT nombre FROM servicio WHERE id = ?', 7))
+
+    def test_lecturas_de_cache(self):
+        medicion, token = perfilado_service.iniciar()
+        try:
+            ns = cache_ns('catalogo')
+            ns.get('menu')
+            ns.set('menu', ['tinas'])
+            ns.get('menu')
+            ns.get_or_set('menu', lambda: ['otro'])
+        finally:
+            perfilado_service.terminar(token)
+        self.assertEqual((medicion.cache_aciertos, medicion.cache_fallos), (2, 1))
+
+        cache_ns('catalogo').get('menu')   # fuera de un request: no suma
+        self.assertEqual(medicion.cache_aciertos, 2)
+
+    def test_resumen_percentiles_y_orden(self):
+        rapida, lenta = perfilado_service.Medicion(), perfilado_service.Medicion()
+        lenta.consultas = 40
+        for ms in range(1, 101):
+            perfilado_service.guardar_muestra('ventas:rapida', 'GET', 200, ms / 10, rapida)
+        for ms in (100, 200, 900):
+            perfilado_service.guardar_muestra('ventas:lenta', 'GET', 500, ms, lenta)
+
+        lenta_fila, rapida_fila = perfilado_service.resumen()
+        self.assertEqual(lenta_fila['vista'], 'ventas:lenta')
+        self.assertEqual((lenta_fila['p50'], lenta_fila['max'], lenta_fila['errores']), (200, 900, 3))
+        self.assertEqual(lenta_fila['consultas_max'], 40)
+        self.assertEqual((rapida_fila['p50'], rapida_fila['p95'], rapida_fila['p99']), (5.0, 9.5, 9.9))
+        self.assertIsNone(rapida_fila['cache_ratio'])
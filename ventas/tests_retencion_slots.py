@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Checkout concurrente: slots retenidos durante el pago Flow y lock por (servicio, fecha).
+
+Lo que estos tests clavan:
+
+· Un slot retenido por otro pago en curso no se ofrece; el propio sí, y uno
+  vencido no cuenta.
+· Dos pagos Flow no pueden retener el mismo slot: el segundo no retiene nada
+  (tampoco desde la vista de checkout, que no deja la PendingReservation).
+· Confirmar el pago materializa la venta y suelta las retenciones.
+· Dos servicios del mismo carrito en el mismo slot cuentan juntos.
+· Validar un carrito cuesta lo mismo con 1 que con 5 servicios.
+· En PostgreSQL el lock es un solo SELECT con las claves en orden fijo.
+· Luna (`crear_reserva`) re-chequea bajo el lock: un slot que otro pago
+  retuvo después de su validación no se reserva.
+
+Ejecutar:
+    python manage.py test ventas.tests_retencion_slots
+"""
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import Client as HttpClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ventas.models import Cliente, PendingReservation, RetencionSlot, Servicio, VentaReserva
+from ventas.services import geo_service
+from ventas.services.reservation_service import (
+    SlotUnavailableError,
+    bloquear_slots,
+    materializar_venta_desde_carrito,
+    retener_slots_carrito,
+    validar_disponibilidad_carrito,
+)
+from ventas.views.flow_views import _materializar_pending_si_pago_exitoso
+
+FECHA = date(2030, 11, 9)
+DIA = FECHA.strftime('%A').lower()
+
+
+def _servicio(nombre, duracion=120, simultaneos=1):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio='tina', precio_base=25000, duracion=duracion,
+        capacidad_minima=1, capacidad_maxima=4, max_servicios_simultaneos=simultaneos,
+        slots_disponibles={DIA: ['10:00', '11:00', '14:00']})
+
+
+def _carrito(*items):
+    return {'servicios': [{'id': s.id, 'fecha': FECHA.isoformat(), 'hora': hora, 'cantidad_personas': 2}
+                          for s, hora in items],
+            'giftcards': [], 'total': 50000}
+
+
+class RetencionSlotsTest(TestCase):
+
+    def setUp(self):
+        self.tina = _servicio('Tina Calbuco')
+        self.cliente = Cliente.objects.create(nombre='Compradora', telefono='+56911111111')
+
+    def _pending(self, cart, minutos=60):
+        return PendingReservation.objects.create(
+            cliente=self.cliente, cart_data=cart, monto=50000,
+            expires_at=timezone.now() + timedelta(minutes=minutos))
+
+    def test_retencion_de_otro_pago_ocupa_el_slot(self):
+        cart = _carrito((self.tina, '10:00'))
+        pending = self._pending(cart)
+        retener_slots_carrito(pending)
+
+        # 11:00 se cruza con el bloque 10:00–12:00 retenido
+        self.assertEqual(len(validar_disponibilidad_carrito(_carrito((self.tina, '11:00')))), 1)
+        self.assertEqual(validar_disponibilidad_carrito(cart, pending=pending), [])
+
+        RetencionSlot.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(validar_disponibilidad_carrito(_carrito((self.tina, '11:00'))), [])
+
+    def test_dos_pagos_no_retienen_el_mismo_slot(self):
+        retener_slots_carrito(self._pending(_carrito((self.tina, '10:00'))))
+        otro_servicio = _servicio('Tina Osorno')
+        segundo = self._pending(_carrito((otro_servicio, '10:00'), (self.tina, '10:00')))
+
+        with self.assertRaises(SlotUnavailableError):
+            retener_slots_carrito(segundo)
+        self.assertFalse(segundo.retenciones.exists())
+
+    def test_confirmar_pago_materializa_y_suelta(self):
+        cart = _carrito((self.tina, '14:00'))
+        pending = self._pending(cart)
+        retener_slots_carrito(pending)
+        with self.assertRaises(SlotUnavailableError):
+            materializar_venta_desde_carrito(self.cliente, _carrito((self.tina, '14:00')))
+
+        venta = _materializar_pending_si_pago_exitoso(pending, 50000)
+
+        self.assertEqual(venta.reservaservicios.get().hora_inicio, '14:00')
+        self.assertFalse(RetencionSlot.objects.exists())
+        pending.refresh_from_db()
+        self.assertEqual(pending.estado, 'confirmado')
+
+    def test_mismo_slot_dos_veces_en_el_carrito(self):
+        cart = _carrito((self.tina, '10:00'), (self.tina, '11:00'))
+        self.assertEqual(validar_disponibilidad_carrito(cart), ['Slot 11:00 no disponible para Tina Calbuco'])
+
+        doble = _servicio('Tina Doble', simultaneos=2)
+        self.assertEqual(validar_disponibilidad_carrito(_carrito((doble, '10:00'), (doble, '10:00'))), [])
+
+    def test_consultas_fijas_por_carrito(self):
+        servicios = [_servicio(f'Tina {i}') for i in range(5)]
+        with self.assertNumQueries(4):
+            validar_disponibilidad_carrito(_carrito((servicios[0], '10:00')))
+        with self.assertNumQueries(4):
+            validar_disponibilidad_carrito(_carrito(*[(s, '10:00') for s in servicios]))
+
+    def test_lock_postgres_en_orden_fijo(self):
+        cursor = mock.MagicMock()
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            bloquear_slots([(9, FECHA), (3, FECHA + timedelta(days=1)), (3, FECHA), (9, FECHA)])
+
+        sql, (servicios, dias) = cursor.__enter__.return_value.execute.call_args.args
+        self.assertIn('pg_advisory_xact_lock(s, d)', sql)
+        self.assertEqual(servicios, [3, 3, 9])
+        self.assertEqual(dias, [FECHA.toordinal(), FECHA.toordinal() + 1, FECHA.toordinal()])
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class CheckoutFlowRetieneTest(TestCase):
+
+    def setUp(self):
+        # El lookup de ciudades es por proceso: otro test pudo dejarle ids de
+        # filas ya revertidas y el Cliente del checkout quedaría apuntando a ellas.
+        geo_service.get_lookup(refresh=True)
+
+    def _checkout(self, cart, telefono):
+        http = HttpClient()
+        sesion = http.session
+        sesion['cart'] = cart
+        sesion.save()
+        with mock.patch('ventas.services.meta_capi_service.send_schedule_event'):
+            return http.post(reverse('ventas:complete_checkout'), {
+                'nombre': 'Compradora Web', 'email': f'{telefono[-4:]}@example.com', 'telefono': telefono,
+                'metodo_pago': 'flow', 'region': 'extranjero',
+            }).json()
+
+    def test_segundo_checkout_del_mismo_slot_no_pasa(self):
+        tina = _servicio('Tina Hornopirén')
+        primero = self._checkout(_carrito((tina, '10:00')), '+56922222201')
+        self.assertTrue(primero['success'], primero)
+        self.assertEqual(RetencionSlot.objects.get().pending_reservation_id, primero['pending_id'])
+
+        segundo = self._checkout(_carrito((tina, '11:00')), '+56922222202')
+        self.assertFalse(segundo['success'])
+        self.assertIn('ya no están disponibles', segundo['error'])
+        self.assertEqual(PendingReservation.objects.count(), 1)
+
+
+@override_settings(LUNA_API_KEY='luna-test', ALLOWED_HOSTS=['*'])
+class LunaCrearReservaRetencionTest(TestCase):
+
+    def test_retencion_de_otro_pago_bajo_el_lock(self):
+        tina = _servicio('Tina Puntiagudo')
+        otro = Cliente.objects.create(nombre='Pagando en Flow', telefono='+56933333301')
+        pending = PendingReservation.objects.create(
+            cliente=otro, cart_data=_carrito((tina, '10:00')), monto=50000,
+            expires_at=timezone.now() + timedelta(minutes=30))
+        retener_slots_carrito(pending)
+
+        # La retención entra entre la validación previa y el lock: se simula
+        # dejando pasar la validación.
+        with mock.patch('ventas.views.luna_api_views.validar_disponibilidad_interna',
+                        return_value={'success': True}):
+            r = HttpClient().post('/api/luna/reservas/create/', {
+                'idempotency_key': 'luna-retencion-1',
+                'cliente': {'nombre': 'Cliente Luna', 'telefono': '+56933333302', 'email': 'luna@example.com',
+                            'documento_identidad': '11111111-1'},
+                'servicios': [{'servicio_id': tina.id, 'fecha': FECHA.isoformat(), 'hora': '11:00',
+                               'cantidad_personas': 2}],
+            }, content_type='application/json', HTTP_X_API_KEY='luna-test')
+
+        self.assertEqual(r.status_code, 409, r.content)
+        self.assertEqual(r.json()['errores'][0]['servicio_id'], tina.id)
+        self.assertFalse(VentaReserva.objects.exists())
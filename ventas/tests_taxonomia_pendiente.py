@@ -0,0 +1,153 @@
+"""
+Tests de la taxonomía incremental: cola TaxonomiaPendiente +
+`recalcular_taxonomia_clientes --pendientes`.
+
+Lo que estos tests clavan:
+    - Crear una reserva encola a su cliente al confirmar la transacción; un
+      guardado de la venta que no toca lo que leen las features no encola.
+    - Cambiar el cliente de una venta encola al de antes y al de ahora; el
+      estado previo lo guarda UN post_init compartido por los módulos de señales.
+    - --pendientes recalcula SOLO los encolados, por lotes, y vacía la cola.
+    - Un cliente que se vuelve a marcar mientras se recalcula sigue en la cola.
+    - --vencidas refresca las taxonomías calculadas antes de hoy (paso del
+      tiempo) y las deja con calculado_en de hoy aunque no cambien.
+
+Ejecutar:
+    python manage.py test ventas.tests_taxonomia_pendiente
+"""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models.signals import post_init
+from django.test import TestCase
+from django.utils import timezone
+
+from ventas.models import (
+    CategoriaServicio,
+    Cliente,
+    ClienteTaxonomia,
+    ReservaServicio,
+    Servicio,
+    TaxonomiaPendiente,
+    VentaReserva,
+)
+from ventas.services.taxonomia_pendiente_service import confirmar, encolar
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+class TaxonomiaPendienteBase(TestCase):
+
+    def setUp(self):
+        categoria = CategoriaServicio.objects.create(nombre='Tinas')
+        self.tina = Servicio.objects.create(
+            nombre='Tina Calbuco', categoria=categoria, tipo_servicio='tina', precio_base=30000,
+            duracion=60, capacidad_minima=1, capacidad_maxima=4, slots_disponibles=SLOTS,
+        )
+        self.n = 0
+        self.dia = 0
+
+    def _cliente(self):
+        self.n += 1
+        return Cliente.objects.create(nombre=f'Cliente {self.n}', telefono=f'+5691220{self.n:04d}',
+                                      email=f'cliente{self.n}@example.com')
+
+    def _reserva(self, cliente):
+        self.dia += 1
+        venta = VentaReserva.objects.create(cliente=cliente)
+        ReservaServicio.objects.create(
+            venta_reserva=venta, servicio=self.tina, fecha_agendamiento=date(2030, 7, self.dia),
+            hora_inicio='16:00', cantidad_personas=2)
+        return venta
+
+    def _pendientes(self, *args):
+        out = StringIO()
+        call_command('recalcular_taxonomia_clientes', '--pendientes', *args, stdout=out)
+        return out.getvalue()
+
+
+class EncolarTests(TaxonomiaPendienteBase):
+
+    def test_reserva_encola_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente = self._cliente()
+            venta = self._reserva(cliente)
+            self.assertFalse(TaxonomiaPendiente.objects.exists())
+        pendiente = TaxonomiaPendiente.objects.get()
+        self.assertEqual((pendiente.cliente_id, pendiente.motivo), (cliente.id, TaxonomiaPendiente.MOTIVO_RESERVA))
+
+        TaxonomiaPendiente.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.save(update_fields=['total'])
+        self.assertFalse(TaxonomiaPendiente.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.estado_pago = 'cancelado'
+            venta.save(update_fields=['estado_pago'])
+        self.assertTrue(TaxonomiaPendiente.objects.filter(cliente=cliente).exists())
+
+    def test_cambiar_de_cliente_encola_a_los_dos_con_un_solo_post_init(self):
+        receptores = [r for r in post_init._live_receivers(VentaReserva)
+                      if r.__module__.startswith('ventas.signals')]
+        self.assertEqual(len(receptores), 1)   # estado_previo, no uno por módulo
+
+        antes, despues = self._cliente(), self._cliente()
+        with self.captureOnCommitCallbacks(execute=True):
+            venta = VentaReserva.objects.get(pk=self._reserva(antes).pk)
+        TaxonomiaPendiente.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            venta.cliente = despues
+            venta.save()
+        self.assertEqual(set(TaxonomiaPendiente.objects.values_list('cliente_id', flat=True)),
+                         {antes.id, despues.id})
+
+    def test_remarcado_durante_el_lote_sigue_en_la_cola(self):
+        cliente = self._cliente()
+        encolar([cliente.id])
+        corte = timezone.now() - timedelta(seconds=1)
+        confirmar([cliente.id], corte)
+        self.assertTrue(TaxonomiaPendiente.objects.filter(cliente=cliente).exists())
+        confirmar([cliente.id], timezone.now())
+        self.assertFalse(TaxonomiaPendiente.objects.exists())
+
+
+class ProcesarPendientesTests(TaxonomiaPendienteBase):
+
+    def test_solo_recalcula_los_encolados_por_lotes(self):
+        encolados = [self._cliente() for _ in range(3)]
+        otro = self._cliente()
+        for cliente in (*encolados, otro):
+            self._reserva(cliente)
+        TaxonomiaPendiente.objects.all().delete()
+        encolar([c.id for c in encolados])
+
+        salida = self._pendientes('--batch-size', '2')
+
+        self.assertIn('3 clientes', salida)
+        self.assertEqual(set(ClienteTaxonomia.objects.values_list('cliente_id', flat=True)),
+                         {c.id for c in encolados})
+        self.assertFalse(TaxonomiaPendiente.objects.exists())
+        self.assertEqual(ClienteTaxonomia.objects.get(cliente=encolados[0]).total_visitas, 1)
+
+    def test_vencidas_refresca_aunque_no_cambie(self):
+        cliente = self._cliente()
+        self._reserva(cliente)
+        encolar([cliente.id])
+        self._pendientes()
+        ayer = timezone.now() - timedelta(days=1)
+        ClienteTaxonomia.objects.filter(cliente=cliente).update(calculado_en=ayer)
+
+        salida = self._pendientes('--vencidas', '10')
+
+        self.assertIn('(1 por paso del tiempo)', salida)
+        self.assertIn('1 sin cambios', salida)
+        self.assertEqual(ClienteTaxonomia.objects.get(cliente=cliente).calculado_en.date(),
+                         timezone.now().date())
+        self.assertFalse(TaxonomiaPendiente.objects.exists())
+        # Ya refrescada hoy: la siguiente corrida no la vuelve a tomar.
+        self.assertIn('(0 por paso del tiempo)', self._pendientes('--vencidas', '10'))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Recálculo de totales de VentaReserva agrupado (`totales_diferidos`).
+
+Antes cada línea guardada desde el inline del admin recalculaba la venta entera
+(5 aggregates + 2 save() completos). Lo que estos tests clavan:
+
+· Dentro de un bloque, N líneas = UN recálculo y UN UPDATE de la venta.
+· Fuera de un bloque el total sigue al día apenas se guarda la línea.
+· El recálculo escribe SOLO los campos de totales (update_fields).
+
+Ejecutar:
+    python manage.py test ventas.tests_totales_diferidos
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ventas.models import Cliente, ReservaServicio, Servicio, VentaReserva
+from ventas.services.totales_service import totales_diferidos
+from whatsapp_agent.tests.test_giftcards_luna import _SinSenalesDeVenta
+
+FECHA = date(2030, 11, 9)
+
+
+def _updates_de_venta(ctx):
+    return [q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE') and 'ventas_ventareserva' in q['sql']]
+
+
+class TotalesDiferidosTest(_SinSenalesDeVenta, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tina = Servicio.objects.create(
+            nombre='Tina Osorno', tipo_servicio='tina', precio_base=25000, duracion=120,
+            capacidad_minima=1, capacidad_maxima=20, max_servicios_simultaneos=10,
+            slots_disponibles={FECHA.strftime('%A').lower(): ['14:00']})
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+
+    def _linea(self, personas):
+        return ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=self.tina, fecha_agendamiento=FECHA,
+            hora_inicio='14:00', cantidad_personas=personas)
+
+    def test_un_solo_recalculo_por_bloque(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with totales_diferidos():
+                for personas in (1, 2, 3, 4):
+                    self._linea(personas)
+
+        self.assertEqual(len(_updates_de_venta(ctx)), 1)
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, Decimal('250000'))
+        self.assertEqual(self.venta.saldo_pendiente, Decimal('250000'))
+        self.assertEqual(self.venta.estado_pago, 'pendiente')
+
+    def test_fuera_de_bloque_recalcula_en_el_acto(self):
+        self._linea(2)
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, Decimal('50000'))
+
+        self._linea(2).delete()
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.total, Decimal('50000'))
+
+    def test_solo_escribe_campos_de_totales(self):
+        # Otro proceso cambió la venta; el recálculo no debe pisarlo.
+        VentaReserva.objects.filter(pk=self.venta.pk).update(comentarios='nota del staff')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.venta.calcular_total()
+
+        updates = _updates_de_venta(ctx)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('comentarios', updates[0])
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.comentarios, 'nota del staff')
@@ -0,0 +1,228 @@
+"""
+Tests de la cola de trabajos en segundo plano (Trabajo + procesar_trabajos).
+
+Lo que estos tests clavan:
+    - Encolar con `clave` no apila copias mientras haya uno activo; cuando
+      terminó, la misma clave se puede volver a encolar.
+    - `tomar` respeta la concurrencia de cada cola y no toma lo que todavía
+      no llega a `ejecutar_desde`.
+    - Un trabajo que falla vuelve a pendiente con backoff y queda fallido al
+      agotar max_intentos; uno cancelado mientras corría queda cancelado.
+    - `rescatar` devuelve a la cola lo que dejó de latir (worker muerto), no
+      lo que sigue latiendo aunque lleve horas.
+    - Un trabajo que pasa su tiempo máximo (por comando) queda fallido y
+      corta su worker.
+    - Sin --colas, `procesar_trabajos` levanta un worker por cupo de cola y
+      relanza el que muere.
+    - Los endpoints de cron encolan y responden sin correr el comando.
+
+Ejecutar:
+    python manage.py test ventas.tests_trabajos
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import Client as HttpClient, TestCase, override_settings
+from django.utils import timezone
+
+from ventas.models import Trabajo
+from ventas.services import trabajos_service
+
+@trabajos_service.tarea('_test_falla')
+def _tarea_que_falla(mensaje='boom'):
+    raise RuntimeError(mensaje)
+
+
+@trabajos_service.tarea('_test_ok')
+def _tarea_ok(valor=0):
+    return f'valor={valor}'
+
+
+class EncolarTests(TestCase):
+
+    def test_clave_no_apila_copias_mientras_este_activo(self):
+        primero, creado = trabajos_service.encolar('_test_ok', {'valor': 1}, clave='cron:x')
+        self.assertTrue(creado)
+        otro, creado = trabajos_service.encolar('_test_ok', {'valor': 2}, clave='cron:x')
+        self.assertFalse(creado)
+        self.assertEqual(otro.pk, primero.pk)
+
+        Trabajo.objects.filter(pk=primero.pk).update(estado=Trabajo.ESTADO_LISTO)
+        nuevo, creado = trabajos_service.encolar('_test_ok', clave='cron:x')
+        self.assertTrue(creado)
+        self.assertNotEqual(nuevo.pk, primero.pk)
+
+    def test_tarea_desconocida(self):
+        with self.assertRaises(ValueError):
+            trabajos_service.encolar('no_existe')
+
+    def test_cola_sin_worker(self):
+        with self.assertRaises(ValueError):
+            trabajos_service.encolar('_test_ok', cola='no_existe')
+
+
+class TomarTests(TestCase):
+
+    def test_respeta_concurrencia_por_cola_y_ejecutar_desde(self):
+        with mock.patch.dict(trabajos_service.CONCURRENCIA, {'campanas': 1, 'default': 2}):
+            a, _ = trabajos_service.encolar('_test_ok', cola='campanas')
+            trabajos_service.encolar('_test_ok', cola='campanas')
+            c, _ = trabajos_service.encolar('_test_ok', cola='default')
+            trabajos_service.encolar('_test_ok', cola='default',
+                                     ejecutar_desde=timezone.now() + timedelta(hours=1))
+
+            tomados = [trabajos_service.tomar(worker='w1') for _ in range(3)]
+
+        self.assertEqual([t.pk for t in tomados[:2]], [a.pk, c.pk])
+        # La segunda de 'campanas' espera (tope 1) y la de 'default' futura no se toma.
+        self.assertIsNone(tomados[2])
+        a.refresh_from_db()
+        self.assertEqual((a.estado, a.intentos, a.tomado_por), (Trabajo.ESTADO_CORRIENDO, 1, 'w1'))
+
+    def test_filtra_por_colas(self):
+        trabajos_service.encolar('_test_ok', cola='avisos')
+        self.assertIsNone(trabajos_service.tomar(['campanas']))
+        self.assertEqual(trabajos_service.tomar(['avisos']).cola, 'avisos')
+
+
+class EjecutarTests(TestCase):
+
+    def test_reintenta_con_backoff_y_queda_fallido(self):
+        trabajo, _ = trabajos_service.encolar('_test_falla', {'mensaje': 'smtp caído'}, max_intentos=2)
+
+        tomado = trabajos_service.tomar()
+        with self.assertLogs('ventas.services.trabajos_service', 'ERROR'):
+            self.assertEqual(trabajos_service.ejecutar(tomado), Trabajo.ESTADO_PENDIENTE)
+        trabajo.refresh_from_db()
+        self.assertIn('smtp caído', trabajo.error)
+        self.assertGreater(trabajo.ejecutar_desde, timezone.now())
+        self.assertIsNone(trabajos_service.tomar())  # todavía en backoff
+
+        Trabajo.objects.filter(pk=trabajo.pk).update(ejecutar_desde=timezone.now())
+        with self.assertLogs('ventas.services.trabajos_service', 'ERROR'):
+            self.assertEqual(trabajos_service.ejecutar(trabajos_service.tomar()), Trabajo.ESTADO_FALLIDO)
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos), (Trabajo.ESTADO_FALLIDO, 2))
+        self.assertIsNotNone(trabajo.terminado_en)
+
+    def test_cancelado_mientras_corre_queda_cancelado(self):
+        trabajo, _ = trabajos_service.encolar('_test_ok', {'valor': 3})
+        tomado = trabajos_service.tomar()
+        Trabajo.objects.filter(pk=trabajo.pk).update(estado=Trabajo.ESTADO_CANCELADO)
+        trabajos_service.ejecutar(tomado)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, Trabajo.ESTADO_CANCELADO)
+
+    def test_comando_guarda_la_salida(self):
+        trabajos_service.encolar_comando('procesar_trabajos', '--colas', 'ninguna', '--hasta-vaciar')
+        out = StringIO()
+        call_command('procesar_trabajos', '--hasta-vaciar', stdout=out)
+        trabajo = Trabajo.objects.get()
+        self.assertEqual(trabajo.estado, Trabajo.ESTADO_LISTO)
+        self.assertIn('0 trabajos procesados', trabajo.resultado)
+        self.assertIn('1 trabajos procesados', out.getvalue())
+
+
+class RescatarTests(TestCase):
+
+    def test_devuelve_a_la_cola_lo_que_dejo_de_latir(self):
+        colgado, _ = trabajos_service.encolar('_test_ok')
+        largo, _ = trabajos_service.encolar('_test_ok')
+        for trabajo in (colgado, largo):
+            trabajos_service.tomar(worker='muerto:1')
+        hace_rato = timezone.now() - timedelta(hours=3)
+        Trabajo.objects.filter(pk=colgado.pk).update(tomado_en=hace_rato, latido_en=hace_rato)
+        # Tomado hace horas pero sigue latiendo: una campaña larga, no se toca.
+        Trabajo.objects.filter(pk=largo.pk).update(tomado_en=hace_rato, latido_en=timezone.now())
+
+        with self.assertLogs('ventas.services.trabajos_service', 'WARNING'):
+            self.assertEqual(trabajos_service.rescatar(), 1)
+        colgado.refresh_from_db()
+        largo.refresh_from_db()
+        self.assertEqual(colgado.estado, Trabajo.ESTADO_PENDIENTE)
+        self.assertIn('muerto:1', colgado.error)
+        self.assertEqual(largo.estado, Trabajo.ESTADO_CORRIENDO)
+
+
+class VigilanteTests(TestCase):
+
+    def test_latido_y_tiempo_maximo_por_comando(self):
+        trabajos_service.encolar_comando('generar_exportaciones')
+        trabajo = trabajos_service.tomar(worker='w1')
+        cortes = []
+        vigilante = trabajos_service.Vigilante(trabajo, terminar=lambda: cortes.append(1))
+        self.assertEqual(vigilante.maximo, trabajos_service.TIEMPO_MAXIMO_COMANDO['generar_exportaciones'])
+
+        Trabajo.objects.filter(pk=trabajo.pk).update(latido_en=timezone.now() - timedelta(hours=1))
+        self.assertTrue(vigilante.latir())
+        trabajo.refresh_from_db()
+        self.assertGreater(trabajo.latido_en, timezone.now() - timedelta(minutes=1))
+
+        vigilante.limite = timezone.now() - timedelta(seconds=1)
+        with self.assertLogs('ventas.services.trabajos_service', 'ERROR'):
+            self.assertFalse(vigilante.latir())
+        trabajo.refresh_from_db()
+        self.assertEqual(cortes, [1])
+        self.assertEqual(trabajo.estado, Trabajo.ESTADO_PENDIENTE)
+        self.assertIn('tiempo máximo', trabajo.error)
+
+    def test_comando_sin_limite_propio_usa_el_default(self):
+        trabajos_service.encolar_comando('enviar_premios_aprobados', cola='avisos')
+        trabajo = trabajos_service.tomar()
+        self.assertEqual(trabajos_service.tiempo_maximo(trabajo), trabajos_service.TIEMPO_MAXIMO_DEFAULT)
+
+
+class SupervisorTests(TestCase):
+
+    def test_un_worker_por_cupo_y_relanza_el_que_muere(self):
+        from ventas.management.commands.procesar_trabajos import Command
+
+        lanzados = []
+
+        def popen(argv):
+            hijo = mock.Mock(pid=len(lanzados) + 100)
+            # El primero muere una vez; el resto sigue vivo.
+            hijo.poll.side_effect = [75, None] if not lanzados else None
+            hijo.poll.return_value = None
+            lanzados.append(argv[argv.index('--colas') + 1])
+            return hijo
+
+        comando = Command(stdout=StringIO())
+        vueltas = iter([False, True])
+
+        def dormir(_segundos):
+            comando._salir = next(vueltas)
+
+        with mock.patch.dict(trabajos_service.CONCURRENCIA, {'default': 2, 'avisos': 1, 'campanas': 1}, clear=True), \
+                mock.patch('ventas.management.commands.procesar_trabajos.subprocess.Popen', side_effect=popen), \
+                mock.patch('ventas.management.commands.procesar_trabajos.time.sleep', side_effect=dormir):
+            comando._salir = False
+            comando._supervisar({'espera': 1})
+
+        self.assertEqual(sorted(lanzados[:4]), ['avisos', 'campanas', 'default', 'default'])
+        self.assertEqual(lanzados[4:], [lanzados[0]])  # el que murió, relanzado en su cola
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class CronEncolaTests(TestCase):
+
+    def test_cron_encola_sin_correr_el_comando(self):
+        http = HttpClient()
+        with mock.patch.dict('os.environ', {'CRON_TOKEN': 'tok'}), \
+                mock.patch('ventas.services.trabajos_service.call_command') as comando:
+            r = http.get('/ventas/api/cron/cruzar-reservas-contactos-whatsapp/?token=tok')
+            r2 = http.get('/ventas/api/cron/cruzar-reservas-contactos-whatsapp/?token=tok')
+        comando.assert_not_called()
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertTrue(data['encolado'])
+        self.assertFalse(r2.json()['encolado'])
+        self.assertEqual(r2.json()['trabajo_id'], data['trabajo_id'])
+        trabajo = Trabajo.objects.get()
+        self.assertEqual(trabajo.argumentos['nombre'], 'cruzar_reservas_contactos_whatsapp')
+        self.assertEqual(trabajo.estado, Trabajo.ESTADO_PENDIENTE)
@@ -4,7 +4,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     api_views, availability_views, checkout_views, crud_views,
     flow_views, import_export_views, misc_views, public_views, reporting_views,
-    admin_views, mercadopago_views, giftcard_campaign_views, campaign_views, crm_views, premio_views, cron_views, giftcard_views, pack_descuento_views, analytics_views, email_campaign_views, visual_campaign_views, calendario_matriz_view, calendario_seleccion_view, resumen_reserva_view, tips_reserva_view, cotizacion_reserva_view, cotizacion_view, eliminar_reservas_no_pagadas_view, pagos_masajistas_views, diagnostico_views, diagnostico_test, diagnostico_simple, inventario_view, agenda_operativa_view, luna_api_views, agenda_masajes_view, ficha_masajista_view, ficha_reserva_view, recon_api_views, ical_views, embudo_luna_view
+    admin_views, mercadopago_views, giftcard_campaign_views, campaign_views, crm_views, premio_views, cron_views, giftcard_views, pack_descuento_views, analytics_views, email_campaign_views, visual_campaign_views, calendario_matriz_view, calendario_seleccion_view, resumen_reserva_view, tips_reserva_view, cotizacion_reserva_view, cotizacion_view, eliminar_reservas_no_pagadas_view, pagos_masajistas_views, diagnostico_views, diagnostico_test, diagnostico_simple, inventario_view, agenda_operativa_view, luna_api_views, agenda_masajes_view, ficha_masajista_view, ficha_reserva_view, recon_api_views, ical_views, embudo_luna_view, perfilado_view
 )
 from . import api # Keep api module import as is
 from . import views_comandas_cliente # Import comandas de clientes views
@@ -92,6 +92,8 @@ urlpatterns = [
     path('productos-vendidos/', reporting_views.productos_vendidos, name='productos_vendidos'),
     path('ventas/prebooking/', api.create_prebooking, name='create_prebooking'), # Keep using api module
     path('exportar-clientes/', import_export_views.exportar_clientes_excel, name='exportar_clientes_excel'),
+    path('exportaciones/', import_export_views.exportaciones, name='exportaciones'),
+    path('exportaciones/<int:pk>/descargar/', import_export_views.descargar_exportacion, name='descargar_exportacion'),
     path('clientes/', crud_views.lista_clientes, name='lista_clientes'),
     path('importar-clientes/', import_export_views.importar_clientes_excel, name='importar_clientes_excel'),
     # Importadores CRM
@@ -144,6 +146,7 @@ urlpatterns = [
     # Booking process URLs
     path('get-available-hours/', availability_views.get_available_hours, name='get_available_hours'),
     path('check-availability/', availability_views.check_slot_availability, name='check_slot_availability'), # Added URL
+    path('api/disponibilidad-rango/', availability_views.get_disponibilidad_rango, name='disponibilidad_rango'),
     path('get-slots-disponibles-para-bloquear/', availability_views.get_slots_disponibles_para_bloquear, name='get_slots_disponibles_para_bloquear'), # AJAX para admin bloqueo de slots
     path('add-to-cart/', checkout_views.add_to_cart, name='add_to_cart'),
     path('remove-from-cart/', checkout_views.remove_from_cart, name='remove_from_cart'),
@@ -282,6 +285,7 @@ urlpatterns = [
     path('diagnostico/giftcards/corregir-inconsistencias/', diagnostico_views.corregir_inconsistencias_giftcards, name='corregir_inconsistencias_giftcards'),
     path('diagnostico/test/', diagnostico_test.diagnostico_test, name='diagnostico_test'),
     path('diagnostico/simple/', diagnostico_simple.diagnostico_simple, name='diagnostico_simple'),
+    path('diagnostico/perfilado/', perfilado_view.perfilado, name='perfilado'),
     # === END GIFTCARD WIZARD ===
 
     # === LUNA AI API (WhatsApp Agent) ===
@@ -337,6 +341,10 @@ urlpatterns = [
     path('cron/seguimientos-masaje/', cron_views.cron_seguimientos_masaje, name='cron_seguimientos_masaje'),
     # Geo — clasificar clientes nuevos sin_clasificar (idempotente, respeta manuales)
     path('cron/normalizar-ciudades/', cron_views.cron_normalizar_ciudades, name='cron_normalizar_ciudades'),
+    # Taxonomía — recalcula solo los clientes encolados por cambios en sus reservas
+    path('cron/taxonomia-pendientes/', cron_views.cron_taxonomia_pendientes, name='cron_taxonomia_pendientes'),
+    # Exportaciones — escribe los reportes grandes encolados y purga los de más de 7 días
+    path('cron/generar-exportaciones/', cron_views.cron_generar_exportaciones, name='cron_generar_exportaciones'),
     # === END CRON JOBS ===
 
     # Pack Descuento Management
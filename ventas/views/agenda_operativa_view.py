@@ -14,7 +14,7 @@ from datetime import datetime, time, timedelta
 from collections import defaultdict
 import json
 import logging
-from ..models import ReservaServicio, ReservaProducto, VentaReserva, Comanda, DetalleComanda
+from ..models import VENTA_CANCELADA, ReservaServicio, ReservaProducto, VentaReserva, Comanda, DetalleComanda
 
 logger = logging.getLogger(__name__)
 
@@ -165,7 +165,7 @@ def salidas_para_checkout(hoy, dias_rezagados=DIAS_REZAGADOS_CHECKOUT):
         fecha_agendamiento__lte=ayer,
         venta_reserva__isnull=False,
     ).exclude(
-        venta_reserva__estado_reserva='cancelada'
+        VENTA_CANCELADA
     ).select_related('servicio', 'venta_reserva__cliente')
 
     # Agrupar por reserva: fecha de llegada, de última noche y qué cabañas.
@@ -426,7 +426,7 @@ def agenda_operativa(request):
         fecha_filtro,
         venta_reserva__isnull=False  # Asegurar que hay venta_reserva
     ).exclude(
-        venta_reserva__estado_reserva='cancelada'
+        VENTA_CANCELADA
     ).exclude(
         servicio__nombre__icontains='descuento'  # Excluir servicios de descuento
     ).select_related(
@@ -524,7 +524,7 @@ def agenda_operativa(request):
             servicio__nombre__icontains='desayuno',
             venta_reserva__isnull=False
         ).exclude(
-            venta_reserva__estado_reserva='cancelada'
+            VENTA_CANCELADA
         ).select_related(
             'servicio',
             'venta_reserva__cliente'
@@ -6,14 +6,14 @@ Proporciona dashboards con métricas de ventas, servicios y productos
 
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Sum, Count, Q, F, Value, CharField
-from django.db.models.functions import TruncMonth, TruncDate, ExtractWeekDay, Coalesce
+from django.db.models import Sum, Count, Q, Value, CharField
+from django.db.models.functions import TruncMonth, TruncDate, ExtractWeekDay
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
 
-from ..models import VentaReserva, ReservaServicio, ReservaProducto, Pago, Servicio, Producto, CategoriaServicio
+from ..models import Servicio, Producto, CategoriaServicio, HechoVentaDiaria
 from ..api_aremko_cli import calcular_reservas_por_programa_semanal
 
 
@@ -107,6 +107,17 @@ def actualizar_gasto_ads_aremko_cli(request):
     return redirect('ventas:analytics_dashboard_ventas')
 
 
+def _hechos(tipo, *filtros):
+    """Filas de la tabla de hechos diaria (HechoVentaDiaria) de `tipo` que cumplen
+    `filtros` (los Q() vacíos se ignoran). Los dashboards leen de acá en vez de
+    agregar ReservaServicio en cada carga: ver ventas/services/hechos_ventas_service.py."""
+    qs = HechoVentaDiaria.objects.filter(tipo=tipo)
+    for filtro in filtros:
+        if filtro:
+            qs = qs.filter(filtro)
+    return qs
+
+
 @staff_member_required
 def dashboard_ventas(request):
     """
@@ -143,20 +154,21 @@ def dashboard_ventas(request):
     try:
         # Dashboard de Ventas: Solo incluir ventas PAGADAS (importante para análisis financiero)
         # A diferencia del dashboard operativo, aquí SÍ filtramos por estado_pago='pagado'
+        # (filtros sobre HechoVentaDiaria: estados de la venta y fecha = fecha_reserva)
         filtro_base = Q(estado_reserva__in=['checkin', 'checkout', 'pendiente']) & Q(estado_pago='pagado')
 
         # Aplicar filtros de fecha (todo basado en fecha_reserva para dashboard de ventas)
         if start_date and end_date:
             # Rango personalizado
-            filtro_base &= Q(fecha_reserva__gte=start_date, fecha_reserva__lte=end_date)
+            filtro_base &= Q(fecha__gte=start_date, fecha__lte=end_date)
             periodo_texto = f"{start_date} a {end_date}"
         elif month:
             # Mes específico
-            filtro_base &= Q(fecha_reserva__year=year, fecha_reserva__month=int(month))
+            filtro_base &= Q(fecha__year=year, fecha__month=int(month))
             periodo_texto = f"{get_month_name(int(month))} {year}"
         else:
             # Todo el año
-            filtro_base &= Q(fecha_reserva__year=year)
+            filtro_base &= Q(fecha__year=year)
             periodo_texto = f"Año {year}"
 
         # Obtener categorías disponibles para el filtro
@@ -170,7 +182,7 @@ def dashboard_ventas(request):
         if categoria_id:
             try:
                 categoria = CategoriaServicio.objects.get(id=categoria_id)
-                filtro_categoria = Q(servicio__categoria_id=categoria_id)
+                filtro_categoria = Q(categoria_id=categoria_id)
                 categoria_nombre = categoria.nombre
                 periodo_texto += f" - {categoria.nombre}"
             except CategoriaServicio.DoesNotExist:
@@ -179,19 +191,14 @@ def dashboard_ventas(request):
         # ====================================================================
         # 1. VENTAS POR FAMILIA DE SERVICIOS (basado en fecha de venta)
         # ====================================================================
-        query_servicios_base = ReservaServicio.objects.filter(
-            venta_reserva__in=VentaReserva.objects.filter(filtro_base)
-        ).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_servicios_base = query_servicios_base.filter(filtro_categoria)
+        query_servicios_base = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO, filtro_base, filtro_categoria)
 
         ventas_por_familia = (
             query_servicios_base
             .values('servicio__categoria__nombre')
             .annotate(
-                total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad_servicios=Count('id')
+                total_ventas=Sum('total'),
+                cantidad_servicios=Sum('cantidad')
             )
             .order_by('-total_ventas')
         )
@@ -215,12 +222,12 @@ def dashboard_ventas(request):
                     # Rango personalizado: comparar el mismo rango del año anterior
                     start_anterior = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=365)).strftime('%Y-%m-%d')
                     end_anterior = (datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=365)).strftime('%Y-%m-%d')
-                    filtro_year_anterior &= Q(fecha_reserva__gte=start_anterior, fecha_reserva__lte=end_anterior)
-                    filtro_year_actual_comparativa &= Q(fecha_reserva__gte=start_date, fecha_reserva__lte=end_date)
+                    filtro_year_anterior &= Q(fecha__gte=start_anterior, fecha__lte=end_anterior)
+                    filtro_year_actual_comparativa &= Q(fecha__gte=start_date, fecha__lte=end_date)
                 elif month:
                     # Mismo mes del año anterior
-                    filtro_year_anterior &= Q(fecha_reserva__year=year_anterior, fecha_reserva__month=int(month))
-                    filtro_year_actual_comparativa &= Q(fecha_reserva__year=year, fecha_reserva__month=int(month))
+                    filtro_year_anterior &= Q(fecha__year=year_anterior, fecha__month=int(month))
+                    filtro_year_actual_comparativa &= Q(fecha__year=year, fecha__month=int(month))
                 else:
                     # Sin filtros: comparar desde inicio de año hasta HOY en ambos años
                     # Esto asegura que si estamos al 11 de enero de 2026, comparamos:
@@ -236,44 +243,36 @@ def dashboard_ventas(request):
                         dia_del_año = (hoy - inicio_actual).days
                         fin_anterior = inicio_anterior + timedelta(days=dia_del_año)
 
-                        filtro_year_anterior &= Q(fecha_reserva__gte=inicio_anterior, fecha_reserva__lte=fin_anterior)
-                        filtro_year_actual_comparativa &= Q(fecha_reserva__gte=inicio_actual, fecha_reserva__lte=hoy)
+                        filtro_year_anterior &= Q(fecha__gte=inicio_anterior, fecha__lte=fin_anterior)
+                        filtro_year_actual_comparativa &= Q(fecha__gte=inicio_actual, fecha__lte=hoy)
                     else:
                         # Si estamos viendo un año pasado, comparar todo el año
-                        filtro_year_anterior &= Q(fecha_reserva__year=year_anterior)
-                        filtro_year_actual_comparativa &= Q(fecha_reserva__year=year)
+                        filtro_year_anterior &= Q(fecha__year=year_anterior)
+                        filtro_year_actual_comparativa &= Q(fecha__year=year)
 
                 # Obtener ventas del año actual con el filtro correcto (mismo período que se compara)
-                query_servicios_actual = ReservaServicio.objects.filter(
-                    venta_reserva__in=VentaReserva.objects.filter(filtro_year_actual_comparativa)
-                ).exclude(servicio__isnull=True)
-
-                if filtro_categoria:
-                    query_servicios_actual = query_servicios_actual.filter(filtro_categoria)
+                query_servicios_actual = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO,
+                                                 filtro_year_actual_comparativa, filtro_categoria)
 
                 ventas_año_actual = (
                     query_servicios_actual
                     .values('servicio__categoria__nombre')
                     .annotate(
-                        total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                        cantidad_servicios=Count('id')
+                        total_ventas=Sum('total'),
+                        cantidad_servicios=Sum('cantidad')
                     )
                 )
 
                 # Obtener ventas del año anterior por categoría
-                query_servicios_anterior = ReservaServicio.objects.filter(
-                    venta_reserva__in=VentaReserva.objects.filter(filtro_year_anterior)
-                ).exclude(servicio__isnull=True)
-
-                if filtro_categoria:
-                    query_servicios_anterior = query_servicios_anterior.filter(filtro_categoria)
+                query_servicios_anterior = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO,
+                                                   filtro_year_anterior, filtro_categoria)
 
                 ventas_año_anterior = (
                     query_servicios_anterior
                     .values('servicio__categoria__nombre')
                     .annotate(
-                        total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                        cantidad_servicios=Count('id')
+                        total_ventas=Sum('total'),
+                        cantidad_servicios=Sum('cantidad')
                     )
                 )
 
@@ -330,19 +329,14 @@ def dashboard_ventas(request):
         # ====================================================================
         # 2. VENTAS POR SERVICIO INDIVIDUAL (Top 15) - basado en fecha de venta
         # ====================================================================
-        query_servicios_individual = ReservaServicio.objects.filter(
-            venta_reserva__in=VentaReserva.objects.filter(filtro_base)
-        ).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_servicios_individual = query_servicios_individual.filter(filtro_categoria)
+        query_servicios_individual = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO, filtro_base, filtro_categoria)
 
         ventas_por_servicio = (
             query_servicios_individual
             .values('servicio__nombre', 'servicio__categoria__nombre')
             .annotate(
-                total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad=Count('id')
+                total_ventas=Sum('total'),
+                cantidad=Sum('cantidad')
             )
             .order_by('-total_ventas')[:15]
         )
@@ -351,12 +345,10 @@ def dashboard_ventas(request):
         # 3. VENTAS POR PRODUCTO (Top 15)
         # ====================================================================
         ventas_por_producto = (
-            ReservaProducto.objects
-            .filter(venta_reserva__in=VentaReserva.objects.filter(filtro_base))
-            .exclude(producto__isnull=True)
+            _hechos(HechoVentaDiaria.TIPO_PRODUCTO, filtro_base)
             .values('producto__nombre')
             .annotate(
-                total_ventas=Sum(F('cantidad') * Coalesce(F('precio_unitario_venta'), F('producto__precio_base'))),
+                total_ventas=Sum('total'),
                 cantidad_vendida=Sum('cantidad')
             )
             .order_by('-total_ventas')[:15]
@@ -368,28 +360,24 @@ def dashboard_ventas(request):
         if filtro_categoria:
             # Si hay filtro de categoría, calcular ventas por día basado en servicios filtrados
             ventas_por_dia_semana = (
-                ReservaServicio.objects
-                .filter(venta_reserva__in=VentaReserva.objects.filter(filtro_base))
-                .exclude(servicio__isnull=True)
-                .filter(filtro_categoria)
-                .annotate(dia_semana=ExtractWeekDay('venta_reserva__fecha_reserva'))
+                _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO, filtro_base, filtro_categoria)
+                .annotate(dia_semana=ExtractWeekDay('fecha'))
                 .values('dia_semana')
                 .annotate(
-                    total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                    cantidad_reservas=Count('venta_reserva', distinct=True)
+                    total_ventas=Sum('total'),
+                    cantidad_reservas=Sum('reservas_categoria')
                 )
                 .order_by('dia_semana')
             )
         else:
             # Sin filtro de categoría, usar totales completos de VentaReserva
             ventas_por_dia_semana = (
-                VentaReserva.objects
-                .filter(filtro_base)
-                .annotate(dia_semana=ExtractWeekDay('fecha_reserva'))
+                _hechos(HechoVentaDiaria.TIPO_VENTA, filtro_base)
+                .annotate(dia_semana=ExtractWeekDay('fecha'))
                 .values('dia_semana')
                 .annotate(
                     total_ventas=Sum('total'),
-                    cantidad_reservas=Count('id')
+                    cantidad_reservas=Sum('cantidad')
                 )
                 .order_by('dia_semana')
             )
@@ -420,30 +408,28 @@ def dashboard_ventas(request):
         if not month:  # Solo si estamos viendo el año completo
             if filtro_categoria:
                 # Si hay filtro de categoría, calcular ventas mensuales de servicios filtrados
-                query_servicios_mes = ReservaServicio.objects.filter(
-                    venta_reserva__in=VentaReserva.objects.filter(Q(fecha_reserva__year=year) & Q(estado_pago='pagado'))
-                ).exclude(servicio__isnull=True).filter(filtro_categoria)
+                query_servicios_mes = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO,
+                                              Q(fecha__year=year) & Q(estado_pago='pagado'), filtro_categoria)
 
                 ventas_por_mes = (
                     query_servicios_mes
-                    .annotate(mes=TruncMonth('venta_reserva__fecha_reserva'))
+                    .annotate(mes=TruncMonth('fecha'))
                     .values('mes')
                     .annotate(
-                        total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                        cantidad_reservas=Count('venta_reserva', distinct=True)
+                        total_ventas=Sum('total'),
+                        cantidad_reservas=Sum('reservas_categoria')
                     )
                     .order_by('mes')
                 )
             else:
                 # Sin filtro de categoría, usar totales completos de VentaReserva
                 ventas_por_mes = (
-                    VentaReserva.objects
-                    .filter(Q(fecha_reserva__year=year) & Q(estado_pago='pagado'))
-                    .annotate(mes=TruncMonth('fecha_reserva'))
+                    _hechos(HechoVentaDiaria.TIPO_VENTA, Q(fecha__year=year) & Q(estado_pago='pagado'))
+                    .annotate(mes=TruncMonth('fecha'))
                     .values('mes')
                     .annotate(
                         total_ventas=Sum('total'),
-                        cantidad_reservas=Count('id')
+                        cantidad_reservas=Sum('cantidad')
                     )
                     .order_by('mes')
                 )
@@ -464,12 +450,11 @@ def dashboard_ventas(request):
         # 6. VENTAS POR FORMA DE PAGO
         # ====================================================================
         ventas_por_forma_pago = (
-            Pago.objects
-            .filter(venta_reserva__in=VentaReserva.objects.filter(filtro_base))
+            _hechos(HechoVentaDiaria.TIPO_PAGO, filtro_base)
             .values('metodo_pago')
             .annotate(
-                total_pagos=Sum('monto'),
-                cantidad_transacciones=Count('id')
+                total_pagos=Sum('total'),
+                cantidad_transacciones=Sum('cantidad')
             )
             .order_by('-total_pagos')
         )
@@ -498,23 +483,17 @@ def dashboard_ventas(request):
         # 7. RESUMEN GENERAL (Dashboard de Ventas)
         # ====================================================================
         # Calcular totales de servicios vendidos (con filtro de categoría si aplica)
-        query_total_servicios = ReservaServicio.objects.filter(
-            venta_reserva__in=VentaReserva.objects.filter(filtro_base)
-        ).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_total_servicios = query_total_servicios.filter(filtro_categoria)
+        query_total_servicios = _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO, filtro_base, filtro_categoria)
 
         total_servicios_result = query_total_servicios.aggregate(
-            total=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas'))
+            total=Sum('total'),
+            reservas=Sum('reservas_categoria')
         )
         total_servicios = float(total_servicios_result['total'] or 0)
 
         # Calcular totales de productos vendidos
-        total_productos_result = ReservaProducto.objects.filter(
-            venta_reserva__in=VentaReserva.objects.filter(filtro_base)
-        ).exclude(producto__isnull=True).aggregate(
-            total=Sum(F('cantidad') * Coalesce(F('precio_unitario_venta'), F('producto__precio_base')))
+        total_productos_result = _hechos(HechoVentaDiaria.TIPO_PRODUCTO, filtro_base).aggregate(
+            total=Sum('total')
         )
         total_productos = float(total_productos_result['total'] or 0)
 
@@ -524,18 +503,12 @@ def dashboard_ventas(request):
             total_ingresos = total_servicios + total_productos
 
             # Contar reservas que tienen al menos un servicio de la categoría filtrada
-            reservas_con_categoria = ReservaServicio.objects.filter(
-                venta_reserva__in=VentaReserva.objects.filter(filtro_base)
-            ).exclude(servicio__isnull=True).filter(filtro_categoria).values_list(
-                'venta_reserva_id', flat=True
-            ).distinct()
-
-            total_reservas = len(set(reservas_con_categoria))
+            total_reservas = total_servicios_result['reservas'] or 0
         else:
             # Sin filtro de categoría, usar totales completos de VentaReserva
-            ventas_totales = VentaReserva.objects.filter(filtro_base).aggregate(
+            ventas_totales = _hechos(HechoVentaDiaria.TIPO_VENTA, filtro_base).aggregate(
                 total_ingresos=Sum('total'),
-                total_reservas=Count('id')
+                total_reservas=Sum('cantidad')
             )
             total_ingresos = float(ventas_totales['total_ingresos'] or 0)
             total_reservas = ventas_totales['total_reservas'] or 0
@@ -707,24 +680,23 @@ def dashboard_operativo(request):
         # Para dashboard operativo: incluir todas las reservas con servicios agendados
         # No filtrar por estado_pago porque queremos ver todos los servicios programados
         # independientemente del estado de pago (importante para planificación operativa)
-        ventas_validas = VentaReserva.objects.filter(
-            Q(estado_reserva__in=['checkin', 'checkout', 'pendiente', 'confirmada'])
-            # Removido filtro de estado_pago para dashboard operativo
-        )
+        # (filtros sobre HechoVentaDiaria: estados de la venta y fecha = fecha_agendamiento)
+        ventas_validas = Q(estado_reserva__in=['checkin', 'checkout', 'pendiente', 'confirmada'])
+        # Removido filtro de estado_pago para dashboard operativo
 
         # Construir filtro para servicios basado en fecha_agendamiento
         filtro_servicios = Q()
         if start_date and end_date:
             # Rango personalizado
-            filtro_servicios = Q(fecha_agendamiento__gte=start_date, fecha_agendamiento__lte=end_date)
+            filtro_servicios = Q(fecha__gte=start_date, fecha__lte=end_date)
             periodo_texto = f"{start_date} a {end_date}"
         elif month:
             # Mes específico
-            filtro_servicios = Q(fecha_agendamiento__year=year, fecha_agendamiento__month=int(month))
+            filtro_servicios = Q(fecha__year=year, fecha__month=int(month))
             periodo_texto = f"{get_month_name(int(month))} {year}"
         else:
             # Todo el año
-            filtro_servicios = Q(fecha_agendamiento__year=year)
+            filtro_servicios = Q(fecha__year=year)
             periodo_texto = f"Año {year}"
 
         # Obtener categorías disponibles para el filtro
@@ -738,7 +710,7 @@ def dashboard_operativo(request):
         if categoria_id:
             try:
                 categoria = CategoriaServicio.objects.get(id=categoria_id)
-                filtro_categoria = Q(servicio__categoria_id=categoria_id)
+                filtro_categoria = Q(categoria_id=categoria_id)
                 categoria_nombre = categoria.nombre
                 periodo_texto += f" - {categoria.nombre}"
             except CategoriaServicio.DoesNotExist:
@@ -747,19 +719,15 @@ def dashboard_operativo(request):
         # ====================================================================
         # 1. SERVICIOS POR CATEGORÍA (fecha cuando se prestan)
         # ====================================================================
-        query_base = ReservaServicio.objects.filter(
-            venta_reserva__in=ventas_validas
-        ).filter(filtro_servicios).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_base = query_base.filter(filtro_categoria)
+        query_base = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas, filtro_servicios,
+                             filtro_categoria)
 
         servicios_por_categoria = (
             query_base
             .values('servicio__categoria__nombre')
             .annotate(
-                total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad_servicios=Count('id')
+                total_ventas=Sum('total'),
+                cantidad_servicios=Sum('cantidad')
             )
             .order_by('-total_ventas')
         )
@@ -777,9 +745,7 @@ def dashboard_operativo(request):
                 year_anterior = year - 1
 
                 # Filtro base para año anterior (sin filtro de estado_pago, igual que dashboard operativo)
-                ventas_validas_anterior = VentaReserva.objects.filter(
-                    Q(estado_reserva__in=['checkin', 'checkout', 'pendiente', 'confirmada'])
-                )
+                ventas_validas_anterior = Q(estado_reserva__in=['checkin', 'checkout', 'pendiente', 'confirmada'])
 
                 # Filtros de fecha para la comparativa
                 filtro_servicios_anterior = Q()
@@ -789,12 +755,12 @@ def dashboard_operativo(request):
                     # Rango personalizado: comparar el mismo rango del año anterior
                     start_anterior = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=365)).strftime('%Y-%m-%d')
                     end_anterior = (datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=365)).strftime('%Y-%m-%d')
-                    filtro_servicios_anterior = Q(fecha_agendamiento__gte=start_anterior, fecha_agendamiento__lte=end_anterior)
-                    filtro_servicios_actual_comparativa = Q(fecha_agendamiento__gte=start_date, fecha_agendamiento__lte=end_date)
+                    filtro_servicios_anterior = Q(fecha__gte=start_anterior, fecha__lte=end_anterior)
+                    filtro_servicios_actual_comparativa = Q(fecha__gte=start_date, fecha__lte=end_date)
                 elif month:
                     # Mismo mes del año anterior
-                    filtro_servicios_anterior = Q(fecha_agendamiento__year=year_anterior, fecha_agendamiento__month=int(month))
-                    filtro_servicios_actual_comparativa = Q(fecha_agendamiento__year=year, fecha_agendamiento__month=int(month))
+                    filtro_servicios_anterior = Q(fecha__year=year_anterior, fecha__month=int(month))
+                    filtro_servicios_actual_comparativa = Q(fecha__year=year, fecha__month=int(month))
                 else:
                     # Sin filtros: comparar desde inicio de año hasta HOY en ambos años
                     hoy = timezone.now().date()
@@ -808,44 +774,36 @@ def dashboard_operativo(request):
                         dia_del_año = (hoy - inicio_actual).days
                         fin_anterior = inicio_anterior + timedelta(days=dia_del_año)
 
-                        filtro_servicios_anterior = Q(fecha_agendamiento__gte=inicio_anterior, fecha_agendamiento__lte=fin_anterior)
-                        filtro_servicios_actual_comparativa = Q(fecha_agendamiento__gte=inicio_actual, fecha_agendamiento__lte=hoy)
+                        filtro_servicios_anterior = Q(fecha__gte=inicio_anterior, fecha__lte=fin_anterior)
+                        filtro_servicios_actual_comparativa = Q(fecha__gte=inicio_actual, fecha__lte=hoy)
                     else:
                         # Si estamos viendo un año pasado, comparar todo el año
-                        filtro_servicios_anterior = Q(fecha_agendamiento__year=year_anterior)
-                        filtro_servicios_actual_comparativa = Q(fecha_agendamiento__year=year)
+                        filtro_servicios_anterior = Q(fecha__year=year_anterior)
+                        filtro_servicios_actual_comparativa = Q(fecha__year=year)
 
                 # Obtener servicios del año actual con el filtro correcto
-                query_servicios_actual_yoy = ReservaServicio.objects.filter(
-                    venta_reserva__in=ventas_validas
-                ).filter(filtro_servicios_actual_comparativa).exclude(servicio__isnull=True)
-
-                if filtro_categoria:
-                    query_servicios_actual_yoy = query_servicios_actual_yoy.filter(filtro_categoria)
+                query_servicios_actual_yoy = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas,
+                                                     filtro_servicios_actual_comparativa, filtro_categoria)
 
                 servicios_año_actual = (
                     query_servicios_actual_yoy
                     .values('servicio__categoria__nombre')
                     .annotate(
-                        total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                        cantidad_servicios=Count('id')
+                        total_ventas=Sum('total'),
+                        cantidad_servicios=Sum('cantidad')
                     )
                 )
 
                 # Obtener servicios del año anterior
-                query_servicios_anterior_yoy = ReservaServicio.objects.filter(
-                    venta_reserva__in=ventas_validas_anterior
-                ).filter(filtro_servicios_anterior).exclude(servicio__isnull=True)
-
-                if filtro_categoria:
-                    query_servicios_anterior_yoy = query_servicios_anterior_yoy.filter(filtro_categoria)
+                query_servicios_anterior_yoy = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas_anterior,
+                                                       filtro_servicios_anterior, filtro_categoria)
 
                 servicios_año_anterior = (
                     query_servicios_anterior_yoy
                     .values('servicio__categoria__nombre')
                     .annotate(
-                        total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                        cantidad_servicios=Count('id')
+                        total_ventas=Sum('total'),
+                        cantidad_servicios=Sum('cantidad')
                     )
                 )
 
@@ -902,19 +860,15 @@ def dashboard_operativo(request):
         # ====================================================================
         # 2. TOP SERVICIOS (fecha cuando se prestan)
         # ====================================================================
-        query_top_servicios = ReservaServicio.objects.filter(
-            venta_reserva__in=ventas_validas
-        ).filter(filtro_servicios).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_top_servicios = query_top_servicios.filter(filtro_categoria)
+        query_top_servicios = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas, filtro_servicios,
+                                      filtro_categoria)
 
         top_servicios = (
             query_top_servicios
             .values('servicio__nombre', 'servicio__categoria__nombre')
             .annotate(
-                total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad=Count('id')
+                total_ventas=Sum('total'),
+                cantidad=Sum('cantidad')
             )
             .order_by('-total_ventas')[:15]
         )
@@ -922,20 +876,16 @@ def dashboard_operativo(request):
         # ====================================================================
         # 3. SERVICIOS POR DÍA DE LA SEMANA (cuando se prestan)
         # ====================================================================
-        query_servicios_dia = ReservaServicio.objects.filter(
-            venta_reserva__in=ventas_validas
-        ).filter(filtro_servicios).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_servicios_dia = query_servicios_dia.filter(filtro_categoria)
+        query_servicios_dia = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas, filtro_servicios,
+                                      filtro_categoria)
 
         servicios_por_dia = (
             query_servicios_dia
-            .annotate(dia_semana=ExtractWeekDay('fecha_agendamiento'))
+            .annotate(dia_semana=ExtractWeekDay('fecha'))
             .values('dia_semana')
             .annotate(
-                total_servicios=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad_servicios=Count('id')
+                total_servicios=Sum('total'),
+                cantidad_servicios=Sum('cantidad')
             )
             .order_by('dia_semana')
         )
@@ -965,20 +915,16 @@ def dashboard_operativo(request):
         # ====================================================================
         servicios_por_mes = []
         if not month:  # Solo si estamos viendo el año completo
-            query_servicios_mes = ReservaServicio.objects.filter(
-                venta_reserva__in=ventas_validas
-            ).filter(fecha_agendamiento__year=year).exclude(servicio__isnull=True)
-
-            if filtro_categoria:
-                query_servicios_mes = query_servicios_mes.filter(filtro_categoria)
+            query_servicios_mes = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas,
+                                          Q(fecha__year=year), filtro_categoria)
 
             servicios_por_mes = (
                 query_servicios_mes
-                .annotate(mes=TruncMonth('fecha_agendamiento'))
+                .annotate(mes=TruncMonth('fecha'))
                 .values('mes')
                 .annotate(
-                    total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                    cantidad_servicios=Count('id')
+                    total_ventas=Sum('total'),
+                    cantidad_servicios=Sum('cantidad')
                 )
                 .order_by('mes')
             )
@@ -996,19 +942,17 @@ def dashboard_operativo(request):
         # 5. RESUMEN OPERATIVO
         # ====================================================================
         # Total de servicios agendados en el período
-        query_total_servicios = ReservaServicio.objects.filter(
-            venta_reserva__in=ventas_validas
-        ).filter(filtro_servicios).exclude(servicio__isnull=True)
-
-        if filtro_categoria:
-            query_total_servicios = query_total_servicios.filter(filtro_categoria)
+        query_total_servicios = _hechos(HechoVentaDiaria.TIPO_SERVICIO_AGENDADO, ventas_validas, filtro_servicios,
+                                        filtro_categoria)
 
+        # Reservas únicas por día de servicio: una venta con servicios en dos días
+        # cuenta en cada uno (ver hechos_ventas_service).
         total_servicios_result = (
             query_total_servicios
             .aggregate(
-                total=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-                cantidad=Count('id'),
-                reservas_unicas=Count('venta_reserva', distinct=True)
+                total=Sum('total'),
+                cantidad=Sum('cantidad'),
+                reservas_unicas=Sum('reservas_categoria' if filtro_categoria else 'reservas')
             )
         )
 
@@ -1286,86 +1230,71 @@ def dashboard_giftcards(request):
 @staff_member_required
 def exportar_estadisticas_csv(request):
     """
-    Exporta estadísticas a CSV
+    Exporta estadísticas a CSV (en streaming, ver exportacion_service)
 
     GET /ventas/analytics/export-csv/?year=2025&month=11
     """
-    import csv
-    from django.http import HttpResponse
+    from ventas.services.exportacion_service import FILAS_POR_TROZO, respuesta_csv
 
     # Obtener los mismos filtros que el dashboard
     year = int(request.GET.get('year', timezone.now().year))
     month = request.GET.get('month', None)
 
-    # Construir query (mismo que dashboard)
+    # Construir query (mismo que dashboard, sobre la tabla de hechos)
     filtro_base = Q(estado_reserva__in=['checkin', 'checkout', 'pendiente']) & Q(estado_pago='pagado')
 
     if month:
-        filtro_base &= Q(fecha_reserva__year=year, fecha_reserva__month=int(month))
+        filtro_base &= Q(fecha__year=year, fecha__month=int(month))
         filename = f"aremko_estadisticas_{year}_{int(month):02d}.csv"
     else:
-        filtro_base &= Q(fecha_reserva__year=year)
+        filtro_base &= Q(fecha__year=year)
         filename = f"aremko_estadisticas_{year}.csv"
 
-    # Crear response CSV
-    response = HttpResponse(content_type='text/csv; charset=utf-8')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write('\ufeff')  # BOM para Excel
-
-    writer = csv.writer(response)
-
-    # Header
-    writer.writerow(['ESTADÍSTICAS AREMKO'])
-    writer.writerow(['Periodo', f"{get_month_name(int(month)) if month else 'Año'} {year}"])
-    writer.writerow([])
-
-    # Ventas por servicio
-    writer.writerow(['VENTAS POR SERVICIO'])
-    writer.writerow(['Servicio', 'Categoría', 'Total Ventas', 'Cantidad'])
-
     ventas_servicio = (
-        ReservaServicio.objects
-        .filter(venta_reserva__in=VentaReserva.objects.filter(filtro_base))
-        .exclude(servicio__isnull=True)
+        _hechos(HechoVentaDiaria.TIPO_SERVICIO_VENDIDO, filtro_base)
         .values('servicio__nombre', 'servicio__categoria__nombre')
         .annotate(
-            total_ventas=Sum(Coalesce(F('precio_unitario_venta'), F('servicio__precio_base')) * F('cantidad_personas')),
-            cantidad=Count('id')
+            total_ventas=Sum('total'),
+            cantidad=Sum('cantidad')
         )
         .order_by('-total_ventas')
     )
-
-    for item in ventas_servicio:
-        writer.writerow([
-            item['servicio__nombre'],
-            item['servicio__categoria__nombre'] or 'Sin categoría',
-            f"${item['total_ventas']:,.0f}",
-            item['cantidad']
-        ])
-
-    writer.writerow([])
-
-    # Ventas por producto
-    writer.writerow(['VENTAS POR PRODUCTO'])
-    writer.writerow(['Producto', 'Total Ventas', 'Cantidad Vendida'])
-
     ventas_producto = (
-        ReservaProducto.objects
-        .filter(venta_reserva__in=VentaReserva.objects.filter(filtro_base))
-        .exclude(producto__isnull=True)
+        _hechos(HechoVentaDiaria.TIPO_PRODUCTO, filtro_base)
         .values('producto__nombre')
         .annotate(
-            total_ventas=Sum(F('cantidad') * Coalesce(F('precio_unitario_venta'), F('producto__precio_base'))),
+            total_ventas=Sum('total'),
             cantidad_vendida=Sum('cantidad')
         )
         .order_by('-total_ventas')
     )
 
-    for item in ventas_producto:
-        writer.writerow([
-            item['producto__nombre'],
-            f"${item['total_ventas']:,.0f}",
-            item['cantidad_vendida']
-        ])
+    def filas():
+        # Header
+        yield ['ESTADÍSTICAS AREMKO']
+        yield ['Periodo', f"{get_month_name(int(month)) if month else 'Año'} {year}"]
+        yield []
+
+        # Ventas por servicio
+        yield ['VENTAS POR SERVICIO']
+        yield ['Servicio', 'Categoría', 'Total Ventas', 'Cantidad']
+        for item in ventas_servicio.iterator(chunk_size=FILAS_POR_TROZO):
+            yield [
+                item['servicio__nombre'],
+                item['servicio__categoria__nombre'] or 'Sin categoría',
+                f"${item['total_ventas']:,.0f}",
+                item['cantidad']
+            ]
+        yield []
+
+        # Ventas por producto
+        yield ['VENTAS POR PRODUCTO']
+        yield ['Producto', 'Total Ventas', 'Cantidad Vendida']
+        for item in ventas_producto.iterator(chunk_size=FILAS_POR_TROZO):
+            yield [
+                item['producto__nombre'],
+                f"${item['total_ventas']:,.0f}",
+                item['cantidad_vendida']
+            ]
 
-    return response
+    return respuesta_csv(filename, None, filas())
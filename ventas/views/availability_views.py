@@ -1,8 +1,11 @@
+import logging
 import traceback
 from datetime import datetime
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
-from ..models import Servicio, ReservaServicio, ServicioBloqueo # Relative imports
+from ..models import VENTA_CANCELADA, Servicio, ReservaServicio, ServicioBloqueo, hora_a_minutos # Relative imports
+
+logger = logging.getLogger(__name__)
 
 def _hhmm(valor):
     """'16:00:00' / time(16,0) / '16:00' → '16:00'. '' si no se puede."""
@@ -44,30 +47,17 @@ def hora_es_slot_del_dia(servicio, fecha, hora):
 # Helper function to check slot availability (used internally or by other views)
 def is_slot_available(servicio, fecha, hora):
     """Checks if a specific service slot (date and time) is available."""
-    from ventas.models import ServicioSlotBloqueo
-
-    # CRITICAL 1: Check if the service is blocked by DAY (día completo)
-    if ServicioBloqueo.servicio_bloqueado_en_fecha(servicio.id, fecha):
-        return False
+    from ventas.services.disponibilidad_service import cargar_ocupacion_dia
 
-    # CRITICAL 2: Check if the specific SLOT is blocked (bloqueo de slot individual)
-    if ServicioSlotBloqueo.slot_bloqueado(servicio.id, fecha, hora):
-        return False
-
-    # CRITICAL 3: la hora tiene que EXISTIR en la grilla de ese día de la semana.
+    # CRITICAL: la hora tiene que EXISTIR en la grilla de ese día de la semana.
     # Faltaba, y era el agujero del martes: el día cerrado no tiene slots, pero
     # como tampoco tiene reservas, todo pasaba como "disponible".
     if not hora_es_slot_del_dia(servicio, fecha, hora):
         return False
 
-    # Check if there are any existing reservations for this service, date and time
-    existing_reservas = ReservaServicio.objects.filter(
-        servicio=servicio,
-        fecha_agendamiento=fecha,
-        hora_inicio=hora
-    )
-    # If there are no existing reservations, the slot is available
-    return not existing_reservas.exists()
+    # Bloqueo de día, bloqueo de slot y cupo por intervalo (reservas que se
+    # cruzan + retenciones de pagos en curso): la misma regla del checkout.
+    return cargar_ocupacion_dia([servicio.id], fecha).cupos_libres(servicio, hora) > 0
 
 def get_available_hours(request):
     """
@@ -82,74 +72,33 @@ def get_available_hours(request):
     try:
         servicio = get_object_or_404(Servicio, id=servicio_id)
         fecha_obj = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-        print(f"[get_available_hours] Date requested: {fecha_obj}") # Debug date
+        logger.debug("[get_available_hours] Date requested: %s", fecha_obj)
 
-        # CRITICAL: Check if service is blocked on this date
-        if ServicioBloqueo.servicio_bloqueado_en_fecha(servicio_id, fecha_obj):
-            print(f"[get_available_hours] Service {servicio_id} is BLOCKED on {fecha_obj}")
+        # Bloqueos y bloques ocupados del día en 3 consultas; el cupo de cada
+        # slot es el del checkout (cruce de intervalos + retenciones vigentes).
+        from ventas.services.disponibilidad_service import cargar_ocupacion_dia
+        ocupacion = cargar_ocupacion_dia([servicio.id], fecha_obj)
+
+        if ocupacion.servicio_bloqueado(servicio.id):
+            logger.debug("[get_available_hours] Service %s is BLOCKED on %s", servicio_id, fecha_obj)
             return JsonResponse({'success': True, 'horas_disponibles': [], 'bloqueado': True})
 
         day_name = fecha_obj.strftime('%A').lower() # Get day name in English lowercase (e.g., 'monday')
-        print(f"[get_available_hours] Day name calculated: {day_name}") # Debug day name
-
-        # --- Get slots for the specific day from the JSON field ---
-        print(f"[get_available_hours] Raw slots_disponibles from DB for service {servicio.id}: {servicio.slots_disponibles}") # Debug raw data
-        print(f"[get_available_hours] Type of slots_disponibles: {type(servicio.slots_disponibles)}") # Debug type
         # Ensure slots_disponibles is a dict
         daily_slots_config = servicio.slots_disponibles if isinstance(servicio.slots_disponibles, dict) else {}
-        print(f"[get_available_hours] Interpreted daily_slots_config: {daily_slots_config}") # Debug interpreted dict
         available_slots_for_day = daily_slots_config.get(day_name, []) # Get slots for the specific day, default to empty list
-        print(f"[get_available_hours] Slots found for {day_name}: {available_slots_for_day}") # Debug slots for the day
+        logger.debug("[get_available_hours] Slots found for %s: %s", day_name, available_slots_for_day)
 
         if not available_slots_for_day:
              # If no specific slots defined for the day, return empty.
-             print(f"[get_available_hours] No slots defined in JSON for service {servicio_id} on {day_name}")
+             logger.debug("[get_available_hours] No slots defined in JSON for service %s on %s", servicio_id, day_name)
              return JsonResponse({'success': True, 'horas_disponibles': []})
 
-        # --- Get existing reservations for this service on this date ---
-        from django.db.models import Count
-        reservas_por_hora = ReservaServicio.objects.filter(
-            servicio=servicio,
-            fecha_agendamiento=fecha_obj
-        ).values('hora_inicio').annotate(cantidad=Count('id'))
-
-        # Crear diccionario de slots ocupados con su cantidad
-        slots_ocupacion = {str(r['hora_inicio']): r['cantidad'] for r in reservas_por_hora}
-        print(f"[get_available_hours] Slots ocupation for {fecha_obj}: {slots_ocupacion}") # Debug slots occupation
-
-        # Obtener capacidad de servicios simultáneos del servicio
-        max_simultaneos = getattr(servicio, 'max_servicios_simultaneos', 1)
-        print(f"[get_available_hours] Servicio {servicio.nombre} max_servicios_simultaneos: {max_simultaneos}") # Debug capacity
-
-        # --- Get blocked slots (bloqueos de slot individuales) ---
-        from ventas.models import ServicioSlotBloqueo
-        bloqueos_slot = ServicioSlotBloqueo.objects.filter(
-            servicio=servicio,
-            fecha=fecha_obj,
-            activo=True
-        ).values_list('hora_slot', flat=True)
-        slots_bloqueados_set = set(bloqueos_slot)
-        print(f"[get_available_hours] Blocked slots: {slots_bloqueados_set}") # Debug blocked slots
-
-        # --- Filter available slots considering capacity AND slot blocks ---
-        # Un slot está disponible si:
-        # 1. Tiene menos reservas que el máximo de servicios simultáneos
-        # 2. NO está bloqueado individualmente
-        horas_disponibles = []
-        for hora in available_slots_for_day:
-            hora_str = str(hora)
-
-            # Verificar si está bloqueado
-            if hora_str in slots_bloqueados_set:
-                print(f"[get_available_hours] Slot {hora_str} is BLOCKED - skipping")
-                continue
-
-            # Verificar capacidad
-            reservas_existentes = slots_ocupacion.get(hora_str, 0)
-            if reservas_existentes < max_simultaneos:
-                horas_disponibles.append(hora_str)
-
-        print(f"[get_available_hours] Filtered available hours: {horas_disponibles}") # Debug filtered list
+        # Un slot está disponible si NO está bloqueado y le queda cupo
+        # (`max_servicios_simultaneos` menos el pico de bloques que se cruzan).
+        horas_disponibles = [str(hora) for hora in available_slots_for_day
+                             if ocupacion.cupos_libres(servicio, str(hora)) > 0]
+        logger.debug("[get_available_hours] Filtered available hours: %s", horas_disponibles)
 
         # --- Sort the final list ---
         # Sort based on time (assuming HH:MM format)
@@ -157,7 +106,7 @@ def get_available_hours(request):
             horas_disponibles.sort(key=lambda x: datetime.strptime(x, '%H:%M').time())
         except ValueError:
             horas_disponibles.sort() # Fallback to string sort if format is unexpected
-        print(f"[get_available_hours] Final sorted list: {horas_disponibles}") # Debug final list
+        logger.debug("[get_available_hours] Final sorted list: %s", horas_disponibles)
 
         return JsonResponse({'success': True, 'horas_disponibles': horas_disponibles})
 
@@ -166,11 +115,10 @@ def get_available_hours(request):
         return JsonResponse({'success': False, 'error': 'Servicio no encontrado'}, status=404)
     except ValueError as e:
         # Handle potential date parsing errors
-        print(f"Error parsing date in get_available_hours: {e}")
+        logger.warning("Error parsing date in get_available_hours: %s", e)
         return JsonResponse({'success': False, 'error': f'Error de formato de fecha: {str(e)}'}, status=400)
     except Exception as e:
-        print(f"Error en get_available_hours: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error en get_available_hours: %s", str(e))
         return JsonResponse({'success': False, 'error': f'Error interno: {str(e)}'}, status=500)
 
 def check_slot_availability(request):
@@ -248,10 +196,10 @@ def get_slots_disponibles_para_bloquear(request):
             servicio=servicio,
             fecha_agendamiento=fecha_obj
         ).exclude(
-            venta_reserva__estado_reserva='cancelada'
-        ).values('hora_inicio').annotate(cantidad=Count('id'))
+            VENTA_CANCELADA
+        ).values('minuto_inicio').annotate(cantidad=Count('id')).order_by()
 
-        slots_ocupados = {r['hora_inicio']: r['cantidad'] for r in reservas_por_hora}
+        slots_ocupados = {r['minuto_inicio']: r['cantidad'] for r in reservas_por_hora}
 
         # 4. Obtener bloqueos de slot existentes
         from ventas.models import ServicioSlotBloqueo
@@ -275,7 +223,7 @@ def get_slots_disponibles_para_bloquear(request):
                 continue
 
             # Verificar si tiene capacidad disponible
-            reservas_existentes = slots_ocupados.get(hora_str, 0)
+            reservas_existentes = slots_ocupados.get(hora_a_minutos(hora_str), 0)
             if reservas_existentes < max_simultaneos:
                 slots_disponibles.append(hora_str)
 
@@ -292,3 +240,85 @@ def get_slots_disponibles_para_bloquear(request):
         print(f"Error en get_slots_disponibles_para_bloquear: {str(e)}")
         traceback.print_exc()
         return JsonResponse({'success': False, 'error': f'Error interno: {str(e)}'}, status=500)
+
+
+# Tope del rango y de servicios por consulta: la grilla es para "qué días del
+# próximo mes", no para bajarse el año entero de una vez.
+MAX_DIAS_RANGO = 62
+MAX_SERVICIOS_RANGO = 30
+
+
+def get_disponibilidad_rango(request):
+    """
+    API endpoint: cupos libres por día y por slot para N servicios en un rango.
+
+    GET ?servicios=3,7,12&desde=YYYY-MM-DD&hasta=YYYY-MM-DD (ambos inclusive)
+
+    Reemplaza llamar a get_available_hours una vez por fecha ("¿qué días del
+    próximo mes está libre la Cabaña X?"). Todo sale de 4 consultas —servicios +
+    una agrupada por cada tabla de ocupación— sin importar el largo del rango.
+    Responde con ETag: el calendario que se vuelve a pintar sin cambios recibe
+    un 304 vacío.
+    """
+    import hashlib
+    import json
+
+    from django.http import HttpResponse
+    from django.utils.cache import get_conditional_response, patch_cache_control
+
+    from ventas.services.cache_service import cache_ns
+    from ventas.services.disponibilidad_service import cargar_ocupacion_rango
+
+    servicios_param = request.GET.get('servicios', '')
+    desde_str = request.GET.get('desde')
+    hasta_str = request.GET.get('hasta')
+
+    if not servicios_param or not desde_str or not hasta_str:
+        return JsonResponse({'success': False, 'error': 'Faltan parámetros servicios, desde o hasta.'}, status=400)
+
+    try:
+        servicio_ids = sorted({int(x) for x in servicios_param.split(',') if x.strip()})
+        desde = datetime.strptime(desde_str, '%Y-%m-%d').date()
+        hasta = datetime.strptime(hasta_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Parámetros inválidos (servicios=1,2 y fechas YYYY-MM-DD).'}, status=400)
+
+    if hasta < desde:
+        return JsonResponse({'success': False, 'error': 'hasta debe ser igual o posterior a desde.'}, status=400)
+    if (hasta - desde).days + 1 > MAX_DIAS_RANGO:
+        return JsonResponse({'success': False, 'error': f'Rango máximo: {MAX_DIAS_RANGO} días.'}, status=400)
+    if not servicio_ids or len(servicio_ids) > MAX_SERVICIOS_RANGO:
+        return JsonResponse({'success': False, 'error': f'Entre 1 y {MAX_SERVICIOS_RANGO} servicios.'}, status=400)
+
+    def _calcular_cuerpo():
+        servicios = list(Servicio.objects.filter(id__in=servicio_ids, activo=True).order_by('id'))
+        ocupacion = cargar_ocupacion_rango([s.id for s in servicios], desde, hasta)
+        payload = {
+            'success': True,
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'servicios': [
+                {
+                    'id': s.id,
+                    'nombre': s.nombre,
+                    'tipo': s.tipo_servicio,
+                    'max_simultaneos': s.max_servicios_simultaneos,
+                    'dias': ocupacion.grilla(s),
+                }
+                for s in servicios
+            ],
+        }
+        return json.dumps(payload, ensure_ascii=False, sort_keys=True)
+
+    # Caché compartida entre workers; cualquier reserva/bloqueo/servicio guardado
+    # invalida el dominio 'disponibilidad' (ventas/signals/cache_signals.py).
+    clave = f"rango:{','.join(map(str, servicio_ids))}:{desde.isoformat()}:{hasta.isoformat()}"
+    cuerpo = cache_ns('disponibilidad').get_or_set(clave, _calcular_cuerpo)
+    etag = '"%s"' % hashlib.md5(cuerpo.encode('utf-8')).hexdigest()
+
+    response = HttpResponse(cuerpo, content_type='application/json')
+    response['ETag'] = etag
+    # Revalidar siempre (la disponibilidad cambia), pero la revalidación sin
+    # cambios es un 304 sin cuerpo.
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
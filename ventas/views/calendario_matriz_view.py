@@ -11,6 +11,7 @@ from datetime import datetime, timedelta, date
 from django.utils import timezone
 from django.contrib import messages
 from ..models import (
+    VENTA_CANCELADA,
     Servicio,
     CategoriaServicio,
     ReservaServicio,
@@ -218,7 +219,7 @@ def generar_matriz_disponibilidad(fecha, categoria, servicios):
         servicio__categoria=categoria,
         servicio__visible_en_matriz=True,
     ).exclude(
-        venta_reserva__estado_pago='cancelado',
+        VENTA_CANCELADA,
     ).select_related('servicio', 'venta_reserva', 'venta_reserva__cliente')
 
     # Usar los servicios visibles como recursos (columnas)
@@ -16,7 +16,8 @@ from ..models import (
     ReservaServicio,
     VentaReserva,
     ServicioBloqueo,
-    ServicioSlotBloqueo
+    ServicioSlotBloqueo,
+    hora_a_minutos
 )
 from .calendario_matriz_view import generar_matriz_disponibilidad
 
@@ -319,7 +320,7 @@ def agregar_servicio_a_reserva(request):
         reservas_existentes = ReservaServicio.objects.filter(
             servicio=servicio,
             fecha_agendamiento=fecha,
-            hora_inicio=hora_str
+            minuto_inicio=hora_a_minutos(hora_str)
         ).count()
 
         espacios_disponibles = servicio.max_servicios_simultaneos - reservas_existentes
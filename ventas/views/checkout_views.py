@@ -3,6 +3,7 @@ import traceback
 from datetime import datetime, timedelta
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.db import transaction
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib import messages
@@ -15,6 +16,7 @@ from ..services.pack_descuento_service import PackDescuentoService
 from ..services.reservation_service import (
     SlotUnavailableError,
     materializar_venta_desde_carrito,
+    retener_slots_carrito,
     validar_disponibilidad_carrito,
 )
 
@@ -506,13 +508,23 @@ def complete_checkout(request):
         )
 
         if metodo_pago == 'flow':
-            pending = PendingReservation.objects.create(
-                cliente=cliente,
-                cart_data=cart,
-                metodo_pago='flow',
-                monto=int(cart['total']),
-                expires_at=timezone.now() + timedelta(minutes=PENDING_RESERVATION_TTL_MINUTES),
-            )
+            # Los slots quedan retenidos mientras paga (hasta expires_at): otro
+            # checkout no los puede tomar y el webhook no termina en 'slot_perdido'.
+            try:
+                with transaction.atomic():
+                    pending = PendingReservation.objects.create(
+                        cliente=cliente,
+                        cart_data=cart,
+                        metodo_pago='flow',
+                        monto=int(cart['total']),
+                        expires_at=timezone.now() + timedelta(minutes=PENDING_RESERVATION_TTL_MINUTES),
+                    )
+                    retener_slots_carrito(pending)
+            except SlotUnavailableError as e:
+                return JsonResponse({
+                    'success': False,
+                    'error': f"Algunos horarios ya no están disponibles: {', '.join(e.slots)}"
+                })
             request.session['pending_reservation_id'] = pending.id
             request.session.modified = True
             print(f"PendingReservation #{pending.id} creada para {cliente.nombre} (${cart['total']:,.0f})")
@@ -550,7 +562,6 @@ def complete_checkout(request):
                 cliente=cliente,
                 cart_data=cart,
                 comprador_form_data={'nombre': nombre, 'email': email, 'telefono': telefono},
-                revalidar=False,
             )
         except SlotUnavailableError as e:
             return JsonResponse({
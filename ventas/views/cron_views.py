@@ -1,19 +1,42 @@
 """
 Vistas para endpoints de cron jobs de premios y campañas
-Permiten ejecutar comandos Django via HTTP desde cron-job.org
+Los llama cron-job.org por HTTP: encolan el comando en la cola de trabajos
+(ver ventas/services/trabajos_service.py) y responden al tiro; lo corre el
+worker `procesar_trabajos`, no el worker de gunicorn.
 """
 from django.http import JsonResponse
-from django.core.management import call_command
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from io import StringIO
 import os
 import logging
-import subprocess
+
+from ventas.services import trabajos_service
 
 logger = logging.getLogger(__name__)
 
 
+def _encolar_comando(comando, *args, cola='default', mensaje='', **opciones):
+    """Encola `comando` y responde con el trabajo. Mientras haya uno activo del
+    mismo comando no se encola otro: el cron que vuelve a llamar no apila copias."""
+    linea = ' '.join([comando, *args, *(f'--{k}' if v is True else f'--{k}={v}' for k, v in opciones.items())])
+    try:
+        trabajo, creado = trabajos_service.encolar_comando(comando, *args, cola=cola, clave=f'cron:{linea}'[:120],
+                                                           **opciones)
+    except Exception as e:
+        logger.error(f"❌ Error encolando {linea}: {e}", exc_info=True)
+        return JsonResponse({"ok": False, "error": str(e), "command": linea}, status=500)
+
+    logger.info(f"✅ Cron {linea} {'encolado' if creado else 'ya estaba en cola'} (trabajo #{trabajo.pk})")
+    return JsonResponse({
+        "ok": True,
+        "message": f"{mensaje}: {'encolado' if creado else 'ya estaba en cola'}",
+        "command": linea,
+        "trabajo_id": trabajo.pk,
+        "estado": trabajo.estado,
+        "encolado": creado,
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
 def cron_procesar_premios_bienvenida(request):
@@ -38,27 +61,8 @@ def cron_procesar_premios_bienvenida(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('procesar_premios_bienvenida', stdout=output)
-
-        logger.info("✅ Cron procesar_premios_bienvenida ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Procesamiento de premios de bienvenida ejecutado",
-            "command": "procesar_premios_bienvenida",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron procesar_premios_bienvenida: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "procesar_premios_bienvenida"
-        }, status=500)
+    return _encolar_comando('procesar_premios_bienvenida',
+                            mensaje="Procesamiento de premios de bienvenida")
 
 
 @csrf_exempt
@@ -86,27 +90,8 @@ def cron_enviar_premios_aprobados(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('enviar_premios_aprobados', stdout=output)
-
-        logger.info("✅ Cron enviar_premios_aprobados ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Envío de premios aprobados ejecutado",
-            "command": "enviar_premios_aprobados",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron enviar_premios_aprobados: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "enviar_premios_aprobados"
-        }, status=500)
+    return _encolar_comando('enviar_premios_aprobados', cola='avisos',
+                            mensaje="Envío de premios aprobados")
 
 
 @csrf_exempt
@@ -120,7 +105,7 @@ def cron_enviar_campanas_email(request):
     Qué hace:
     - Busca campañas con estado='ready' o 'sending'
     - Procesa lotes de emails respetando configuración
-    - Se ejecuta en background para evitar timeouts
+    - Lo corre el worker de la cola `campanas`, no esta petición
     - Continúa desde donde quedó si se interrumpió
 
     Frecuencia recomendada: Cada 5 minutos
@@ -152,25 +137,6 @@ def cron_enviar_campanas_email(request):
                 "campaigns_count": 0
             })
 
-        # Ejecutar comando en BACKGROUND
-        # Esto permite que el endpoint retorne rápido mientras el envío continúa
-        subprocess.Popen(
-            ['python', 'manage.py', 'enviar_campana_email', '--auto'],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            start_new_session=True
-        )
-
-        logger.info(f"✅ Cron enviar_campanas_email iniciado. {count} campaña(s) en cola")
-
-        return JsonResponse({
-            "ok": True,
-            "message": f"Procesamiento de {count} campaña(s) iniciado en background",
-            "command": "enviar_campana_email --auto",
-            "campaigns_count": count,
-            "note": "El envío continúa en segundo plano"
-        })
-
     except Exception as e:
         logger.error(f"❌ Error en cron enviar_campanas_email: {e}", exc_info=True)
         return JsonResponse({
@@ -179,6 +145,9 @@ def cron_enviar_campanas_email(request):
             "command": "enviar_campana_email --auto"
         }, status=500)
 
+    return _encolar_comando('enviar_campana_email', auto=True, cola='campanas',
+                            mensaje=f"Procesamiento de {count} campaña(s)")
+
 
 @csrf_exempt
 @require_http_methods(["GET", "POST"])
@@ -204,27 +173,8 @@ def cron_triggers_surveys(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('send_communication_triggers', type='surveys', stdout=output)
-
-        logger.info("✅ Cron send_communication_triggers (surveys) ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Triggers de encuestas de satisfacción ejecutados",
-            "command": "send_communication_triggers --type=surveys",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron triggers surveys: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "send_communication_triggers --type=surveys"
-        }, status=500)
+    return _encolar_comando('send_communication_triggers', type='surveys', cola='avisos',
+                            mensaje="Triggers de encuestas de satisfacción")
 
 
 @csrf_exempt
@@ -251,27 +201,8 @@ def cron_triggers_reactivation(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('send_communication_triggers', type='reactivation', stdout=output)
-
-        logger.info("✅ Cron send_communication_triggers (reactivation) ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Triggers de reactivación de clientes ejecutados",
-            "command": "send_communication_triggers --type=reactivation",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron triggers reactivation: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "send_communication_triggers --type=reactivation"
-        }, status=500)
+    return _encolar_comando('send_communication_triggers', type='reactivation', cola='avisos',
+                            mensaje="Triggers de reactivación de clientes")
 
 
 @csrf_exempt
@@ -299,27 +230,8 @@ def cron_enviar_emails_programados(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('enviar_emails_programados', stdout=output)
-
-        logger.info("✅ Cron enviar_emails_programados ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Envío de emails programados ejecutado",
-            "command": "enviar_emails_programados",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron enviar_emails_programados: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "enviar_emails_programados"
-        }, status=500)
+    return _encolar_comando('enviar_emails_programados', cola='avisos',
+                            mensaje="Envío de emails programados")
 
 
 @csrf_exempt
@@ -346,27 +258,8 @@ def cron_triggers_reminders(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('send_communication_triggers', type='reminders', stdout=output)
-
-        logger.info("✅ Cron send_communication_triggers (reminders) ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Triggers de recordatorios de reservas ejecutados",
-            "command": "send_communication_triggers --type=reminders",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron triggers reminders: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "send_communication_triggers --type=reminders"
-        }, status=500)
+    return _encolar_comando('send_communication_triggers', type='reminders', cola='avisos',
+                            mensaje="Triggers de recordatorios de reservas")
 
 
 @csrf_exempt
@@ -393,27 +286,8 @@ def cron_enviar_campana_giftcard(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('enviar_campana_giftcard', stdout=output)
-
-        logger.info("✅ Cron enviar_campana_giftcard ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Campaña de gift cards ejecutada",
-            "command": "enviar_campana_giftcard",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron enviar_campana_giftcard: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "enviar_campana_giftcard"
-        }, status=500)
+    return _encolar_comando('enviar_campana_giftcard', cola='campanas',
+                            mensaje="Campaña de gift cards")
 
 
 @csrf_exempt
@@ -441,27 +315,8 @@ def cron_gen_atencion_clientes(request):
             logger.warning("❌ Intento de acceso a cron con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    try:
-        # Capturar output del comando
-        output = StringIO()
-        call_command('gen_atencion_clientes', stdout=output)
-
-        logger.info("✅ Cron gen_atencion_clientes ejecutado vía HTTP")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Generación de tareas de atención a clientes ejecutada",
-            "command": "gen_atencion_clientes",
-            "output": output.getvalue()
-        })
-
-    except Exception as e:
-        logger.error(f"❌ Error en cron gen_atencion_clientes: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "gen_atencion_clientes"
-        }, status=500)
+    return _encolar_comando('gen_atencion_clientes',
+                            mensaje="Generación de tareas de atención a clientes")
 
 
 # ============================================================================
@@ -491,7 +346,6 @@ def cron_generar_bandeja_whatsapp_diaria(request):
     Frecuencia recomendada: 06:00 AM hora Santiago, todos los días.
     Tiempo medido en producción: ~12 segundos sobre 14.228 clientes.
     """
-    import time
     expected_token = os.getenv('CRON_TOKEN')
     if expected_token:
         request_token = request.GET.get('token') or request.POST.get('token')
@@ -499,31 +353,8 @@ def cron_generar_bandeja_whatsapp_diaria(request):
             logger.warning("❌ Intento de acceso a cron generar_bandeja con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    t0 = time.time()
-    try:
-        output = StringIO()
-        call_command('generar_bandeja_whatsapp_diaria', stdout=output)
-        elapsed = round(time.time() - t0, 2)
-
-        logger.info(f"✅ Cron generar_bandeja_whatsapp_diaria OK en {elapsed}s")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Bandeja diaria generada",
-            "command": "generar_bandeja_whatsapp_diaria",
-            "duracion_segundos": elapsed,
-            "output": output.getvalue(),
-        })
-    except Exception as e:
-        elapsed = round(time.time() - t0, 2)
-        logger.error(f"❌ Error en cron generar_bandeja_whatsapp_diaria ({elapsed}s): {e}",
-                     exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "generar_bandeja_whatsapp_diaria",
-            "duracion_segundos": elapsed,
-        }, status=500)
+    return _encolar_comando('generar_bandeja_whatsapp_diaria',
+                            mensaje="Bandeja diaria de WhatsApp")
 
 
 @csrf_exempt
@@ -546,7 +377,6 @@ def cron_cruzar_reservas_contactos_whatsapp(request):
     Frecuencia recomendada: 23:30 hora Santiago, todos los días.
     Tiempo estimado: <5 segundos (procesa solo 12-50 reservas/día).
     """
-    import time
     expected_token = os.getenv('CRON_TOKEN')
     if expected_token:
         request_token = request.GET.get('token') or request.POST.get('token')
@@ -554,31 +384,8 @@ def cron_cruzar_reservas_contactos_whatsapp(request):
             logger.warning("❌ Intento de acceso a cron cruzar_reservas con token inválido")
             return JsonResponse({"ok": False, "error": "Token inválido"}, status=403)
 
-    t0 = time.time()
-    try:
-        output = StringIO()
-        call_command('cruzar_reservas_contactos_whatsapp', stdout=output)
-        elapsed = round(time.time() - t0, 2)
-
-        logger.info(f"✅ Cron cruzar_reservas_contactos_whatsapp OK en {elapsed}s")
-
-        return JsonResponse({
-            "ok": True,
-            "message": "Atribución de conversiones ejecutada",
-            "command": "cruzar_reservas_contactos_whatsapp",
-            "duracion_segundos": elapsed,
-            "output": output.getvalue(),
-        })
-    except Exception as e:
-        elapsed = round(time.time() - t0, 2)
-        logger.error(f"❌ Error en cron cruzar_reservas_contactos_whatsapp ({elapsed}s): {e}",
-                     exc_info=True)
-        return JsonResponse({
-            "ok": False,
-            "error": str(e),
-            "command": "cruzar_reservas_contactos_whatsapp",
-            "duracion_segundos": elapsed,
-        }, status=500)
+    return _encolar_comando('cruzar_reservas_contactos_whatsapp',
+                            mensaje="Atribución de conversiones WhatsApp")
 
 
 def _validar_cron_token(request):
@@ -605,22 +412,8 @@ def cron_entregas_comandas_vencidas(request):
     err = _validar_cron_token(request)
     if err:
         return err
-    try:
-        output = StringIO()
-        call_command('procesar_entregas_comandas_vencidas', stdout=output)
-        logger.info("✅ Cron procesar_entregas_comandas_vencidas ejecutado vía HTTP")
-        return JsonResponse({
-            "ok": True,
-            "message": "Entregas de comandas vencidas procesadas",
-            "command": "procesar_entregas_comandas_vencidas",
-            "output": output.getvalue(),
-        })
-    except Exception as e:
-        logger.error(f"❌ Error en cron entregas-comandas-vencidas: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False, "error": str(e),
-            "command": "procesar_entregas_comandas_vencidas",
-        }, status=500)
+    return _encolar_comando('procesar_entregas_comandas_vencidas',
+                            mensaje="Entregas de comandas vencidas")
 
 
 @csrf_exempt
@@ -635,22 +428,8 @@ def cron_seguimientos_masaje(request):
     err = _validar_cron_token(request)
     if err:
         return err
-    try:
-        output = StringIO()
-        call_command('enviar_seguimientos_masaje', stdout=output)
-        logger.info("✅ Cron enviar_seguimientos_masaje ejecutado vía HTTP")
-        return JsonResponse({
-            "ok": True,
-            "message": "Seguimientos de masaje procesados",
-            "command": "enviar_seguimientos_masaje",
-            "output": output.getvalue(),
-        })
-    except Exception as e:
-        logger.error(f"❌ Error en cron seguimientos-masaje: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False, "error": str(e),
-            "command": "enviar_seguimientos_masaje",
-        }, status=500)
+    return _encolar_comando('enviar_seguimientos_masaje', cola='avisos',
+                            mensaje="Seguimientos de masaje")
 
 
 @csrf_exempt
@@ -666,20 +445,39 @@ def cron_normalizar_ciudades(request):
     err = _validar_cron_token(request)
     if err:
         return err
-    try:
-        output = StringIO()
-        call_command('normalizar_ciudades_clientes', '--solo-sin-clasificar',
-                     stdout=output)
-        logger.info("✅ Cron normalizar_ciudades_clientes ejecutado vía HTTP")
-        return JsonResponse({
-            "ok": True,
-            "message": "Normalización de ciudades ejecutada (solo sin_clasificar)",
-            "command": "normalizar_ciudades_clientes --solo-sin-clasificar",
-            "output": output.getvalue(),
-        })
-    except Exception as e:
-        logger.error(f"❌ Error en cron normalizar-ciudades: {e}", exc_info=True)
-        return JsonResponse({
-            "ok": False, "error": str(e),
-            "command": "normalizar_ciudades_clientes",
-        }, status=500)
+    return _encolar_comando('normalizar_ciudades_clientes', '--solo-sin-clasificar',
+                            mensaje="Normalización de ciudades (solo sin_clasificar)")
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def cron_taxonomia_pendientes(request):
+    """Endpoint cron: recalcula la taxonomía solo de los clientes encolados por
+    cambios en sus reservas, más las 500 taxonomías más viejas calculadas antes
+    de hoy (paso del tiempo). Reemplaza la corrida completa nocturna.
+
+    GET o POST: /ventas/cron/taxonomia-pendientes/?token=xxx
+    Frecuencia recomendada: cada 5 minutos.
+    """
+    err = _validar_cron_token(request)
+    if err:
+        return err
+    return _encolar_comando('recalcular_taxonomia_clientes', '--pendientes', '--vencidas', '500',
+                            '--registrar-movimientos',
+                            mensaje="Taxonomía de clientes pendientes")
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def cron_generar_exportaciones(request):
+    """Endpoint cron: escribe las exportaciones grandes encoladas por los
+    reportes (ExportacionArchivo) y borra las de más de 7 días.
+
+    GET o POST: /ventas/cron/generar-exportaciones/?token=xxx
+    Frecuencia recomendada: cada 5 minutos.
+    """
+    err = _validar_cron_token(request)
+    if err:
+        return err
+    return _encolar_comando('generar_exportaciones',
+                            mensaje="Exportaciones pendientes")
\ No newline at end of file
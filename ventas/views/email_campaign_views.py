@@ -15,6 +15,7 @@ from django.views.decorators.http import require_http_methods
 from django.core.serializers.json import DjangoJSONEncoder
 
 from ventas.models import Cliente, EmailCampaign, EmailRecipient, CampaignEmailTemplate
+from ventas.services import trabajos_service
 import json
 import logging
 
@@ -389,16 +390,12 @@ def send_email_campaign(request, campaign_id):
     campaign.status = 'ready'
     campaign.save()
     
-    # Ejecutar comando de envío en background
-    from django.core.management import call_command
-    import threading
-    
-    def send_campaign():
-        call_command('enviar_campana_email', campaign_id=campaign_id)
-    
-    thread = threading.Thread(target=send_campaign)
-    thread.daemon = True
-    thread.start()
+    # Encolar el envío: lo corre el worker (procesar_trabajos), no un thread
+    # que muere con el proceso web.
+    trabajos_service.encolar_comando(
+        'enviar_campana_email', campaign_id=campaign_id, cola='campanas',
+        clave=f'campana_email:{campaign_id}', max_intentos=1,
+    )
     
     return JsonResponse({
         'success': True,
@@ -12,6 +12,7 @@ from django.db import transaction
 from ..models import VentaReserva, Pago, PendingReservation
 from ..services.reservation_service import (
     SlotUnavailableError,
+    liberar_retenciones,
     materializar_venta_desde_carrito,
 )
 
@@ -187,6 +188,7 @@ def _materializar_pending_si_pago_exitoso(pending, amount):
                     'telefono': cliente.telefono or '',
                 },
                 revalidar=True,
+                pending=pending,
             )
             Pago.objects.create(
                 venta_reserva=venta,
@@ -204,6 +206,7 @@ def _materializar_pending_si_pago_exitoso(pending, amount):
         )
         print(f"ALERTA: {detalle}")
         pending.marcar_slot_perdido(detalle)
+        liberar_retenciones(pending)
         return None
 
 
@@ -273,34 +276,17 @@ def flow_confirmation(request):
                     # Nunca fallar el webhook por error de CAPI.
                     print(f"Meta CAPI Purchase fallo (no critico): {capi_err}")
 
-                # Enviar GiftCards si las hay (solo si la materializacion fue exitosa)
-                from ..models import GiftCard
-                from ..services.giftcard_pdf_service import GiftCardPDFService
-                giftcards = GiftCard.objects.filter(
-                    venta_reserva=materializada,
-                    estado='por_cobrar',
-                )
-                # Materializar ANTES del update: el queryset es lazy y filtra por
-                # estado='por_cobrar' — iterarlo después del update devuelve vacío
-                # (bug preexistente: el email de Flow salía sin giftcards).
-                giftcards_lista = list(giftcards)
-                if giftcards_lista:
-                    print(f"Enviando email de {len(giftcards_lista)} GiftCard(s) para venta {materializada.id}")
-                    giftcards.update(estado='cobrado')
-                    # Datos de la carta desde la fuente única (antes acá se ponía
-                    # "Experiencia Aremko ($X)" hardcodeado y la foto con URL rota).
-                    giftcards_data = [GiftCardPDFService.datos_carta(gc) for gc in giftcards_lista]
-                    GiftCardPDFService.enviar_giftcard_por_email(
-                        comprador_email=materializada.cliente.email,
-                        comprador_nombre=materializada.cliente.nombre,
-                        giftcards_data=giftcards_data,
-                    )
+                # Enviar GiftCards si las hay (solo si la materializacion fue exitosa).
+                # Misma entrega que la señal del Pago: si ya las reclamó, no hace nada.
+                from ..services import giftcard_entrega_service
+                giftcard_entrega_service.programar(materializada.id)
                 return HttpResponse("Payment Confirmed", status=200)
 
             elif flow_status in (3, 4):
                 pending.estado = 'rechazado' if flow_status == 3 else 'cancelado'
                 pending.notas = (pending.notas + f'\nFlow status={flow_status} at {timezone.now().isoformat()}').strip()
                 pending.save(update_fields=['estado', 'notas', 'updated_at'])
+                liberar_retenciones(pending)
                 print(f"PendingReservation #{pending.id} marcado como {pending.estado}")
                 return HttpResponse("Payment Rejected/Cancelled", status=200)
             else:
@@ -5,15 +5,22 @@ La URL lleva un token secreto porque queda PEGADA en el extranet de Booking y
 de Airbnb, que la leen sin ninguna sesión. No expone datos del huésped: solo
 fechas ocupadas y el número de reserva, que es lo mínimo para que la OTA sepa
 que no puede vender.
+
+Las OTAs leen la URL cada pocos minutos y casi siempre no cambió nada: el token
+y el .ics salen de la caché compartida (`ventas/ical.py::feed_cacheado`) y la
+respuesta lleva ETag, así que una relectura sin cambios es un 304 sin cuerpo y
+sin tocar la base.
 """
 import logging
 from datetime import timedelta
 
 from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 
-from ventas.ical import construir_ics, tramos_ocupados
+from ventas.ical import feed_cacheado
 from ventas.models import CalendarioCabana
+from ventas.services.cache_service import cache_ns
 
 logger = logging.getLogger(__name__)
 
@@ -23,19 +30,28 @@ logger = logging.getLogger(__name__)
 DIAS_DE_GRACIA_ATRAS = 7
 
 
+def _cabana_por_token(token):
+    """(servicio_id, nombre) del calendario activo con ese token, o None."""
+    cal = (CalendarioCabana.objects
+           .filter(token=token, activo=True)
+           .select_related('servicio').first())
+    return (cal.servicio_id, cal.servicio.nombre) if cal else None
+
+
 def calendario_cabana_ics(request, token, slug=None):
     """GET /reservas/ical/<token>/<slug>.ics — fechas ocupadas de una cabaña.
 
     El `slug` no se valida: está en la URL para que Jorge distinga de un
     vistazo cuál pegó en cada anuncio. Lo que manda es el token.
     """
-    cal = (CalendarioCabana.objects
-           .filter(token=token, activo=True)
-           .select_related('servicio').first())
-    if cal is None:
+    # Un token desconocido no se cachea (None): se vuelve a buscar cada vez.
+    # Cambiar o desactivar un calendario invalida el dominio entero.
+    cabana = cache_ns('ical').get_or_set(f'token:{token}', lambda: _cabana_por_token(token))
+    if cabana is None:
         # 404 y no 403: a quien tenga un token viejo no se le confirma que
         # exista un calendario detrás.
         raise Http404('calendario no encontrado')
+    servicio_id, nombre = cabana
 
     # Solo de una semana atrás en adelante. Las OTAs ignoran el pasado, así que
     # publicar el histórico completo no sirve para nada y sí tiene costo: en la
@@ -44,13 +60,15 @@ def calendario_cabana_ics(request, token, slug=None):
     # y de paso le contaba a un tercero qué noches estuvo llena la cabaña desde
     # que existe. Los 7 días de margen cubren a alguien que sigue alojado.
     desde = timezone.localdate() - timedelta(days=DIAS_DE_GRACIA_ATRAS)
-    tramos = tramos_ocupados(cal.servicio_id, desde=desde)
-    cuerpo = construir_ics(cal.servicio.nombre, tramos)
+    feed = feed_cacheado(servicio_id, nombre, desde)
     logger.info('[ical] %s servido con %s tramos desde %s',
-                cal.servicio.nombre, len(tramos), desde)
+                nombre, feed['tramos'], desde)
 
-    resp = HttpResponse(cuerpo, content_type='text/calendar; charset=utf-8')
+    resp = HttpResponse(feed['cuerpo'], content_type='text/calendar; charset=utf-8')
     resp['Content-Disposition'] = f'inline; filename="{slug or "aremko"}.ics"'
-    # Sin caché: si Booking cachea, la ventana de doble venta se agranda.
+    resp['ETag'] = feed['etag']
+    # Sin caché: si Booking cachea, la ventana de doble venta se agranda. El
+    # ETag no cambia eso: la OTA que manda If-None-Match igual pregunta cada
+    # vez, y la respuesta sin cambios es un 304 vacío.
     resp['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    return resp
+    return get_conditional_response(request, etag=feed['etag'], response=resp)
@@ -1,51 +1,53 @@
-import xlwt
+import os
 from openpyxl import load_workbook
-from datetime import datetime
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db import transaction
 from django.db.models import Q
-from ..models import Cliente, Company, Contact  # Relative import
+from ..models import Cliente, Company, Contact, ExportacionArchivo  # Relative import
+from ..services import exportacion_service
 
 # Helper function to check if the user is an administrator
 def es_administrador(user):
     return user.is_staff or user.is_superuser
 
 @login_required
+@user_passes_test(es_administrador)  # Los datos de todos los clientes: como importar
 def exportar_clientes_excel(request):
-    response = HttpResponse(content_type='application/ms-excel')
-    response['Content-Disposition'] = 'attachment; filename="Clientes_{}.xls"'.format(
-        datetime.now().strftime('%Y%m%d_%H%M%S')
-    )
-
-    wb = xlwt.Workbook(encoding='utf-8')
-    ws = wb.add_sheet('Clientes')
-
-    # Estilos
-    header_style = xlwt.easyxf('font: bold on; pattern: pattern solid, fore_colour gray25;')
-
-    # Headers
-    headers = ['ID', 'Nombre', 'Teléfono', 'Email', 'Documento Identidad', 'Ciudad'] # Added Documento and Ciudad
-    for col, header in enumerate(headers):
-        ws.write(0, col, header, header_style)
-        ws.col(col).width = 256 * 20
-
-    # Obtener todos los clientes
-    clientes = Cliente.objects.all().order_by('nombre')
-
-    # Datos
-    for row, cliente in enumerate(clientes, 1):
-        ws.write(row, 0, cliente.id)
-        ws.write(row, 1, cliente.nombre)
-        ws.write(row, 2, cliente.telefono or '')
-        ws.write(row, 3, cliente.email or '')
-        ws.write(row, 4, cliente.documento_identidad or '') # Added
-        ws.write(row, 5, cliente.ciudad or '') # Added
-
-    wb.save(response)
-    return response
+    """Todos los clientes en XLSX (o CSV con ?export=csv), escritos por trozos.
+    Ver ventas/services/exportacion_service.py."""
+    return exportacion_service.responder(request, 'clientes')
+
+
+def _exportaciones_visibles(user):
+    """Un administrador ve todas; el resto, las que pidió (servicios vendidos
+    también encola y redirige acá)."""
+    if es_administrador(user):
+        return ExportacionArchivo.objects.all()
+    return ExportacionArchivo.objects.filter(solicitado_por=user)
+
+
+@login_required
+def exportaciones(request):
+    """Las últimas 50 exportaciones generadas en segundo plano."""
+    exportaciones = _exportaciones_visibles(request.user).select_related('solicitado_por')[:50]
+    return render(request, 'ventas/exportaciones.html', {
+        'exportaciones': exportaciones,
+        'dias_conservacion': exportacion_service.DIAS_CONSERVACION,
+    })
+
+
+@login_required
+def descargar_exportacion(request, pk):
+    """Sirve el archivo desde el storage: la URL del bucket no se expone."""
+    exportacion = get_object_or_404(_exportaciones_visibles(request.user), pk=pk,
+                                    estado=ExportacionArchivo.ESTADO_LISTO)
+    if not exportacion.archivo:
+        raise Http404("La exportación no tiene archivo")
+    return FileResponse(exportacion.archivo.open('rb'), as_attachment=True,
+                        filename=os.path.basename(exportacion.archivo.name))
 
 @login_required
 @user_passes_test(es_administrador)  # Solo administradores pueden importar
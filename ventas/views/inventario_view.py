@@ -7,7 +7,7 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Sum, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
-from ..models import Producto, ReservaProducto
+from ..models import VENTA_CANCELADA, Producto, ReservaProducto
 
 def staff_required(view_func):
     """Decorador para requerir que el usuario sea staff"""
@@ -46,7 +46,7 @@ def gestion_inventario(request):
             producto=producto,
             fecha_entrega=hoy,
         ).exclude(
-            venta_reserva__estado_reserva='cancelada'
+            VENTA_CANCELADA
         ).aggregate(
             total=Sum('cantidad')
         )['total'] or 0
@@ -56,7 +56,7 @@ def gestion_inventario(request):
             producto=producto,
             fecha_entrega__isnull=True,
         ).exclude(
-            venta_reserva__estado_reserva='cancelada'
+            VENTA_CANCELADA
         ).annotate(
             primer_servicio=Min('venta_reserva__reservaservicios__fecha_agendamiento')
         ).filter(
@@ -84,7 +84,7 @@ def gestion_inventario(request):
                 Q(fecha_entrega=hoy) |
                 (Q(fecha_entrega__isnull=True) & Q(venta_reserva__reservaservicios__fecha_agendamiento=hoy))
             ).exclude(
-                venta_reserva__estado_reserva='cancelada'
+                VENTA_CANCELADA
             ).distinct().values(
                 'venta_reserva__id',
                 'cantidad',
@@ -29,11 +29,13 @@ import logging
 from ventas.models import (
     Servicio, Cliente, VentaReserva, ReservaServicio,
     ServicioBloqueo, ServicioSlotBloqueo, Region, Comuna,
-    Producto, ReservaProducto, Comanda, DetalleComanda
+    Producto, ReservaProducto, Comanda, DetalleComanda, hora_a_minutos
 )
 from whatsapp_agent.models import PropuestaReserva
 from whatsapp_agent.prompt import nombre_presentable
 from ventas.services.cliente_service import ClienteService
+from ventas.services.disponibilidad_service import buscar_conflictos
+from ventas.services.reservation_service import bloquear_slots
 from ventas.services.pack_descuento_service import PackDescuentoService
 
 
@@ -512,15 +514,14 @@ def validar_disponibilidad(request):
             reservas_existentes = ReservaServicio.objects.filter(
                 servicio=servicio,
                 fecha_agendamiento=fecha,
-                hora_inicio=hora_str,
+                minuto_inicio=hora_a_minutos(hora_str),
                 venta_reserva__estado_pago__in=['pendiente', 'pagado', 'parcial']
             )
 
-            # Calcular cuántas veces se ha reservado el servicio en ese slot
-            slots_ocupados = reservas_existentes.count()
-            capacidad_disponible_slots = servicio.max_servicios_simultaneos - slots_ocupados
-
-            if capacidad_disponible_slots <= 0:
+            # Servicios simultáneos: por intervalo, no solo el slot exacto (una
+            # cabaña de 3 h choca con la que empieza 1 h después). Un slot
+            # retenido por un pago Flow en curso cuenta como ocupado.
+            if buscar_conflictos(servicio, fecha, hora_str, contar_retenciones=True):
                 errores_validacion.append({
                     'servicio_index': idx,
                     'servicio_id': servicio_id,
@@ -804,6 +805,31 @@ def crear_reserva(request):
                     except VentaReserva.DoesNotExist:
                         pass  # propuesta dice creada pero la reserva no está → proceder a crear
 
+            # Mismo lock por (servicio, fecha) que el checkout web: la validación de
+            # cada ReservaServicio (pre_save) corre sin que otra compra tome el slot.
+            bloquear_slots(
+                (s['servicio_id'], datetime.strptime(s['fecha'], '%Y-%m-%d').date())
+                for s in servicios_data
+            )
+            # Re-chequeo BAJO el lock: entre la validación de arriba y el lock
+            # pudo entrar otra venta o una retención de pago Flow en curso (la
+            # validación del pre_save no ve las retenciones).
+            conflictos = [
+                {'servicio_id': s['servicio_id'], 'error': 'no_availability',
+                 'mensaje': f'{servicio.nombre} ya no tiene disponibilidad en ese horario'}
+                for s in servicios_data
+                for servicio in [Servicio.objects.get(id=s['servicio_id'])]
+                if buscar_conflictos(servicio, datetime.strptime(s['fecha'], '%Y-%m-%d').date(),
+                                     s['hora'], contar_retenciones=True)
+            ]
+            if conflictos:
+                return Response({
+                    'success': False,
+                    'error': 'availability_error',
+                    'errores': conflictos,
+                    'mensaje': 'Uno o más servicios no están disponibles'
+                }, status=status.HTTP_409_CONFLICT)
+
             # 1. Buscar o crear cliente
             telefono_normalizado = validar_telefono_chileno(cliente_data.get('telefono', ''))[2]
 
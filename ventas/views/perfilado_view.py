@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""Tablero de perfilado por vista (latencia, consultas, N+1, caché).
+
+GET  /ventas/diagnostico/perfilado/
+POST /ventas/diagnostico/perfilado/   (vaciar el buffer de este proceso)
+
+Los datos los junta `PerfiladoMiddleware` solo con PERFILADO_ACTIVO=true.
+"""
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import redirect, render
+
+from ventas.services import perfilado_service
+
+
+@staff_member_required
+def perfilado(request):
+    if request.method == 'POST':
+        perfilado_service.vaciar()
+        return redirect('ventas:perfilado')
+
+    return render(request, 'ventas/perfilado.html', {
+        'activo': getattr(settings, 'PERFILADO_ACTIVO', False),
+        'muestreo': getattr(settings, 'PERFILADO_MUESTREO', 1.0),
+        'filas': perfilado_service.resumen(),
+        'total_muestras': len(perfilado_service.muestras()),
+        'capacidad': perfilado_service.capacidad(),
+        'umbral_duplicadas': perfilado_service.UMBRAL_DUPLICADAS,
+    })
@@ -4,16 +4,22 @@ from django.urls import reverse
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from ..models import Servicio, CategoriaServicio, HomepageConfig, Lead, Producto, CategoriaProducto # Relative import, ADD HomepageConfig, Lead, Producto, CategoriaProducto
+from ..services.cache_service import cache_ns
+from ..services.pagina_cache_service import cache_pagina_publica
 
 
+@cache_pagina_publica()
 def homepage_view(request):
     """
     Vista que renderiza la página de inicio pública de Aremko.cl
     Muestra los servicios disponibles y permite realizar reservas.
     """
-    # Obtener servicios activos Y publicados en la web
-    servicios = Servicio.objects.filter(activo=True, publicado_web=True).select_related('categoria')
-    categorias = CategoriaServicio.objects.all()
+    # Obtener servicios activos Y publicados en la web. Dominio 'homepage' de la
+    # caché compartida: se invalida al guardar un servicio o una categoría.
+    portada = cache_ns('homepage')
+    servicios = portada.get_or_set('servicios', lambda: list(
+        Servicio.objects.filter(activo=True, publicado_web=True).select_related('categoria')))
+    categorias = portada.get_or_set('categorias', lambda: list(CategoriaServicio.objects.all()))
 
     # Obtener carrito de compras de la sesión o crear uno nuevo
     cart = request.session.get('cart', {'servicios': [], 'total': 0})
@@ -175,6 +181,7 @@ def homepage_view(request):
     return render(request, template, context)
 
 
+@cache_pagina_publica()
 def categoria_detail_view(request, categoria_id):
     """
     Vista que muestra los servicios de una categoría específica.
@@ -260,6 +267,7 @@ def _clp_str(valor):
     return '$' + f'{int(valor):,}'.replace(',', '.')
 
 
+@cache_pagina_publica()
 def masajes_landing_view(request):
     """Landing de masajes "Cinco Sentidos" — pareja-first (el 98% de los masajes son
     en pareja). Precios de la Pausa espejados de pausa_landing_view; el precio del
@@ -829,12 +837,26 @@ def _get_client_ip(request):
     return request.META.get('REMOTE_ADDR') or None
 
 
+REFUGIO_UTM_KEYS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term')
+
+
 def refugio_landing_view(request):
     """Landing page pública de la campaña Refugio Aremko.
 
     Texto + precio + galería editables vía RefugioConfig singleton.
     Si `RefugioConfig.activo == False` devuelve 404 (campaña cerrada).
     """
+    # Capturar UTM en la sesión para que sobrevivan el submit (POST). Antes de
+    # la página: corre también cuando sale de la caché.
+    utm_data = {k: request.GET.get(k, '') for k in REFUGIO_UTM_KEYS if request.GET.get(k)}
+    if utm_data:
+        request.session['refugio_utm'] = utm_data
+    return _refugio_landing_pagina(request)
+
+
+# Los UTM se repiten en inputs ocultos del formulario: son parte de la página.
+@cache_pagina_publica(parametros=REFUGIO_UTM_KEYS)
+def _refugio_landing_pagina(request):
     from django.http import Http404
     from ..models import RefugioConfig, RefugioImagen
 
@@ -851,12 +873,6 @@ def refugio_landing_view(request):
     except Exception:
         canonical_url = request.path
 
-    # Capturar UTM en la sesión para que sobrevivan el submit (POST)
-    utm_keys = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term')
-    utm_data = {k: request.GET.get(k, '') for k in utm_keys if request.GET.get(k)}
-    if utm_data:
-        request.session['refugio_utm'] = utm_data
-
     context = {
         'config': config,
         'imagenes': imagenes,
@@ -869,6 +885,7 @@ def refugio_landing_view(request):
     return render(request, 'ventas/refugio_landing.html', context)
 
 
+@cache_pagina_publica()
 def ritual_rio_landing_view(request):
     """Landing OCULTA del producto insignia "Noche de ritual junto al río" (Plan Río / H-031).
 
@@ -904,6 +921,7 @@ def ritual_rio_landing_view(request):
     })
 
 
+@cache_pagina_publica()
 def pausa_landing_view(request):
     """Landing INDEXABLE de la "Pausa junto al río" (H-041): la experiencia de ENTRADA —
     tina caliente + masaje en pareja, el MISMO día, sin alojamiento. Destino de los anuncios
@@ -4,12 +4,12 @@ from django.http import HttpResponse
 from django.shortcuts import render
 from django.utils import timezone
 from django.db.models import Sum, Count, F, Q
-from django.db.models.functions import Coalesce # Added Coalesce import
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.paginator import Paginator
 from django.contrib.auth.models import User
 from django.db import models # Re-adding import just in case
-from ..models import ReservaServicio, CategoriaServicio, Pago, VentaReserva, MovimientoCliente, ReservaProducto, Proveedor, Producto, Cliente # Relative imports, Added Cliente
+from ..services import exportacion_service
+from ..models import ReservaServicio, CategoriaServicio, Pago, VentaReserva, MovimientoCliente, ReservaProducto, Proveedor, Producto # Relative imports
 
 # Helper function to check if the user is an administrator
 def es_administrador(user):
@@ -36,6 +36,15 @@ def servicios_vendidos_view(request):
     except ValueError:
         fecha_fin = hoy
 
+    # Exportación: se escribe por trozos sin armar la tabla (ver exportacion_service)
+    if request.GET.get('export') in ('excel', 'csv'):
+        return exportacion_service.responder(request, 'servicios_vendidos', {
+            'fecha_inicio': fecha_inicio.strftime('%Y-%m-%d'),
+            'fecha_fin': fecha_fin.strftime('%Y-%m-%d'),
+            'categoria': categoria_id,
+            'venta_reserva_id': venta_reserva_id,
+        })
+
     # Consultar todos los servicios vendidos, including assigned provider
     servicios_vendidos = ReservaServicio.objects.select_related(
         'venta_reserva__cliente', 'servicio__categoria', 'proveedor_asignado'
@@ -121,56 +130,6 @@ def servicios_vendidos_view(request):
         'total_monto_vendido': total_monto_vendido
     }
 
-    # Verificar si se solicitó exportación
-    if request.GET.get('export') == 'excel':
-        response = HttpResponse(content_type='application/ms-excel')
-        response['Content-Disposition'] = 'attachment; filename="Servicios_Vendidos_{}.xls"'.format(
-            datetime.now().strftime('%Y%m%d_%H%M%S')
-        )
-
-        wb = xlwt.Workbook(encoding='utf-8')
-        ws = wb.add_sheet('Servicios Vendidos')
-
-        # Estilos
-        header_style = xlwt.easyxf('font: bold on; pattern: pattern solid, fore_colour gray25;')
-        date_style = xlwt.easyxf(num_format_str='DD/MM/YYYY')
-        time_style = xlwt.easyxf(num_format_str='HH:MM')
-        money_style = xlwt.easyxf(num_format_str='#,##0')
-
-        # Headers
-        headers = [
-            'ID Venta/Reserva',
-            'Cliente',
-            'Categoría del Servicio',
-            'Servicio',
-            'Estado',
-            'Fecha de Agendamiento',
-            'Hora de Agendamiento',
-            'Cantidad de Personas',
-            'Monto Total',
-            'Proveedor Asignado' # Add new header
-        ]
-
-        for col, header in enumerate(headers):
-            ws.write(0, col, header, header_style)
-            ws.col(col).width = 256 * 20  # Ancho aproximado de 20 caracteres
-
-        # Datos
-        for row, servicio_data in enumerate(data, 1): # Use data dict
-            ws.write(row, 0, servicio_data['venta_reserva_id'])
-            ws.write(row, 1, servicio_data['cliente_nombre'])
-            ws.write(row, 2, servicio_data['categoria_servicio'])
-            ws.write(row, 3, servicio_data['servicio_nombre'])
-            ws.write(row, 4, servicio_data['estado_reserva'])  # Add estado
-            ws.write(row, 5, servicio_data['fecha_agendamiento'], date_style) # Use date object
-            ws.write(row, 6, servicio_data['hora_agendamiento_str']) # Use string for Excel time
-            ws.write(row, 7, servicio_data['cantidad_personas'])
-            ws.write(row, 8, servicio_data['total_monto'], money_style)
-            ws.write(row, 9, servicio_data['proveedor_asignado']) # Add provider data to Excel
-
-        wb.save(response)
-        return response
-
     return render(request, 'ventas/servicios_vendidos.html', context)
 
 
@@ -669,155 +628,33 @@ def auditoria_movimientos_view(request):
     return render(request, 'ventas/auditoria_movimientos.html', context)
 
 
-def _get_combined_metrics_for_segmentation():
-    """
-    Helper para obtener métricas combinadas (servicios actuales + históricos) para segmentación
-    Si la tabla histórica no existe, solo usa datos actuales.
-    """
-    from ventas.models import ServiceHistory
-    from django.db import connection
-    import logging
+# Segmentación por gasto total (actual + histórico). Lee MetricaCliente (una fila
+# por teléfono, ver ventas/services/metricas_cliente_service.py) y filtra por
+# total_gasto, que está indexado.
+SPEND_THRESHOLD_MEDIUM = 50000  # 50,000 CLP
+SPEND_THRESHOLD_HIGH = 150000  # 150,000 CLP
+CLIENTES_POR_PAGINA = 100
 
-    logger = logging.getLogger(__name__)
+SEGMENTOS_GASTO = {
+    'low_spend': Q(total_gasto__gt=0, total_gasto__lt=SPEND_THRESHOLD_MEDIUM),
+    'medium_spend': Q(total_gasto__gte=SPEND_THRESHOLD_MEDIUM, total_gasto__lt=SPEND_THRESHOLD_HIGH),
+    'high_spend': Q(total_gasto__gte=SPEND_THRESHOLD_HIGH),
+    'zero_spend': Q(total_gasto=0),
+}
+
+
+def _pagina_de_clientes(request, metricas):
+    """Página pedida (?page=) de las métricas, de mayor a menor gasto total."""
+    paginator = Paginator(metricas.select_related('comuna').order_by('-total_gasto', 'telefono'),
+                          CLIENTES_POR_PAGINA)
+    return paginator.get_page(request.GET.get('page'))
+
+
+def _querystring_sin_pagina(request):
+    params = request.GET.copy()
+    params.pop('page', None)
+    return params.urlencode()
 
-    # Verificar si la tabla crm_service_history existe
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables
-                    WHERE table_name = 'crm_service_history'
-                )
-            """)
-            table_exists = cursor.fetchone()[0]
-    except Exception as e:
-        logger.warning(f"Error checking table existence: {e}")
-        table_exists = False
-
-    if not table_exists:
-        logger.info("Tabla crm_service_history no existe, usando solo datos actuales")
-        # Solo usar datos actuales
-        clientes = Cliente.objects.annotate(
-            total_servicios=Count('ventareserva'),
-            total_gasto=Coalesce(Sum('ventareserva__total'), 0, output_field=models.DecimalField())
-        ).values('id', 'nombre', 'email', 'total_servicios', 'total_gasto')
-
-        results = []
-        for c in clientes:
-            results.append({
-                'cliente_id': c['id'],
-                'nombre': c['nombre'],
-                'email': c['email'],
-                'servicios_actuales': c['total_servicios'],
-                'gasto_actual': float(c['total_gasto']),
-                'servicios_historicos': 0,
-                'gasto_historico': 0,
-                'total_servicios': c['total_servicios'],
-                'total_gasto': float(c['total_gasto'])
-            })
-        return results
-
-    # Tabla existe, usar query combinada AGRUPADA POR TELEFONO para consolidar duplicados
-    try:
-        query = """
-        WITH clientes_por_telefono AS (
-            -- Agrupar clientes por teléfono y elegir un representante
-            SELECT
-                telefono,
-                MIN(id) as cliente_id_representante,
-                MAX(nombre) as nombre,
-                MAX(email) as email,
-                ARRAY_AGG(id) as todos_los_ids
-            FROM ventas_cliente
-            WHERE telefono IS NOT NULL AND telefono != ''
-            GROUP BY telefono
-        )
-        SELECT
-            cpt.cliente_id_representante as cliente_id,
-            cpt.nombre,
-            cpt.email,
-            cpt.telefono,
-            -- Servicios actuales: SUMAR de TODOS los IDs con ese teléfono
-            (SELECT COUNT(DISTINCT rs2.id)
-             FROM ventas_ventareserva vr2
-             JOIN ventas_reservaservicio rs2 ON vr2.id = rs2.venta_reserva_id
-             WHERE vr2.cliente_id = ANY(cpt.todos_los_ids)
-               AND vr2.estado_pago IN ('pagado', 'parcial')
-            ) as servicios_actuales,
-            -- Gasto actual: Usar el TOTAL de la VentaReserva (incluye descuentos/ajustes)
-            (SELECT COALESCE(SUM(vr2.total), 0)
-             FROM ventas_ventareserva vr2
-             WHERE vr2.cliente_id = ANY(cpt.todos_los_ids)
-               AND vr2.estado_pago IN ('pagado', 'parcial')
-            ) as gasto_actual,
-            -- Servicios históricos: SUMAR de TODOS los IDs con ese teléfono
-            -- EXCLUIR servicios con fecha placeholder 2021-01-01 (importación histórica sin fecha real)
-            (SELECT COUNT(DISTINCT sh2.id)
-             FROM crm_service_history sh2
-             WHERE sh2.cliente_id = ANY(cpt.todos_los_ids)
-               AND sh2.service_date != '2021-01-01'
-            ) as servicios_historicos,
-            (SELECT COALESCE(SUM(sh2.price_paid), 0)
-             FROM crm_service_history sh2
-             WHERE sh2.cliente_id = ANY(cpt.todos_los_ids)
-               AND sh2.service_date != '2021-01-01'
-            ) as gasto_historico,
-            -- Totales combinados
-            ((SELECT COUNT(DISTINCT rs2.id)
-              FROM ventas_ventareserva vr2
-              JOIN ventas_reservaservicio rs2 ON vr2.id = rs2.venta_reserva_id
-              WHERE vr2.cliente_id = ANY(cpt.todos_los_ids)
-                AND vr2.estado_pago IN ('pagado', 'parcial')
-             ) +
-             (SELECT COUNT(DISTINCT sh2.id)
-              FROM crm_service_history sh2
-              WHERE sh2.cliente_id = ANY(cpt.todos_los_ids)
-                AND sh2.service_date != '2021-01-01'
-             )) as total_servicios,
-            ((SELECT COALESCE(SUM(vr2.total), 0)
-              FROM ventas_ventareserva vr2
-              WHERE vr2.cliente_id = ANY(cpt.todos_los_ids)
-                AND vr2.estado_pago IN ('pagado', 'parcial')
-             ) +
-             (SELECT COALESCE(SUM(sh2.price_paid), 0)
-              FROM crm_service_history sh2
-              WHERE sh2.cliente_id = ANY(cpt.todos_los_ids)
-                AND sh2.service_date != '2021-01-01'
-             )) as total_gasto
-        FROM clientes_por_telefono cpt
-        ORDER BY total_gasto DESC
-        """
-
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            columns = [col[0] for col in cursor.description]
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
-
-        return results
-    except Exception as e:
-        logger.error(f"Error ejecutando query combinada: {e}")
-        # Fallback a solo datos actuales
-        clientes = Cliente.objects.annotate(
-            total_servicios=Count('ventareserva'),
-            total_gasto=Coalesce(Sum('ventareserva__total'), 0, output_field=models.DecimalField())
-        ).values('id', 'nombre', 'email', 'total_servicios', 'total_gasto')
-
-        results = []
-        for c in clientes:
-            results.append({
-                'cliente_id': c['id'],
-                'nombre': c['nombre'],
-                'email': c['email'],
-                'servicios_actuales': c['total_servicios'],
-                'gasto_actual': float(c['total_gasto']),
-                'servicios_historicos': 0,
-                'gasto_historico': 0,
-                'total_servicios': c['total_servicios'],
-                'total_gasto': float(c['total_gasto'])
-            })
-        return results
 
 @login_required
 def cliente_segmentation_view(request):
@@ -825,45 +662,29 @@ def cliente_segmentation_view(request):
     Displays client segmentation based ONLY on total spend (no visit count).
     Incluye tanto servicios actuales como históricos (CSV importados).
     """
-    # Define Segmentation Thresholds (adjust as needed)
-    SPEND_THRESHOLD_MEDIUM = 50000 # Example: 50,000 CLP
-    SPEND_THRESHOLD_HIGH = 150000 # Example: 150,000 CLP
+    from ..models import Comuna, MetricaCliente
 
-    # Obtener métricas combinadas (actuales + históricos)
-    clientes_data = _get_combined_metrics_for_segmentation()
+    # Un solo aggregate con un Count filtrado por segmento
+    conteos = MetricaCliente.objects.aggregate(
+        total=Count('pk'),
+        **{segmento: Count('pk', filter=filtro) for segmento, filtro in SEGMENTOS_GASTO.items()},
+    )
 
-    # --- Categorize Clients (SOLO POR GASTO) ---
     segments = {
-        'low_spend': {'count': 0, 'label': 'Bajo Gasto (< $50,000)'},
-        'medium_spend': {'count': 0, 'label': 'Gasto Medio ($50,000 - $150,000)'},
-        'high_spend': {'count': 0, 'label': 'Alto Gasto (> $150,000)'},
-        'zero_spend': {'count': 0, 'label': 'Clientes Sin Gasto Registrado'},
+        'low_spend': {'count': conteos['low_spend'], 'label': 'Bajo Gasto (< $50,000)'},
+        'medium_spend': {'count': conteos['medium_spend'], 'label': 'Gasto Medio ($50,000 - $150,000)'},
+        'high_spend': {'count': conteos['high_spend'], 'label': 'Alto Gasto (> $150,000)'},
+        'zero_spend': {'count': conteos['zero_spend'], 'label': 'Clientes Sin Gasto Registrado'},
     }
 
-    for cliente_data in clientes_data:
-        spend = cliente_data['total_gasto']
-
-        if spend == 0:
-             segments['zero_spend']['count'] += 1
-             continue
-
-        # Categorize ONLY by Spend
-        if spend < SPEND_THRESHOLD_MEDIUM:
-            segments['low_spend']['count'] += 1
-        elif spend < SPEND_THRESHOLD_HIGH:
-            segments['medium_spend']['count'] += 1
-        else:
-            segments['high_spend']['count'] += 1
-
     # Obtener comunas únicas para filtro personalizado (usando el nuevo campo estructurado)
-    from ..models import Comuna
     comunas = Comuna.objects.filter(
         clientes__isnull=False  # Solo comunas que tienen clientes
     ).distinct().order_by('nombre').values('id', 'nombre')
 
     context = {
         'segments': segments,
-        'total_clients': len(clientes_data),
+        'total_clients': conteos['total'],
         # Pass thresholds for display/info
         'spend_threshold_medium': SPEND_THRESHOLD_MEDIUM,
         'spend_threshold_high': SPEND_THRESHOLD_HIGH,
@@ -879,43 +700,13 @@ def cliente_segmentation_view(request):
 def client_list_by_segment_view(request, segment_name):
     """
     Displays a list of clients for a specific segment (SOLO BASADO EN GASTO).
-    Incluye tanto servicios actuales como históricos.
+    Incluye tanto servicios actuales como históricos, paginado.
     """
-    # Define Segmentation Thresholds
-    SPEND_THRESHOLD_MEDIUM = 50000 # 50,000 CLP
-    SPEND_THRESHOLD_HIGH = 150000 # 150,000 CLP
-
-    # Obtener métricas combinadas
-    clientes_data = _get_combined_metrics_for_segmentation()
-
-    # Filtrar clientes según el segmento en Python (SOLO POR GASTO)
-    filtered_client_ids = []
-
-    for cliente_data in clientes_data:
-        spend = cliente_data['total_gasto']
-
-        include = False
-
-        if segment_name == 'low_spend':
-            include = 0 < spend < SPEND_THRESHOLD_MEDIUM
-        elif segment_name == 'medium_spend':
-            include = SPEND_THRESHOLD_MEDIUM <= spend < SPEND_THRESHOLD_HIGH
-        elif segment_name == 'high_spend':
-            include = spend >= SPEND_THRESHOLD_HIGH
-        elif segment_name == 'zero_spend':
-            include = spend == 0
-
-        if include:
-            filtered_client_ids.append(cliente_data['cliente_id'])
-
-    # Convertir IDs filtrados de vuelta a queryset de Cliente
-    if filtered_client_ids:
-        clients = Cliente.objects.filter(id__in=filtered_client_ids).annotate(
-            num_visits=Count('ventareserva'),
-            total_spend=Coalesce(Sum('ventareserva__total'), 0, output_field=models.DecimalField())
-        )
-    else:
-        clients = Cliente.objects.none()
+    from ..models import MetricaCliente
+
+    filtro = SEGMENTOS_GASTO.get(segment_name)
+    metricas = MetricaCliente.objects.filter(filtro) if filtro is not None else MetricaCliente.objects.none()
+    page_obj = _pagina_de_clientes(request, metricas)
 
     # Mapeo de nombres de segmento para el display
     segment_labels = {
@@ -928,7 +719,9 @@ def client_list_by_segment_view(request, segment_name):
     context = {
         'segment_name': segment_name,
         'segment_label': segment_labels.get(segment_name, segment_name),
-        'clients': clients,
+        'clients': page_obj,
+        'page_obj': page_obj,
+        'querystring': _querystring_sin_pagina(request),
     }
 
     return render(request, 'ventas/client_list_by_segment.html', context)
@@ -939,6 +732,8 @@ def client_list_custom_filter_view(request):
     """
     Vista para filtro personalizado de clientes por rango de gasto, comuna y email
     """
+    from ..models import Comuna, MetricaCliente
+
     # Obtener parámetros del formulario
     gasto_min = request.GET.get('gasto_min', '0')
     gasto_max = request.GET.get('gasto_max', '')
@@ -955,56 +750,24 @@ def client_list_custom_filter_view(request):
     except ValueError:
         gasto_max = float('inf')
 
-    # Obtener métricas combinadas
-    clientes_data = _get_combined_metrics_for_segmentation()
-
-    # Filtrar por rango de gasto y crear mapas detallados
-    filtered_client_ids = []
-    gasto_map = {}  # {cliente_id: {'actual': X, 'historico': Y, 'total': Z}}
-
-    for cliente_data in clientes_data:
-        spend_total = cliente_data['total_gasto']
-        spend_actual = cliente_data.get('gasto_actual', 0)
-        spend_historico = cliente_data.get('gasto_historico', 0)
-
-        if gasto_min <= spend_total <= gasto_max:
-            filtered_client_ids.append(cliente_data['cliente_id'])
-            gasto_map[cliente_data['cliente_id']] = {
-                'actual': spend_actual,
-                'historico': spend_historico,
-                'total': spend_total
-            }
-
-    # Convertir a queryset y aplicar filtro de comuna
-    if filtered_client_ids:
-        clients = Cliente.objects.filter(id__in=filtered_client_ids)
-
-        # Filtrar por comuna si no es "todas"
-        if comuna_id and comuna_id != 'todas':
-            clients = clients.filter(comuna_id=int(comuna_id))
-
-        # Filtrar por email si se especificó
-        from django.db.models import Q
-        if email_filter == 'con_email':
-            clients = clients.exclude(Q(email__isnull=True) | Q(email=''))
-        elif email_filter == 'sin_email':
-            clients = clients.filter(Q(email__isnull=True) | Q(email=''))
-
-        # Agregar gastos detallados a cada cliente
-        clients_list = []
-        for cliente in clients:
-            gastos = gasto_map.get(cliente.id, {'actual': 0, 'historico': 0, 'total': 0})
-            cliente.gasto_actual = gastos['actual']
-            cliente.gasto_historico = gastos['historico']
-            cliente.gasto_total_combinado = gastos['total']
-            clients_list.append(cliente)
-
-        # Ordenar por gasto total descendente (mayor a menor)
-        clients_list.sort(key=lambda c: c.gasto_total_combinado, reverse=True)
-
-        clients = clients_list
-    else:
-        clients = []
+    # Rango de gasto sobre el índice de total_gasto
+    metricas = MetricaCliente.objects.filter(total_gasto__gte=gasto_min)
+    if gasto_max != float('inf'):
+        metricas = metricas.filter(total_gasto__lte=gasto_max)
+
+    # Filtrar por comuna si no es "todas"
+    comuna = None
+    if comuna_id and comuna_id != 'todas':
+        comuna = Comuna.objects.filter(id=comuna_id).first() if comuna_id.isdigit() else None
+        metricas = metricas.filter(comuna=comuna) if comuna else metricas.none()
+
+    # Filtrar por email si se especificó
+    if email_filter == 'con_email':
+        metricas = metricas.exclude(email='')
+    elif email_filter == 'sin_email':
+        metricas = metricas.filter(email='')
+
+    page_obj = _pagina_de_clientes(request, metricas)
 
     # Generar label descriptivo
     if gasto_max == float('inf'):
@@ -1013,13 +776,8 @@ def client_list_custom_filter_view(request):
         segment_label = f'Gasto: ${gasto_min:,.0f} - ${gasto_max:,.0f}'
 
     # Agregar nombre de comuna al label si está filtrado
-    if comuna_id and comuna_id != 'todas':
-        from ..models import Comuna
-        try:
-            comuna = Comuna.objects.get(id=int(comuna_id))
-            segment_label += f' | Comuna: {comuna.nombre}'
-        except Comuna.DoesNotExist:
-            pass
+    if comuna:
+        segment_label += f' | Comuna: {comuna.nombre}'
 
     # Agregar filtro de email al label si está especificado
     if email_filter == 'con_email':
@@ -1030,7 +788,9 @@ def client_list_custom_filter_view(request):
     context = {
         'segment_name': 'custom_filter',
         'segment_label': segment_label,
-        'clients': clients,
+        'clients': page_obj,
+        'page_obj': page_obj,
+        'querystring': _querystring_sin_pagina(request),
         'gasto_min': int(gasto_min) if gasto_min else 0,
         'gasto_max': int(gasto_max) if gasto_max != float('inf') else '',
         'comuna_id': comuna_id,
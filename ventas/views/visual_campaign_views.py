@@ -16,8 +16,8 @@ from django.utils import timezone
 from django.views.decorators.http import require_POST
 
 from ventas.models import EmailCampaignTemplate, CampaignSendLog, NewsletterSubscriber
+from ventas.services import trabajos_service
 import logging
-import threading
 import time
 
 logger = logging.getLogger(__name__)
@@ -195,10 +195,11 @@ def visual_campaign_start(request, pk):
             campaign.started_at = timezone.now()
             campaign.save()
             
-            # Iniciar en background
-            thread = threading.Thread(target=send_visual_campaign_async, args=(campaign.pk,))
-            thread.daemon = True
-            thread.start()
+            # Encolar: lo corre el worker (procesar_trabajos)
+            trabajos_service.encolar(
+                'campana_visual', {'campaign_pk': campaign.pk}, cola='campanas',
+                clave=f'campana_visual:{campaign.pk}', max_intentos=1,
+            )
             
             messages.success(request, f'Campaña iniciada. Se enviará en background.')
             return redirect('visual_campaign_stats', pk=pk)
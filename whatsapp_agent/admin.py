@@ -101,7 +101,8 @@ class AusenciaEnviadaAdmin(admin.ModelAdmin):
 @admin.register(SugerenciaAgenteWhatsApp)
 class SugerenciaAgenteWhatsAppAdmin(admin.ModelAdmin):
     """Solo lectura: observabilidad de lo que el agente sugirió/escaló."""
-    list_display = ('created_at', 'phone', 'escalar', 'enviada', 'modelo', 'output_tokens', 'latency_ms')
+    list_display = ('created_at', 'phone', 'escalar', 'enviada', 'modelo', 'output_tokens', 'cache_ratio',
+                    'cost_usd', 'latency_ms')
     list_filter = ('escalar', 'enviada', 'modo', 'modelo')
     search_fields = ('phone', 'wa_message_id', 'texto', 'motivo_escalar')
     readonly_fields = [f.name for f in SugerenciaAgenteWhatsApp._meta.fields]
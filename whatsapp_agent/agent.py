@@ -20,7 +20,7 @@ import unicodedata
 
 from django.utils import timezone
 
-from . import escalation, grounding, prompt as prompt_mod, rollback
+from . import escalation, prompt as prompt_mod, rollback, snapshot
 from .models import SugerenciaAgenteWhatsApp, WhatsAppAgentConfig
 
 logger = logging.getLogger(__name__)
@@ -188,7 +188,9 @@ _TOOLS = [{
             'Alternativa si solo tienes fechas: `fecha_salida` (check-out). '
             'Ejemplo: cliente "2 noches desde el sábado 27" → fecha_llegada="sábado 27" (TEXTO LITERAL, NO lo conviertas a fecha), noches=2. '
             'Devuelve cabañas libres en TODAS las noches del rango, cada una con `total_por_noche` '
-            '(tarifa plana) y `total_estadia`. Muestra solo los totales, NUNCA el precio unitario por persona.'
+            '(tarifa plana) y `total_estadia`. Muestra solo los totales, NUNCA el precio unitario por persona. '
+            'Si el cliente dice que es flexible con las fechas, pasa `flexible_dias` (1-7): '
+            'devuelve además `ventanas_alternativas` (otras llegadas con la misma cantidad de noches).'
         ),
         'parameters': {
             'type': 'object',
@@ -197,6 +199,7 @@ _TOOLS = [{
                 'noches': {'type': 'integer', 'description': 'Número de noches (entero ≥1). PREFERIDO sobre fecha_salida.'},
                 'personas': {'type': 'integer', 'description': 'Cantidad de personas (1-2)'},
                 'fecha_salida': {'type': 'string', 'description': 'Check-out (alternativa si no tienes noches). PASÁ EL TEXTO LITERAL del cliente; NO calcules el día.'},
+                'flexible_dias': {'type': 'integer', 'description': 'Solo si el cliente es flexible: días de margen (±N, máx 7) alrededor de la llegada.'},
             },
             'required': ['fecha_llegada', 'personas'],
         },
@@ -664,6 +667,26 @@ def _nombre_de_tool(name):
     return name
 
 
+# Tools que solo LEEN: si el modelo pide varias en un mismo paso (disponibilidad +
+# pack + reservas del cliente) corren a la vez. Las que tocan carrito o propuesta
+# quedan fuera: esas van en serie y en el orden en que se pidieron.
+_TOOLS_SOLO_LECTURA = frozenset({
+    'consultar_disponibilidad',
+    'consultar_disponibilidad_combo',
+    'consultar_disponibilidad_pack',
+    'consultar_disponibilidad_pack_cabana',
+    'consultar_disponibilidad_alojamiento_multinoche',
+    'consultar_disponibilidad_refugio',
+    'alternativas_experiencia',
+    'buscar_reservas_cliente',
+    'catalogo_giftcards',
+})
+
+
+def _tool_de_lectura(name):
+    return _nombre_de_tool(name) in _TOOLS_SOLO_LECTURA
+
+
 def _fecha_hoy_texto():
     """'2026-06-14 (domingo)' en hora de Chile, para que el LLM resuelva 'el sábado'."""
     from django.utils import timezone
@@ -862,26 +885,38 @@ def _estado_estructurado(canal, external_id):
 
 
 def _guardar(entrante, *, texto='', escalar=False, motivo='', modo='', modelo='',
-             error='', input_tokens=0, output_tokens=0, latency_ms=0):
+             error='', input_tokens=0, output_tokens=0, latency_ms=0, tools=None,
+             cached_tokens=0):
     """Crea/actualiza la sugerencia (cache por wa_message_id)."""
+    from destino_puerto_varas.services.llm.cost_tracker import CostTracker
     sug, _ = SugerenciaAgenteWhatsApp.objects.update_or_create(
         wa_message_id=entrante.wa_message_id,
         defaults=dict(
             phone=entrante.phone, texto=texto, escalar=escalar, motivo_escalar=motivo[:200],
             modo=modo, modelo=modelo[:120], error=error[:200],
             input_tokens=input_tokens, output_tokens=output_tokens, latency_ms=latency_ms,
+            tools=tools or [],
+            **CostTracker.turn_metrics(modelo, input_tokens, output_tokens, cached_tokens),
         ),
     )
     return sug
 
 
-def _borrador_escala(motivo, *, error='', modelo='', tokens=(0, 0, 0)):
+def _borrador_escala(motivo, *, error='', modelo='', tokens=(0, 0, 0, 0), tools=()):
     return {
         'escalar': True, 'motivo': motivo, 'texto': '', 'modelo': modelo, 'error': error,
         'input_tokens': tokens[0], 'output_tokens': tokens[1], 'latency_ms': tokens[2],
+        'cached_tokens': tokens[3],
+        'tools': list(tools),
     }
 
 
+def _tiempos_de_tools(tool_calls_executed):
+    """[{nombre, ms, paralela}] de las tools del turno, para la sugerencia."""
+    return [{'nombre': tc.get('name', ''), 'ms': tc.get('ms', 0), 'paralela': bool(tc.get('paralela'))}
+            for tc in (tool_calls_executed or [])]
+
+
 def _contexto_saludo(entrante):
     """(estado_saludo, nombre) determinístico para un entrante. Tolerante a fallos.
 
@@ -1642,9 +1677,10 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
         return {'escalar': False, 'motivo': '', 'texto': confirmacion, 'modelo': 'codigo',
                 'error': '', 'input_tokens': 0, 'output_tokens': 0, 'latency_ms': 0}
 
-    # 2) Catálogo vivo (grounding).
+    # 2) Catálogo vivo (grounding) + carta de precios (P-34), desde la foto compartida:
+    #    se arman una vez por versión del catálogo, no en cada turno.
     try:
-        catalogo = grounding.catalogo_vivo()
+        foto = snapshot.obtener(config)
     except Exception as exc:  # noqa: BLE001 — nunca romper por el catálogo
         logger.exception('Agente WA: error armando catálogo: %s', exc)
         return _borrador_escala('no se pudo cargar el catálogo', error=str(exc)[:200])
@@ -1652,18 +1688,22 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
     # Armado de prompts. Un error aquí (ej. llave sin escapar en un f-string del
     # prompt → NameError) NUNCA debe tragarse en null global: deriva a humano.
     try:
-        # P-34: carta de precios para aperturas genéricas. carta_de_precios()
-        # nunca lanza (devuelve '' ante error) — el bloque 2b solo aparece si hay carta.
-        from whatsapp_agent.carta import carta_de_precios
-        system_prompt = prompt_mod.build_system_prompt(
-            config.persona_tono, catalogo, config.link_reserva, config.conocimiento,
-            fecha_hoy=_fecha_hoy_texto(), saludo_estado=saludo_estado, saludo_nombre=saludo_nombre,
-            carta=carta_de_precios())
+        # Las partes fijas vienen armadas; acá solo se pegan la fecha y el saludo. Todo
+        # menos el saludo va como prefijo cacheable: es igual para todos los clientes
+        # del día, así que el proveedor lo cobra con descuento.
+        system_fijo, system_saludo = prompt_mod.system_prompt_cacheable(
+            foto['partes'], fecha_hoy=_fecha_hoy_texto(),
+            saludo_estado=saludo_estado, saludo_nombre=saludo_nombre)
         # Estado en curso (carrito + cotización vigente) leído de la BD, para que Luna no
         # dependa de la ventana de mensajes ni de "recordar" lo ya armado.
         estado_actual = _estado_estructurado(canal, phone)
+        # Al modelo va el historial recortado al presupuesto; las heurísticas de las
+        # tools siguen leyendo `historial` entero.
+        from django.conf import settings
+        from destino_puerto_varas.services.llm.token_budget import recortar_historial
         user_prompt = prompt_mod.build_user_prompt(
-            historial, mensaje, datos_cliente=datos_cliente, estado_actual=estado_actual)
+            recortar_historial(historial, settings.DPV_LLM_HISTORY_TOKEN_BUDGET), mensaje,
+            datos_cliente=datos_cliente, estado_actual=estado_actual)
     except Exception as exc:  # noqa: BLE001 — nunca romper por el armado del prompt
         logger.exception('Agente WA: error armando el prompt: %s', exc)
         return _borrador_escala('no se pudo armar el prompt', error=str(exc)[:200])
@@ -1764,6 +1804,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
                     (args or {}).get('personas', 1),
                     noches=(args or {}).get('noches'),
                     fecha_salida=(args or {}).get('fecha_salida'),
+                    flexible_dias=(args or {}).get('flexible_dias') or 0,
                 )
             except Exception as exc:  # noqa: BLE001
                 logger.exception('Agente WA: tool alojamiento multinoche falló: %s', exc)
@@ -2763,15 +2804,17 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
         return {'error': f'herramienta desconocida: {name}'}
 
     try:
-        from destino_puerto_varas.services.llm.openrouter_provider import OpenRouterProvider
+        from destino_puerto_varas.services.llm.openrouter_provider import (
+            OpenRouterProvider, system_message)
         provider = OpenRouterProvider()
         resultado = provider.generate_with_tools(
             messages=[
-                {'role': 'system', 'content': system_prompt},
+                system_message(system_fijo, system_saludo),
                 {'role': 'user', 'content': user_prompt},
             ],
             tools=_TOOLS,
             tool_executor=_tool_executor_con_contexto,
+            paralelizable=_tool_de_lectura,
             model=modelo,
             max_tokens=config.max_tokens,
             temperature=float(config.temperature),
@@ -2780,17 +2823,19 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
         logger.exception('Agente WA: provider lanzó excepción: %s', exc)
         return _borrador_escala('modelo no disponible', error=str(exc)[:200], modelo=modelo)
 
-    tokens = (resultado.input_tokens, resultado.output_tokens, resultado.latency_ms)
+    tokens = (resultado.input_tokens, resultado.output_tokens, resultado.latency_ms,
+              resultado.cached_tokens)
+    tools = _tiempos_de_tools(resultado.tool_calls_executed)
 
     # 4) Fallback seguro: si el LLM falló, deriva a humano (no inventamos).
     if not resultado.ok:
         return _borrador_escala('modelo no disponible', error=resultado.error[:200],
-                                modelo=modelo, tokens=tokens)
+                                modelo=modelo, tokens=tokens, tools=tools)
 
     # 5) ¿El LLM decidió escalar?
     escalar, motivo_llm, texto_limpio = escalation.parse_escalada(resultado.text)
     if escalar:
-        return _borrador_escala(motivo_llm, modelo=modelo, tokens=tokens)
+        return _borrador_escala(motivo_llm, modelo=modelo, tokens=tokens, tools=tools)
 
     texto = escalation.sanear_salida(texto_limpio)
     if not texto:
@@ -2802,9 +2847,10 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
         if cierre:
             logger.info('[Agente WA] modelo vacío tras tools → cierre determinístico')
             return {'escalar': False, 'motivo': '', 'texto': cierre, 'modelo': modelo, 'error': '',
-                    'input_tokens': tokens[0], 'output_tokens': tokens[1], 'latency_ms': tokens[2]}
+                    'input_tokens': tokens[0], 'output_tokens': tokens[1], 'latency_ms': tokens[2],
+                    'cached_tokens': tokens[3], 'tools': tools}
         return _borrador_escala('respuesta vacía del modelo', error='empty_output',
-                                modelo=modelo, tokens=tokens)
+                                modelo=modelo, tokens=tokens, tools=tools)
 
     # H-097: una tool avisó que su pregunta ya se hizo y la respuesta no sirvió.
     # Repetirla por tercera vez es la peor cara del bot; la toma una persona.
@@ -2815,7 +2861,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
                            _tc.get('name'))
             return _borrador_escala(
                 'la misma pregunta ya se hizo y la respuesta del cliente no se pudo usar',
-                modelo=modelo, tokens=tokens)
+                modelo=modelo, tokens=tokens, tools=tools)
 
     # H-095: el borrador puede ser plomería interna. Pasó de verdad (14:45): al
     # cliente le llegó «ALTO. Todavía no se puede cotizar. Mandá al cliente
@@ -2832,7 +2878,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
                            'pregunta con qué reemplazarlo → escalar. Texto: %s', texto[:160])
             return _borrador_escala(
                 'el borrador traía instrucciones internas, no un mensaje para el cliente',
-                modelo=modelo, tokens=tokens)
+                modelo=modelo, tokens=tokens, tools=tools)
 
     # H-045: el texto no está vacío, pero puede contradecir una tool que sí tuvo éxito en este
     # mismo turno (ver comentario junto a escalation.hay_contradiccion_exito_vs_texto). No se
@@ -2843,7 +2889,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
             texto[:200])
         return _borrador_escala(
             'posible contradicción: el texto niega algo que una tool ya confirmó exitoso',
-            modelo=modelo, tokens=tokens)
+            modelo=modelo, tokens=tokens, tools=tools)
 
     # H-090: el espejo del anterior — el texto AFIRMA una mutación que ninguna tool
     # hizo. Sin esto, el cliente cree que su carrito cambió y no cambió.
@@ -2853,7 +2899,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
             '→ escalar. Texto: %s', texto[:200])
         return _borrador_escala(
             'el texto dice que se agregó/cambió algo, pero ninguna herramienta tocó el carrito',
-            modelo=modelo, tokens=tokens)
+            modelo=modelo, tokens=tokens, tools=tools)
 
     # H-096: si preguntó algo que El Pase ya responde, se le suma el link.
     texto = sumar_pase_si_pregunta(texto, mensaje, phone)
@@ -2861,6 +2907,7 @@ def _producir_borrador_inner(config, mensaje, historial='', saludo_estado='', sa
     return {
         'escalar': False, 'motivo': '', 'texto': texto, 'modelo': modelo, 'error': '',
         'input_tokens': tokens[0], 'output_tokens': tokens[1], 'latency_ms': tokens[2],
+        'cached_tokens': tokens[3], 'tools': tools,
     }
 
 
@@ -2972,5 +3019,5 @@ def generar_sugerencia(phone, *, forzar=False):
         entrante, texto=d['texto'], escalar=d['escalar'], motivo=d['motivo'],
         modo=config.modo, modelo=d['modelo'], error=d['error'],
         input_tokens=d['input_tokens'], output_tokens=d['output_tokens'],
-        latency_ms=d['latency_ms'],
+        latency_ms=d['latency_ms'], tools=d.get('tools'), cached_tokens=d.get('cached_tokens', 0),
     )
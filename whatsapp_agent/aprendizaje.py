@@ -126,7 +126,7 @@ def procesar_pendientes(limite=50):
 
 def clasificar(config, borrador, enviado):
     """Clasifica una corrección vía LLM. Devuelve dict (+'modelo','error'). No lanza."""
-    from . import grounding
+    from . import snapshot
     from .agent import _modelo_efectivo
 
     base = {'tipo': 'puntual', 'texto_propuesto': '', 'ref_catalogo': '', 'motivo': '',
@@ -137,7 +137,7 @@ def clasificar(config, borrador, enviado):
         return base
 
     try:
-        catalogo = grounding.catalogo_vivo()
+        catalogo = snapshot.obtener(config)['catalogo']
     except Exception as exc:  # noqa: BLE001
         logger.exception('Aprendizaje: error armando catálogo: %s', exc)
         catalogo = '(catálogo no disponible)'
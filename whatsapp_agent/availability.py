@@ -378,8 +378,8 @@ def disponibilidad(fecha=None, personas=1, tipo=None, limite=2, incluir_slots_pr
              capacidad_minima, capacidad_maxima, duracion_texto, slots_libres:[...]|null}
         ], 'error'? }
     """
-    from ventas.models import Servicio, ServicioBloqueo, ServicioSlotBloqueo
-    from ventas.calendar_utils import verificar_disponibilidad
+    from ventas.models import Servicio
+    from ventas.services.disponibilidad_service import cargar_ocupacion_dia
     from ventas.views.calendario_matriz_view import extraer_slots_para_fecha
 
     from .grounding import formatear_duracion
@@ -410,7 +410,7 @@ def disponibilidad(fecha=None, personas=1, tipo=None, limite=2, incluir_slots_pr
         personas = 1
 
     from .models import WhatsAppAgentConfig
-    comp_ids = WhatsAppAgentConfig.get_solo().ids_complementarios()
+    comp_ids = WhatsAppAgentConfig.ids_complementarios_cacheados()
 
     qs = Servicio.objects.filter(
         publicado_web=True, activo=True,
@@ -431,14 +431,19 @@ def disponibilidad(fecha=None, personas=1, tipo=None, limite=2, incluir_slots_pr
     # Para masajes hoy, si aún no hay masajistas en sitio, sumar el viaje (~1h).
     masaje_en_sitio = _hay_masaje_agendado_hoy(f) if es_hoy else False
 
+    # Bloqueos y reservas del día para TODOS los candidatos en un número fijo de
+    # consultas; el loop de abajo solo mira memoria (antes: 2-3 queries por slot).
+    candidatos = list(qs)
+    ocupacion = cargar_ocupacion_dia([s.id for s in candidatos], f) if f is not None else None
+
     servicios = []
-    for s in qs:
+    for s in candidatos:
         if not _es_masaje_agendable(s):
             continue  # masaje no auto-agendable (consulta por WhatsApp) → no se ofrece
         libres = None
         if f is not None:
             # Modo disponibilidad: horarios libres ese día.
-            if ServicioBloqueo.servicio_bloqueado_en_fecha(s.id, f):
+            if ocupacion.servicio_bloqueado(s.id):
                 continue
             # Piso: hoy no se ofrecen horas pasadas; masaje sin masajistas en sitio
             # exige el tiempo de viaje (clientes vienen de otra ciudad).
@@ -454,10 +459,10 @@ def disponibilidad(fecha=None, personas=1, tipo=None, limite=2, incluir_slots_pr
                     hm = _hhmm_min(hora)
                     if hm is not None and hm < piso_min:
                         continue  # hora pasada (o sin margen de viaje) → no ofrecer
-                if ServicioSlotBloqueo.slot_bloqueado(s.id, f, hora):
+                if ocupacion.slot_bloqueado(s.id, hora):
                     continue
                 try:
-                    if verificar_disponibilidad(s, f, hora, personas):
+                    if ocupacion.slot_admite(s, hora, personas):
                         libres.append(hora)
                 except Exception:  # noqa: BLE001 — un slot con error no debe tumbar la consulta
                     logger.exception('disponibilidad: error verificando %s %s %s', s.id, f, hora)
@@ -525,7 +530,31 @@ def disponibilidad(fecha=None, personas=1, tipo=None, limite=2, incluir_slots_pr
     }
 
 
-def disponibilidad_alojamiento_multinoche(fecha_llegada, personas=1, noches=None, fecha_salida=None):
+MAX_DIAS_FLEXIBLES = 7
+
+
+def _monto(valor):
+    return int(valor) if valor == int(valor) else valor
+
+
+def _cabanas_libres(cabanas, ocupacion, llegada, salida, personas, noches):
+    """Cabañas libres TODAS las noches de [llegada, salida), ordenadas por total."""
+    libres = []
+    for cabana in cabanas:
+        if not ocupacion.libre_entre(cabana.id, llegada, salida):
+            continue
+        total_por_noche = float(cabana.precio_base) * personas
+        libres.append({
+            'nombre': cabana.nombre,
+            'total_por_noche': _monto(total_por_noche),
+            'noches': noches,
+            'total_estadia': _monto(total_por_noche * noches),
+        })
+    return sorted(libres, key=lambda x: x['total_estadia'])
+
+
+def disponibilidad_alojamiento_multinoche(fecha_llegada, personas=1, noches=None, fecha_salida=None,
+                                          flexible_dias=0):
     """Disponibilidad de cabañas para estadías multi-noche (H-027).
 
     Parámetros:
@@ -533,17 +562,26 @@ def disponibilidad_alojamiento_multinoche(fecha_llegada, personas=1, noches=None
     - personas: 1-2 (default 1).
     - noches: entero ≥1. Si se pasa, calcula salida = llegada + noches días. PREFERIDO.
     - fecha_salida: YYYY-MM-DD (alternativa si no se pasa noches). Si ambos, noches tiene precedencia.
+    - flexible_dias: 0-7. Si el cliente es flexible, prueba también llegadas ±N días
+      (misma cantidad de noches) y devuelve las mejores ventanas.
 
     Solo cabañas: publicadas, activas, capacidad 1-2 personas, NO complementos.
-    Devuelve cabañas LIBRES en TODAS las noches del rango.
+    Devuelve cabañas LIBRES en TODAS las noches del rango: sin reservas ni bloqueo
+    de día (ServicioBloqueo: OTA, mantención).
+
+    La ocupación de todas las cabañas y de todo el rango (ampliado en ±N días si es
+    flexible) sale de una sola carga agrupada (`cargar_ocupacion_rango`); cada
+    ventana se evalúa en memoria, sin consultas por cabaña ni por fecha.
 
     Respuesta: {'noches', 'fecha_llegada', 'fecha_salida', 'personas', 'cabanas': [
         {nombre, total_por_noche, noches, total_estadia}  (SIN precio_por_persona)
+    ], 'ventanas_alternativas'? (solo si flexible_dias > 0): [
+        {fecha_llegada, fecha_salida, total_disponibles, desde_total}
     ], 'error'?}
     """
     try:
-        from datetime import timedelta
-        from ventas.models import Servicio, ReservaServicio
+        from ventas.models import Servicio
+        from ventas.services.disponibilidad_service import cargar_ocupacion_rango
         from .models import WhatsAppAgentConfig
 
         f_llegada = _parse_fecha(fecha_llegada)
@@ -573,62 +611,69 @@ def disponibilidad_alojamiento_multinoche(fecha_llegada, personas=1, noches=None
         if personas < 1 or personas > 2:
             return {'error': 'máximo 2 personas por cabaña', 'cabanas': []}
 
+        try:
+            flexible_dias = max(0, min(int(flexible_dias or 0), MAX_DIAS_FLEXIBLES))
+        except (TypeError, ValueError):
+            flexible_dias = 0
+
         # Calcular noches del rango
         delta = f_salida - f_llegada
         noches = delta.days
 
         # Obtener todas las cabañas candidatas
-        comp_ids = WhatsAppAgentConfig.get_solo().ids_complementarios()
+        comp_ids = WhatsAppAgentConfig.ids_complementarios_cacheados()
 
-        cabanas = Servicio.objects.filter(
+        cabanas = list(Servicio.objects.filter(
             tipo_servicio='cabana',
             publicado_web=True,
             activo=True,
             capacidad_minima__lte=personas,
             capacidad_maxima__gte=personas,
-        ).exclude(id__in=comp_ids).order_by('nombre')
-
-        # Para cada cabaña, verificar si está libre en TODAS las noches
-        resultado = []
-        for cabana in cabanas:
-            # Contar ocupaciones en cualquiera de las noches del rango
-            ocupadas_en_rango = ReservaServicio.objects.filter(
-                servicio=cabana,
-                fecha_agendamiento__gte=f_llegada,
-                fecha_agendamiento__lt=f_salida,
-            ).count()
-
-            # Si está ocupada en alguna noche del rango, excluir
-            if ocupadas_en_rango > 0:
-                continue
-
-            # Cabaña libre: calcular precio
-            precio_base = float(cabana.precio_base)
-            total_por_noche = precio_base * personas
-            total_estadia = total_por_noche * noches
-
-            resultado.append({
-                'nombre': cabana.nombre,
-                'total_por_noche': int(total_por_noche) if total_por_noche == int(total_por_noche) else total_por_noche,
-                'noches': noches,
-                'total_estadia': int(total_estadia) if total_estadia == int(total_estadia) else total_estadia,
-            })
-
-        # Ordenar por precio y guardar el total ANTES de limitar
-        resultado_ordenado = sorted(resultado, key=lambda x: x['total_estadia'])
+        ).exclude(id__in=comp_ids).order_by('nombre'))
+
+        # Ocupación de todas las cabañas para todas las noches que puede tocar
+        # cualquier ventana (la última noche es la víspera de la salida más tardía).
+        desplazamiento = timedelta(days=flexible_dias)
+        ocupacion = cargar_ocupacion_rango(
+            [c.id for c in cabanas],
+            f_llegada - desplazamiento,
+            f_salida + desplazamiento - timedelta(days=1),
+        )
+
+        resultado_ordenado = _cabanas_libres(cabanas, ocupacion, f_llegada, f_salida, personas, noches)
         total_disponibles = len(resultado_ordenado)
 
-        # Limitar a máximo 2 cabañas (las 2 más económicas, por total_estadia)
-        resultado = resultado_ordenado[:2]
-
-        return {
+        respuesta = {
             'fecha_llegada': f_llegada.isoformat(),
             'fecha_salida': f_salida.isoformat(),
             'noches': noches,
             'personas': personas,
-            'cabanas': resultado,
+            # Limitar a máximo 2 cabañas (las 2 más económicas, por total_estadia)
+            'cabanas': resultado_ordenado[:2],
             'total_disponibles': total_disponibles,
         }
+
+        if flexible_dias:
+            hoy = timezone.localdate()
+            ventanas = []
+            for dias in range(-flexible_dias, flexible_dias + 1):
+                llegada = f_llegada + timedelta(days=dias)
+                if dias == 0 or llegada < hoy:
+                    continue
+                salida = llegada + timedelta(days=noches)
+                libres = _cabanas_libres(cabanas, ocupacion, llegada, salida, personas, noches)
+                if libres:
+                    ventanas.append((abs(dias), {
+                        'fecha_llegada': llegada.isoformat(),
+                        'fecha_salida': salida.isoformat(),
+                        'total_disponibles': len(libres),
+                        'desde_total': libres[0]['total_estadia'],
+                    }))
+            # Las más cercanas a la fecha pedida primero; a igual distancia, más opciones.
+            ventanas.sort(key=lambda v: (v[0], -v[1]['total_disponibles'], v[1]['fecha_llegada']))
+            respuesta['ventanas_alternativas'] = [v for _, v in ventanas[:3]]
+
+        return respuesta
     except Exception as exc:  # noqa: BLE001
         logger.exception('Agente WA: error en disponibilidad_alojamiento_multinoche: %s', exc)
         return {'error': f'Error al consultar disponibilidad: {str(exc)[:100]}', 'cabanas': []}
@@ -82,7 +82,7 @@ def carta_de_precios():
 
         from .models import WhatsAppAgentConfig
 
-        comp_ids = WhatsAppAgentConfig.get_solo().ids_complementarios()
+        comp_ids = WhatsAppAgentConfig.ids_complementarios_cacheados()
         qs = (Servicio.objects
               .filter(publicado_web=True, activo=True)
               .exclude(id__in=comp_ids))
@@ -219,7 +219,7 @@ def catalogo_vivo():
 
     from .models import WhatsAppAgentConfig
     from .availability import TIPOS_PRINCIPALES
-    comp_ids = WhatsAppAgentConfig.get_solo().ids_complementarios()
+    comp_ids = WhatsAppAgentConfig.ids_complementarios_cacheados()
 
     servicios = list(
         Servicio.objects
@@ -0,0 +1,74 @@
+"""Mide cuánto tarda cada etapa de un turno de Luna, sin llamar al LLM real.
+
+Repite entrantes ya respondidos (los que tienen SugerenciaAgenteWhatsApp) por
+`_producir_borrador` con un modelo de guion local (ver whatsapp_agent/medicion_turnos.py)
+y reporta p50/p95 de milisegundos y consultas SQL por etapa. No envía nada y no
+deja cambios en la base (cada turno se revierte).
+
+Ejemplos:
+  python manage.py medir_turnos_luna
+  python manage.py medir_turnos_luna --limite 100 --repeticiones 3 --frio
+  python manage.py medir_turnos_luna --mensaje "tienen tina el sábado?" --repeticiones 20
+  python manage.py medir_turnos_luna --json > antes.json
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Banco de medición de turnos de Luna con un LLM de guion local (no envía nada).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, default=50,
+                            help='Cuántos entrantes grabados repetir (los más nuevos).')
+        parser.add_argument('--phone', type=str, default='',
+                            help='Solo los entrantes de este teléfono.')
+        parser.add_argument('--mensaje', type=str, default='',
+                            help='Repite este texto en vez de conversaciones grabadas.')
+        parser.add_argument('--repeticiones', type=int, default=1,
+                            help='Veces que se repite cada turno.')
+        parser.add_argument('--frio', action='store_true',
+                            help='Invalida el snapshot del catálogo antes de cada turno.')
+        parser.add_argument('--latencia-llm', type=int, default=0,
+                            help='Milisegundos simulados por paso del modelo.')
+        parser.add_argument('--fecha', type=str, default='',
+                            help='Fecha que consultan las tools del guion (default: próximo sábado).')
+        parser.add_argument('--json', action='store_true',
+                            help='Imprime el resumen como JSON (para comparar entre versiones).')
+
+    def handle(self, *args, **opts):
+        from whatsapp_agent.medicion_turnos import repetir, turnos_grabados
+
+        fecha = None
+        if opts['fecha']:
+            try:
+                fecha = timezone.datetime.strptime(opts['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--fecha debe ser AAAA-MM-DD.')
+
+        mensaje = (opts['mensaje'] or '').strip()
+        if mensaje:
+            turnos = [(opts['phone'] or '', mensaje, timezone.now())]
+        else:
+            turnos = turnos_grabados(limite=opts['limite'], phone=opts['phone'])
+        if not turnos:
+            raise CommandError('No hay entrantes grabados con sugerencia; usa --mensaje "texto".')
+
+        banco = repetir(turnos, repeticiones=max(1, opts['repeticiones']), frio=opts['frio'],
+                        latencia_llm_ms=opts['latencia_llm'], fecha=fecha)
+        filas = banco.resumen()
+
+        if opts['json']:
+            self.stdout.write(json.dumps({'turnos': len(turnos), 'etapas': filas}, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'— {len(turnos)} turno(s) × {opts["repeticiones"]} —'))
+        self.stdout.write(f'  {"etapa":<58} {"n":>4} {"p50 ms":>9} {"p95 ms":>9} {"sql p50":>8} {"sql p95":>8}')
+        for f in filas:
+            self.stdout.write(
+                f'  {f["etapa"]:<58} {f["n"]:>4} {f["p50_ms"]:>9} {f["p95_ms"]:>9} '
+                f'{f["consultas_p50"]:>8} {f["consultas_p95"]:>8}')
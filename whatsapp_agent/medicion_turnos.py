@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Banco de medición de turnos de Luna: repite conversaciones grabadas contra un
+LLM de guion local y mide cada etapa del turno.
+
+`probar_agente_wa` llama al modelo real (lento, caro, no determinístico): sirve
+para ver QUÉ contesta Luna, no CUÁNTO tarda el código alrededor. Acá el modelo
+es `ModeloGuion`: pide tools según palabras del mensaje (cabaña → alojamiento,
+tina/masaje → disponibilidad + pack, reserva → reservas del cliente, regalo →
+gift cards) y contesta un texto fijo. Así una regresión en `availability`,
+`packs` o `grounding` aparece como más milisegundos o más consultas en su etapa.
+
+Etapas (cada una con ms y consultas SQL):
+  catalogo   snapshot del catálogo (grounding + carta; con `frio` se rearma siempre)
+  estado     carrito + cotización vigente del cliente
+  prompt:system / prompt:user   armado de cada prompt
+  tool:<x>   cada tool que pidió el guion
+  llm        el modelo de guion (≈0, o `latencia_llm_ms` simulados por paso)
+  turno      `_producir_borrador` completo
+
+Solo se guionan tools de LECTURA y cada turno corre en una transacción que se
+revierte: repetir conversaciones reales no deja rastro en la base. Dentro de la
+transacción las tools van en serie (ver `ejecutar_tool_calls`), que además es lo
+que permite contar sus consultas.
+
+Uso: `python manage.py medir_turnos_luna --limite 30 --repeticiones 3`.
+"""
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from destino_puerto_varas.services.llm import openrouter_provider
+from destino_puerto_varas.services.llm.openrouter_provider import LLMResult, ejecutar_tool_calls
+from ventas.services.perfilado_service import Medicion, percentil
+
+TEXTO_GUION = 'Te cuento lo que encontré para esa fecha 🌿'
+
+
+class _Revertir(Exception):
+    """Sale del atomic del turno para deshacer lo que haya escrito."""
+
+
+def proximo_sabado(hoy=None):
+    hoy = hoy or timezone.localdate()
+    return hoy + timedelta(days=(5 - hoy.weekday()) % 7 or 7)
+
+
+def guion(mensaje, fecha):
+    """[(tool, argumentos)] que el modelo de guion pide para `mensaje`. Determinístico."""
+    texto = (mensaje or '').lower()
+    iso = fecha.isoformat()
+    llamadas = []
+    if re.search(r'caba[ñn]a|alojamiento|noche', texto):
+        llamadas.append(('consultar_disponibilidad_alojamiento_multinoche',
+                         {'fecha_llegada': iso, 'personas': 2, 'noches': 1}))
+    if re.search(r'tina|masaje|pack|precio', texto):
+        llamadas.append(('consultar_disponibilidad', {'fecha': iso, 'personas': 2}))
+        llamadas.append(('consultar_disponibilidad_pack', {'fecha': iso, 'personas': 2}))
+    if 'reserva' in texto:
+        llamadas.append(('buscar_reservas_cliente', {}))
+    if re.search(r'regal|gift', texto):
+        llamadas.append(('catalogo_giftcards', {}))
+    return llamadas
+
+
+class Banco:
+    """Junta las mediciones por etapa de todos los turnos repetidos."""
+
+    def __init__(self):
+        self.etapas = {}
+
+    @contextmanager
+    def medir(self, etapa):
+        medicion = Medicion()
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(medicion.execute_wrapper):
+                yield
+        finally:
+            self.etapas.setdefault(etapa, []).append(
+                ((time.perf_counter() - inicio) * 1000, medicion.consultas))
+
+    def envolver(self, etapa, funcion):
+        def medida(*args, **kwargs):
+            with self.medir(etapa):
+                return funcion(*args, **kwargs)
+        return medida
+
+    def resumen(self):
+        """Una fila por etapa, de la peor p95 a la mejor."""
+        filas = []
+        for etapa, muestras in self.etapas.items():
+            tiempos = sorted(ms for ms, _ in muestras)
+            consultas = sorted(n for _, n in muestras)
+            filas.append({
+                'etapa': etapa,
+                'n': len(muestras),
+                'p50_ms': round(percentil(tiempos, 50), 1),
+                'p95_ms': round(percentil(tiempos, 95), 1),
+                'consultas_p50': percentil(consultas, 50),
+                'consultas_p95': percentil(consultas, 95),
+            })
+        filas.sort(key=lambda f: -f['p95_ms'])
+        return filas
+
+
+class ModeloGuion:
+    """Reemplazo local de `OpenRouterProvider` para el banco: sin red, sin azar."""
+
+    def __init__(self, banco, fecha, latencia_llm_ms=0):
+        self.banco = banco
+        self.fecha = fecha
+        self.latencia_llm_ms = latencia_llm_ms
+        self.mensaje = ''   # el del turno en curso: lo fija `repetir`
+
+    def _paso_llm(self):
+        with self.banco.medir('llm'):
+            if self.latencia_llm_ms:
+                time.sleep(self.latencia_llm_ms / 1000)
+
+    def generate_with_tools(self, messages, tools, tool_executor, model=None,
+                            paralelizable=None, **kwargs):
+        self._paso_llm()
+        ejecutadas = []
+        llamadas = guion(self.mensaje, self.fecha)
+        if llamadas:
+            ejecutar = lambda nombre, args: self.banco.envolver(  # noqa: E731
+                f'tool:{nombre}', tool_executor)(nombre, args)
+            resultados, en_paralelo = ejecutar_tool_calls(llamadas, ejecutar, paralelizable)
+            for (nombre, args), (resultado, ms) in zip(llamadas, resultados):
+                ejecutadas.append({'name': nombre, 'arguments': args, 'result': resultado,
+                                   'ms': ms, 'paralela': en_paralelo})
+            self._paso_llm()
+        return LLMResult(text=TEXTO_GUION, model=model or 'guion', input_tokens=0,
+                         output_tokens=0, latency_ms=0, tool_calls_executed=ejecutadas)
+
+
+def turnos_grabados(limite=50, phone=''):
+    """[(phone, mensaje, timestamp)] de entrantes que ya tuvieron sugerencia, de
+    los más nuevos a los más viejos."""
+    from ventas.models import WhatsAppMessage
+
+    from .models import SugerenciaAgenteWhatsApp
+
+    sugerencias = SugerenciaAgenteWhatsApp.objects.all()
+    if phone:
+        sugerencias = sugerencias.filter(phone=phone)
+    ids = list(sugerencias.values_list('wa_message_id', flat=True)[:limite])
+    entrantes = (WhatsAppMessage.objects
+                 .filter(wa_message_id__in=ids, direction='in')
+                 .exclude(body='')
+                 .order_by('-timestamp')
+                 .values_list('phone', 'body', 'timestamp'))
+    return list(entrantes)
+
+
+def repetir(turnos, repeticiones=1, frio=False, latencia_llm_ms=0, fecha=None):
+    """Repite cada turno `repeticiones` veces y devuelve el `Banco` con las medidas."""
+    from ventas.services.cache_service import invalidar
+
+    from . import agent, prompt, snapshot
+
+    banco = Banco()
+    modelo = ModeloGuion(banco, fecha or proximo_sabado(), latencia_llm_ms)
+    config = agent.get_config()
+
+    with ExitStack() as parches:
+        parches.enter_context(mock.patch.object(
+            openrouter_provider, 'OpenRouterProvider', lambda: modelo))
+        for modulo, nombre, etapa in ((snapshot, 'obtener', 'catalogo'),
+                                      (agent, '_estado_estructurado', 'estado'),
+                                      (prompt, 'system_prompt_cacheable', 'prompt:system'),
+                                      (prompt, 'build_user_prompt', 'prompt:user')):
+            parches.enter_context(mock.patch.object(
+                modulo, nombre, banco.envolver(etapa, getattr(modulo, nombre))))
+
+        for _ in range(repeticiones):
+            for phone, mensaje, timestamp in turnos:
+                if frio:
+                    invalidar('luna_config')
+                historial = agent._historial_texto(phone, timestamp, config.history_window)
+                modelo.mensaje = mensaje
+                try:
+                    with transaction.atomic():
+                        with banco.medir('turno'):
+                            agent._producir_borrador(config, mensaje, historial,
+                                                     phone=phone, canal='whatsapp')
+                        raise _Revertir
+                except _Revertir:
+                    pass
+    return banco
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""Columna nueva con default (tiempos por tool del turno en la sugerencia).
+
+Escrita a mano —como todas en este repo— porque `makemigrations` arrastra el
+drift de AR-033/034 y pide input interactivo por cambios preexistentes.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_agent', '0013_recordatorioluna'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sugerenciaagentewhatsapp',
+            name='tools',
+            field=models.JSONField(
+                blank=True, default=list,
+                help_text='Tools del turno en orden: [{nombre, ms, paralela}]. paralela = corrió a la vez '
+                          'que las otras lecturas del mismo paso del modelo.'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Columnas nuevas con default: tokens de la caché de prompt y costo por turno.
+
+Escrita a mano —como todas en este repo— porque `makemigrations` arrastra el
+drift de AR-033/034 y pide input interactivo por cambios preexistentes.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('whatsapp_agent', '0014_sugerenciaagentewhatsapp_tools'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sugerenciaagentewhatsapp',
+            name='cached_tokens',
+            field=models.PositiveIntegerField(
+                default=0, help_text='Parte de input_tokens que el proveedor leyó de su caché de prompt.'),
+        ),
+        migrations.AddField(
+            model_name='sugerenciaagentewhatsapp',
+            name='cache_ratio',
+            field=models.FloatField(default=0, help_text='cached_tokens / input_tokens (0..1).'),
+        ),
+        migrations.AddField(
+            model_name='sugerenciaagentewhatsapp',
+            name='cost_usd',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=10),
+        ),
+    ]
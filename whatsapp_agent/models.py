@@ -134,6 +134,14 @@ class WhatsAppAgentConfig(SingletonModel):
         except Exception:  # noqa: BLE001 — si la tabla M2M aún no migró, no romper
             return set()
 
+    @classmethod
+    def ids_complementarios_cacheados(cls):
+        """`get_solo().ids_complementarios()` desde la caché compartida (dominio
+        'luna_config'): se invalida al guardar la config, su M2M o un servicio."""
+        from ventas.services.cache_service import cache_ns
+        return cache_ns('luna_config').get_or_set(
+            'ids_complementarios', lambda: cls.get_solo().ids_complementarios())
+
 
 class SugerenciaAgenteWhatsApp(models.Model):
     """Borrador generado por el agente para un entrante concreto.
@@ -159,6 +167,15 @@ class SugerenciaAgenteWhatsApp(models.Model):
     input_tokens = models.PositiveIntegerField(default=0)
     output_tokens = models.PositiveIntegerField(default=0)
     latency_ms = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(
+        default=0, help_text='Parte de input_tokens que el proveedor leyó de su caché de prompt.')
+    cache_ratio = models.FloatField(default=0, help_text='cached_tokens / input_tokens (0..1).')
+    cost_usd = models.DecimalField(max_digits=10, decimal_places=6, default=0)
+    tools = models.JSONField(
+        default=list, blank=True,
+        help_text='Tools del turno en orden: [{nombre, ms, paralela}]. paralela = corrió a la vez '
+                  'que las otras lecturas del mismo paso del modelo.',
+    )
 
     enviada = models.BooleanField(
         default=False,
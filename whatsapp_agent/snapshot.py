@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Foto del catálogo para el prompt de Luna, armada una vez y compartida.
+
+Cada turno llamaba a `grounding.catalogo_vivo()` (3 consultas) y a
+`carta.carta_de_precios()` (4 más) y volvía a armar las ~30 KB del system prompt,
+aunque el catálogo cambia un par de veces al día. Acá se guarda, en la caché
+compartida (dominio 'luna_config'), el catálogo, la carta y las partes FIJAS del
+system prompt (`prompt.build_system_prompt_partes`); cada mensaje solo pega el
+saludo y la fecha de hoy (`prompt.unir_system_prompt`).
+
+Se invalida sola: guardar un `Servicio`, un `Producto`, una categoría o la
+config del agente sube la versión de 'luna_config'
+(`ventas/signals/cache_signals.py`) en todos los workers a la vez.
+
+Las partes dependen además del tono/link/conocimiento de la config que llega al
+turno: se guardan con su huella y, si no calza (config sin guardar, comando de
+prueba), se rearman sobre el mismo catálogo sin tocar la base. El conocimiento
+entra entero salvo que se fije `DPV_LLM_KNOWLEDGE_TOKEN_BUDGET` (por defecto 0,
+sin tope).
+"""
+import hashlib
+import logging
+
+from django.conf import settings
+
+from destino_puerto_varas.services.llm.token_budget import estimar_tokens, recortar_secciones
+
+from . import prompt as prompt_mod
+
+logger = logging.getLogger(__name__)
+
+CLAVE = 'snapshot_catalogo'
+
+
+def _huella_config(config):
+    datos = '\x1f'.join((config.persona_tono or '', config.link_reserva or '',
+                         config.conocimiento or ''))
+    return hashlib.md5(datos.encode('utf-8')).hexdigest()
+
+
+def _conocimiento(config):
+    conocimiento = config.conocimiento or ''
+    recortado = recortar_secciones(conocimiento, settings.DPV_LLM_KNOWLEDGE_TOKEN_BUDGET)
+    if recortado != conocimiento:
+        logger.warning('Conocimiento del agente recortado al presupuesto: ~%s → ~%s tokens',
+                       estimar_tokens(conocimiento), estimar_tokens(recortado))
+    return recortado
+
+
+def _partes(config, catalogo, carta):
+    return prompt_mod.build_system_prompt_partes(
+        config.persona_tono, catalogo, config.link_reserva, _conocimiento(config), carta=carta)
+
+
+def _armar(config):
+    from .carta import carta_de_precios
+    from .grounding import catalogo_vivo
+
+    catalogo = catalogo_vivo()
+    carta = carta_de_precios()
+    return {
+        'catalogo': catalogo,
+        'carta': carta,
+        'config': _huella_config(config),
+        'partes': _partes(config, catalogo, carta),
+    }
+
+
+def obtener(config):
+    """{catalogo, carta, partes} vigentes. Lanza si no se pudo leer el catálogo,
+    igual que `catalogo_vivo()`."""
+    from ventas.services.cache_service import cache_ns
+
+    ns = cache_ns('luna_config')
+    foto = ns.get_or_set(CLAVE, lambda: _armar(config))
+    if foto['config'] != _huella_config(config):
+        foto = dict(foto, config=_huella_config(config),
+                    partes=_partes(config, foto['catalogo'], foto['carta']))
+    return foto
+
+
+def system_prompt(config, fecha_hoy='', saludo_estado='', saludo_nombre=''):
+    """El mismo texto que `prompt.build_system_prompt(...)` con el catálogo vivo."""
+    return prompt_mod.unir_system_prompt(
+        obtener(config)['partes'], fecha_hoy=fecha_hoy,
+        saludo_estado=saludo_estado, saludo_nombre=saludo_nombre)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""`disponibilidad_alojamiento_multinoche()` en lote: noches ocupadas de todas las
+cabañas en una carga agrupada, no un COUNT por cabaña.
+
+Lo que estos tests clavan:
+
+· Una cabaña con reserva en CUALQUIER noche del rango no aparece; la noche de
+  salida no cuenta (check-out).
+· Un bloqueo de día (OTA, mantención) la saca igual que una reserva.
+· La cantidad de consultas NO crece con la cantidad de cabañas.
+· Con `flexible_dias` devuelve otras llegadas libres sin consultas extra.
+
+Ejecutar:
+    python manage.py test whatsapp_agent.tests.test_alojamiento_multinoche_lote
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ventas.models import Cliente, ReservaServicio, Servicio, ServicioBloqueo, VentaReserva
+from whatsapp_agent.availability import disponibilidad_alojamiento_multinoche
+from whatsapp_agent.models import WhatsAppAgentConfig
+
+LLEGADA = date(2030, 11, 8)
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+def _cabana(nombre, precio):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio='cabana', precio_base=precio, duracion=60 * 20,
+        capacidad_minima=1, capacidad_maxima=2, publicado_web=True,
+        slots_disponibles=SLOTS)
+
+
+class AlojamientoMultinocheLoteTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.torre = _cabana('Cabaña Torre', 60000)
+        self.arrayan = _cabana('Cabaña Arrayán', 70000)
+        self.laurel = _cabana('Cabaña Laurel', 80000)
+        cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=cliente, total=0)
+        WhatsAppAgentConfig.ids_complementarios_cacheados()  # fuera de la medición
+
+    def _reservar(self, cabana, fecha):
+        ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=cabana, fecha_agendamiento=fecha,
+            hora_inicio='16:00', cantidad_personas=2)
+
+    def _nombres(self, respuesta):
+        return [c['nombre'] for c in respuesta['cabanas']]
+
+    def test_reserva_en_cualquier_noche_excluye(self):
+        self._reservar(self.torre, LLEGADA + timedelta(days=1))     # 2ª noche
+        self._reservar(self.arrayan, LLEGADA + timedelta(days=2))   # día de salida: no cuenta
+
+        r = disponibilidad_alojamiento_multinoche(LLEGADA.isoformat(), 2, noches=2)
+
+        self.assertEqual(self._nombres(r), ['Cabaña Arrayán', 'Cabaña Laurel'])
+        self.assertEqual(r['total_disponibles'], 2)
+        self.assertEqual(r['cabanas'][0]['total_estadia'], 280000)
+        self.assertNotIn('ventanas_alternativas', r)
+
+    def test_bloqueo_de_dia_excluye(self):
+        ServicioBloqueo.objects.create(
+            servicio=self.torre, fecha_inicio=LLEGADA, fecha_fin=LLEGADA,
+            fecha=LLEGADA, hora_slot='N/A', motivo='Airbnb')
+
+        r = disponibilidad_alojamiento_multinoche(LLEGADA.isoformat(), 1, noches=3)
+
+        self.assertNotIn('Cabaña Torre', self._nombres(r))
+        self.assertEqual(r['total_disponibles'], 2)
+
+    def test_consultas_no_crecen_con_las_cabanas(self):
+        with CaptureQueriesContext(connection) as ctx:
+            disponibilidad_alojamiento_multinoche(LLEGADA.isoformat(), 2, noches=2)
+        antes = len(ctx.captured_queries)
+
+        for i in range(6):
+            _cabana(f'Cabaña Extra {i}', 90000)
+        with CaptureQueriesContext(connection) as ctx:
+            disponibilidad_alojamiento_multinoche(LLEGADA.isoformat(), 2, noches=2, flexible_dias=3)
+
+        self.assertEqual(len(ctx.captured_queries), antes)
+
+    def test_fechas_flexibles(self):
+        for cabana in (self.torre, self.arrayan, self.laurel):
+            self._reservar(cabana, LLEGADA)
+        self._reservar(self.torre, LLEGADA + timedelta(days=2))
+
+        r = disponibilidad_alojamiento_multinoche(LLEGADA.isoformat(), 2, noches=2, flexible_dias=2)
+
+        self.assertEqual(r['cabanas'], [])
+        ventanas = r['ventanas_alternativas']
+        # +1 (9-11): Arrayán y Laurel; -1 (7-9) choca con la noche del 8; -2 (6-8) libre entera.
+        self.assertEqual(ventanas[0], {
+            'fecha_llegada': '2030-11-09', 'fecha_salida': '2030-11-11',
+            'total_disponibles': 2, 'desde_total': 280000})
+        self.assertEqual([v['fecha_llegada'] for v in ventanas],
+                         ['2030-11-09', '2030-11-06', '2030-11-10'])
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""`disponibilidad()` en lote: mismas respuestas, consultas fijas.
+
+Antes cada servicio × cada slot hacía `slot_bloqueado` + `verificar_disponibilidad`
+(2-3 queries por slot): un sábado con 10 tinas de 6 horarios eran cientos de idas
+a la base por UNA tool-call de Luna. Lo que estos tests clavan:
+
+· El resultado es IDÉNTICO al del camino viejo slot por slot + el chequeo por
+  intervalo del checkout (`buscar_conflictos` con retenciones): Luna no ofrece
+  una hora que el checkout después rechaza.
+· Una retención vigente (pago Flow en curso) ocupa; una venta cancelada no.
+· La cantidad de consultas NO crece con la cantidad de servicios.
+"""
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ventas.calendar_utils import verificar_disponibilidad
+from ventas.models import (Cliente, PendingReservation, ReservaServicio, RetencionSlot, Servicio,
+                           ServicioBloqueo, ServicioSlotBloqueo, VentaReserva)
+from ventas.services.disponibilidad_service import buscar_conflictos
+from whatsapp_agent import availability
+from whatsapp_agent.models import WhatsAppAgentConfig
+from whatsapp_agent.tests.test_giftcards_luna import _SinSenalesDeVenta
+
+# Lejos de "hoy": sin piso horario ni tiempo de viaje de masajistas.
+FECHA = date(2030, 11, 9)
+DIA = FECHA.strftime('%A').lower()
+HORAS = ['12:00', '14:30', '17:00', '19:30', '22:00']
+
+
+def _tina(nombre, capacidad=4):
+    return Servicio.objects.create(
+        nombre=nombre, tipo_servicio='tina', precio_base=25000, duracion=120,
+        capacidad_minima=1, capacidad_maxima=capacidad, publicado_web=True,
+        slots_disponibles={DIA: list(HORAS)})
+
+
+def _libres_slot_por_slot(servicio, personas):
+    """El camino VIEJO (una consulta por pregunta) + lo que valida el checkout."""
+    if ServicioBloqueo.servicio_bloqueado_en_fecha(servicio.id, FECHA):
+        return None
+    return [h for h in HORAS
+            if not ServicioSlotBloqueo.slot_bloqueado(servicio.id, FECHA, h)
+            and verificar_disponibilidad(servicio, FECHA, h, personas)
+            and not buscar_conflictos(servicio, FECHA, h, contar_retenciones=True)]
+
+
+class DisponibilidadEnLoteTest(_SinSenalesDeVenta, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cliente = Cliente.objects.create(nombre='Prueba', telefono='+56911111111')
+        self.venta = VentaReserva.objects.create(cliente=self.cliente, total=0)
+        # Que la 1ª medición no pague el INSERT del singleton ni la caché fría.
+        WhatsAppAgentConfig.get_solo()
+        WhatsAppAgentConfig.ids_complementarios_cacheados()
+
+    def _reservar(self, servicio, hora, personas):
+        ReservaServicio.objects.create(
+            venta_reserva=self.venta, servicio=servicio, fecha_agendamiento=FECHA,
+            hora_inicio=hora, cantidad_personas=personas)
+
+    def _consultas(self, personas=2):
+        with CaptureQueriesContext(connection) as ctx:
+            res = availability.disponibilidad(FECHA.isoformat(), personas, 'tina', limite=None)
+        return res, len(ctx.captured_queries)
+
+    def test_mismo_resultado_que_slot_por_slot(self):
+        llena = _tina('Tina Llena', capacidad=2)
+        media = _tina('Tina Media')
+        cerrada = _tina('Tina Cerrada')
+        con_slot = _tina('Tina Con Slot Bloqueado')
+        self._reservar(llena, '12:00', 2)
+        self._reservar(media, '14:30', 2)
+        self._reservar(media, '17:00', 3)
+        # `fecha`/`hora_slot`: campos del modelo fusionado (P-28), NOT NULL.
+        ServicioBloqueo.objects.create(
+            servicio=cerrada, fecha_inicio=FECHA, fecha_fin=FECHA, motivo='Mantención',
+            fecha=FECHA, hora_slot='N/A')
+        ServicioSlotBloqueo.objects.create(
+            servicio=con_slot, fecha=FECHA, hora_slot='19:30', motivo='Limpieza')
+
+        res, _ = self._consultas(personas=2)
+        por_nombre = {s['nombre']: s['slots_libres'] for s in res['servicios']}
+
+        for servicio in (llena, media, con_slot):
+            self.assertEqual(por_nombre[servicio.nombre], _libres_slot_por_slot(servicio, 2),
+                             servicio.nombre)
+        self.assertNotIn(cerrada.nombre, por_nombre)
+        # 14:30 y 17:00 tienen reserva; 12:00 (12-14) y 19:30 no se cruzan con nada.
+        self.assertEqual(por_nombre['Tina Media'], ['12:00', '19:30', '22:00'])
+
+    def test_retencion_ocupa_y_cancelada_no(self):
+        retenida = _tina('Tina Retenida')
+        cancelada = _tina('Tina Cancelada')
+        pending = PendingReservation.objects.create(
+            cliente=self.cliente, cart_data={}, monto=50000,
+            expires_at=timezone.now() + timedelta(minutes=20))
+        # Retención de 13:00 a 15:00: pisa las horas de 12:00 y 14:30.
+        RetencionSlot.objects.create(
+            servicio=retenida, fecha=FECHA, minuto_inicio=13 * 60, minuto_fin=15 * 60,
+            pending_reservation=pending, expires_at=pending.expires_at)
+        self._reservar(cancelada, '17:00', 2)
+        VentaReserva.objects.filter(pk=self.venta.pk).update(estado_pago='cancelado')
+
+        res, _ = self._consultas()
+        por_nombre = {s['nombre']: s['slots_libres'] for s in res['servicios']}
+
+        self.assertEqual(por_nombre['Tina Retenida'], ['17:00', '19:30', '22:00'])
+        self.assertEqual(por_nombre['Tina Cancelada'], HORAS)
+
+    def test_las_consultas_no_crecen_con_los_servicios(self):
+        for i in range(2):
+            self._reservar(_tina(f'Tina {i}'), '17:00', 1)
+        _, con_dos = self._consultas()
+
+        for i in range(2, 12):
+            self._reservar(_tina(f'Tina {i}'), '17:00', 1)
+        res, con_doce = self._consultas()
+
+        self.assertEqual(len(res['servicios']), 12)
+        self.assertEqual(con_doce, con_dos)
+        # config de Luna + servicios + bloqueos de día + bloqueos de slot + reservas
+        self.assertLessEqual(con_doce, 6)
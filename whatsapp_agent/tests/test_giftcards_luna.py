@@ -60,19 +60,27 @@ class _SinSenalesDeVenta:
         cls._mover_senales(desconectar=False)
         super().tearDownClass()
 
-    @staticmethod
-    def _mover_senales(desconectar):
+    @classmethod
+    def _mover_senales(cls, desconectar):
         from django.db.models.signals import post_save
 
         from control_gestion.signals import react_to_reserva_change
         from ventas.models import Pago, VentaReserva
         from ventas.signals.main_signals import actualizar_tramo_y_premios_on_pago
 
-        mover = post_save.disconnect if desconectar else post_save.connect
-        for receptor in (actualizar_tramo_y_premios_on_pago,
-                         react_to_reserva_change):
-            for emisor in (VentaReserva, Pago):
-                mover(receptor, sender=emisor)
+        if not desconectar:
+            # Reconectar SOLO lo que estaba conectado: conectarlos a Pago (que
+            # no los tenía) hacía que cualquier Pago creado después en la
+            # corrida llamara a receptores de VentaReserva.
+            for receptor, emisor in cls._senales_movidas:
+                post_save.connect(receptor, sender=emisor)
+            return
+        cls._senales_movidas = [
+            (receptor, emisor)
+            for receptor in (actualizar_tramo_y_premios_on_pago, react_to_reserva_change)
+            for emisor in (VentaReserva, Pago)
+            if post_save.disconnect(receptor, sender=emisor)
+        ]
 
     def setUp(self):
         from ventas import middleware
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Banco de medición de turnos (`medir_turnos_luna` + `medicion_turnos`).
+
+Lo que estos tests clavan:
+
+· Repite entrantes grabados por `_producir_borrador` sin red: el modelo de guion
+  pide las tools según el mensaje y cada una aparece como etapa propia.
+· Reporta p50/p95 de ms y consultas por etapa; con el catálogo caliente la
+  etapa `catalogo` no consulta la base.
+· No deja rastro: cada turno se revierte.
+
+Ejecutar:
+    python manage.py test whatsapp_agent.tests.test_medir_turnos_luna
+"""
+import json
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from ventas.models import Servicio, WhatsAppMessage
+from whatsapp_agent.medicion_turnos import guion, proximo_sabado
+from whatsapp_agent.models import SugerenciaAgenteWhatsApp
+
+SLOTS = {dia: ['16:00'] for dia in ('monday', 'tuesday', 'wednesday', 'thursday',
+                                    'friday', 'saturday', 'sunday')}
+
+
+class GuionTest(SimpleTestCase):
+
+    def test_tools_segun_el_mensaje(self):
+        fecha = date(2030, 11, 9)
+        self.assertEqual([n for n, _ in guion('¿Tienen tina el sábado?', fecha)],
+                         ['consultar_disponibilidad', 'consultar_disponibilidad_pack'])
+        self.assertEqual([n for n, _ in guion('Quiero una cabaña y ver mi reserva', fecha)],
+                         ['consultar_disponibilidad_alojamiento_multinoche',
+                          'buscar_reservas_cliente'])
+        self.assertEqual(guion('Hola!', fecha), [])
+
+    def test_proximo_sabado(self):
+        self.assertEqual(proximo_sabado(date(2030, 11, 6)), date(2030, 11, 9))   # miércoles
+        self.assertEqual(proximo_sabado(date(2030, 11, 9)), date(2030, 11, 16))  # sábado → el otro
+
+
+class MedirTurnosLunaTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Servicio.objects.create(
+            nombre='Tina Calbuco', tipo_servicio='tina', precio_base=25000, duracion=120,
+            capacidad_minima=1, capacidad_maxima=4, publicado_web=True, slots_disponibles=SLOTS)
+        ahora = timezone.now()
+        for i, texto in enumerate(('Hola, ¿tienen tina para el sábado?', '¿Y masaje?')):
+            WhatsAppMessage.objects.create(
+                direction='in', wa_message_id=f'wamid.{i}', phone='+56911111111',
+                body=texto, timestamp=ahora - timedelta(minutes=10 - i))
+            SugerenciaAgenteWhatsApp.objects.create(wa_message_id=f'wamid.{i}', phone='+56911111111')
+
+    def _medir(self, *args):
+        salida = StringIO()
+        call_command('medir_turnos_luna', '--json', *args, stdout=salida)
+        return {f['etapa']: f for f in json.loads(salida.getvalue())['etapas']}
+
+    def test_etapas_por_turno(self):
+        etapas = self._medir('--repeticiones', '3')
+
+        self.assertEqual(etapas['turno']['n'], 6)
+        for etapa in ('catalogo', 'estado', 'prompt:system', 'prompt:user', 'llm',
+                      'tool:consultar_disponibilidad', 'tool:consultar_disponibilidad_pack'):
+            self.assertIn(etapa, etapas)
+        self.assertGreater(etapas['tool:consultar_disponibilidad']['consultas_p95'], 0)
+        # Catálogo caliente: solo el primer turno lo arma.
+        self.assertEqual(etapas['catalogo']['consultas_p50'], 0)
+        self.assertEqual(SugerenciaAgenteWhatsApp.objects.count(), 2)
+
+    def test_frio_rearma_el_catalogo(self):
+        etapas = self._medir('--frio')
+        self.assertGreater(etapas['catalogo']['consultas_p50'], 0)
+
+    def test_mensaje_suelto(self):
+        etapas = self._medir('--mensaje', 'Quiero regalar una gift card')
+        self.assertEqual(etapas['turno']['n'], 1)
+        self.assertIn('tool:catalogo_giftcards', etapas)
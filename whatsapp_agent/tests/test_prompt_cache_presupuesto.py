@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Caché de prompt del proveedor y presupuesto de tokens del turno de Luna.
+
+Lo que estos tests clavan:
+
+· La parte fija del system prompt va marcada con `cache_control` y el saludo
+  (lo único que cambia entre clientes) va aparte y al final.
+· A los modelos sin caché explícita les llega texto plano, con el mismo contenido.
+· El historial se recorta por los mensajes MÁS VIEJOS, enteros (una respuesta de
+  varias líneas no queda a medias); el conocimiento, por sus últimos párrafos.
+· Los tokens cacheados se suman en el loop de tools, abaratan el costo y quedan
+  en la sugerencia con su ratio.
+
+Ejecutar:
+    python manage.py test whatsapp_agent.tests.test_prompt_cache_presupuesto
+"""
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from destino_puerto_varas.services.llm.openrouter_provider import (OpenRouterProvider,
+                                                                   system_message)
+from destino_puerto_varas.services.llm.pricing import calculate_cost_usd
+from destino_puerto_varas.services.llm.token_budget import (estimar_tokens, recortar_historial,
+                                                            recortar_secciones)
+from whatsapp_agent import prompt
+from whatsapp_agent.agent import _guardar
+
+
+def _respuesta(texto, prompt_tokens, cached):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=texto, tool_calls=None),
+                                 finish_reason='stop')],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=20,
+                              prompt_tokens_details=SimpleNamespace(cached_tokens=cached)))
+
+
+class PresupuestoTest(SimpleTestCase):
+
+    def test_historial_conserva_lo_mas_reciente(self):
+        historial = '\n'.join(f'[Cliente]: mensaje número {i:03d}' for i in range(200))
+        recortado = recortar_historial(historial, 300)
+
+        self.assertLessEqual(estimar_tokens(recortado), 320)
+        self.assertTrue(recortado.endswith('[Cliente]: mensaje número 199'))
+        self.assertTrue(recortado.startswith('(… '))
+        self.assertEqual(recortar_historial('[Cliente]: hola', 300), '[Cliente]: hola')
+
+    def test_historial_no_corta_un_mensaje_de_varias_lineas(self):
+        respuesta = '[Aremko]: Tenemos tres opciones:\n' + '\n'.join(
+            f'- Tina {i}: disponible a las {10 + i}:00 con hidromasaje y vista al río' for i in range(8))
+        historial = '\n'.join(['[Cliente]: hola'] * 5 + [respuesta, '[Cliente]: la segunda'])
+        recortado = recortar_historial(historial, estimar_tokens(respuesta) + 10)
+
+        lineas = recortado.split('\n')
+        self.assertEqual(lineas[0], '(… 5 mensajes anteriores omitidos)')
+        self.assertEqual(lineas[1], '[Aremko]: Tenemos tres opciones:')
+        self.assertTrue(recortado.endswith(respuesta + '\n[Cliente]: la segunda'))
+
+        # Si la respuesta no entra, sale entera: sin líneas sueltas sin quién las dijo.
+        solo_la_ultima = recortar_historial(historial, 10)
+        self.assertEqual(solo_la_ultima, '(… 6 mensajes anteriores omitidos)\n[Cliente]: la segunda')
+
+    def test_conocimiento_conserva_los_primeros_parrafos(self):
+        conocimiento = 'Regla principal.\n\n' + '\n\n'.join('x' * 350 for _ in range(10))
+        recortado = recortar_secciones(conocimiento, 300)
+        self.assertTrue(recortado.startswith('Regla principal.'))
+        self.assertLessEqual(estimar_tokens(recortado), 300)
+
+
+class SystemPromptCacheableTest(SimpleTestCase):
+
+    def test_saludo_aparte_y_mismo_contenido(self):
+        partes = prompt.build_system_prompt_partes('Soy Luna.', 'CATÁLOGO', 'https://x.cl/')
+        fijo, saludo = prompt.system_prompt_cacheable(
+            partes, fecha_hoy='sábado 9', saludo_estado='regreso', saludo_nombre='Camila')
+        completo = prompt.unir_system_prompt(
+            partes, fecha_hoy='sábado 9', saludo_estado='regreso', saludo_nombre='Camila')
+
+        self.assertIn('Camila', saludo)
+        self.assertNotIn('Camila', fijo)
+        self.assertEqual(sorted(fijo + saludo), sorted(completo))
+        otro_fijo, _ = prompt.system_prompt_cacheable(
+            partes, fecha_hoy='sábado 9', saludo_estado='primer_contacto', saludo_nombre='Pedro')
+        self.assertEqual(otro_fijo, fijo)
+
+    def _enviado(self, modelo):
+        cliente = mock.Mock()
+        cliente.chat.completions.create.return_value = _respuesta('Hola', 1000, 0)
+        provider = OpenRouterProvider()
+        provider.api_key = 'x'
+        provider._client = cliente
+        provider.generate_with_tools([system_message('FIJO', 'SALUDO'),
+                                      {'role': 'user', 'content': 'u'}],
+                                     tools=[], tool_executor=None, model=modelo)
+        return cliente.chat.completions.create.call_args.kwargs['messages'][0]
+
+    def test_marca_solo_para_modelos_con_cache_explicita(self):
+        anthropic = self._enviado('anthropic/claude-haiku-4.5')
+        self.assertEqual(anthropic['content'][0]['cache_control'], {'type': 'ephemeral'})
+        self.assertEqual(anthropic['content'][1], {'type': 'text', 'text': 'SALUDO'})
+
+        self.assertEqual(self._enviado('openai/gpt-4o-mini')['content'], 'FIJOSALUDO')
+
+
+class TokensCacheadosTest(TestCase):
+
+    def test_se_suman_y_quedan_en_la_sugerencia(self):
+        cliente = mock.Mock()
+        tool_call = SimpleNamespace(id='a', function=SimpleNamespace(
+            name='consultar_disponibilidad', arguments='{}'))
+        cliente.chat.completions.create.side_effect = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content='', tool_calls=[tool_call]),
+                                         finish_reason='tool_calls')],
+                usage=SimpleNamespace(prompt_tokens=8000, completion_tokens=30,
+                                      prompt_tokens_details=SimpleNamespace(cached_tokens=7000))),
+            _respuesta('Tenemos cupo.', 8200, 7000),
+        ]
+        provider = OpenRouterProvider()
+        provider.api_key = 'x'
+        provider._client = cliente
+        modelo = 'anthropic/claude-haiku-4.5'
+
+        resultado = provider.generate_with_tools(
+            [system_message('FIJO'), {'role': 'user', 'content': 'u'}], tools=[],
+            tool_executor=lambda nombre, args: {'ok': True}, model=modelo)
+        self.assertEqual((resultado.input_tokens, resultado.cached_tokens), (16200, 14000))
+        self.assertLess(calculate_cost_usd(modelo, 16200, 50, cached_tokens=14000),
+                        calculate_cost_usd(modelo, 16200, 50))
+
+        entrante = SimpleNamespace(wa_message_id='wamid.1', phone='+56911111111',
+                                   timestamp=timezone.now())
+        sug = _guardar(entrante, texto='Tenemos cupo.', modelo=modelo,
+                       input_tokens=resultado.input_tokens, output_tokens=resultado.output_tokens,
+                       cached_tokens=resultado.cached_tokens)
+        sug.refresh_from_db()
+        self.assertEqual(sug.cached_tokens, 14000)
+        self.assertAlmostEqual(sug.cache_ratio, 14000 / 16200, places=3)
+        self.assertGreater(sug.cost_usd, 0)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Foto del catálogo para el prompt de Luna (`whatsapp_agent/snapshot.py`).
+
+Lo que estos tests clavan:
+
+· El system prompt armado desde la foto es IDÉNTICO al de `build_system_prompt`.
+· El segundo turno no consulta el catálogo ni la carta: sale de la caché.
+· Guardar un Servicio, un Producto o la config del agente la rearma.
+· Una config distinta a la de la foto (comando de prueba) no recibe partes ajenas.
+
+Ejecutar:
+    python manage.py test whatsapp_agent.tests.test_snapshot_catalogo
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ventas.models import Producto, Servicio
+from whatsapp_agent import prompt, snapshot
+from whatsapp_agent.carta import carta_de_precios
+from whatsapp_agent.grounding import catalogo_vivo
+from whatsapp_agent.models import WhatsAppAgentConfig
+
+
+class SnapshotCatalogoTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tina = Servicio.objects.create(
+            nombre='Tina Calbuco', tipo_servicio='tina', precio_base=25000, duracion=120,
+            capacidad_minima=1, capacidad_maxima=4, publicado_web=True)
+        self.config = WhatsAppAgentConfig.get_solo()
+        self.config.persona_tono = 'Eres Luna, de Aremko.'
+        self.config.conocimiento = 'Los lunes cerramos a las 20:00.'
+        self.config.save()
+
+    def test_mismo_prompt_que_build_system_prompt(self):
+        esperado = prompt.build_system_prompt(
+            self.config.persona_tono, catalogo_vivo(), self.config.link_reserva,
+            self.config.conocimiento, fecha_hoy='sábado 9 de noviembre de 2030',
+            saludo_estado='regreso', saludo_nombre='Camila', carta=carta_de_precios())
+
+        self.assertEqual(snapshot.system_prompt(
+            self.config, fecha_hoy='sábado 9 de noviembre de 2030',
+            saludo_estado='regreso', saludo_nombre='Camila'), esperado)
+
+    def test_segundo_turno_sin_consultas(self):
+        snapshot.system_prompt(self.config)
+        with CaptureQueriesContext(connection) as ctx:
+            texto = snapshot.system_prompt(self.config, saludo_estado='primer_contacto')
+        self.assertEqual(ctx.captured_queries, [])
+        self.assertIn('Tina Calbuco', texto)
+
+    def test_guardar_servicio_producto_o_config_la_rearma(self):
+        self.assertNotIn('Tina Osorno', snapshot.obtener(self.config)['catalogo'])
+
+        self.tina.nombre = 'Tina Osorno'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tina.save()
+        self.assertIn('Tina Osorno', snapshot.obtener(self.config)['catalogo'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Vino Carmenere', precio_base=12000,
+                                    cantidad_disponible=5, publicado_web=True)
+        self.assertIn('Vino Carmenere', snapshot.obtener(self.config)['catalogo'])
+
+        self.config.conocimiento = 'Los lunes cerramos a las 18:00.'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.config.save()
+        self.assertIn('18:00', snapshot.system_prompt(self.config))
+
+    def test_config_sin_guardar_no_usa_partes_ajenas(self):
+        snapshot.obtener(self.config)
+        prueba = WhatsAppAgentConfig(persona_tono='Tono de prueba', link_reserva='https://x.cl/')
+
+        with CaptureQueriesContext(connection) as ctx:
+            texto = snapshot.system_prompt(prueba)
+        self.assertEqual(ctx.captured_queries, [])
+        self.assertIn('Tono de prueba', texto)
+        self.assertNotIn('Eres Luna, de Aremko.', texto)
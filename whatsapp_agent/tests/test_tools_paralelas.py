@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Tools de lectura de un mismo paso del modelo corren a la vez
+(`openrouter_provider.ejecutar_tool_calls`).
+
+Lo que estos tests clavan:
+
+· Varias lecturas en un paso tardan lo que la más lenta, no la suma; los
+  resultados vuelven en el orden en que el modelo las pidió.
+· Si una sola escribe (carrito, propuesta), todo el paso va en serie y en orden.
+· Dentro de una transacción abierta va en serie: otro hilo no vería lo no confirmado.
+· Cada tool queda con su tiempo en `tool_calls_executed` y en la sugerencia.
+
+Ejecutar:
+    python manage.py test whatsapp_agent.tests.test_tools_paralelas
+"""
+import json
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from destino_puerto_varas.services.llm import openrouter_provider
+from destino_puerto_varas.services.llm.openrouter_provider import (OpenRouterProvider,
+                                                                   ejecutar_tool_calls)
+from whatsapp_agent.agent import _tiempos_de_tools, _tool_de_lectura
+
+ESPERA = 0.15
+
+
+def _lenta(llamadas):
+    def ejecutar(nombre, argumentos):
+        llamadas.append(nombre)
+        time.sleep(ESPERA)
+        return {'tool': nombre, 'fecha': argumentos.get('fecha')}
+    return ejecutar
+
+
+def _todas_de_lectura(nombre):
+    return nombre.startswith('consultar')
+
+
+class EjecutarToolCallsTest(SimpleTestCase):
+
+    def test_lecturas_en_paralelo_y_en_orden(self):
+        llamadas = [('consultar_disponibilidad', {'fecha': '2030-11-09'}),
+                    ('consultar_disponibilidad_pack', {'fecha': '2030-11-10'}),
+                    ('consultar_disponibilidad_refugio', {'fecha': '2030-11-11'})]
+        inicio = time.monotonic()
+        resultados, en_paralelo = ejecutar_tool_calls(llamadas, _lenta([]), _todas_de_lectura)
+        transcurrido = time.monotonic() - inicio
+
+        self.assertTrue(en_paralelo)
+        self.assertLess(transcurrido, ESPERA * 2)
+        self.assertEqual([r['fecha'] for r, _ in resultados],
+                         ['2030-11-09', '2030-11-10', '2030-11-11'])
+        self.assertTrue(all(ms >= ESPERA * 1000 * 0.9 for _, ms in resultados))
+
+    def test_una_escritura_pone_el_paso_en_serie(self):
+        orden = []
+        llamadas = [('consultar_disponibilidad', {}), ('agregar_servicio_carrito', {}),
+                    ('consultar_disponibilidad_pack', {})]
+        _, en_paralelo = ejecutar_tool_calls(llamadas, _lenta(orden), _todas_de_lectura)
+
+        self.assertFalse(en_paralelo)
+        self.assertEqual(orden, [nombre for nombre, _ in llamadas])
+
+    def test_excepcion_de_una_tool_vuelve_como_error(self):
+        def ejecutar(nombre, argumentos):
+            if nombre == 'consultar_disponibilidad_pack':
+                raise RuntimeError('sin slots')
+            return {'ok': True}
+
+        with self.assertLogs(openrouter_provider.logger, 'ERROR'):
+            resultados, _ = ejecutar_tool_calls(
+                [('consultar_disponibilidad', {}), ('consultar_disponibilidad_pack', {})],
+                ejecutar, _todas_de_lectura)
+        self.assertEqual(resultados[0][0], {'ok': True})
+        self.assertIn('tool_execution_failed', resultados[1][0]['error'])
+
+    def test_solo_las_tools_de_lectura_de_luna(self):
+        self.assertTrue(_tool_de_lectura('consultar_disponibilidad'))
+        self.assertTrue(_tool_de_lectura('buscar_reservas_cliente'))
+        self.assertFalse(_tool_de_lectura('agregar_servicio_carrito'))
+        self.assertFalse(_tool_de_lectura('preparar_reserva'))
+
+
+class DentroDeTransaccionTest(TestCase):
+
+    def test_en_serie_dentro_de_una_transaccion(self):
+        llamadas = [('consultar_disponibilidad', {}), ('consultar_disponibilidad_pack', {})]
+        _, en_paralelo = ejecutar_tool_calls(llamadas, _lenta([]), _todas_de_lectura)
+        self.assertFalse(en_paralelo)
+
+
+def _respuesta(tool_calls=None, texto=''):
+    mensaje = SimpleNamespace(content=texto, tool_calls=tool_calls)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=mensaje, finish_reason='stop')],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+def _tool_call(id_, nombre, argumentos):
+    return SimpleNamespace(id=id_, function=SimpleNamespace(name=nombre,
+                                                            arguments=json.dumps(argumentos)))
+
+
+class GenerateWithToolsTest(SimpleTestCase):
+
+    def test_paso_con_dos_lecturas(self):
+        cliente = mock.Mock()
+        cliente.chat.completions.create.side_effect = [
+            _respuesta([_tool_call('a', 'consultar_disponibilidad', {'fecha': '2030-11-09'}),
+                        _tool_call('b', 'consultar_disponibilidad_pack', {'fecha': '2030-11-10'})]),
+            _respuesta(texto='Tenemos tina a las 18:00.'),
+        ]
+        provider = OpenRouterProvider()
+        provider.api_key = 'x'
+        provider._client = cliente
+
+        resultado = provider.generate_with_tools(
+            [{'role': 'system', 'content': 's'}, {'role': 'user', 'content': 'u'}],
+            tools=[], tool_executor=_lenta([]), paralelizable=_todas_de_lectura)
+
+        self.assertEqual(resultado.text, 'Tenemos tina a las 18:00.')
+        self.assertEqual([(tc['name'], tc['paralela']) for tc in resultado.tool_calls_executed],
+                         [('consultar_disponibilidad', True), ('consultar_disponibilidad_pack', True)])
+        mensajes = cliente.chat.completions.create.call_args.kwargs['messages']
+        self.assertEqual([m['tool_call_id'] for m in mensajes if m['role'] == 'tool'], ['a', 'b'])
+
+        tiempos = _tiempos_de_tools(resultado.tool_calls_executed)
+        self.assertEqual([t['nombre'] for t in tiempos],
+                         ['consultar_disponibilidad', 'consultar_disponibilidad_pack'])
+        self.assertTrue(all(t['ms'] >= ESPERA * 1000 * 0.9 and t['paralela'] for t in tiempos))